@@ -6,6 +6,7 @@
 
 模块划分：
   - fusion.py            : 多学科 / 多课程图谱融合核心（数据源 = MySQL）
+  - store.py             : 融合图谱表的全量重建与增量维护（知识点/关系信号驱动）
   - entity_quality.py    : 实体质量启发式评估（移植自 Learn KnowledgeQualityEvaluator）
   - deepseek_evaluator.py: 融合图谱质量评估（DeepSeek 大模型验证关系准确性）
   - views.py             : 教师端页面 / 融合接口 / 评估接口
@@ -9,13 +9,17 @@ Learn 四维特征实体对齐（移植自 multi_graph_fusion/entity_alignment.p
   >=0.85 EquivalentTo 等价 -> 融合层合并为同一全局节点
   >=0.65 GeneralizeTo 泛化 -> 增加'相似'软关联边
   >=0.50 ApplyTo      应用 -> 增加'相似'软关联边
-容错：jieba / BERT 不可用时自动降级，不影响主流程。
+候选生成：全部知识点一次批量编码（BERT 向量经 embedding_service 持久化缓存），字面向量（字符/词 n-gram 哈希）与 BERT 向量各取 top-k 近邻作为候选，
+近邻检索用 FAISS（可选）或 NumPy 分块矩阵乘法，不再逐对计算，也不再对每个学科随机采样。
+容错：jieba / BERT / FAISS 不可用时自动降级，不影响主流程。
 """
-import os
+import time
 import logging
-from functools import lru_cache
+import zlib
 from difflib import SequenceMatcher
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 # jieba 可选
@@ -26,6 +30,14 @@ except Exception:
     jieba = None
     _HAS_JIEBA = False
 
+# faiss 可选：没有时用 NumPy 分块矩阵乘法做精确近邻检索
+try:
+    import faiss
+    _HAS_FAISS = True
+except Exception:
+    faiss = None
+    _HAS_FAISS = False
+
 # 置信度阈值（沿用 Learn EntityAlignment）
 TH_EQUIVALENT = 0.85
 TH_GENERALIZE = 0.65
@@ -33,60 +45,23 @@ TH_APPLY = 0.50
 
 _WEIGHTS = {'semantic': 0.35, 'name': 0.40, 'attribute': 0.15, 'rule': 0.10}
 
-# ---------------- 本地 BERT 语义相似度（单例，带降级） ----------------
-_sim_model = None
-_sim_tokenizer = None
-_sim_inited = False
-
-
-def _init_sim_model():
-    global _sim_model, _sim_tokenizer, _sim_inited
-    if _sim_inited:
-        return
-    _sim_inited = True
-    # 强制离线：避免无缓存 + 坏代理的机器卡在 huggingface 联网校验上。
-    # 没有本地缓存时会立即抛异常并优雅降级为字面相似度，而不是等待代理超时。
-    os.environ.setdefault('HF_HUB_OFFLINE', '1')
-    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
-    try:
-        import torch  # noqa
-        from transformers import AutoTokenizer, AutoModel
-        # 模型来源优先级：settings.BERT_MODEL_PATH > 默认模型名（依赖本地缓存）
-        name = 'bert-base-chinese'
-        try:
-            from django.conf import settings
-            name = getattr(settings, 'BERT_MODEL_PATH', None) or name
-        except Exception:
-            pass
-        _sim_tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
-        _sim_model = AutoModel.from_pretrained(name, local_files_only=True)
-        _sim_model.eval()
-        logger.info("[fusion] 语义相似度 BERT 加载成功: %s", name)
-    except Exception as e:
-        logger.warning("[fusion] BERT 加载失败，语义相似度降级为字面：%s", e)
-        _sim_model = None
-        _sim_tokenizer = None
-
-
-@lru_cache(maxsize=8192)
-def _embed(text: str):
-    """对单段文本做 BERT [CLS] 向量编码，带 LRU 缓存避免重复前向。"""
-    import torch
-    inp = _sim_tokenizer(text, return_tensors='pt', max_length=128, truncation=True)
-    with torch.no_grad():
-        out = _sim_model(**inp)
-    return out.last_hidden_state[:, 0, :].squeeze().numpy()
+# 每个实体在对方学科中取的近邻候选数（字面、语义各取 top-k 后合并）
+ALIGN_TOP_K = 10
+EMBED_BATCH_SIZE = 64
+_SEARCH_BLOCK = 1024
+_NGRAM_DIM = 1024
+
+# ---------------- 本地 BERT 语义相似度（共用 embedding_service，带降级） ----------------
+def _embed_batch(texts):
+    """批量 BERT [CLS] 编码，返回 L2 归一化矩阵；向量持久化缓存，BERT 不可用时返回 None"""
+    from learning.knowledge_graph_builder import embedding_service
+    return embedding_service.embed_texts(texts, batch_size=EMBED_BATCH_SIZE)
 
 
 def _semantic_similarity(t1: str, t2: str) -> float:
-    _init_sim_model()
-    if _sim_model is None or _sim_tokenizer is None:
-        return SequenceMatcher(None, t1, t2).ratio()
-    try:
-        from scipy.spatial.distance import cosine
-        return float(1 - cosine(_embed(t1), _embed(t2)))
-    except Exception:
-        return SequenceMatcher(None, t1, t2).ratio()
+    from learning.knowledge_graph_builder import embedding_service
+    sem = embedding_service.similarity(t1, t2)
+    return sem if sem is not None else SequenceMatcher(None, t1, t2).ratio()
 
 
 # ---------------- 四维特征 ----------------
@@ -101,11 +76,10 @@ def _attribute_overlap(e1: dict, e2: dict) -> float:
     return 0.0
 
 
-def _confidence(e1: dict, e2: dict):
-    sem = _semantic_similarity(
-        f"{e1['name']} {e1.get('description', '') or ''}",
-        f"{e2['name']} {e2.get('description', '') or ''}",
-    )
+def _confidence(e1: dict, e2: dict, sem=None):
+    """sem 为预先算好的语义相似度（批量编码的向量内积），不传时现算"""
+    if sem is None:
+        sem = _semantic_similarity(_entity_text(e1), _entity_text(e2))
     nam = _name_similarity(e1['name'], e2['name'])
     att = _attribute_overlap(e1, e2)
     rule = 0.1
@@ -126,45 +100,92 @@ def _alignment_type(conf: float):
     return None
 
 
-def _candidate_index(entities):
-    index = {}
-    for idx, e in enumerate(entities):
-        name = e['name']
-        if _HAS_JIEBA:
-            tokens = [w for w in jieba.cut(name) if len(w) >= 2]
-        else:
-            tokens = [name[i:i + 2] for i in range(len(name) - 1)] or [name]
-        for tok in tokens:
-            index.setdefault(tok, []).append(idx)
-    return index
+# ---------------- 近邻候选生成 ----------------
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _name_tokens(name):
+    """字面特征：单字 + 相邻二元字，有 jieba 时再加词"""
+    tokens = list(name) + [name[i:i + 2] for i in range(len(name) - 1)]
+    if _HAS_JIEBA:
+        tokens += [w for w in jieba.cut(name) if len(w) >= 2]
+    return tokens
+
+
+def _ngram_vectors(names):
+    """名称的字面向量：n-gram 用 crc32 哈希到固定维度（跨进程稳定），计数后归一化"""
+    vectors = np.zeros((len(names), _NGRAM_DIM), dtype=np.float32)
+    for i, name in enumerate(names):
+        for tok in _name_tokens(name):
+            vectors[i, zlib.crc32(tok.encode('utf-8')) % _NGRAM_DIM] += 1.0
+    return _normalize(vectors)
+
+
+def _entity_text(e):
+    return f"{e['name']} {e.get('description', '') or ''}"
+
 
+def _entity_vectors(entities):
+    """{'ngram': 字面向量, 'semantic': BERT 向量或 None}，行顺序与 entities 一致"""
+    return {
+        'ngram': _ngram_vectors([e['name'] for e in entities]),
+        'semantic': _embed_batch([_entity_text(e) for e in entities]) if entities else None,
+    }
 
-def align_cross_subject(entities1, entities2, name_prefilter=0.3):
-    """对齐两学科实体集合（倒排索引候选 + 名称预过滤）"""
+
+def _slice_vectors(vectors, start, end):
+    return {key: (value[start:end] if value is not None else None) for key, value in vectors.items()}
+
+
+def _top_k_neighbors(queries, base, k):
+    """每个查询向量在 base 中内积最大的 k 个下标（不保证顺序）"""
+    k = min(k, len(base))
+    if k == 0 or len(queries) == 0:
+        return np.zeros((len(queries), 0), dtype=np.int64)
+    if _HAS_FAISS:
+        index = faiss.IndexFlatIP(base.shape[1])
+        index.add(np.ascontiguousarray(base))
+        return index.search(np.ascontiguousarray(queries), k)[1]
+    result = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), _SEARCH_BLOCK):
+        sims = queries[start:start + _SEARCH_BLOCK] @ base.T
+        result[start:start + _SEARCH_BLOCK] = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return result
+
+
+def align_cross_subject(entities1, entities2, name_prefilter=0.3, vectors1=None, vectors2=None, top_k=ALIGN_TOP_K):
+    """
+    对齐两学科实体集合（字面 + 语义 top-k 近邻候选 + 名称预过滤）
+
+    vectors1 / vectors2: _entity_vectors 的结果，align_subjects 对全部知识点统一编码后传入，不传时现算
+    """
     if not entities1 or not entities2:
         return []
-    index2 = _candidate_index(entities2)
+    vectors1 = vectors1 or _entity_vectors(entities1)
+    vectors2 = vectors2 or _entity_vectors(entities2)
+    semantic1, semantic2 = vectors1['semantic'], vectors2['semantic']
+
+    neighbor_sets = [_top_k_neighbors(vectors1['ngram'], vectors2['ngram'], top_k)]
+    if semantic1 is not None and semantic2 is not None:
+        neighbor_sets.append(_top_k_neighbors(semantic1, semantic2, top_k))
+    neighbors = np.concatenate(neighbor_sets, axis=1)
+
     alignments = []
     processed = set()
-
-    for e1 in entities1:
+    for i, e1 in enumerate(entities1):
         name1 = e1['name']
-        cand_idx = set()
-        if _HAS_JIEBA:
-            tokens = [w for w in jieba.cut(name1) if len(w) >= 2]
-        else:
-            tokens = [name1[i:i + 2] for i in range(len(name1) - 1)] or [name1]
-        for tok in tokens:
-            cand_idx.update(index2.get(tok, []))
-        candidates = [entities2[i] for i in cand_idx] if cand_idx else entities2
-
         best, best_conf, best_feat = None, 0.0, None
-        for e2 in candidates:
+        for j in sorted(set(neighbors[i].tolist())):
+            e2 = entities2[j]
             if e2['kp_id'] in processed:
                 continue
             if _name_similarity(name1, e2['name']) < name_prefilter:
                 continue
-            conf, feat = _confidence(e1, e2)
+            sem = float(semantic1[i] @ semantic2[j]) if semantic1 is not None and semantic2 is not None else None
+            conf, feat = _confidence(e1, e2, sem=sem)
             if conf > best_conf:
                 best, best_conf, best_feat = e2, conf, feat
 
@@ -182,28 +203,35 @@ def align_cross_subject(entities1, entities2, name_prefilter=0.3):
     return alignments
 
 
-def align_subjects(subject_ids, max_per_subject=500):
-    """对科目集合两两跨学科对齐（数据源 MySQL），返回所有跨科目对齐对"""
+def align_subjects(subject_ids):
+    """对科目集合两两跨学科对齐（数据源 MySQL），返回所有跨科目对齐对；全部知识点参与，只编码一次"""
     from learning.models import KnowledgePoint
-    import random
 
+    started = time.perf_counter()
     by_subject = {}
-    qs = KnowledgePoint.objects.filter(subject_id__in=subject_ids).select_related('subject')
+    qs = KnowledgePoint.objects.filter(subject_id__in=subject_ids).select_related('subject').order_by('subject_id', 'id')
     for kp in qs:
         by_subject.setdefault(kp.subject_id, []).append({
             'name': kp.name, 'description': '', 'kp_id': kp.id,
             'subject': kp.subject.name, 'subject_id': kp.subject_id,
         })
-    # 采样限制防止 O(n^2) 爆炸；固定种子保证同一组科目结果可复现
-    rng = random.Random(42)
-    for sid, ents in by_subject.items():
-        if len(ents) > max_per_subject:
-            by_subject[sid] = rng.sample(ents, max_per_subject)
 
     sids = list(by_subject.keys())
+    all_entities = [e for sid in sids for e in by_subject[sid]]
+    all_vectors = _entity_vectors(all_entities)
+    vectors = {}
+    offset = 0
+    for sid in sids:
+        vectors[sid] = _slice_vectors(all_vectors, offset, offset + len(by_subject[sid]))
+        offset += len(by_subject[sid])
+
     all_alignments = []
     for i in range(len(sids)):
         for j in range(i + 1, len(sids)):
-            all_alignments.extend(align_cross_subject(by_subject[sids[i]], by_subject[sids[j]]))
-    logger.info("[fusion] 跨学科对齐完成，共 %s 对", len(all_alignments))
+            all_alignments.extend(align_cross_subject(
+                by_subject[sids[i]], by_subject[sids[j]],
+                vectors1=vectors[sids[i]], vectors2=vectors[sids[j]],
+            ))
+    logger.info("[fusion] 跨学科对齐完成，%s 个知识点，共 %s 对，耗时 %.2fs",
+                len(all_entities), len(all_alignments), time.perf_counter() - started)
     return all_alignments
@@ -9,10 +9,12 @@
   Step 1.5 Learn 四维语义对齐（等价->合并节点；泛化/应用->软关联边）
   Step 2+3 关系重映射 + 跨库去重 + 方向冲突消解
   Step 4   输出 {nodes, links} JSON（与单科 API 同构，前端零改动）
+全局节点、知识点映射、按科目去重的关系和语义对齐结果由 store.py 持久化并随知识点/关系的变化增量维护，
+fuse_graph 只读取所选科目的行，再做跨科目的语义合并与方向冲突消解。
 """
 import re
 import logging
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,9 @@ _REL_PRIORITY = {'前置': 4, '隶属': 3, '关联': 2, '相似': 1}
 # 无向关系类型：融合时按无序节点对去重
 _UNDIRECTED = {'关联', '相似'}
 
+# 读取 FusedEdge 时的关系行（_fuse_relations 按 source_id / target_id 映射到输出节点）
+_Edge = namedtuple('_Edge', 'source_id target_id relationship_type')
+
 
 def normalize_name(name: str) -> str:
     """实体名称规范化（同名合并判定键）：去空白/全角/大小写/常见标点"""
@@ -32,37 +37,26 @@ def normalize_name(name: str) -> str:
 
 
 # ====================== Step 1: 同名知识点对齐合并 ======================
-def _build_alignment(knowledge_points):
-    clusters = defaultdict(list)
-    for kp in knowledge_points:
-        clusters[normalize_name(kp.name)].append(kp)
-
-    kp_to_global = {}
-    global_nodes = {}
-
-    for norm, kps in clusters.items():
-        if not norm:  # 空名脏数据，各自独立
-            for kp in kps:
-                kp_to_global[kp.id] = kp.id
-                global_nodes[kp.id] = {
-                    'id': kp.id, 'name': kp.name,
-                    'subjects': [kp.subject.name], 'merged_count': 1,
-                    'cross_subject': False,
-                }
-            continue
-
-        global_id = min(kp.id for kp in kps)
-        display_name = min(kps, key=lambda k: k.id).name
-        subjects = sorted({kp.subject.name for kp in kps})
-        global_nodes[global_id] = {
-            'id': global_id, 'name': display_name,
-            'subjects': subjects, 'merged_count': len(kps),
-            'cross_subject': len(subjects) > 1,
-        }
-        for kp in kps:
-            kp_to_global[kp.id] = global_id
-
-    return kp_to_global, global_nodes
+def _build_alignment(members):
+    """
+    members: 所选科目的 (kp_id, 全局节点 id, 名称, 科目名)，按 kp_id 升序
+    返回 kp_to_global、node_rep（全局节点 -> 代表知识点）、global_nodes；
+    输出节点 id 取该节点在所选科目中最早创建的知识点 id
+    """
+    kp_to_global, node_rep, global_nodes = {}, {}, {}
+    for kp_id, node_id, name, subject_name in members:
+        gid = node_rep.setdefault(node_id, kp_id)
+        kp_to_global[kp_id] = gid
+        node = global_nodes.get(gid)
+        if node is None:
+            global_nodes[gid] = {'id': gid, 'name': name, 'subjects': {subject_name}, 'merged_count': 1}
+        else:
+            node['subjects'].add(subject_name)
+            node['merged_count'] += 1
+    for node in global_nodes.values():
+        node['subjects'] = sorted(node['subjects'])
+        node['cross_subject'] = len(node['subjects']) > 1
+    return kp_to_global, node_rep, global_nodes
 
 
 # ====================== Step 2+3: 关系重映射 + 去重 + 冲突消解 ======================
@@ -104,10 +98,12 @@ def fuse_graph(subject_ids=None, semantic=True):
 
     参数:
       subject_ids: 科目 id 列表。None/空 -> 融合全部科目。
-      semantic   : 是否启用 Learn 四维语义对齐。
+      semantic   : 是否应用已保存的 Learn 四维语义对齐结果（rebuild_fused_graph --realign 重算）。
     返回 dict（含 nodes/links + 融合统计 + 对齐对 alignments）。
+    融合图谱表尚未构建时排入后台构建任务，本次按所选科目现算，不带语义对齐（building 为 True）。
     """
-    from learning.models import Subject, KnowledgePoint, KnowledgeGraph, QMatrix
+    from learning.models import FusedEdge, FusedNodeMember, QMatrix, Subject
+    from .store import is_built, load_alignments, schedule_build, unbuilt_rows
 
     subjects = Subject.objects.all()
     if subject_ids:
@@ -120,56 +116,60 @@ def fuse_graph(subject_ids=None, semantic=True):
                 'merged_node_count': 0, 'cross_subject_node_count': 0,
                 'alignments': [], 'message': '无可融合的科目'}
 
-    knowledge_points = list(
-        KnowledgePoint.objects.filter(subject_id__in=subject_id_list).select_related('subject')
-    )
-    relationships = list(
-        KnowledgeGraph.objects.filter(subject_id__in=subject_id_list)
-        .only('source_id', 'target_id', 'relationship_type')
-    )
+    built = is_built()
+    if built:
+        members = FusedNodeMember.objects.filter(subject_id__in=subject_id_list).order_by(
+            'knowledge_point_id'
+        ).values_list('knowledge_point_id', 'node_id', 'knowledge_point__name', 'subject__name')
+    else:
+        schedule_build()
+        members, relationships = unbuilt_rows(subject_id_list)
 
-    # Step 1: 同名对齐合并
-    kp_to_global, global_nodes = _build_alignment(knowledge_points)
+    # Step 1: 同名对齐合并（读取全局节点映射）
+    kp_to_global, node_rep, global_nodes = _build_alignment(members)
 
-    # Step 1.5: 四维语义对齐
+    # Step 1.5: 四维语义对齐（读取已保存的对齐结果）
     semantic_merged = 0
     semantic_links = []
     alignment_pairs = []
-    if semantic and len(subject_id_list) >= 2:
-        try:
-            from .entity_alignment import align_subjects
-            alignments = align_subjects(subject_id_list)
-            alignment_pairs = alignments
-            for al in alignments:
-                gs = kp_to_global.get(al['source_kp_id'])
-                gt = kp_to_global.get(al['target_kp_id'])
-                if gs is None or gt is None or gs == gt:
-                    continue
-                if al['type'] == 'EquivalentTo':
-                    keep, drop = (gs, gt) if gs <= gt else (gt, gs)
-                    for kid, gid in list(kp_to_global.items()):
-                        if gid == drop:
-                            kp_to_global[kid] = keep
-                    if drop in global_nodes:
-                        dn = global_nodes.pop(drop)
-                        kn = global_nodes[keep]
-                        kn['subjects'] = sorted(set(kn.get('subjects', [])) | set(dn.get('subjects', [])))
-                        kn['merged_count'] = kn.get('merged_count', 1) + dn.get('merged_count', 1)
-                        kn['cross_subject'] = len(kn['subjects']) > 1
-                    semantic_merged += 1
-                else:
-                    semantic_links.append({
-                        'source': gs, 'target': gt, 'relationship_type': '相似',
-                        'type': 'bidirectional', 'arrow': False,
-                        'semantic': True, 'confidence': al['confidence'],
-                    })
-            logger.info("[fusion] 语义对齐：等价合并 %s，软关联 %s", semantic_merged, len(semantic_links))
-        except Exception as e:
-            import traceback
-            logger.warning("[fusion] 语义对齐失败（跳过）：%s\n%s", e, traceback.format_exc())
-
-    # Step 2+3: 关系重映射 + 去重 + 冲突消解
-    links = _fuse_relations(relationships, kp_to_global)
+    if semantic and built and len(subject_id_list) >= 2:
+        alignment_pairs = load_alignments(subject_id_list)
+        for al in alignment_pairs:
+            gs = kp_to_global.get(al['source_kp_id'])
+            gt = kp_to_global.get(al['target_kp_id'])
+            if gs is None or gt is None or gs == gt:
+                continue
+            if al['type'] == 'EquivalentTo':
+                keep, drop = (gs, gt) if gs <= gt else (gt, gs)
+                for kid, gid in list(kp_to_global.items()):
+                    if gid == drop:
+                        kp_to_global[kid] = keep
+                if drop in global_nodes:
+                    dn = global_nodes.pop(drop)
+                    kn = global_nodes[keep]
+                    kn['subjects'] = sorted(set(kn.get('subjects', [])) | set(dn.get('subjects', [])))
+                    kn['merged_count'] = kn.get('merged_count', 1) + dn.get('merged_count', 1)
+                    kn['cross_subject'] = len(kn['subjects']) > 1
+                semantic_merged += 1
+            else:
+                semantic_links.append({
+                    'source': gs, 'target': gt, 'relationship_type': '相似',
+                    'type': 'bidirectional', 'arrow': False,
+                    'semantic': True, 'confidence': al['confidence'],
+                })
+        logger.info("[fusion] 语义对齐：等价合并 %s，软关联 %s", semantic_merged, len(semantic_links))
+
+    # Step 2+3: 融合关系按全局节点重映射 + 跨科目去重 + 冲突消解
+    node_to_global = {node_id: kp_to_global[kp_id] for node_id, kp_id in node_rep.items()}
+    if built:
+        relationships = [
+            _Edge(*row) for row in FusedEdge.objects.filter(
+                subject_id__in=subject_id_list,
+                source_subject_id__in=subject_id_list,
+                target_subject_id__in=subject_id_list,
+            ).order_by('id').values_list('source_id', 'target_id', 'relationship_type')
+        ]
+    links = _fuse_relations(relationships, node_to_global)
 
     # 合并语义软关联边（去掉与已有边重复的节点对）
     if semantic_links:
@@ -213,7 +213,9 @@ def fuse_graph(subject_ids=None, semantic=True):
         'semantic_merged': semantic_merged,
         'semantic_links': len(semantic_links),
         'alignments': alignment_pairs,
+        'building': not built,
         'message': (f'融合 {len(subject_id_list)} 个科目：{len(nodes)} 节点'
                     f'（合并 {merged}，其中语义等价 {semantic_merged}），'
-                    f'{len(links)} 关系（含语义软关联 {len(semantic_links)}）'),
+                    f'{len(links)} 关系（含语义软关联 {len(semantic_links)}）'
+                    + ('' if built else '；融合图谱正在后台构建，语义对齐稍后可用')),
     }
@@ -0,0 +1,422 @@
+"""
+融合图谱持久化（learning.models 中的 FusedNode / FusedNodeMember / FusedEdge / FusedAlignment）
+======================================================================
+融合接口不再在每次请求时对所选科目的全部知识点和关系重算对齐、去重和语义对齐，而是读取预先算好的行：
+  - FusedNode       : 规范化名称（normalize_name）相同的知识点归为同一全局节点，空名知识点各自独立；
+                      显示名称取最早创建的成员的名称；
+  - FusedNodeMember : 知识点 -> 全局节点（附知识点所属科目）；
+  - FusedEdge       : 原始关系两端映射到全局节点后，按（科目, 节点对, 两端知识点科目, 关系类型）去重，
+                      support 记原始关系条数；保留科目维度，按所选科目读取时只取两端知识点都在所选科目中的关系，
+                      再消解方向冲突（与逐次现算的结果一致）；
+  - FusedAlignment  : 跨学科四维语义对齐结果。对齐需要全部知识点参与且较慢，作为输入保存，
+                      rebuild(realign=True) 时重算；知识点改名（规范化名称变化）后删除它的对齐。
+
+首次构建：python manage.py rebuild_fused_graph --realign；未执行时，第一次读取融合图谱会排入一条
+'fusion' 后台任务（run_training_worker 执行），任务完成前读取路径按所选科目现算节点和关系，不带语义对齐。
+
+增量维护：知识点、关系的保存 / 删除通过信号只重算涉及的全局节点及其关系；
+不触发信号的批量写入（graph_storage.save_to_django）写完后显式调用
+refresh_knowledge_points / refresh_relations。增量结果与 rebuild() 的全量结果一致，
+可用 python manage.py rebuild_fused_graph --check 核对。
+新建或改名的知识点还没有语义对齐，另排入一条只重算对齐的后台任务（已有排队中的则不重复排入）。
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from learning.models import (
+    FusedAlignment, FusedEdge, FusedNode, FusedNodeMember, KnowledgeGraph, KnowledgePoint, Subject, TrainingJob,
+)
+from .fusion import _UNDIRECTED, _Edge, normalize_name
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+
+# 后台任务的 task_key：全量构建（含语义对齐）/ 只重算语义对齐
+BUILD_TASK_KEY = 'fused_graph_build'
+REALIGN_TASK_KEY = 'fused_graph_realign'
+
+
+def node_key(kp_id, name):
+    """全局节点判定键：规范化名称；空名知识点（脏数据）各自独立"""
+    return normalize_name(name) or f"#{kp_id}"
+
+
+def _edge_counts(raw_edges, kp_node):
+    """
+    原始关系 [(科目, 源知识点, 目标知识点, 关系类型)] + {知识点: (节点, 科目)}
+    -> {(科目, 源节点, 目标节点, 源知识点科目, 目标知识点科目, 关系类型): 原始关系条数}
+    端点缺失或两端落在同一节点（自环）的关系丢弃；无向关系的两端按节点标识排序
+    """
+    counts = Counter()
+    for subject_id, source_id, target_id, rel_type in raw_edges:
+        source, target = kp_node.get(source_id), kp_node.get(target_id)
+        if source is None or target is None or source[0] == target[0]:
+            continue
+        rel_type = rel_type or '关联'
+        if rel_type in _UNDIRECTED and source[0] > target[0]:
+            source, target = target, source
+        counts[(subject_id, source[0], target[0], source[1], target[1], rel_type)] += 1
+    return counts
+
+
+# ====================== 全量构建 ======================
+def expected_state():
+    """按当前知识点和关系从头计算的融合结果（节点以 key 标识）"""
+    nodes, members = {}, {}
+    for kp_id, name, subject_id in KnowledgePoint.objects.order_by('id').values_list(
+        'id', 'name', 'subject_id'
+    ).iterator(chunk_size=2000):
+        key = node_key(kp_id, name)
+        nodes.setdefault(key, name)
+        members[kp_id] = (key, subject_id)
+    raw_edges = KnowledgeGraph.objects.values_list(
+        'subject_id', 'source_id', 'target_id', 'relationship_type'
+    ).iterator(chunk_size=2000)
+    return {'nodes': nodes, 'members': members, 'edges': dict(_edge_counts(raw_edges, members))}
+
+
+def current_state():
+    """融合图谱表中的结果，格式同 expected_state"""
+    keys, nodes = {}, {}
+    for node_id, key, name in FusedNode.objects.values_list('id', 'key', 'name'):
+        keys[node_id] = key
+        nodes[key] = name
+    members = {
+        kp_id: (keys[node_id], subject_id)
+        for kp_id, node_id, subject_id in FusedNodeMember.objects.values_list('knowledge_point_id', 'node_id', 'subject_id')
+    }
+    edges = {}
+    for subject_id, source_id, target_id, ss, ts, rel_type, support in FusedEdge.objects.values_list(
+        'subject_id', 'source_id', 'target_id', 'source_subject_id', 'target_subject_id', 'relationship_type', 'support'
+    ):
+        source, target = (keys[source_id], ss), (keys[target_id], ts)
+        if rel_type in _UNDIRECTED and source[0] > target[0]:
+            source, target = target, source
+        edges[(subject_id, source[0], target[0], source[1], target[1], rel_type)] = support
+    return {'nodes': nodes, 'members': members, 'edges': edges}
+
+
+def _compute_alignments():
+    from .entity_alignment import align_subjects
+    subject_ids = list(Subject.objects.values_list('id', flat=True))
+    if len(subject_ids) < 2:
+        return []
+    return align_subjects(subject_ids)
+
+
+def _replace_alignments(alignments):
+    # 对齐计算期间被删除的知识点不再写入
+    kp_ids = {al['source_kp_id'] for al in alignments} | {al['target_kp_id'] for al in alignments}
+    existing = set(KnowledgePoint.objects.filter(id__in=kp_ids).values_list('id', flat=True))
+    FusedAlignment.objects.all().delete()
+    FusedAlignment.objects.bulk_create(
+        [
+            FusedAlignment(source_id=al['source_kp_id'], target_id=al['target_kp_id'],
+                           align_type=al['type'], confidence=al['confidence'],
+                           features=al.get('features') or {})
+            for al in alignments
+            if al['source_kp_id'] in existing and al['target_kp_id'] in existing
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def rebuild(realign=False):
+    """
+    全量重建融合图谱表
+
+    realign: 同时对全部科目重新做四维语义对齐（较慢），否则沿用已保存的 FusedAlignment
+    Returns: {'nodes', 'members', 'edges', 'alignments'} 各表行数
+    """
+    alignments = _compute_alignments() if realign else None
+    state = expected_state()
+    with transaction.atomic():
+        if alignments is not None:
+            _replace_alignments(alignments)
+        FusedEdge.objects.all().delete()
+        FusedNodeMember.objects.all().delete()
+        FusedNode.objects.all().delete()
+
+        FusedNode.objects.bulk_create(
+            [FusedNode(key=key, name=name) for key, name in state['nodes'].items()],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # MySQL 的 bulk_create 不回填主键，重新查询
+        ids = dict(FusedNode.objects.values_list('key', 'id'))
+        FusedNodeMember.objects.bulk_create(
+            [
+                FusedNodeMember(knowledge_point_id=kp_id, node_id=ids[key], subject_id=subject_id)
+                for kp_id, (key, subject_id) in state['members'].items()
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        edges = []
+        for (subject_id, ks, kt, ss, ts, rel_type), support in state['edges'].items():
+            source, target = (ids[ks], ss), (ids[kt], ts)
+            if rel_type in _UNDIRECTED and source[0] > target[0]:
+                source, target = target, source
+            edges.append(FusedEdge(subject_id=subject_id, source_id=source[0], target_id=target[0],
+                                   source_subject_id=source[1], target_subject_id=target[1],
+                                   relationship_type=rel_type, support=support))
+        FusedEdge.objects.bulk_create(edges, batch_size=BULK_BATCH_SIZE)
+
+    counts = {
+        'nodes': len(state['nodes']), 'members': len(state['members']), 'edges': len(state['edges']),
+        'alignments': FusedAlignment.objects.count(),
+    }
+    logger.info("[fusion] 融合图谱重建完成：%s", counts)
+    return counts
+
+
+def realign():
+    """只重新做四维语义对齐，节点、成员和关系表不变"""
+    alignments = _compute_alignments()
+    with transaction.atomic():
+        _replace_alignments(alignments)
+    count = FusedAlignment.objects.count()
+    logger.info("[fusion] 语义对齐重算完成：%s 条", count)
+    return {'alignments': count}
+
+
+def is_built():
+    """融合图谱表已构建（没有任何知识点时视为已构建）"""
+    return FusedNode.objects.exists() or not KnowledgePoint.objects.exists()
+
+
+def _schedule(task_key, mode):
+    """排入一条 'fusion' 后台任务；同一 task_key 已有排队中的任务时不重复排入"""
+    from learning.training_jobs import enqueue_job
+    if TrainingJob.objects.filter(job_type='fusion', task_key=task_key, status='pending').exists():
+        return None
+    return enqueue_job('fusion', task_key, {'mode': mode})
+
+
+def schedule_build():
+    """融合图谱尚未构建时排入全量构建任务（读取路径调用，不在请求内构建）"""
+    if TrainingJob.objects.filter(job_type='fusion', task_key=BUILD_TASK_KEY, status='running').exists():
+        return None
+    return _schedule(BUILD_TASK_KEY, 'build')
+
+
+def schedule_realign():
+    return _schedule(REALIGN_TASK_KEY, 'realign')
+
+
+def run_fusion_job(reporter, mode='build'):
+    """run_training_worker 执行的 'fusion' 任务：build 全量构建并做语义对齐，realign 只重算语义对齐"""
+    if mode == 'realign':
+        reporter.update(progress=0, stage='语义对齐')
+        return realign()
+    reporter.update(progress=0, stage='构建融合图谱')
+    return rebuild(realign=True)
+
+
+def unbuilt_rows(subject_ids):
+    """
+    融合图谱表构建完成前，读取路径按所选科目现算的成员和关系（不含语义对齐）：
+    成员 (kp_id, 节点 key, 名称, 科目名) 按 kp_id 升序；关系为以节点 key 为端点的 _Edge
+    """
+    members, kp_node = [], {}
+    for kp_id, name, subject_name in KnowledgePoint.objects.filter(subject_id__in=subject_ids).order_by(
+        'id'
+    ).values_list('id', 'name', 'subject__name'):
+        key = node_key(kp_id, name)
+        members.append((kp_id, key, name, subject_name))
+        kp_node[kp_id] = key
+    relationships = [
+        _Edge(kp_node[source_id], kp_node[target_id], rel_type)
+        for source_id, target_id, rel_type in KnowledgeGraph.objects.filter(subject_id__in=subject_ids).order_by(
+            'id'
+        ).values_list('source_id', 'target_id', 'relationship_type')
+        if source_id in kp_node and target_id in kp_node
+    ]
+    return members, relationships
+
+
+# ====================== 增量维护 ======================
+def _ensure_nodes(names_by_key):
+    """key -> 节点 id，缺少的节点新建（显示名称随后由 _refresh_nodes 校正）"""
+    ids = dict(FusedNode.objects.filter(key__in=list(names_by_key)).values_list('key', 'id'))
+    missing = [key for key in names_by_key if key not in ids]
+    if missing:
+        FusedNode.objects.bulk_create(
+            [FusedNode(key=key, name=names_by_key[key]) for key in missing],
+            batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+        )
+        ids.update(FusedNode.objects.filter(key__in=missing).values_list('key', 'id'))
+    return ids
+
+
+def _refresh_nodes(node_ids):
+    """删除没有成员的节点，显示名称改为最早创建的成员的名称"""
+    first = {}
+    for node_id, name in FusedNodeMember.objects.filter(node_id__in=node_ids).order_by(
+        'knowledge_point_id'
+    ).values_list('node_id', 'knowledge_point__name'):
+        first.setdefault(node_id, name)
+    FusedNode.objects.filter(id__in=[n for n in node_ids if n not in first]).delete()
+    stale = []
+    for node in FusedNode.objects.filter(id__in=list(first)):
+        if node.name != first[node.id]:
+            node.name = first[node.id]
+            stale.append(node)
+    FusedNode.objects.bulk_update(stale, ['name'], batch_size=BULK_BATCH_SIZE)
+
+
+def _refresh_edges(node_ids):
+    """按当前原始关系重算与这些节点相连的融合关系"""
+    member_kps = list(FusedNodeMember.objects.filter(node_id__in=node_ids).values_list('knowledge_point_id', flat=True))
+    raw_edges = list(
+        KnowledgeGraph.objects.filter(Q(source_id__in=member_kps) | Q(target_id__in=member_kps))
+        .values_list('subject_id', 'source_id', 'target_id', 'relationship_type')
+    )
+    endpoints = {e[1] for e in raw_edges} | {e[2] for e in raw_edges}
+    kp_node = {
+        kp_id: (node_id, subject_id)
+        for kp_id, node_id, subject_id in FusedNodeMember.objects.filter(
+            knowledge_point_id__in=endpoints
+        ).values_list('knowledge_point_id', 'node_id', 'subject_id')
+    }
+    wanted = _edge_counts(raw_edges, kp_node)
+
+    stale_ids, changed = [], []
+    for edge in FusedEdge.objects.filter(Q(source_id__in=node_ids) | Q(target_id__in=node_ids)):
+        key = (edge.subject_id, edge.source_id, edge.target_id, edge.source_subject_id, edge.target_subject_id,
+               edge.relationship_type)
+        support = wanted.pop(key, None)
+        if support is None:
+            stale_ids.append(edge.id)
+        elif support != edge.support:
+            edge.support = support
+            changed.append(edge)
+    FusedEdge.objects.filter(id__in=stale_ids).delete()
+    FusedEdge.objects.bulk_update(changed, ['support'], batch_size=BULK_BATCH_SIZE)
+    FusedEdge.objects.bulk_create(
+        [
+            FusedEdge(subject_id=subject_id, source_id=gs, target_id=gt, source_subject_id=ss, target_subject_id=ts,
+                      relationship_type=rel_type, support=support)
+            for (subject_id, gs, gt, ss, ts, rel_type), support in wanted.items()
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def refresh_knowledge_points(kp_ids=(), node_ids=()):
+    """
+    知识点新建 / 改名 / 删除后同步融合图谱
+
+    kp_ids: 新建或改名的知识点（不存在的忽略）
+    node_ids: 另外需要重算的节点（被删除知识点原先所在的节点）
+    归属节点或科目变化的知识点改写成员行（节点变化时删除它的语义对齐）；涉及的节点重算融合关系、显示名称，空节点删除
+    """
+    if not FusedNode.objects.exists():
+        # 尚未构建（或全部知识点已删除）：由 rebuild_fused_graph 或后台构建任务全量构建
+        return
+    affected = set(node_ids)
+    touched = set(node_ids)
+    with transaction.atomic():
+        kps = {
+            kp_id: (name, subject_id)
+            for kp_id, name, subject_id in KnowledgePoint.objects.filter(id__in=list(kp_ids)).values_list(
+                'id', 'name', 'subject_id'
+            )
+        }
+        if kps:
+            wanted = {kp_id: node_key(kp_id, name) for kp_id, (name, _) in kps.items()}
+            current = {
+                kp_id: (node_id, subject_id)
+                for kp_id, node_id, subject_id in FusedNodeMember.objects.filter(
+                    knowledge_point_id__in=list(kps)
+                ).values_list('knowledge_point_id', 'node_id', 'subject_id')
+            }
+            ids = _ensure_nodes({key: kps[kp_id][0] for kp_id, key in wanted.items()})
+            moved = [kp_id for kp_id, key in wanted.items() if current.get(kp_id) != (ids[key], kps[kp_id][1])]
+            existing = [kp_id for kp_id in moved if kp_id in current]
+            renamed = [kp_id for kp_id in existing if current[kp_id][0] != ids[wanted[kp_id]]]
+            affected.update(current[kp_id][0] for kp_id in existing)
+            affected.update(ids[wanted[kp_id]] for kp_id in moved)
+            touched.update(ids[key] for key in wanted.values())
+            touched.update(affected)
+
+            FusedNodeMember.objects.filter(knowledge_point_id__in=existing).delete()
+            FusedNodeMember.objects.bulk_create(
+                [
+                    FusedNodeMember(knowledge_point_id=kp_id, node_id=ids[wanted[kp_id]], subject_id=kps[kp_id][1])
+                    for kp_id in moved
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            FusedAlignment.objects.filter(Q(source_id__in=renamed) | Q(target_id__in=renamed)).delete()
+            # 新知识点和改名后的知识点没有语义对齐，提交后排入重算任务
+            if (renamed or len(existing) < len(moved)) and Subject.objects.count() >= 2:
+                transaction.on_commit(schedule_realign)
+        if affected:
+            _refresh_edges(affected)
+        if touched:
+            _refresh_nodes(touched)
+
+
+def refresh_relations(kp_ids):
+    """原始关系新建 / 修改 / 删除后，重算两端知识点所在节点的融合关系"""
+    node_ids = set(
+        FusedNodeMember.objects.filter(knowledge_point_id__in=list(kp_ids)).values_list('node_id', flat=True)
+    )
+    if node_ids:
+        with transaction.atomic():
+            _refresh_edges(node_ids)
+
+
+def load_alignments(subject_ids):
+    """两端都在所选科目中的语义对齐，格式同 entity_alignment.align_subjects"""
+    rows = FusedAlignment.objects.filter(
+        source__subject_id__in=subject_ids, target__subject_id__in=subject_ids
+    ).order_by('id').values_list(
+        'source_id', 'target_id', 'source__name', 'target__name', 'align_type', 'confidence', 'features',
+        'source__subject__name', 'target__subject__name',
+    )
+    return [
+        {
+            'source_kp_id': source_id, 'target_kp_id': target_id, 'source': source, 'target': target,
+            'type': align_type, 'confidence': confidence, 'features': features,
+            'source_subject': source_subject, 'target_subject': target_subject,
+        }
+        for source_id, target_id, source, target, align_type, confidence, features, source_subject, target_subject
+        in rows
+    ]
+
+
+# ====================== 信号 ======================
+@receiver(post_save, sender=KnowledgePoint)
+def _knowledge_point_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_knowledge_points([instance.id])
+
+
+@receiver(pre_delete, sender=KnowledgePoint)
+def _knowledge_point_deleting(sender, instance, **kwargs):
+    # 成员行随知识点级联删除，先记下原先所在的节点
+    instance._fused_node_id = FusedNodeMember.objects.filter(
+        knowledge_point_id=instance.id
+    ).values_list('node_id', flat=True).first()
+
+
+@receiver(post_delete, sender=KnowledgePoint)
+def _knowledge_point_deleted(sender, instance, **kwargs):
+    node_id = getattr(instance, '_fused_node_id', None)
+    if node_id is not None:
+        refresh_knowledge_points(node_ids=[node_id])
+
+
+@receiver(post_save, sender=KnowledgeGraph)
+@receiver(post_delete, sender=KnowledgeGraph)
+def _knowledge_graph_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_relations([instance.source_id, instance.target_id])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ExerciseFile, Subject, Dataset, DiagnosisModel
+from .models import ExerciseFile, Subject, Dataset, DiagnosisModel, TrainingJob
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
@@ -80,3 +80,11 @@ class DiagnosisModelAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(TrainingJob)
+class TrainingJobAdmin(admin.ModelAdmin):
+    list_display = ['task_key', 'job_type', 'status', 'progress', 'stage', 'worker', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['job_type', 'status', 'created_at']
+    search_fields = ['task_key']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'heartbeat_at']
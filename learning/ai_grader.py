@@ -12,6 +12,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # ========= Django 专用导入 =========
 from django.conf import settings
 from learning.models import AnswerLog, Exercise
+from learning.mastery_snapshot import refresh_for_answer_log
 from decimal import Decimal
 
 # ====================== API配置 ======================
@@ -303,6 +304,7 @@ def grade_single_answer(answer_log_id):
         answer_log.grading_confidence = Decimal("0.85")
         answer_log.is_correct = None
         answer_log.save()
+        refresh_for_answer_log(answer_log)
         print(f"✅ 批改完成，最终得分：{final_score}\n")
         return final_score
     except Exception as e:
@@ -0,0 +1,97 @@
+"""
+主观题答案本地预评分：同一道题的答案先聚类，每个紧密簇只让大模型评代表答案
+
+  - 同一道题的全部答案一次性向量化：字符 1~2 元组哈希到 VECTOR_DIM 维，TF-IDF 加权后单位化。
+    近似答案（多写/少写几个字、换了个词、标点不同）的余弦相似度很高，完全不同的答案接近 0；
+  - 贪心取中心聚类：每轮取“相似度 ≥ 阈值的邻居”最多的未分配答案作为代表，把它的未分配邻居
+    划入该簇。簇内每个成员与代表的相似度都不低于阈值，不会像单链接那样沿着一串相似答案越链越远；
+  - 成员沿用代表的得分，评分可信度按与代表的距离线性下降（get_member_confidence）：
+    与代表完全相同仍为 BASE_CONFIDENCE，恰好在阈值上时降低 MAX_CONFIDENCE_DROP。
+默写题按逐字比对评分，不调用大模型，不参与聚类。
+"""
+
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from learning.ai_scoring.grading_cache import normalize_answer
+
+# 余弦相似度不低于该值的答案才会归入同一簇（可在 settings.AI_PREGRADE_SIMILARITY 中覆盖，设为 None 关闭）
+SIMILARITY_THRESHOLD = 0.8
+VECTOR_DIM = 4096
+NGRAM_RANGE = (1, 2)
+
+BASE_CONFIDENCE = 0.85
+MAX_CONFIDENCE_DROP = 0.3
+
+
+def similarity_threshold():
+    return getattr(settings, 'AI_PREGRADE_SIMILARITY', SIMILARITY_THRESHOLD)
+
+
+def _ngram_ids(text):
+    text = normalize_answer(text).lower()
+    ids = []
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if not gram.strip():
+                continue
+            ids.append(zlib.crc32(gram.encode('utf-8')) % VECTOR_DIM)
+    return ids
+
+
+def embed_answers(texts):
+    """一道题的全部答案 -> (n, VECTOR_DIM) 单位向量矩阵（float32）"""
+    counts = np.zeros((len(texts), VECTOR_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        ids = _ngram_ids(text)
+        if ids:
+            np.add.at(counts[row], ids, 1.0)
+    # 在同一道题的答案内部计算 IDF：大家都写到的套话权重低，区分答案的内容权重高
+    df = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+    vectors = np.sqrt(counts) * idf.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cluster_answers(texts, threshold=None):
+    """
+    Returns:
+        list[(代表下标, [(成员下标, 与代表的相似度), ...])]，成员不含代表本身；
+        每个答案恰好出现在一个簇中，单独成簇的答案成员列表为空
+    """
+    if threshold is None:
+        threshold = similarity_threshold()
+    n = len(texts)
+    if n == 0:
+        return []
+    if threshold is None or n == 1:
+        return [(i, []) for i in range(n)]
+
+    vectors = embed_answers(texts)
+    sims = vectors @ vectors.T
+    adjacent = sims >= threshold
+    unassigned = np.ones(n, dtype=bool)
+    clusters = []
+    while unassigned.any():
+        degrees = adjacent[:, unassigned].sum(axis=1)
+        degrees[~unassigned] = -1
+        rep = int(np.argmax(degrees))
+        members = np.flatnonzero(adjacent[rep] & unassigned)
+        unassigned[members] = False
+        unassigned[rep] = False
+        clusters.append((rep, [(int(m), float(min(sims[rep, m], 1.0))) for m in members if m != rep]))
+    return clusters
+
+
+def get_member_confidence(similarity, threshold=None):
+    """与代表的余弦距离越大可信度越低：距离 0 为 BASE_CONFIDENCE，距离达到 1 - 阈值时降低 MAX_CONFIDENCE_DROP"""
+    if threshold is None:
+        threshold = similarity_threshold()
+    span = max(1.0 - (threshold or 0.0), 1e-6)
+    distance = min(max(1.0 - similarity, 0.0), span)
+    return round(BASE_CONFIDENCE - MAX_CONFIDENCE_DROP * distance / span, 3)
@@ -0,0 +1,330 @@
+"""
+主观题批量智能体评分（在 run_training_worker 的任务子进程中执行，任务类型 grading）
+
+与逐条调用 auto_score_answer 的区别：
+  - 用 httpx.AsyncClient 异步请求，每道题的 DeepSeek / Kimi / 讯飞评分同时发出，多道题并发评分；
+  - 每个评分模型一个令牌桶限速（PROVIDER_RATE_LIMITS，可在 settings.AI_GRADING_RATE_LIMITS 中覆盖），
+    代替全局 rate_limit() 锁和 KIMI_DELAY 固定等待；
+  - 相同题目的相同答案（按 grading_cache 的内容缓存键）只评一次，已在缓存中的直接使用；
+  - 同一道题的近似答案先在本地聚类（answer_clustering），每个紧密簇只评代表答案，
+    其余成员沿用代表的得分，评分可信度按与代表的距离降低；
+  - 每道题评完立即写入评分缓存（grading_cache），每 FLUSH_SIZE 道题 bulk_update 一次 AnswerLog。
+    任务中断后重新提交，已写回的记录不再是待批改状态，已评分但未写回的记录直接使用缓存结果，
+    不会重复调用大模型。
+提示词、分数解析、仲裁规则与 scoring_agent 的同步评分完全相同。
+"""
+
+import asyncio
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from learning.ai_scoring.answer_clustering import cluster_answers, get_member_confidence, similarity_threshold
+from learning.ai_scoring.scoring_agent import (
+    MAX_RETRIES, XUNFEI_MAX_RETRIES, XUNFEI_TIMEOUT,
+    answer_cache_key, apply_agent_result, build_api_request, build_arbitration_prompt, build_extract_prompt,
+    build_result, build_scoring_prompt, cache_result, cached_scores, exact_word_match_scoring, format_process,
+    get_cached_score, grading_inputs, is_dictation, needs_arbitration, parse_model_score, parse_rubric_components,
+    parse_score_response, round_to_half, store_scores, weighted_score, _DEFAULT_COMPONENTS,
+)
+from learning.mastery_snapshot import refresh_snapshots
+from learning.models import AnswerLog, User
+
+# 每个评分模型的 (每秒请求数, 突发上限)
+PROVIDER_RATE_LIMITS = {
+    'deepseek': (5.0, 5),
+    'kimi': (1.0, 1),
+    'xunfei': (2.0, 2),
+}
+MAX_CONCURRENT_ANSWERS = 16
+FLUSH_SIZE = 20
+REQUEST_TIMEOUT = 60
+
+_UPDATE_FIELDS = ['is_correct', 'score', 'ai_feedback', 'graded_at', 'graded_by', 'grading_confidence']
+
+
+class TokenBucket:
+    """异步令牌桶：平均每秒 rate 个请求，最多累积 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def pending_logs(subject_id):
+    """科目下待批改的主观题答题记录（与原批量批改的筛选条件相同）"""
+    return AnswerLog.objects.filter(
+        exercise__subject_id=int(subject_id),
+        exercise__question_type__in=['5'],
+        is_correct__isnull=True,
+    ).exclude(text_answer__isnull=True).exclude(text_answer='')
+
+
+def _make_buckets():
+    limits = dict(PROVIDER_RATE_LIMITS)
+    limits.update(getattr(settings, 'AI_GRADING_RATE_LIMITS', {}) or {})
+    return {api_type: TokenBucket(rate, capacity) for api_type, (rate, capacity) in limits.items()}
+
+
+async def _chat(client, buckets, api_type, prompt):
+    """异步调用一个评分模型；429 时指数退避。DeepSeek / Kimi 最终失败抛异常，讯飞失败返回 None（与同步版一致）"""
+    url, headers, payload = build_api_request(api_type, prompt)
+    max_retries = XUNFEI_MAX_RETRIES if api_type == 'xunfei' else MAX_RETRIES
+    timeout = XUNFEI_TIMEOUT if api_type == 'xunfei' else REQUEST_TIMEOUT
+    last_error = None
+
+    for attempt in range(max_retries):
+        await buckets[api_type].acquire()
+        try:
+            resp = await client.post(url, headers=headers, json=payload, timeout=timeout)
+            if resp.status_code == 429:
+                wait = (2 ** attempt) * 2
+                print(f"[WARN] {api_type} 触发限流(429)，等待 {wait} 秒后重试...")
+                last_error = '429'
+                await asyncio.sleep(wait)
+                continue
+            resp.raise_for_status()
+            return resp.json()["choices"][0]["message"]["content"]
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"[WARN] {api_type} 第{attempt + 1}次尝试失败：{e}")
+            last_error = e
+            if attempt < max_retries - 1:
+                await asyncio.sleep(attempt + 1)
+
+    if api_type == 'xunfei':
+        print("[ERROR] 讯飞星火调用失败（已达最大重试次数）")
+        return None
+    raise RuntimeError(f"{api_type} 调用失败：{last_error}")
+
+
+async def score_answer_async(client, buckets, inputs):
+    """一道题的三模型仲裁评分，返回 (ds_score, km_score, xf_score, final_score, process)"""
+    question, answer = inputs['question'], inputs['student_answer']
+    full, key_points, std_answer = inputs['full_score'], inputs['key_points'], inputs['std_answer']
+    if is_dictation(key_points, std_answer):
+        return exact_word_match_scoring(question, answer, full, key_points, std_answer)
+
+    try:
+        components = parse_rubric_components(
+            await _chat(client, buckets, 'deepseek', build_extract_prompt(question, key_points, std_answer, answer))
+        )
+    except Exception as e:
+        print(f"[WARN] 组件提取失败：{e}")
+        components = dict(_DEFAULT_COMPONENTS)
+
+    prompt = build_scoring_prompt(key_points, components, answer, full)
+    ds_raw, km_raw, xf_raw = await asyncio.gather(
+        _chat(client, buckets, 'deepseek', prompt),
+        _chat(client, buckets, 'kimi', prompt),
+        _chat(client, buckets, 'xunfei', prompt),
+        return_exceptions=True,
+    )
+    for raw in (ds_raw, km_raw):
+        if isinstance(raw, BaseException):
+            raise raw
+    ds_score, ds_reason = parse_model_score(ds_raw)
+    km_score, km_reason = parse_model_score(km_raw)
+    xf_score, xf_reason = parse_model_score(None if isinstance(xf_raw, BaseException) else xf_raw)
+
+    total = None
+    if needs_arbitration(full, ds_score, km_score, xf_score):
+        try:
+            arb_raw = await _chat(client, buckets, 'deepseek', build_arbitration_prompt(
+                question, answer, full, key_points, std_answer,
+                ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason
+            ))
+            total = round_to_half(parse_score_response(arb_raw)[0])
+        except Exception as e:
+            print(f"[WARN] 仲裁失败：{e}")
+    if total is None:
+        total = weighted_score(ds_score, km_score, xf_score)
+
+    return ds_score, km_score, xf_score, total, format_process(ds_score, km_score, xf_score, total, ds_reason)
+
+
+async def _grade_one(client, buckets, semaphore, key, inputs):
+    async with semaphore:
+        try:
+            scores = await score_answer_async(client, buckets, inputs)
+        except Exception as e:
+            print(f"[ERROR] 判分失败 错误:{str(e)}")
+            return key, None, str(e)
+    store_scores(inputs, scores)
+    return key, scores, None
+
+
+async def _grade_all(to_grade, concurrency, on_done):
+    """to_grade: {内容缓存键: 评分输入}，每个键评一次，结果交给 on_done(键, 分数元组或 None, 错误)"""
+    buckets = _make_buckets()
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency * 3, max_keepalive_connections=concurrency * 3)
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = [_grade_one(client, buckets, semaphore, key, inputs) for key, inputs in to_grade.items()]
+        for finished in asyncio.as_completed(tasks):
+            await on_done(*await finished)
+
+
+def _cluster_pending(to_grade, threshold):
+    """
+    把待评分答案按题目分组后聚类，簇成员从 to_grade 中移除
+
+    Returns:
+        dict: 代表答案的内容缓存键 -> [(成员的内容缓存键, 与代表的相似度)]
+    """
+    by_exercise = {}
+    for key, inputs in to_grade.items():
+        if is_dictation(inputs['key_points'], inputs['std_answer']):
+            continue
+        exercise = (inputs['question'], inputs['key_points'], inputs['std_answer'], inputs['full_score'])
+        by_exercise.setdefault(exercise, []).append(key)
+
+    members = {}
+    for keys in by_exercise.values():
+        texts = [to_grade[key]['student_answer'] for key in keys]
+        for rep, group in cluster_answers(texts, threshold):
+            if group:
+                members[keys[rep]] = [(keys[m], sim) for m, sim in group]
+    for group in members.values():
+        for key, _ in group:
+            del to_grade[key]
+    return members
+
+
+def run_batch_grading(subject_id, grader_id, reporter=None, concurrency=MAX_CONCURRENT_ANSWERS, pregrade=True):
+    """
+    批改科目下全部待批改主观题（TrainingJob 任务 grading 的执行体）
+
+    pregrade=False 时不做近似答案聚类，每个不同答案都调用大模型评分。
+
+    Returns:
+        dict: total、success_count、fail_count、resumed_count（直接使用缓存结果的条数）、
+              graded_count（实际调用大模型评分的不同答案数）、
+              clustered_count（沿用相似答案评分的不同答案数）、seconds、
+              results（每条记录的得分/判定或错误信息）
+    """
+    started = time.perf_counter()
+    grader = User.objects.get(id=grader_id)
+    logs = {log.id: log for log in pending_logs(subject_id).select_related('exercise', 'student').order_by('id')}
+    total = len(logs)
+
+    ready = []       # 已有缓存结果：上次中断前评完但未写回，或相同答案已评过分
+    to_grade = {}    # 内容缓存键 -> 评分输入，相同答案只评一次
+    waiting = {}     # 内容缓存键 -> [(答题记录ID, 评分输入)]
+    for log_id, log in logs.items():
+        inputs = grading_inputs(log)
+        cached = get_cached_score(log_id)
+        if cached and cached.get('success') and cached.get('student_answer') == inputs['student_answer']:
+            ready.append((log_id, cached))
+            continue
+        scores = cached_scores(inputs)
+        if scores is not None:
+            result = build_result(inputs, *scores)
+            cache_result(log_id, result)
+            ready.append((log_id, result))
+            continue
+        key = answer_cache_key(inputs)
+        to_grade.setdefault(key, inputs)
+        waiting.setdefault(key, []).append((log_id, inputs))
+
+    threshold = similarity_threshold() if pregrade else None
+    members = _cluster_pending(to_grade, threshold) if threshold is not None else {}
+
+    outcomes = {}
+    unsaved = []
+    graded_students = set()
+
+    def flush():
+        """把已评分的记录批量写回；期间已被教师手动批改的记录不覆盖"""
+        batch = unsaved[:]
+        unsaved.clear()
+        still_pending = set(AnswerLog.objects.filter(
+            id__in=[log_id for log_id, _ in batch], is_correct__isnull=True
+        ).values_list('id', flat=True))
+        now = timezone.now()
+        objects = []
+        for log_id, result in batch:
+            if log_id in still_pending:
+                apply_agent_result(logs[log_id], result, grader, now)
+                objects.append(logs[log_id])
+                graded_students.add(logs[log_id].student_id)
+        if objects:
+            AnswerLog.objects.bulk_update(objects, _UPDATE_FIELDS)
+        if reporter:
+            reporter.update(progress=len(outcomes) / total * 100 if total else 100.0,
+                            stage=f"已批改 {len(outcomes)}/{total}")
+
+    def record(log_id, result):
+        outcomes[log_id] = result
+        if result.get('success'):
+            unsaved.append((log_id, result))
+
+    for log_id, result in ready:
+        record(log_id, result)
+    flush()
+
+    async_flush = sync_to_async(flush)
+
+    async def on_done(key, scores, error):
+        # 代表答案失败时，沿用它评分的成员一并记为失败，重新提交任务时再评
+        for member_key, similarity in [(key, None)] + members.get(key, []):
+            for log_id, inputs in waiting[member_key]:
+                if scores is None:
+                    record(log_id, {'success': False, 'error': error, 'final_score': 0.0})
+                    continue
+                result = build_result(inputs, *scores)
+                if similarity is not None:
+                    result['confidence'] = get_member_confidence(similarity, threshold)
+                    result['process'] += f"\n【相似答案】沿用相似答案的评分（相似度 {similarity:.2f}）"
+                print(f"[OK] 判分完成！ID:{log_id} 得分:{result['final_score']}")
+                cache_result(log_id, result)
+                record(log_id, result)
+        if len(unsaved) >= FLUSH_SIZE:
+            await async_flush()
+
+    if to_grade:
+        asyncio.run(_grade_all(to_grade, max(1, int(concurrency)), on_done))
+    flush()
+
+    if graded_students:
+        refresh_snapshots(graded_students, subject_id)
+
+    results = []
+    for log_id, log in logs.items():
+        result = outcomes[log_id]
+        if result.get('success'):
+            results.append({
+                'log_id': log_id,
+                'student': log.student.username,
+                'final_score': result['final_score'],
+                'is_correct': log.is_correct,
+            })
+        else:
+            results.append({'log_id': log_id, 'student': log.student.username, 'error': result.get('error', '评分失败')})
+    success_count = sum(1 for r in results if 'error' not in r)
+    return {
+        'total': total,
+        'success_count': success_count,
+        'fail_count': total - success_count,
+        'resumed_count': len(ready),
+        'graded_count': len(to_grade),
+        'clustered_count': sum(len(group) for group in members.values()),
+        'seconds': round(time.perf_counter() - started, 1),
+        'results': results,
+    }
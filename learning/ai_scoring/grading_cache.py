@@ -0,0 +1,172 @@
+"""
+智能体评分缓存（SQLite，多个 gunicorn worker / 后台任务进程共用一个文件）
+
+两类数据：
+  answer_cache  按内容寻址的评分结果：键为 (题目, 评分标准, 标准答案, 满分, 归一化后的学生答案, 评分方式, 提示词版本)
+                的 SHA-256。不同学生的相同答案（默写题尤其常见）只评一次；修改题目、评分标准或提示词
+                （PROMPT_VERSION）后键随之变化，旧条目按 LRU / TTL 自然淘汰。
+  log_results   每条答题记录最近一次的评分结果（含教师手动评分的合并信息），供批改页和学生答题结果页展示。
+每次写入只插入/覆盖一行，不再整体重写 data/scoring_cache.json；旧文件中的记录在首次打开时导入 log_results。
+命中/未命中次数记在 stats 表中，所有进程累计。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+from learning import sqlite_cache
+
+# 评分提示词或打分规则变化时递增，使旧的内容缓存失效
+PROMPT_VERSION = 1
+
+DEFAULT_CACHE_PATH = os.path.join(settings.BASE_DIR, "data", "grading_cache.sqlite3")
+LEGACY_JSON_PATH = os.path.join(settings.BASE_DIR, "data", "scoring_cache.json")
+
+MAX_ENTRIES = 200000
+TTL_SECONDS = 180 * 24 * 3600
+# 每写入这么多条内容缓存检查一次淘汰
+EVICT_EVERY = 500
+
+_local = threading.local()
+_write_count = 0
+_write_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answer_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answer_cache_last_access ON answer_cache (last_access);
+CREATE TABLE IF NOT EXISTS log_results (
+    log_id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _cache_path():
+    return getattr(settings, 'AI_GRADING_CACHE_PATH', None) or DEFAULT_CACHE_PATH
+
+
+def _connect():
+    """每个进程、每个线程一个连接（sqlite3 连接不能跨线程，fork 出的子进程也不能沿用父进程的连接）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite_cache.connect(_cache_path())
+    conn.executescript(_SCHEMA)
+    _import_legacy_json(conn)
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _import_legacy_json(conn):
+    if not os.path.exists(LEGACY_JSON_PATH):
+        return
+    if conn.execute("SELECT 1 FROM log_results LIMIT 1").fetchone():
+        return
+    try:
+        with open(LEGACY_JSON_PATH, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except Exception:
+        return
+    now = time.time()
+    conn.executemany(
+        "INSERT OR IGNORE INTO log_results (log_id, value, updated_at) VALUES (?, ?, ?)",
+        [(int(log_id), json.dumps(result, ensure_ascii=False), now)
+         for log_id, result in legacy.items() if str(log_id).isdigit()],
+    )
+
+
+def _count(name, n=1):
+    _connect().execute(
+        "INSERT INTO stats (name, count) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET count = count + ?",
+        (name, n, n),
+    )
+
+
+# ---------------- 按内容寻址的评分结果 ----------------
+def normalize_answer(text):
+    """全角/半角统一、去首尾空白、连续空白合并，格式差异不影响命中"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def answer_key(question, key_points, std_answer, full, answer, provider):
+    payload = json.dumps(
+        [PROMPT_VERSION, provider, question or '', key_points or '', std_answer or '', float(full), answer],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_answer_result(key):
+    row = _connect().execute("SELECT value, created_at FROM answer_cache WHERE key = ?", (key,)).fetchone()
+    now = time.time()
+    if row is None or now - row[1] > TTL_SECONDS:
+        _count('miss')
+        return None
+    _connect().execute("UPDATE answer_cache SET last_access = ? WHERE key = ?", (now, key))
+    _count('hit')
+    return json.loads(row[0])
+
+
+def set_answer_result(key, value):
+    global _write_count
+    now = time.time()
+    _connect().execute(
+        "INSERT OR REPLACE INTO answer_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+        (key, json.dumps(value, ensure_ascii=False), now, now),
+    )
+    with _write_lock:
+        _write_count += 1
+        due = _write_count % EVICT_EVERY == 0
+    if due:
+        evict()
+
+
+def evict():
+    """删除超过 TTL 的条目；总数超过 MAX_ENTRIES 时再按最近访问时间删除最旧的"""
+    sqlite_cache.prune(_connect(), 'answer_cache', TTL_SECONDS, MAX_ENTRIES)
+
+
+def cache_stats():
+    conn = _connect()
+    counts = dict(conn.execute("SELECT name, count FROM stats").fetchall())
+    hits, misses = counts.get('hit', 0), counts.get('miss', 0)
+    return {
+        'entries': conn.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0],
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }
+
+
+# ---------------- 每条答题记录的评分结果 ----------------
+def get_log_result(log_id):
+    row = _connect().execute("SELECT value FROM log_results WHERE log_id = ?", (int(log_id),)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def set_log_result(log_id, result):
+    _connect().execute(
+        "INSERT OR REPLACE INTO log_results (log_id, value, updated_at) VALUES (?, ?, ?)",
+        (int(log_id), json.dumps(result, ensure_ascii=False), time.time()),
+    )
+
+
+def delete_log_results(log_ids):
+    _connect().executemany("DELETE FROM log_results WHERE log_id = ?", [(int(log_id),) for log_id in log_ids])
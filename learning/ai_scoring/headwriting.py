@@ -12,6 +12,7 @@ from PIL import Image, ImageEnhance, ImageFilter
 
 from django.conf import settings
 from learning.models import AnswerLog, Exercise, User
+from learning.mastery_snapshot import refresh_for_answer_log
 
 # ==================== 配置 ====================
 API_KEY = "cfEHl6knqWydoBVBIhhuRft6"
@@ -128,7 +129,7 @@ def batch_ocr_to_django():
             exercise = Exercise.objects.get(id=question_id)
             student = User.objects.get(username=student_id)
 
-            AnswerLog.objects.update_or_create(
+            answer_log, _ = AnswerLog.objects.update_or_create(
                 student=student,
                 exercise=exercise,
                 defaults={
@@ -136,6 +137,7 @@ def batch_ocr_to_django():
                     "subject": exercise.subject
                 }
             )
+            refresh_for_answer_log(answer_log)
             success_count += 1
             with open(OUTPUT_TXT, 'a', encoding='utf-8') as f:
                 f.write(f"{student_id}-{question_id}-{ocr_text}\n")
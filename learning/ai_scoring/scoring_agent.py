@@ -8,6 +8,9 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from django.conf import settings
 from learning.models import Exercise, AnswerLog
+from learning.ai_scoring.grading_cache import (
+    answer_key, get_answer_result, get_log_result, normalize_answer, set_answer_result, set_log_result,
+)
 
 BASE_DIR = settings.BASE_DIR
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -35,33 +38,6 @@ KIMI_DELAY = 1.0
 last_request_time = 0
 time_lock = threading.Lock()
 
-# 评分结果缓存（文件持久化，服务器重启不丢失，不改变数据库）
-SCORING_CACHE_FILE = os.path.join(DATA_DIR, "scoring_cache.json")
-_cache_lock = threading.Lock()
-
-
-def _load_cache():
-    """从文件加载缓存"""
-    if os.path.exists(SCORING_CACHE_FILE):
-        try:
-            with open(SCORING_CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
-
-
-def _save_cache(cache):
-    """保存缓存到文件"""
-    try:
-        with open(SCORING_CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False)
-    except Exception:
-        pass
-
-
-_scoring_result_cache = _load_cache()
-
 try:
     import openpyxl
     from openpyxl.styles import Font, Alignment, PatternFill
@@ -89,7 +65,21 @@ def round_to_half(value):
     return round(value * 2) / 2.0
 
 
-def call_api_with_retry(api_type, prompt, max_retries=MAX_RETRIES):
+def build_api_request(api_type, prompt):
+    """各评分模型的 (url, headers, payload)，同步评分与 batch_grading 的异步评分共用"""
+    if api_type == 'xunfei':
+        headers = {
+            "Authorization": f"Bearer {XUNFEI_API_TOKEN}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": XUNFEI_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1,
+            "max_tokens": 800
+        }
+        return XUNFEI_API_URL, headers, payload
+
     if api_type == 'deepseek':
         url = "https://api.deepseek.com/v1/chat/completions"
         headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
@@ -98,13 +88,19 @@ def call_api_with_retry(api_type, prompt, max_retries=MAX_RETRIES):
         url = "https://api.moonshot.cn/v1/chat/completions"
         headers = {"Authorization": f"Bearer {KIMI_API_KEY}"}
         model = "moonshot-v1-8k"
-        time.sleep(KIMI_DELAY)
 
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.1
     }
+    return url, headers, payload
+
+
+def call_api_with_retry(api_type, prompt, max_retries=MAX_RETRIES):
+    url, headers, payload = build_api_request(api_type, prompt)
+    if api_type == 'kimi':
+        time.sleep(KIMI_DELAY)
 
     for attempt in range(max_retries):
         try:
@@ -125,22 +121,13 @@ def call_api_with_retry(api_type, prompt, max_retries=MAX_RETRIES):
 
 
 def call_xunfei_api(prompt, max_retries=XUNFEI_MAX_RETRIES):
-    headers = {
-        "Authorization": f"Bearer {XUNFEI_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": XUNFEI_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.1,
-        "max_tokens": 800
-    }
+    url, headers, payload = build_api_request('xunfei', prompt)
 
     for attempt in range(max_retries):
         try:
             rate_limit()
             resp = requests.post(
-                XUNFEI_API_URL,
+                url,
                 headers=headers,
                 json=payload,
                 timeout=XUNFEI_TIMEOUT
@@ -177,8 +164,11 @@ def parse_score_response(content):
     return score, reason
 
 
-def extract_rubric_components(question, key_points, std_answer, answer):
-    extract_prompt = f"""
+_DEFAULT_COMPONENTS = {"covered_points": [], "missing_points": [], "partial_points": [], "confidence": 0.5}
+
+
+def build_extract_prompt(question, key_points, std_answer, answer):
+    return f"""
 你是一个评分要点提取专家。请分析学生答案，与评分标准进行逐点比对。
 【题目】{question}
 【评分标准】{key_points}
@@ -186,14 +176,23 @@ def extract_rubric_components(question, key_points, std_answer, answer):
 【学生答案】{answer}
 【输出要求】严格JSON格式：{{"covered_points":[],"missing_points":[],"partial_points":[],"confidence":0.85}}
 """
+
+
+def parse_rubric_components(response):
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group())
+    return dict(_DEFAULT_COMPONENTS)
+
+
+def extract_rubric_components(question, key_points, std_answer, answer):
+    extract_prompt = build_extract_prompt(question, key_points, std_answer, answer)
     try:
         response = call_api_with_retry('deepseek', extract_prompt)
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
+        return parse_rubric_components(response)
     except Exception as e:
         print(f"[WARN] 组件提取失败：{e}")
-    return {"covered_points": [], "missing_points": [], "partial_points": [], "confidence": 0.5}
+    return dict(_DEFAULT_COMPONENTS)
 
 
 def clean_for_dictation(text):
@@ -222,8 +221,8 @@ def exact_word_match_scoring(question, answer, full, key_points, std_answer):
     return final_score, final_score, final_score, process
 
 
-def arbitrate_scores(question, answer, full, key_points, std_answer,
-                     ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason):
+def build_arbitration_prompt(question, answer, full, key_points, std_answer,
+                             ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason):
     scores = [("DeepSeek", ds_score, ds_reason), ("Kimi", km_score, km_reason)]
     if xf_score is not None:
         scores.append(("讯飞星火", xf_score, xf_reason))
@@ -232,11 +231,17 @@ def arbitrate_scores(question, answer, full, key_points, std_answer,
     diff_points = [f"最高分{max_score}，最低分{min_score}"] if max_score - min_score > 0 else ["无分歧"]
     dispute_desc = "；".join(diff_points)
 
-    prompt = f"""你是阅卷仲裁官，裁决最终得分，四舍五入到0.5倍
+    return f"""你是阅卷仲裁官，裁决最终得分，四舍五入到0.5倍
 【题目】{question}【评分标准】{key_points}【标准答案】{std_answer}【学生答案】{answer}【满分】{full}
 【评分】DeepSeek:{ds_score}({ds_reason})，Kimi:{km_score}({km_reason})，讯飞:{xf_score}({xf_reason})
 【分歧】{dispute_desc}
 输出：得分: X.X 裁决理由: ..."""
+
+
+def arbitrate_scores(question, answer, full, key_points, std_answer,
+                     ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason):
+    prompt = build_arbitration_prompt(question, answer, full, key_points, std_answer,
+                                      ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason)
     try:
         response = call_api_with_retry('deepseek', prompt)
         score, reason = parse_score_response(response)
@@ -246,53 +251,68 @@ def arbitrate_scores(question, answer, full, key_points, std_answer,
         return None, None
 
 
-def score_with_autoscore(question, answer, full, key_points, std_answer=""):
-    full = float(full)
-    components = extract_rubric_components(question, key_points, std_answer, answer)
+def build_scoring_prompt(key_points, components, answer, full):
     covered = components.get('covered_points', [])
     partial = components.get('partial_points', [])
     missing = components.get('missing_points', [])
-    confidence = components.get('confidence', 0.5)
 
     components_text = f"已覆盖:{covered} 部分:{partial} 缺失:{missing}"
-    enhanced_prompt = f"""【评分标准】{key_points}\n【覆盖情况】{components_text}\n【学生答案】{answer}\n【满分】{full}
+    return f"""【评分标准】{key_points}\n【覆盖情况】{components_text}\n【学生答案】{answer}\n【满分】{full}
 按要点评分，输出：得分: X.X 给分理由: ..."""
 
-    ds_raw = call_api_with_retry('deepseek', enhanced_prompt)
-    ds_score, ds_reason = parse_score_response(ds_raw)
-    ds_score = round_to_half(ds_score)
 
-    km_raw = call_api_with_retry('kimi', enhanced_prompt)
-    km_score, km_reason = parse_score_response(km_raw)
-    km_score = round_to_half(km_score)
+def parse_model_score(raw):
+    """单个评分模型的输出 -> (0.5 取整的得分, 理由)；调用失败（raw 为 None）时得分为 None"""
+    if raw is None:
+        return None, "调用失败"
+    score, reason = parse_score_response(raw)
+    return round_to_half(score), reason
 
-    xf_raw = call_xunfei_api(enhanced_prompt)
-    xf_score, xf_reason = (parse_score_response(xf_raw) if xf_raw else (None, "调用失败"))
-    xf_score = round_to_half(xf_score) if xf_score is not None else None
 
+def needs_arbitration(full, ds_score, km_score, xf_score):
     scores = [s for s in [ds_score, km_score, xf_score] if s is not None]
     max_diff = max(scores) - min(scores) if len(scores) >= 2 else 0
-    threshold = full * 0.1
+    return max_diff > full * 0.1
+
+
+def weighted_score(ds_score, km_score, xf_score):
+    return round_to_half(ds_score * 0.5 + km_score * 0.3 + (xf_score or 0) * 0.2)
+
+
+def format_process(ds_score, km_score, xf_score, total, ds_reason):
+    return f"【三模型评分】DS:{ds_score} KM:{km_score} XF:{xf_score} -> 最终:{total}\n【理由】{ds_reason[:200]}"
+
+
+def score_with_autoscore(question, answer, full, key_points, std_answer=""):
+    full = float(full)
+    components = extract_rubric_components(question, key_points, std_answer, answer)
+    enhanced_prompt = build_scoring_prompt(key_points, components, answer, full)
 
-    if max_diff > threshold:
-        final_score, arb_reason = arbitrate_scores(
+    ds_score, ds_reason = parse_model_score(call_api_with_retry('deepseek', enhanced_prompt))
+    km_score, km_reason = parse_model_score(call_api_with_retry('kimi', enhanced_prompt))
+    xf_score, xf_reason = parse_model_score(call_xunfei_api(enhanced_prompt))
+
+    total = None
+    if needs_arbitration(full, ds_score, km_score, xf_score):
+        total, arb_reason = arbitrate_scores(
             question, answer, full, key_points, std_answer,
             ds_score, ds_reason, km_score, km_reason, xf_score, xf_reason
         )
-        if final_score is not None:
-            total = final_score
-        else:
-            total = round_to_half(ds_score * 0.5 + km_score * 0.3 + (xf_score or 0) * 0.2)
-    else:
-        total = round_to_half(ds_score * 0.5 + km_score * 0.3 + (xf_score or 0) * 0.2)
+    if total is None:
+        total = weighted_score(ds_score, km_score, xf_score)
 
-    process = f"【三模型评分】DS:{ds_score} KM:{km_score} XF:{xf_score} -> 最终:{total}\n【理由】{ds_reason[:200]}"
+    process = format_process(ds_score, km_score, xf_score, total, ds_reason)
     return ds_score, km_score, xf_score, total, process
 
 
+def is_dictation(key_points, std_answer):
+    """逐字比对类题目（默写等）不调用大模型"""
+    return bool(std_answer) and any(kw in key_points for kw in ["每写错一个字", "每写对一个字", "逐字"])
+
+
 def score_one(question, answer, full, key_points, std_answer=""):
     full = float(full)
-    if std_answer and any(kw in key_points for kw in ["每写错一个字", "每写对一个字", "逐字"]):
+    if is_dictation(key_points, std_answer):
         return exact_word_match_scoring(question, answer, full, key_points, std_answer)
     return score_with_autoscore(question, answer, full, key_points, std_answer)
 
@@ -311,42 +331,94 @@ def score_baseline(question, answer, full, key_points, std_answer=""):
         return 0.0, "错误", "错误"
 
 
+def grading_inputs(answer_log):
+    """答题记录 -> 评分所需字段"""
+    exercise = answer_log.exercise
+    return {
+        'question': exercise.content,
+        'full_score': float(exercise.score),
+        'key_points': exercise.solution or "",
+        'std_answer': exercise.answer or "",
+        'student_answer': answer_log.text_answer or "",
+    }
+
+
+def build_result(inputs, ds_score, km_score, xf_score, final_score, process):
+    return {
+        'success': True,
+        'final_score': round(final_score, 1) if final_score is not None else 0.0,
+        'full_score': inputs['full_score'],
+        'ds_score': round(ds_score, 1) if ds_score is not None else None,
+        'km_score': round(km_score, 1) if km_score is not None else None,
+        'xf_score': round(xf_score, 1) if xf_score is not None else None,
+        'process': process,
+        'question': inputs['question'],
+        'student_answer': inputs['student_answer'],
+        'std_answer': inputs['std_answer'],
+        'key_points': inputs['key_points'],
+    }
+
+
+def cache_result(answer_log_id, result):
+    """记录答题记录最近一次的评分结果（grading_cache.log_results）"""
+    set_log_result(answer_log_id, result)
+
+
+def answer_cache_key(inputs):
+    """评分结果的内容缓存键：默写题按逐字比对用的清洗结果，其余按归一化答案"""
+    if is_dictation(inputs['key_points'], inputs['std_answer']):
+        provider, answer = 'dictation', clean_for_dictation(inputs['student_answer'].strip())
+    else:
+        provider, answer = 'agent:deepseek+kimi+xunfei', normalize_answer(inputs['student_answer'])
+    return answer_key(inputs['question'], inputs['key_points'], inputs['std_answer'],
+                      inputs['full_score'], answer, provider)
+
+
+def cached_scores(inputs):
+    """相同题目、相同答案已评过分时返回 (ds, km, xf, final, process)，否则 None"""
+    scores = get_answer_result(answer_cache_key(inputs))
+    return tuple(scores) if scores is not None else None
+
+
+def store_scores(inputs, scores):
+    set_answer_result(answer_cache_key(inputs), list(scores))
+
+
+def apply_agent_result(answer_log, result, grader, graded_at):
+    """把智能体评分结果写到答题记录对象上（不保存）：得分达到满分的 60% 判为正确；
+    沿用相似答案评分的结果带有较低的 confidence"""
+    full = result['full_score']
+    score = result['final_score']
+    threshold = full * 0.6 if full > 0 else 0
+    answer_log.is_correct = score >= threshold
+    answer_log.score = score
+    answer_log.ai_feedback = result.get('process', '')
+    answer_log.graded_at = graded_at
+    answer_log.graded_by = grader
+    answer_log.grading_confidence = result.get('confidence', 0.85)
+
+
 def auto_score_answer(answer_log_id):
     """读取答题记录，三模型仲裁评分，返回结果字典（不写数据库）"""
     try:
-        answer_log = AnswerLog.objects.get(id=answer_log_id)
-        exercise = answer_log.exercise
-
-        question = exercise.content
-        full_score = float(exercise.score)
-        key_points = exercise.solution or ""
-        std_answer = exercise.answer or ""
-        student_answer = answer_log.text_answer or ""
-
-        ds_score, km_score, xf_score, final_score, process = score_one(
-            question=question,
-            answer=student_answer,
-            full=full_score,
-            key_points=key_points,
-            std_answer=std_answer
-        )
+        answer_log = AnswerLog.objects.select_related('exercise').get(id=answer_log_id)
+        inputs = grading_inputs(answer_log)
+
+        scores = cached_scores(inputs)
+        if scores is None:
+            scores = score_one(
+                question=inputs['question'],
+                answer=inputs['student_answer'],
+                full=inputs['full_score'],
+                key_points=inputs['key_points'],
+                std_answer=inputs['std_answer']
+            )
+            store_scores(inputs, scores)
+        ds_score, km_score, xf_score, final_score, process = scores
 
         print(f"[OK] 判分完成！ID:{answer_log_id} 得分:{final_score}")
-        result = {
-            'success': True,
-            'final_score': round(final_score, 1) if final_score is not None else 0.0,
-            'full_score': full_score,
-            'ds_score': round(ds_score, 1) if ds_score is not None else None,
-            'km_score': round(km_score, 1) if km_score is not None else None,
-            'xf_score': round(xf_score, 1) if xf_score is not None else None,
-            'process': process,
-            'question': question,
-            'student_answer': student_answer,
-            'std_answer': std_answer,
-            'key_points': key_points,
-        }
-        _scoring_result_cache[str(answer_log_id)] = result
-        _save_cache(_scoring_result_cache)
+        result = build_result(inputs, ds_score, km_score, xf_score, final_score, process)
+        cache_result(answer_log_id, result)
         return result
 
     except AnswerLog.DoesNotExist:
@@ -358,7 +430,7 @@ def auto_score_answer(answer_log_id):
 
 def get_cached_score(answer_log_id):
     """读取缓存的评分结果（不调用 API，不写数据库）"""
-    return _scoring_result_cache.get(str(answer_log_id))
+    return get_log_result(answer_log_id)
 
 
 def batch_auto_score(subject_id=None):
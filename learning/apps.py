@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class LearningConfig(AppConfig):
+    name = 'learning'
+
+    def ready(self):
+        # 融合图谱表随知识点/关系的保存、删除增量更新（导入时注册信号接收器）
+        from graph_fusion import store  # noqa: F401
+        # 前置知识点索引随 KnowledgeGraph 的保存、删除失效；admin / shell / 管理命令里改关系也要生效
+        from learning import prerequisite_index  # noqa: F401
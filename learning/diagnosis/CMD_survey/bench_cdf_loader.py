@@ -0,0 +1,186 @@
+"""
+对比 CDF 系列模型旧的逐条 iloc 取数与共用张量化 TrainDataLoader 的每轮耗时，
+以及逐 batch np.concatenate 收集指标与 MetricAccumulator 流式累加的耗时
+
+    python bench_cdf_loader.py                       # 默认 JunyiCon / MathCon
+    python bench_cdf_loader.py --datasets MathCon --epochs 5 --batch_size 256
+
+每个数据集分别统计：
+    load   只遍历一遍训练集的耗时
+    hier   用 HierCDF 跑一轮前向+反向（含取数）的耗时
+    metric 一轮内收集预测并计算 acc / f1 / auc / rmse 的耗时（不含模型计算）
+数据集目录需包含 log_split__train_mini.csv、q_matrix.txt、config.py，
+先修图 knowledge_graphs_prereq.csv 不存在时按无边图处理。
+"""
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, roc_auc_score
+
+from model.cdf_dataloader import TrainDataLoader
+from model.HierCDF.HierCDF import HierCDF, MyLoss
+from model.HierCDF.tools import labelize, to_numpy
+from model.metrics import MetricAccumulator
+
+DEFAULT_DATASETS = ['JunyiCon', 'MathCon']
+
+
+class IlocDataLoader:
+    """原各模型目录下的实现：逐条 iloc 取数，Q 矩阵行转 DoubleTensor"""
+
+    def __init__(self, train_data, Q_matrix, batch_size):
+        self.train_data = train_data
+        self.Q_matrix = Q_matrix
+        self.batch_size = batch_size
+        self.n_sample = train_data.shape[0]
+        self.cursor = 0
+        self.indices = np.arange(self.n_sample)
+
+    def next_batch(self):
+        stu_ids, exer_ids, y_labels = [], [], []
+        for cptr in range(self.batch_size):
+            if self.cursor + cptr >= self.n_sample:
+                break
+            record = self.train_data.iloc[self.indices[self.cursor + cptr], :]
+            stu_ids.append(record['user_id'])
+            exer_ids.append(record['exercise_id'])
+            y_labels.append(record['score'])
+        self.cursor += self.batch_size
+        item_know = self.Q_matrix[exer_ids, :]
+        return torch.LongTensor(stu_ids), torch.LongTensor(exer_ids), torch.DoubleTensor(item_know), torch.LongTensor(y_labels)
+
+    def is_end(self):
+        return self.cursor >= self.n_sample
+
+    def reset(self, shuffle=True):
+        self.cursor = 0
+        if shuffle:
+            np.random.shuffle(self.indices)
+
+
+def read_dataset(data_dir):
+    spec = importlib.util.spec_from_file_location('bench_config', os.path.join(data_dir, 'config.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    train_df = pd.read_csv(os.path.join(data_dir, 'log_split__train_mini.csv'))
+    q_matrix = np.loadtxt(os.path.join(data_dir, 'q_matrix.txt'), delimiter=' ')
+    graph_path = os.path.join(data_dir, 'knowledge_graphs_prereq.csv')
+    know_graph = pd.read_csv(graph_path) if os.path.exists(graph_path) else pd.DataFrame(columns=['from', 'to'])
+    # 数据集里的 Q 矩阵可能比日志中的习题少几行，只保留能取到 Q 行的记录
+    train_df = train_df[train_df['exercise_id'] < q_matrix.shape[0]].reset_index(drop=True)
+    return config.hparams, train_df, q_matrix, know_graph
+
+
+def time_loader(loader, epochs):
+    start = time.perf_counter()
+    for _ in range(epochs):
+        loader.reset(shuffle=True)
+        while not loader.is_end():
+            loader.next_batch()
+    return (time.perf_counter() - start) / epochs
+
+
+def time_hier(loader, hparams, q_matrix, know_graph, epochs, device, log_dir):
+    torch.manual_seed(0)
+    net = HierCDF(hparams['n_user'], q_matrix.shape[0], q_matrix.shape[1], hparams['hidden_dim'],
+                  know_graph, itf_type=hparams['itf_type'], log_path=log_dir)
+    net._to_device(device)
+    loss_fn = MyLoss(net, nn.NLLLoss, hparams['loss_factor'])
+    optimizer = torch.optim.Adam(net.parameters(), lr=hparams['lr'])
+    start = time.perf_counter()
+    for _ in range(epochs):
+        loader.reset(shuffle=True)
+        while not loader.is_end():
+            user_ids, item_ids, item_know, y_target = loader.next_batch()
+            user_ids, item_ids, y_target = user_ids.to(device), item_ids.to(device), y_target.to(device)
+            # 旧 loader 产出 float64，模型已统一为 float32
+            y_pred = net.forward(user_ids, item_ids, item_know.float().to(device), device)
+            output = torch.cat((1.0 - y_pred, y_pred), 1)
+            loss = loss_fn(torch.log(output), y_target, user_ids)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    return (time.perf_counter() - start) / epochs
+
+
+def time_concat_metrics(loader, epochs):
+    start = time.perf_counter()
+    for _ in range(epochs):
+        loader.reset(shuffle=True)
+        y_pred_all, y_score_all, y_target_all = np.array([]), np.array([]), np.array([], dtype=np.int_)
+        while not loader.is_end():
+            _, _, _, y_target = loader.next_batch()
+            y_pred = torch.rand(y_target.shape[0], 1)
+            y_pred_all = np.concatenate([y_pred_all, labelize(y_pred)], axis=0)
+            y_score_all = np.concatenate([y_score_all, to_numpy(y_pred)], axis=0)
+            y_target_all = np.concatenate([y_target_all, y_target.numpy()], axis=0)
+        accuracy_score(y_target_all, y_pred_all), f1_score(y_target_all, y_pred_all)
+        roc_auc_score(y_target_all, y_score_all), mean_squared_error(y_target_all, y_score_all)
+    return (time.perf_counter() - start) / epochs
+
+
+def time_stream_metrics(loader, epochs):
+    metrics = MetricAccumulator(loader.n_sample)
+    start = time.perf_counter()
+    for _ in range(epochs):
+        loader.reset(shuffle=True)
+        metrics.reset()
+        while not loader.is_end():
+            _, _, _, y_target = loader.next_batch()
+            metrics.update(torch.rand(y_target.shape[0], 1), y_target)
+        metrics.compute()
+    return (time.perf_counter() - start) / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CDF 训练取数与指标收集每轮耗时对比')
+    parser.add_argument('--datasets', nargs='+', default=DEFAULT_DATASETS)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch_size', type=int, default=None, help='默认取数据集 config.py 中的 batch_size')
+    args = parser.parse_args()
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    log_dir = tempfile.mkdtemp(prefix='bench_cdf_')
+
+    print(f"{'dataset':<16}{'logs':>10}{'iloc load':>14}{'tensor load':>14}{'iloc hier':>14}{'tensor hier':>14}"
+          f"{'concat metric':>15}{'stream metric':>15}")
+    for name in args.datasets:
+        data_dir = os.path.join('data', name)
+        if not os.path.exists(os.path.join(data_dir, 'log_split__train_mini.csv')):
+            print(f"{name:<16}跳过：未找到 log_split__train_mini.csv")
+            continue
+
+        hparams, train_df, q_matrix, know_graph = read_dataset(data_dir)
+        batch_size = args.batch_size or hparams['batch_size']
+        iloc_loader = IlocDataLoader(train_df, q_matrix, batch_size)
+        tensor_loader = TrainDataLoader(train_df, q_matrix, batch_size, pin_memory=device != 'cpu')
+
+        # 两种方式按原顺序产出的 batch 必须一致
+        iloc_loader.reset(shuffle=False)
+        tensor_loader.reset(shuffle=False)
+        reference, gathered = iloc_loader.next_batch(), tensor_loader.next_batch()
+        if not all(torch.equal(a, b.to(a.dtype)) for a, b in zip(reference, gathered)):
+            print(f"{name:<16}batch 不一致，停止对比")
+            return
+
+        row = [
+            time_loader(iloc_loader, args.epochs),
+            time_loader(tensor_loader, args.epochs),
+            time_hier(iloc_loader, hparams, q_matrix, know_graph, args.epochs, device, log_dir),
+            time_hier(tensor_loader, hparams, q_matrix, know_graph, args.epochs, device, log_dir),
+            time_concat_metrics(tensor_loader, args.epochs),
+            time_stream_metrics(tensor_loader, args.epochs),
+        ]
+        print(f"{name:<16}{len(train_df):>10}" + ''.join(f"{value:>13.3f}s" for value in row[:4])
+              + ''.join(f"{value:>14.3f}s" for value in row[4:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+对比 my_collate 与张量化 InteractionDataset 的每轮耗时
+
+    python bench_collate.py                       # 默认 ASSISTment_2009-2010 / Junyi / Math1
+    python bench_collate.py --datasets Math1 --epochs 5 --batch_size 256
+
+每个数据集分别统计：
+    load   只遍历一遍 DataLoader 的耗时
+    ncdm   用 NCDM 跑一轮前向+反向（含取数）的耗时
+数据集目录下 train.json（或列式文件）不存在时依次退回 val / log_data。
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('CD_DATASET', 'Math1')
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+import params
+import dataloader
+from columnar import load_records, records_exist
+from interaction_dataset import build_dataset, make_loader
+from model.NCDM import Net
+
+DEFAULT_DATASETS = ['ASSISTment_2009-2010', 'Junyi', 'Math1']
+
+
+def read_config(data_dir):
+    with open(os.path.join(data_dir, 'config.txt')) as f:
+        f.readline()
+        un, en, kn = f.readline().split(',')
+    return int(un), int(en), int(kn)
+
+
+def find_split(data_dir):
+    for split in ('train', 'val', 'log_data'):
+        path = os.path.join(data_dir, f'{split}.json')
+        if records_exist(path):
+            return path
+    return None
+
+
+def time_loader(loader, epochs):
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _batch in loader:
+            pass
+    return (time.perf_counter() - start) / epochs
+
+
+def time_ncdm(loader, un, en, kn, epochs, device):
+    # CMD_survey 数据集的 ID 是 1-based，嵌入表多留一行
+    net = Net(kn, en + 1, un + 1).to(device)
+    optimizer = torch.optim.Adam(net.parameters(), lr=params.lr)
+    loss_function = nn.BCELoss()
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for user_id, item_id, knowledge_emb, y in loader:
+            pred = net(user_id.to(device), item_id.to(device), knowledge_emb.to(device))
+            loss = loss_function(pred, y.to(device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    return (time.perf_counter() - start) / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='my_collate vs InteractionDataset 每轮耗时对比')
+    parser.add_argument('--datasets', nargs='+', default=DEFAULT_DATASETS)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch_size', type=int, default=params.batch_size)
+    args = parser.parse_args()
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+    print(f"{'dataset':<24}{'logs':>10}{'collate load':>14}{'tensor load':>14}{'collate ncdm':>14}{'tensor ncdm':>14}")
+    for name in args.datasets:
+        data_dir = os.path.join('data', name)
+        path = find_split(data_dir) if os.path.isdir(data_dir) else None
+        if path is None:
+            print(f"{name:<24}跳过：未找到 train/val/log_data 数据")
+            continue
+
+        un, en, kn = read_config(data_dir)
+        params.kn = kn  # my_collate 读取的是 params.kn
+        records = load_records(path)
+
+        collate_loader = DataLoader(records, batch_size=args.batch_size, shuffle=True, collate_fn=dataloader.my_collate)
+        tensor_loader = make_loader(build_dataset(records, kn), args.batch_size, shuffle=True)
+
+        # 两种方式产出的 batch 必须一致
+        reference = dataloader.my_collate([records[i] for i in range(min(len(records), args.batch_size))])
+        gathered = tensor_loader.dataset[list(range(min(len(records), args.batch_size)))]
+        if not all(torch.equal(a, b) for a, b in zip(reference, gathered)):
+            print(f"{name:<24}batch 不一致，停止对比")
+            sys.exit(1)
+
+        row = [
+            time_loader(collate_loader, args.epochs),
+            time_loader(tensor_loader, args.epochs),
+            time_ncdm(collate_loader, un, en, kn, args.epochs, device),
+            time_ncdm(tensor_loader, un, en, kn, args.epochs, device),
+        ]
+        print(f"{name:<24}{len(records):>10}" + ''.join(f"{value:>13.3f}s" for value in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+训练数据的列式存储格式（替代 train.json / val.json / log_data.json）
+
+数据集目录下的 columnar/ 子目录中保存:
+    {split}_user.npy    int32  每条作答记录的学生ID
+    {split}_exer.npy    int32  每条作答记录的习题ID
+    {split}_score.npy   int32  作答得分（0/1），含小数得分的数据集保存为 float32
+    {split}_log_id.npy  int64  可选，每条记录对应的 AnswerLog id（平台导出的 log_data 才有，增量训练按它替换重新批改的记录）
+    q_indptr.npy        int64  Q矩阵的 CSR 行指针，行号就是习题ID
+    q_indices.npy       int32  Q矩阵的 CSR 列索引，即 knowledge_code
+
+split 取 train / val / log_data，与原 JSON 文件名一一对应。
+所有数组都由 numpy.save 写出，读取时以 mmap_mode='r' 打开，不会整体载入内存；
+目录下没有列式文件时，load_records 会回退到原来的 JSON 读取方式。
+
+把已有的 JSON 数据集转成列式格式:
+    python columnar.py data/Math1
+"""
+
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+COLUMNAR_DIR = 'columnar'
+SPLITS = ('train', 'val', 'log_data')
+
+
+def columnar_dir(data_dir):
+    return os.path.join(data_dir, COLUMNAR_DIR)
+
+
+def _split_file(data_dir, split, column):
+    return os.path.join(columnar_dir(data_dir), f'{split}_{column}.npy')
+
+
+def _locate(path):
+    """把 JSON 路径（如 data/1/train.json）拆成 (数据集目录, split)"""
+    path = os.fspath(path)
+    data_dir, filename = os.path.split(path)
+    split, _ = os.path.splitext(filename)
+    return data_dir, split
+
+
+def has_columnar(data_dir, split):
+    return (
+        os.path.exists(_split_file(data_dir, split, 'user'))
+        and os.path.exists(os.path.join(columnar_dir(data_dir), 'q_indptr.npy'))
+    )
+
+
+def records_exist(path):
+    """JSON 文件或对应的列式文件任一存在即可"""
+    data_dir, split = _locate(path)
+    return has_columnar(data_dir, split) or os.path.exists(path)
+
+
+def build_q_csr(exer_to_kps, n_rows):
+    """
+    把 {习题ID: [知识点ID, ...]} 转成 CSR 数组
+
+    Args:
+        exer_to_kps: 习题ID -> knowledge_code 列表
+        n_rows: 行数，需大于最大习题ID（行号直接使用习题ID）
+    """
+    counts = np.zeros(n_rows, dtype=np.int64)
+    for exer_id, kps in exer_to_kps.items():
+        counts[exer_id] = len(kps)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.zeros(indptr[-1], dtype=np.int32)
+    for exer_id, kps in exer_to_kps.items():
+        indices[indptr[exer_id]:indptr[exer_id + 1]] = kps
+    return indptr, indices
+
+
+def save_q_matrix(data_dir, exer_to_kps, n_rows):
+    os.makedirs(columnar_dir(data_dir), exist_ok=True)
+    indptr, indices = build_q_csr(exer_to_kps, n_rows)
+    np.save(os.path.join(columnar_dir(data_dir), 'q_indptr.npy'), indptr)
+    np.save(os.path.join(columnar_dir(data_dir), 'q_indices.npy'), indices)
+
+
+def _score_array(scores):
+    scores = np.asarray(scores)
+    if scores.size and not np.array_equal(scores, np.round(scores)):
+        return scores.astype(np.float32)
+    return scores.astype(np.int32)
+
+
+def save_split(data_dir, split, user_ids, exer_ids, scores, log_ids=None):
+    os.makedirs(columnar_dir(data_dir), exist_ok=True)
+    np.save(_split_file(data_dir, split, 'user'), np.asarray(user_ids, dtype=np.int32))
+    np.save(_split_file(data_dir, split, 'exer'), np.asarray(exer_ids, dtype=np.int32))
+    np.save(_split_file(data_dir, split, 'score'), _score_array(scores))
+    log_id_file = _split_file(data_dir, split, 'log_id')
+    if log_ids is not None:
+        np.save(log_id_file, np.asarray(log_ids, dtype=np.int64))
+    elif os.path.exists(log_id_file):
+        # 旧的 id 列与新写入的记录对不上，必须删掉
+        os.remove(log_id_file)
+
+
+def load_log_ids(data_dir, split):
+    """split 中每条记录的 AnswerLog id，导出时没有写 id 列则返回 None"""
+    path = _split_file(data_dir, split, 'log_id')
+    return np.load(path) if os.path.exists(path) else None
+
+
+def load_q_matrix(data_dir, mmap=True):
+    mode = 'r' if mmap else None
+    indptr = np.load(os.path.join(columnar_dir(data_dir), 'q_indptr.npy'), mmap_mode=mode)
+    indices = np.load(os.path.join(columnar_dir(data_dir), 'q_indices.npy'), mmap_mode=mode)
+    return indptr, indices
+
+
+def load_split(data_dir, split, mmap=True):
+    mode = 'r' if mmap else None
+    q_indptr, q_indices = load_q_matrix(data_dir, mmap=mmap)
+    return ColumnarLogs(
+        np.load(_split_file(data_dir, split, 'user'), mmap_mode=mode),
+        np.load(_split_file(data_dir, split, 'exer'), mmap_mode=mode),
+        np.load(_split_file(data_dir, split, 'score'), mmap_mode=mode),
+        q_indptr,
+        q_indices,
+    )
+
+
+def load_records(path):
+    """
+    读取一个 split 的作答记录
+
+    优先打开同目录 columnar/ 下的列式文件（mmap，零拷贝），
+    不存在时按原方式 json.load 整个文件。两种返回值都支持 len、下标和迭代，
+    元素都是 {'user_id', 'exer_id', 'score', 'knowledge_code'} 结构的 dict。
+    """
+    data_dir, split = _locate(path)
+    if has_columnar(data_dir, split):
+        return load_split(data_dir, split)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ColumnarLogs:
+    """列式作答记录的只读视图，按下标访问时才组装出单条记录"""
+
+    def __init__(self, user, exer, score, q_indptr, q_indices):
+        self.user = user
+        self.exer = exer
+        self.score = score
+        self.q_indptr = q_indptr
+        self.q_indices = q_indices
+
+    def __len__(self):
+        return len(self.user)
+
+    def knowledge_code(self, exer_id):
+        return self.q_indices[self.q_indptr[exer_id]:self.q_indptr[exer_id + 1]].tolist()
+
+    def __getitem__(self, idx):
+        exer_id = int(self.exer[idx])
+        return {
+            'user_id': int(self.user[idx]),
+            'exer_id': exer_id,
+            'score': self.score[idx].item(),
+            'knowledge_code': self.knowledge_code(exer_id),
+        }
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __add__(self, other):
+        if hasattr(other, 'q_indptr') and np.array_equal(self.q_indptr, other.q_indptr):
+            return ColumnarLogs(
+                np.concatenate([self.user, other.user]),
+                np.concatenate([self.exer, other.exer]),
+                np.concatenate([self.score, other.score]),
+                self.q_indptr,
+                self.q_indices,
+            )
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+
+def student_knowledge_sets(records):
+    """统计每个学生作答过的知识点集合: {user_id: set(knowledge_code)}"""
+    known = defaultdict(set)
+    if hasattr(records, 'q_indptr'):
+        pairs = np.unique(np.stack([np.asarray(records.user), np.asarray(records.exer)], axis=1), axis=0)
+        for user_id, exer_id in pairs:
+            known[int(user_id)].update(records.knowledge_code(int(exer_id)))
+        return known
+    for log in records:
+        known[log['user_id']].update(log['knowledge_code'])
+    return known
+
+
+def json_to_columnar(data_dir, splits=SPLITS):
+    """把数据集目录下已有的 JSON 文件转存为列式格式，返回转换的 split 列表"""
+    loaded = {}
+    exer_to_kps = {}
+    for split in splits:
+        path = os.path.join(data_dir, f'{split}.json')
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        loaded[split] = rows
+        for row in rows:
+            exer_to_kps.setdefault(int(row['exer_id']), [int(code) for code in row.get('knowledge_code') or []])
+
+    if not loaded:
+        return []
+
+    save_q_matrix(data_dir, exer_to_kps, max(exer_to_kps) + 1)
+    for split, rows in loaded.items():
+        save_split(
+            data_dir, split,
+            [row['user_id'] for row in rows],
+            [row['exer_id'] for row in rows],
+            [row['score'] for row in rows],
+        )
+    return list(loaded)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把 train/val/log_data.json 转成列式 .npy 格式')
+    parser.add_argument('data_dirs', nargs='+', help='数据集目录，如 data/Math1')
+    args = parser.parse_args()
+
+    for data_dir in args.data_dirs:
+        converted = json_to_columnar(data_dir)
+        print(f"{data_dir}: {', '.join(converted) if converted else '未找到 JSON 文件'}")
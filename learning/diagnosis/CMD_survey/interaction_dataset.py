@@ -0,0 +1,93 @@
+"""
+张量化的作答记录 Dataset（替代逐条拼 knowledge_emb 的 my_collate）
+
+作答记录一次性转成 user / exer / score 张量，Q矩阵按习题预先展开成
+(习题数, 知识点数) 的稠密张量。DataLoader 以 BatchSampler 整批取下标，
+__getitem__ 直接做下标 gather（q_matrix[exer_ids]），不再有 Python 循环。
+产出的 batch 与 my_collate 完全一致:
+    (LongTensor 学生ID, LongTensor 习题ID, Tensor knowledge_emb, Tensor score)
+"""
+
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
+
+
+class InteractionDataset(Dataset):
+    """作答记录张量 + 按习题预计算的 Q 矩阵张量，按一批下标整体取数"""
+
+    def __init__(self, user_ids, exer_ids, scores, q_matrix):
+        self.user_ids = torch.as_tensor(user_ids, dtype=torch.long)
+        self.exer_ids = torch.as_tensor(exer_ids, dtype=torch.long)
+        self.scores = torch.as_tensor(scores, dtype=torch.float32)
+        self.q_matrix = q_matrix
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __getitem__(self, indices):
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        exer_ids = self.exer_ids[indices]
+        return self.user_ids[indices], exer_ids, self.q_matrix[exer_ids], self.scores[indices]
+
+
+def build_q_tensor(exer_ids, code_rows, n_rows, kn, code_offset=0):
+    """
+    按习题构造稠密 Q 矩阵张量，规则与 my_collate 相同：
+    knowledge_code 为空的习题整行置 1，越界的知识点编号忽略
+
+    Args:
+        exer_ids: 每行对应的习题下标（已减去 id 偏移）
+        code_rows: 与 exer_ids 对齐的 knowledge_code 列表
+        n_rows: Q 矩阵行数
+        kn: 知识点数
+        code_offset: knowledge_code 到列下标的偏移（1-based 编号传 1）
+    """
+    q_matrix = torch.zeros(n_rows, kn)
+    for exer_id, codes in zip(exer_ids, code_rows):
+        if len(codes) == 0:
+            q_matrix[exer_id] = 1.0
+            continue
+        cols = np.asarray(codes, dtype=np.int64) - code_offset
+        cols = cols[(cols >= 0) & (cols < kn)]
+        q_matrix[exer_id, torch.from_numpy(cols)] = 1.0
+    return q_matrix
+
+
+def build_dataset(records, kn, id_offset=0, code_offset=0):
+    """
+    把 load_records 的返回值（ColumnarLogs 或 JSON 记录列表）转成 InteractionDataset
+
+    Args:
+        records: 作答记录
+        kn: 知识点数
+        id_offset: user_id / exer_id 到下标的偏移（1-based 编号传 1）
+        code_offset: knowledge_code 到列下标的偏移
+    """
+    if hasattr(records, 'q_indptr'):  # columnar.ColumnarLogs
+        user_ids = np.asarray(records.user, dtype=np.int64) - id_offset
+        exer_ids = np.asarray(records.exer, dtype=np.int64) - id_offset
+        scores = np.asarray(records.score, dtype=np.float32)
+        raw_exers = np.unique(np.asarray(records.exer))
+        code_rows = [records.knowledge_code(int(exer_id)) for exer_id in raw_exers]
+    else:
+        user_ids = np.fromiter((log['user_id'] for log in records), dtype=np.int64, count=len(records)) - id_offset
+        exer_ids = np.fromiter((log['exer_id'] for log in records), dtype=np.int64, count=len(records)) - id_offset
+        scores = np.fromiter((log['score'] for log in records), dtype=np.float32, count=len(records))
+        # 数据集中同一习题的 knowledge_code 一致，取首次出现的记录
+        first_codes = {}
+        for log in records:
+            first_codes.setdefault(log['exer_id'], log['knowledge_code'])
+        raw_exers = np.fromiter(first_codes.keys(), dtype=np.int64, count=len(first_codes))
+        code_rows = list(first_codes.values())
+
+    n_rows = int(exer_ids.max()) + 1 if len(exer_ids) else 0
+    q_matrix = build_q_tensor(np.asarray(raw_exers, dtype=np.int64) - id_offset, code_rows, n_rows, kn, code_offset)
+    return InteractionDataset(user_ids, exer_ids, scores, q_matrix)
+
+
+def make_loader(dataset, batch_size, shuffle):
+    """整批采样下标交给 Dataset gather，len(loader) 仍是 batch 数"""
+    base_sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    sampler = BatchSampler(base_sampler, batch_size=batch_size, drop_last=False)
+    return DataLoader(dataset=dataset, sampler=sampler, batch_size=None)
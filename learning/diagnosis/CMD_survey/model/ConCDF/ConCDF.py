@@ -2,17 +2,16 @@ import os
 import networkx as nx
 import numpy as np
 import pandas as pd
-from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, mean_squared_error
 import torch
 import torch.nn as nn
 import warnings
 import torch.nn.functional as F
 from .dataloader import TrainDataLoader
 from .itf import mirt2pl, sigmoid_dot, dot, itf_dict
+from ..metrics import MetricAccumulator
 from .tools import Logger, df_preview, format_hparams, labelize, to_numpy
 
 warnings.filterwarnings('ignore')
-torch.set_default_tensor_type(torch.DoubleTensor)
 
 
 class ConCDF(nn.Module):
@@ -231,12 +230,12 @@ class ConCDF(nn.Module):
         # 选择NLLLoss损失函数
         loss_fn = MyLoss(self, nn.NLLLoss, loss_factor)
 
-        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size)
+        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size, pin_memory=hparams.get('pin_memory', False))
+        # 训练指标在设备上流式累加，每轮结束统一计算
+        train_metrics = MetricAccumulator(dataloader.n_sample, device)
 
         optimizer = torch.optim.Adam(params=self.parameters(), lr=lr)
 
-        y_target_all = np.array(train_data.loc[:, 'score']).astype(np.int_)
-
         # 记录最佳指标
         best_epoch = -1
         best_auc = 0.0
@@ -244,18 +243,18 @@ class ConCDF(nn.Module):
         best_rmse = float('inf')
 
         for step in range(1, epoch + 1):
-            dataloader.reset(shuffle=False)
+            dataloader.reset(shuffle=hparams.get('shuffle', True))
             n_batch = 0
-            y_pred_all = np.array([])
+            train_metrics.reset()
             loss_all = 0.0
             batch_count = 0
             while not dataloader.is_end():
                 optimizer.zero_grad()
                 user_ids, item_ids, item_know, y_target = dataloader.next_batch()
-                user_ids = user_ids.to(device)
-                item_ids = item_ids.to(device)
-                item_know = item_know.to(device)
-                y_target = y_target.to(device)
+                user_ids = user_ids.to(device, non_blocking=True)
+                item_ids = item_ids.to(device, non_blocking=True)
+                item_know = item_know.to(device, non_blocking=True)
+                y_target = y_target.to(device, non_blocking=True)
                 y_pred = self.forward(user_ids, item_ids, item_know, device)
 
                 output_1 = y_pred  # 预测正确概率
@@ -270,23 +269,19 @@ class ConCDF(nn.Module):
                 self.pos_clipper([self.user_contract, self.item_contract])
                 self.pos_clipper([self.cross_layer1, self.cross_layer2])
 
-                # 将预测结果变为整数数组
-                y_pred_batch = labelize(y_pred)
-                # 将该轮预测结果链接到总数组中
-                y_pred_all = np.concatenate([y_pred_all, y_pred_batch], axis=0)
+                train_metrics.update(y_pred, y_target)
 
-                loss_all += loss.item()
+                loss_all += loss.detach()
                 n_batch += 1
 
                 if batch_count % batch_show == batch_show - 1:
                     self.logger.write('ConCDF:'
                                       'epoch = {}, batch = {}, loss = {}'.format(
-                        step, batch_count, loss_all / batch_show), logger_mode)
+                        step, batch_count, float(loss_all) / batch_show), logger_mode)
                     loss_all = 0.0
                 batch_count += 1
 
-            # train_acc = accuracy_score(y_target_all, y_pred_all)
-            train_f1 = f1_score(y_target_all, y_pred_all)
+            train_f1 = train_metrics.compute()['f1']
 
             self.logger.write('ConCDF:'
                               'epoch = {}, train_f1 = {}'.format(step, train_f1), logger_mode)
@@ -352,15 +347,22 @@ class ConCDF(nn.Module):
         return result
 
     def validate(self, valid_data: pd.DataFrame, Q_matrix: np.array, device, logger_mode):
-        valid_pred = self.predict(valid_data, Q_matrix, device)
-        z_true = valid_pred['score'].astype(int).tolist()
-        z_score = valid_pred['predict_score'].tolist()
-        z_label = valid_pred['predict_label'].tolist()
-
-        valid_acc = accuracy_score(z_true, z_label)
-        valid_auc = roc_auc_score(z_true, z_score)
-        valid_f1 = f1_score(z_true, z_label)
-        valid_mse = mean_squared_error(z_true, z_score)
+        dataloader = TrainDataLoader(valid_data, Q_matrix, 8192)
+        metrics = MetricAccumulator(dataloader.n_sample, device)
+        self._to_device(device)
+        with torch.no_grad():
+            while not dataloader.is_end():
+                user_ids, item_ids, item_know, y_target = dataloader.next_batch()
+                user_ids = user_ids.to(device)
+                item_ids = item_ids.to(device)
+                item_know = item_know.to(device)
+                metrics.update(self.forward(user_ids, item_ids, item_know, device=device), y_target)
+        result = metrics.compute()
+
+        valid_acc = result['acc']
+        valid_auc = result['auc']
+        valid_f1 = result['f1']
+        valid_mse = result['mse']
 
         self.logger.write('ConCDF:'
                           'valid acc = {}'.format(valid_acc), logger_mode)
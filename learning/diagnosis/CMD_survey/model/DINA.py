@@ -3,7 +3,7 @@ import numpy as np
 import torch
 from torch import nn
 from tqdm import tqdm
-from sklearn.metrics import roc_auc_score, accuracy_score, f1_score
+from .metrics import MetricAccumulator
 import torch.autograd as autograd
 import torch.nn.functional as F
 import sys
@@ -81,7 +81,7 @@ class DINA:
         else:
             self.dina_net = DINANet(user_num, item_num, hidden_dim)
 
-    def train(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001) -> ...:
+    def train(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001, epoch_callback=None) -> ...:
         self.dina_net = self.dina_net.to(device)
         loss_function = nn.BCELoss()
 
@@ -114,6 +114,8 @@ class DINA:
             if test_data is not None:
                 auc, accuracy, rmse, f1 = self.eval(test_data, device=device)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (e, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(e, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = e
                     best_auc = auc
@@ -125,7 +127,7 @@ class DINA:
             print('BEST epoch<%d>, auc: %s, acc: %s, rmse: %.6f, f1: %.6f' % (best_epoch, best_auc, acc1, rmse1, best_f1))
         return best_epoch, best_auc, acc1
 
-    def train_with_curves(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001) -> ...:
+    def train_with_curves(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001, epoch_callback=None) -> ...:
         self.dina_net = self.dina_net.to(device)
         loss_function = nn.BCELoss()
 
@@ -162,6 +164,8 @@ class DINA:
                 training_curves['auc'].append(auc)
                 training_curves['rmse'].append(rmse)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (e, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(e, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = e
                     best_auc = auc
@@ -174,20 +178,19 @@ class DINA:
     def eval(self, test_data, device="cpu") -> tuple:
         self.dina_net = self.dina_net.to(device)
         self.dina_net.eval()
-        y_pred = []
-        y_true = []
-        for batch_data in tqdm(test_data, "evaluating", file=sys.stdout):
-            user_id, item_id, knowledge, response = batch_data
-            user_id: torch.Tensor = user_id.to(device)
-            item_id: torch.Tensor = item_id.to(device)
-            knowledge: torch.Tensor = knowledge.to(device)
-            pred: torch.Tensor = self.dina_net(user_id, item_id, knowledge)
-            y_pred.extend(pred.tolist())
-            y_true.extend(response.tolist())
-        rmse = np.sqrt(np.mean((np.array(y_true) - np.array(y_pred)) ** 2))
+        metrics = MetricAccumulator(len(test_data.dataset), device)
+        with torch.no_grad():
+            for batch_data in tqdm(test_data, "evaluating", file=sys.stdout):
+                user_id, item_id, knowledge, response = batch_data
+                user_id: torch.Tensor = user_id.to(device)
+                item_id: torch.Tensor = item_id.to(device)
+                knowledge: torch.Tensor = knowledge.to(device)
+                pred: torch.Tensor = self.dina_net(user_id, item_id, knowledge)
+                metrics.update(pred, response)
+        result = metrics.compute()
 
         self.dina_net.train()
-        return roc_auc_score(y_true, y_pred), accuracy_score(y_true, np.array(y_pred) >= 0.5), rmse, f1_score(y_true, np.array(y_pred) >= 0.5)
+        return result['auc'], result['acc'], result['rmse'], result['f1']
 
     def save(self, filepath):
         torch.save(self.dina_net.state_dict(), filepath)
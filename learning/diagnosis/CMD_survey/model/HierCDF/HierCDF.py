@@ -5,7 +5,6 @@ import gc
 import networkx as nx
 import numpy as np
 import pandas as pd
-from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, mean_squared_error
 import time
 import torch
 import torch.nn as nn
@@ -13,10 +12,11 @@ import warnings
 
 from .dataloader import TrainDataLoader
 from .itf import mirt2pl, sigmoid_dot, dot, itf_dict
+from ..metrics import MetricAccumulator
+from ..parent_index import ParentIndex
 from .tools import Logger, df_preview, format_hparams, labelize, to_numpy
 
 warnings.filterwarnings('ignore')
-torch.set_default_tensor_type(torch.DoubleTensor)
 
 
 class HierCDF(nn.Module):
@@ -48,6 +48,8 @@ class HierCDF(nn.Module):
 
         # 将表示知识的图进行拓扑排序，排序点和边
         self.topo_order = list(nx.topological_sort(self.know_edge))
+        # 父结点索引与拓扑层次，后验推理时按层批量计算
+        self.parent_index = ParentIndex(know_graph, n_know)
 
         # the conditional mastery degree when parent is mastered父结点掌握时的概率
         condi_p = torch.Tensor(n_user, know_graph.shape[0])
@@ -122,83 +124,14 @@ class HierCDF(nn.Module):
     '''
 
     def get_posterior(self, user_ids: torch.LongTensor, device='cpu') -> torch.Tensor:
-        n_batch = user_ids.shape[0]  # 获取user_ids的batch信息，表示用户数量（学生数）
-
-        # 初始化posterior，其形式为（n_batch,n_know）
-        # posterior存后验概率，行表示单一用户对不同知识点的掌握情况，
-        #                   列表示单一知识点在不同用户的体现
-        posterior = torch.rand(n_batch, self.n_know).to(device)
-
         # 获取批量参数并用sigmoid函数激活
         batch_priori = torch.sigmoid(self.priori[user_ids, :])  # 取出与user_ids相对应编号的priori信息，这里取出的是各自的n_know信息
         batch_condi_p = torch.sigmoid(self.condi_p[user_ids, :])  # c+
         batch_condi_n = torch.sigmoid(self.condi_n[user_ids, :])  # c-
 
-        # self.logger.write('batch_priori:{}'.format(batch_priori.requires_grad),'console')
-
-        # 按拓扑顺序计算每个知识点的后验概率
-        # for k in range(self.n_know):
-        for k in self.topo_order:
-            # get predecessor list获取当前知识点的所有父结点
-            predecessors = list(self.know_edge.predecessors(k))  # predecessors(k)返回图中的边m，且m->k存在有向边
-            predecessors.sort()
-            len_p = len(predecessors)
-
-            # for each knowledge k, do:
-            # 无父节点的情况:从先验(priori)中找到该无父节点的概率，然后传给对应的后验概率（posterior）
-            if len_p == 0:
-                priori = batch_priori[:, k]
-                posterior[:, k] = priori.reshape(-1)
-                continue
-
-            # format of masks生成所有父结点掌握状态的掩码,规定掩码的形式，确定长度信息
-            fmt = '{0:0%db}' % (len_p)
-            # number of parent master condition父结点状态组合数，有len_p个父节点，就有2^len_p个不同掌握情况
-            n_condi = 2 ** len_p
-
-            # sigmoid to limit priori to (0,1)
-            # priori = batch_priori[:,predecessors]获取父结点的后验概率，由于是拓扑排序，父结点的后验概率已经得出，因此传给对应的先验概率表示
-            priori = posterior[:, predecessors]
-
-            # self.logger.write('priori:{}'.format(priori.requires_grad),'console')
-
-            # 获取当前知识点的条件概率参数
-            pred_idx = self.know_graph[self.know_graph['to'] == k].sort_values(by='from').index
-            condi_p = torch.pow(batch_condi_p[:, pred_idx], 1 / len_p)  # c+,经过几何平均进行了调整，防止结果过大
-            condi_n = torch.pow(batch_condi_n[:, pred_idx], 1 / len_p)
-
-            # 计算边际概率，Eq.(7)的C（θ）的计算的准备
-            margin_p = condi_p * priori
-            margin_n = condi_n * (1.0 - priori)
-
-            # 创建全0张量，这里形式为1行n_batch列
-            posterior_k = torch.zeros((1, n_batch)).to(device)
-
-            # 对所有父结点状态组合进行边缘化
-            for idx in range(n_condi):
-                # for each parent mastery condition, do:
-                mask = fmt.format(idx)
-                # 二进制字符串-->Python字符串数组-->numpy数组-->数组各值转化为int-->Tensor
-                mask = torch.Tensor(np.array(list(mask)).astype(int)).to(device)
-
-                # mask相当于θ，对应位为1时为margin_p，否则为margin_n，这里是c(θ)的正式计算
-                '''
-                论文中的Eq.(8)和Eq.(9)中都有θ_i_jz，通过Eq.(10)与Eq.(9)的联合，Eq.(10)可化为先累乘后累加的形式
-                当其为1时，Eq.(10)的累乘各项就可表示为：m*(c+)^(1/q)---->margin_p
-                当其为0时，Eq.(10)的累乘各项可表示为：(1-m)*(c-)^(1/q)---->margin_n
-                综合考虑0,1时即为margin
-                '''
-                margin = mask * margin_p + (1 - mask) * margin_n
-                margin = torch.prod(margin, dim=1).unsqueeze(dim=0)  # 将margin的各个乘项相乘，并转换成与posterior_k相对应的形状格式，方便后续拼接操作
-
-                # posterior_k每行代表一个父结点掌握情况组合，每列代表一个用户
-                # 通过cat在posterior中添加新的一个组合行margin
-                posterior_k = torch.cat([posterior_k, margin], dim=0)
-            posterior_k = (torch.sum(posterior_k, dim=0)).squeeze()  # 计算完累乘后继续计算公式里的累加
-
-            posterior[:, k] = posterior_k.reshape(-1)  # 将当前计算节点k的各个用户的结果更新至posterior中
-
-        return posterior
+        # 按拓扑层次计算：无父结点的知识点取先验，其余结点的父结点后验在上一层已得出，
+        # Eq.(8)~(10) 中对父结点掌握状态 θ 的求和按父结点分解为逐项乘积（见 ParentIndex.posterior）
+        return self.parent_index.posterior(batch_priori, batch_condi_p, batch_condi_n)
 
     '''
     计算父结点都掌握的情况下的极端(c+)^(len_p)
@@ -206,26 +139,9 @@ class HierCDF(nn.Module):
     '''
 
     def get_condi_p(self, user_ids: torch.LongTensor, device='cpu') -> torch.Tensor:
-        n_batch = user_ids.shape[0]
-        result_tensor = torch.rand(n_batch, self.n_know).to(device)
         batch_priori = torch.sigmoid(self.priori[user_ids, :])
         batch_condi_p = torch.sigmoid(self.condi_p[user_ids, :])
-
-        # for k in range(self.n_know):
-        for k in self.topo_order:
-            # get predecessor list
-            predecessors = list(self.know_edge.predecessors(k))
-            predecessors.sort()
-            len_p = len(predecessors)
-            if len_p == 0:
-                priori = batch_priori[:, k]
-                result_tensor[:, k] = priori.reshape(-1)
-                continue
-            pred_idx = self.know_graph[self.know_graph['to'] == k].sort_values(by='from').index
-            condi_p = torch.pow(batch_condi_p[:, pred_idx], 1 / len_p)
-            result_tensor[:, k] = torch.prod(condi_p, dim=1).reshape(-1)
-
-        return result_tensor
+        return self.parent_index.condi_extreme(batch_priori, batch_condi_p)
 
     '''
     计算父结点都未掌握的情况下的极端(c-)^(len_p)
@@ -233,26 +149,9 @@ class HierCDF(nn.Module):
     '''
 
     def get_condi_n(self, user_ids: torch.LongTensor, device='cpu') -> torch.Tensor:
-        n_batch = user_ids.shape[0]
-        result_tensor = torch.rand(n_batch, self.n_know).to(device)
         batch_priori = torch.sigmoid(self.priori[user_ids, :])
         batch_condi_n = torch.sigmoid(self.condi_n[user_ids, :])
-
-        # for k in range(self.n_know):
-        for k in self.topo_order:
-            # get predecessor list
-            predecessors = list(self.know_edge.predecessors(k))
-            predecessors.sort()
-            len_p = len(predecessors)
-            if len_p == 0:
-                priori = batch_priori[:, k]
-                result_tensor[:, k] = priori.reshape(-1)
-                continue
-            pred_idx = self.know_graph[self.know_graph['to'] == k].sort_values(by='from').index
-            condi_n = torch.pow(batch_condi_n[:, pred_idx], 1 / len_p)
-            result_tensor[:, k] = torch.prod(condi_n, dim=1).reshape(-1)
-
-        return result_tensor
+        return self.parent_index.condi_extreme(batch_priori, batch_condi_n)
 
     '''
     自制拼接操作
@@ -347,12 +246,12 @@ class HierCDF(nn.Module):
         # 选择NLLLoss损失函数
         loss_fn = MyLoss(self, nn.NLLLoss, loss_factor)
 
-        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size)
+        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size, pin_memory=hparams.get('pin_memory', False))
+        # 训练指标在设备上流式累加，每轮结束统一计算
+        train_metrics = MetricAccumulator(dataloader.n_sample, device)
 
         optimizer = torch.optim.Adam(params=self.parameters(), lr=lr)
 
-        y_target_all = np.array(train_data.loc[:, 'score']).astype(np.int_)
-
         # 记录最佳指标
         best_epoch = -1
         best_auc = 0.0
@@ -360,18 +259,18 @@ class HierCDF(nn.Module):
         best_rmse = float('inf')
 
         for step in range(1, epoch + 1):
-            dataloader.reset(shuffle=False)
+            dataloader.reset(shuffle=hparams.get('shuffle', True))
             n_batch = 0
-            y_pred_all = np.array([])
+            train_metrics.reset()
             loss_all = 0.0
             batch_count = 0
             while not dataloader.is_end():
                 optimizer.zero_grad()
                 user_ids, item_ids, item_know, y_target = dataloader.next_batch()
-                user_ids = user_ids.to(device)
-                item_ids = item_ids.to(device)
-                item_know = item_know.to(device)
-                y_target = y_target.to(device)
+                user_ids = user_ids.to(device, non_blocking=True)
+                item_ids = item_ids.to(device, non_blocking=True)
+                item_know = item_know.to(device, non_blocking=True)
+                y_target = y_target.to(device, non_blocking=True)
                 y_pred = self.forward(user_ids, item_ids, item_know, device)
 
                 output_1 = y_pred  # 预测正确概率
@@ -386,23 +285,21 @@ class HierCDF(nn.Module):
                 self.pos_clipper([self.user_contract, self.item_contract])
                 self.pos_clipper([self.cross_layer1, self.cross_layer2])
 
-                # 将预测结果变为整数数组
-                y_pred_batch = labelize(y_pred)
-                # 将该轮预测结果链接到总数组中
-                y_pred_all = np.concatenate([y_pred_all, y_pred_batch], axis=0)
+                train_metrics.update(y_pred, y_target)
 
-                loss_all += loss.item()
+                loss_all += loss.detach()
                 n_batch += 1
 
                 if batch_count % batch_show == batch_show - 1:
                     self.logger.write('HierCDF:'
                                       'epoch = {}, batch = {}, loss = {}'.format(
-                        step, batch_count, loss_all / batch_show), logger_mode)
+                        step, batch_count, float(loss_all) / batch_show), logger_mode)
                     loss_all = 0.0
                 batch_count += 1
 
-            train_acc = accuracy_score(y_target_all, y_pred_all)
-            train_f1 = f1_score(y_target_all, y_pred_all)
+            train_result = train_metrics.compute()
+            train_acc = train_result['acc']
+            train_f1 = train_result['f1']
 
             self.logger.write('HierCDF:'
                               'epoch = {}, train_f1 = {}'.format(step, train_acc), logger_mode)
@@ -476,15 +373,23 @@ class HierCDF(nn.Module):
         return result
 
     def validate(self, valid_data: pd.DataFrame, Q_matrix: np.array, device, logger_mode):
-        valid_pred = self.predict(valid_data, Q_matrix, device)
-        z_true = valid_pred['score'].astype(int).tolist()
-        z_score = valid_pred['predict_score'].tolist()
-        z_label = valid_pred['predict_label'].tolist()
-
-        valid_acc = accuracy_score(z_true, z_label)
-        valid_auc = roc_auc_score(z_true, z_score)
-        valid_f1 = f1_score(z_true, z_label)
-        valid_mse = mean_squared_error(z_true, z_score)
+        valid_data = self._filter_samples_by_item_id(valid_data, self.max_exercise_id, 'console', 'valid')
+        dataloader = TrainDataLoader(valid_data, Q_matrix, 8192)
+        metrics = MetricAccumulator(dataloader.n_sample, device)
+        self._to_device(device)
+        with torch.no_grad():
+            while not dataloader.is_end():
+                user_ids, item_ids, item_know, y_target = dataloader.next_batch()
+                user_ids = user_ids.to(device)
+                item_ids = item_ids.to(device)
+                item_know = item_know.to(device)
+                metrics.update(self.forward(user_ids, item_ids, item_know, device=device), y_target)
+        result = metrics.compute()
+
+        valid_acc = result['acc']
+        valid_auc = result['auc']
+        valid_f1 = result['f1']
+        valid_mse = result['mse']
 
         self.logger.write('HierCDF:'
                           'valid acc = {}'.format(valid_acc), logger_mode)
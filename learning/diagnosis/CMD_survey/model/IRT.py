@@ -4,7 +4,7 @@ import torch
 from torch import nn
 import torch.nn.functional as F
 from tqdm import tqdm
-from sklearn.metrics import roc_auc_score, accuracy_score, f1_score
+from .metrics import MetricAccumulator
 import time
 import sys
 
@@ -108,7 +108,7 @@ class IRT:
         super(IRT, self).__init__()
         self.irt_net = IRTNet(user_num, item_num, value_range, a_range)
 
-    def train(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001) -> ...:
+    def train(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001, epoch_callback=None) -> ...:
         self.irt_net = self.irt_net.to(device)
         loss_function = nn.BCELoss()
 
@@ -140,6 +140,8 @@ class IRT:
             if test_data is not None:
                 auc, accuracy, rmse, f1 = self.eval(test_data, device=device)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (e, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(e, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = e
                     best_auc = auc
@@ -150,7 +152,7 @@ class IRT:
             print('BEST epoch<%d>, auc: %s, acc: %s, rmse: %.6f, f1: %.6f' % (best_epoch, best_auc, best_acc, best_rmse, best_f1))
         return best_epoch, best_auc, best_acc,best_rmse
 
-    def train_with_curves(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001) -> ...:
+    def train_with_curves(self, train_data, test_data=None, *, epoch: int, device="cpu", lr=0.001, epoch_callback=None) -> ...:
         self.irt_net = self.irt_net.to(device)
         loss_function = nn.BCELoss()
 
@@ -186,6 +188,8 @@ class IRT:
                 training_curves['auc'].append(auc)
                 training_curves['rmse'].append(rmse)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (e, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(e, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = e
                     best_auc = auc
@@ -198,19 +202,18 @@ class IRT:
     def eval(self, test_data, device="cpu") -> tuple:
         self.irt_net = self.irt_net.to(device)
         self.irt_net.eval()
-        y_pred = []
-        y_true = []
-        for batch_data in tqdm(test_data, "evaluating", file=sys.stdout):
-            user_id, item_id, _, response = batch_data
-            user_id: torch.Tensor = user_id.to(device)
-            item_id: torch.Tensor = item_id.to(device)
-            pred: torch.Tensor = self.irt_net(user_id, item_id)
-            y_pred.extend(pred.tolist())
-            y_true.extend(response.tolist())
-        rmse = np.sqrt(np.mean((np.array(y_true) - np.array(y_pred)) ** 2))
+        metrics = MetricAccumulator(len(test_data.dataset), device)
+        with torch.no_grad():
+            for batch_data in tqdm(test_data, "evaluating", file=sys.stdout):
+                user_id, item_id, _, response = batch_data
+                user_id: torch.Tensor = user_id.to(device)
+                item_id: torch.Tensor = item_id.to(device)
+                pred: torch.Tensor = self.irt_net(user_id, item_id)
+                metrics.update(pred, response)
+        result = metrics.compute()
 
         self.irt_net.train()
-        return roc_auc_score(y_true, y_pred), accuracy_score(y_true, np.array(y_pred) >= 0.5), rmse, f1_score(y_true, np.array(y_pred) >= 0.5)
+        return result['auc'], result['acc'], result['rmse'], result['f1']
 
     def save(self, filepath):
         torch.save(self.irt_net.state_dict(), filepath)
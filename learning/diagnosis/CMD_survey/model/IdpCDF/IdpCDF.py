@@ -6,14 +6,13 @@ import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, roc_auc_score
 
 from .dataloader import TrainDataLoader
 from .itf import itf_dict
+from ..metrics import MetricAccumulator
 from .tools import Logger, format_hparams, labelize, to_numpy
 
 warnings.filterwarnings("ignore")
-torch.set_default_tensor_type(torch.DoubleTensor)
 
 
 class IRTCDM(nn.Module):
@@ -163,12 +162,6 @@ class IRTCDM(nn.Module):
     def _to_device(self, device):
         self.to(device)
 
-    @staticmethod
-    def _safe_auc(y_true, y_score):
-        if len(np.unique(y_true)) < 2:
-            return float("nan")
-        return roc_auc_score(y_true, y_score)
-
     def train(
         self,
         hparams: dict,
@@ -198,7 +191,9 @@ class IRTCDM(nn.Module):
                 valid_data = None
 
         loss_fn = MyLoss(self, nn.NLLLoss, loss_factor)
-        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size)
+        dataloader = TrainDataLoader(train_data, Q_matrix, batch_size, pin_memory=hparams.get("pin_memory", False))
+        # 训练指标在设备上流式累加，每轮结束统一计算
+        train_metrics = MetricAccumulator(dataloader.n_sample, device)
         optimizer = torch.optim.Adam(self.parameters(), lr=lr)
 
         # 记录最佳指标
@@ -208,20 +203,18 @@ class IRTCDM(nn.Module):
         best_rmse = float('inf')
 
         for step in range(1, epoch + 1):
-            dataloader.reset(shuffle=False)
-            y_score_all = np.array([])
-            y_label_all = np.array([], dtype=np.int_)
-            y_target_all = np.array([], dtype=np.int_)
+            dataloader.reset(shuffle=hparams.get("shuffle", True))
+            train_metrics.reset()
             loss_all = 0.0
             batch_count = 0
 
             while not dataloader.is_end():
                 optimizer.zero_grad()
                 user_ids, item_ids, item_know, y_target = dataloader.next_batch()
-                user_ids = user_ids.to(device)
-                item_ids = item_ids.to(device)
-                item_know = item_know.to(device)
-                y_target = y_target.to(device)
+                user_ids = user_ids.to(device, non_blocking=True)
+                item_ids = item_ids.to(device, non_blocking=True)
+                item_know = item_know.to(device, non_blocking=True)
+                y_target = y_target.to(device, non_blocking=True)
 
                 y_pred = self.forward(user_ids, item_ids, item_know, device)
                 output_1 = y_pred
@@ -235,24 +228,23 @@ class IRTCDM(nn.Module):
 
                 self.pos_clipper([self.user_contract, self.item_contract, self.cross_layer1, self.cross_layer2])
 
-                y_score_all = np.concatenate([y_score_all, to_numpy(y_pred)], axis=0)
-                y_label_all = np.concatenate([y_label_all, labelize(y_pred)], axis=0)
-                y_target_all = np.concatenate([y_target_all, y_target.detach().cpu().numpy()], axis=0)
-                loss_all += loss.item()
+                train_metrics.update(y_pred, y_target)
+                loss_all += loss.detach()
 
                 if batch_count % batch_show == batch_show - 1:
                     self.logger.write(
                         "IdpCDF:"
-                        "epoch = {}, batch = {}, loss = {}".format(step, batch_count, loss_all / batch_show),
+                        "epoch = {}, batch = {}, loss = {}".format(step, batch_count, float(loss_all) / batch_show),
                         logger_mode,
                     )
                     loss_all = 0.0
                 batch_count += 1
 
-            train_acc = accuracy_score(y_target_all, y_label_all)
-            train_f1 = f1_score(y_target_all, y_label_all)
-            train_auc = self._safe_auc(y_target_all, y_score_all)
-            train_mse = mean_squared_error(y_target_all, y_score_all)
+            train_result = train_metrics.compute()
+            train_acc = train_result["acc"]
+            train_f1 = train_result["f1"]
+            train_auc = train_result["auc"]
+            train_mse = train_result["mse"]
             self.logger.write(
                 "IdpCDF:"
                 "epoch = {}, train_acc = {}, train_f1 = {}, train_auc = {}, train_mse = {}".format(
@@ -300,9 +292,9 @@ class IRTCDM(nn.Module):
         with torch.no_grad():
             while not dataloader.is_end():
                 user_ids, item_ids, item_know, _ = dataloader.next_batch()
-                user_ids = user_ids.to(device)
-                item_ids = item_ids.to(device)
-                item_know = item_know.to(device)
+                user_ids = user_ids.to(device, non_blocking=True)
+                item_ids = item_ids.to(device, non_blocking=True)
+                item_know = item_know.to(device, non_blocking=True)
 
                 z_output = self.forward(user_ids, item_ids, item_know, device=device)
                 df_batch = pd.DataFrame(
@@ -316,15 +308,23 @@ class IRTCDM(nn.Module):
         return data.reset_index(drop=True).join(df_pred.reset_index(drop=True))
 
     def validate(self, valid_data: pd.DataFrame, Q_matrix: np.array, device, logger_mode):
-        valid_pred = self.predict(valid_data, Q_matrix, device)
-        z_true = valid_pred["score"].astype(int).tolist()
-        z_score = valid_pred["predict_score"].tolist()
-        z_label = valid_pred["predict_label"].tolist()
-
-        valid_acc = accuracy_score(z_true, z_label)
-        valid_auc = self._safe_auc(z_true, z_score)
-        valid_f1 = f1_score(z_true, z_label)
-        valid_mse = mean_squared_error(z_true, z_score)
+        valid_data = self._filter_samples_by_item_id(valid_data, self.max_exercise_id, "console", "valid")
+        dataloader = TrainDataLoader(valid_data, Q_matrix, 8192)
+        metrics = MetricAccumulator(dataloader.n_sample, device)
+        self._to_device(device)
+        with torch.no_grad():
+            while not dataloader.is_end():
+                user_ids, item_ids, item_know, y_target = dataloader.next_batch()
+                user_ids = user_ids.to(device)
+                item_ids = item_ids.to(device)
+                item_know = item_know.to(device)
+                metrics.update(self.forward(user_ids, item_ids, item_know, device=device), y_target)
+        result = metrics.compute()
+
+        valid_acc = result["acc"]
+        valid_auc = result["auc"]
+        valid_f1 = result["f1"]
+        valid_mse = result["mse"]
 
         self.logger.write("IdpCDF:"
                           "valid acc = {}".format(valid_acc), logger_mode)
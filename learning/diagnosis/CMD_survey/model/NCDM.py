@@ -5,7 +5,7 @@ import torch.optim as optim
 import torch.nn.functional as F
 import numpy as np
 from tqdm import tqdm
-from sklearn.metrics import roc_auc_score, accuracy_score, f1_score
+from .metrics import MetricAccumulator
 import sys
 
 
@@ -105,7 +105,7 @@ class NCDM:
         super(NCDM, self).__init__()
         self.ncdm_net = Net(knowledge_n, exer_n, student_n)
 
-    def train(self, train_data, test_data=None, epoch=10, device="cpu", lr=0.002, silence=False):
+    def train(self, train_data, test_data=None, epoch=10, device="cpu", lr=0.002, silence=False, epoch_callback=None):
         self.ncdm_net = self.ncdm_net.to(device)
         self.ncdm_net.train()
         loss_function = nn.BCELoss()
@@ -140,6 +140,8 @@ class NCDM:
             if test_data is not None:
                 auc, accuracy, rmse, f1 = self.eval(test_data, device=device)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (epoch_i, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(epoch_i, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = epoch_i
                     best_auc = auc
@@ -150,7 +152,7 @@ class NCDM:
             print('BEST epoch<%d>, auc: %s, acc: %s, rmse: %.6f, f1: %.6f' % (best_epoch, best_auc, best_acc, best_rmse, best_f1))
         return best_epoch, best_auc, best_acc,best_rmse
 
-    def train_with_curves(self, train_data, test_data=None, epoch=10, device="cpu", lr=0.002, silence=False):
+    def train_with_curves(self, train_data, test_data=None, epoch=10, device="cpu", lr=0.002, silence=False, epoch_callback=None):
         self.ncdm_net = self.ncdm_net.to(device)
         loss_function = nn.BCELoss()
         optimizer = optim.Adam(self.ncdm_net.parameters(), lr=lr)
@@ -187,6 +189,8 @@ class NCDM:
                 training_curves['auc'].append(auc)
                 training_curves['rmse'].append(rmse)
                 print("[Epoch %d] auc: %.6f, accuracy: %.6f, rmse: %.6f, f1: %.6f" % (epoch_i, auc, accuracy, rmse, f1))
+                if epoch_callback is not None:
+                    epoch_callback(epoch_i, epoch, {'auc': auc, 'acc': accuracy, 'rmse': rmse})
                 if auc > best_auc:
                     best_epoch = epoch_i
                     best_auc = auc
@@ -199,19 +203,18 @@ class NCDM:
     def eval(self, test_data, device="cpu"):
         self.ncdm_net = self.ncdm_net.to(device)
         self.ncdm_net.eval()
-        y_true, y_pred = [], []
-        for batch_data in tqdm(test_data, "Evaluating", file=sys.stdout):
-            user_id, item_id, knowledge_emb, y = batch_data
-            user_id: torch.Tensor = user_id.to(device)
-            item_id: torch.Tensor = item_id.to(device)
-            knowledge_emb: torch.Tensor = knowledge_emb.to(device)
-            pred: torch.Tensor = self.ncdm_net(user_id, item_id, knowledge_emb)
-
-            y_pred.extend(pred.detach().cpu().tolist())
-            y_true.extend(y.tolist())
-        rmse = np.sqrt(np.mean((np.array(y_true) - np.array(y_pred)) ** 2))
+        metrics = MetricAccumulator(len(test_data.dataset), device)
+        with torch.no_grad():
+            for batch_data in tqdm(test_data, "Evaluating", file=sys.stdout):
+                user_id, item_id, knowledge_emb, y = batch_data
+                user_id: torch.Tensor = user_id.to(device)
+                item_id: torch.Tensor = item_id.to(device)
+                knowledge_emb: torch.Tensor = knowledge_emb.to(device)
+                pred: torch.Tensor = self.ncdm_net(user_id, item_id, knowledge_emb)
+                metrics.update(pred, y)
+        result = metrics.compute()
 
-        return roc_auc_score(y_true, y_pred), accuracy_score(y_true, np.array(y_pred) >= 0.5), rmse, f1_score(y_true, np.array(y_pred) >= 0.5)
+        return result['auc'], result['acc'], result['rmse'], result['f1']
 
     def save(self, filepath):
         torch.save(self.ncdm_net.state_dict(), filepath)
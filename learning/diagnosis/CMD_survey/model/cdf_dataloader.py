@@ -0,0 +1,60 @@
+"""
+CDF 系列模型（HierCDF / ConCDF / PCGCDF / IdpCDF）共用的批数据加载器
+
+作答记录 DataFrame 在构造时一次性转成连续的 int64 张量，Q 矩阵转成 float32 张量；
+每个 batch 只是对（打乱后的）下标切片，再按习题 gather 出 Q 矩阵的行，
+不再逐条 iloc 取数。接口与原各模型目录下的 TrainDataLoader 保持一致：
+    reset(shuffle) / is_end() / next_batch() -> (学生ID, 习题ID, item_know, score)
+"""
+
+import numpy as np
+import pandas as pd
+import torch
+
+ITEM_COLUMNS = ('exercise_id', 'exer_id', 'item_id')
+
+
+def _item_column(data: pd.DataFrame) -> str:
+    for candidate in ITEM_COLUMNS:
+        if candidate in data.columns:
+            return candidate
+    raise KeyError('no exercise id column found, expected one of {}'.format(ITEM_COLUMNS))
+
+
+class TrainDataLoader:
+    def __init__(self, train_data: pd.DataFrame, Q_matrix: np.array, batch_size: int, pin_memory: bool = False):
+        self.batch_size = batch_size
+        self.n_sample = train_data.shape[0]
+        self.user_ids = torch.from_numpy(np.ascontiguousarray(train_data['user_id'].to_numpy(dtype=np.int64)))
+        self.item_ids = torch.from_numpy(np.ascontiguousarray(train_data[_item_column(train_data)].to_numpy(dtype=np.int64)))
+        self.labels = torch.from_numpy(np.ascontiguousarray(train_data['score'].to_numpy(dtype=np.int64)))
+        self.Q_matrix = torch.from_numpy(np.ascontiguousarray(np.asarray(Q_matrix, dtype=np.float32)))
+        # 只有 CUDA 可用时锁页内存才有意义
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.cursor = 0
+        # None 表示按原顺序读取，直接切片即可
+        self.indices = None
+
+    def next_batch(self) -> list:
+        if self.is_end():
+            return None, None, None, None
+        start, end = self.cursor, min(self.cursor + self.batch_size, self.n_sample)
+        self.cursor = end
+        if self.indices is None:
+            user_ids, item_ids, labels = self.user_ids[start:end], self.item_ids[start:end], self.labels[start:end]
+        else:
+            idx = self.indices[start:end]
+            user_ids, item_ids, labels = self.user_ids[idx], self.item_ids[idx], self.labels[idx]
+        item_know = self.Q_matrix.index_select(0, item_ids)
+        batch = (user_ids, item_ids, item_know, labels)
+        if self.pin_memory:
+            batch = tuple(t.pin_memory() for t in batch)
+        return batch
+
+    def is_end(self) -> bool:
+        return self.cursor >= self.n_sample
+
+    def reset(self, shuffle=True):
+        self.cursor = 0
+        self.indices = torch.randperm(self.n_sample) if shuffle else None
+        return
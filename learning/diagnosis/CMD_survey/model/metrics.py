@@ -0,0 +1,91 @@
+"""
+流式二分类指标累加器（CDF 系列训练循环与 NCDM / IRT / DINA 的 eval 共用）
+
+预测分数和标签在所在设备上写入预先分配的缓冲区，每个 batch 只做一次切片拷贝，
+不再逐 batch np.concatenate / .cpu()；一轮结束时 compute() 一次性算出
+acc / f1 / auc / rmse / mse，只在最后做一次设备到主机的同步。
+结果与 sklearn 的 accuracy_score / f1_score / roc_auc_score 一致（AUC 对并列分数取平均秩）。
+"""
+
+import math
+
+import torch
+
+
+class MetricAccumulator:
+    def __init__(self, capacity: int = 0, device='cpu', threshold: float = 0.5):
+        self.device = torch.device(device)
+        self.threshold = threshold
+        self.scores = torch.empty(max(int(capacity), 1), dtype=torch.float32, device=self.device)
+        self.targets = torch.empty_like(self.scores)
+        self.size = 0
+
+    def reset(self):
+        self.size = 0
+        return self
+
+    def _reserve(self, n):
+        # 容量不足时按倍数扩容（只在预估样本数偏小时发生）
+        if n > self.scores.numel():
+            capacity = max(n, 2 * self.scores.numel())
+            scores = torch.empty(capacity, dtype=torch.float32, device=self.device)
+            targets = torch.empty_like(scores)
+            scores[:self.size] = self.scores[:self.size]
+            targets[:self.size] = self.targets[:self.size]
+            self.scores, self.targets = scores, targets
+
+    def update(self, scores: torch.Tensor, targets: torch.Tensor):
+        scores = scores.detach().reshape(-1)
+        targets = targets.detach().reshape(-1)
+        end = self.size + scores.numel()
+        self._reserve(end)
+        self.scores[self.size:end] = scores.to(self.device, torch.float32, non_blocking=True)
+        self.targets[self.size:end] = targets.to(self.device, torch.float32, non_blocking=True)
+        self.size = end
+
+    def compute(self) -> dict:
+        if self.size == 0:
+            nan = float('nan')
+            return {'acc': nan, 'f1': nan, 'auc': nan, 'rmse': nan, 'mse': nan}
+        scores = self.scores[:self.size]
+        targets = self.targets[:self.size]
+        positive = targets > 0.5
+        predicted = scores >= self.threshold
+
+        tp = (predicted & positive).sum()
+        fp = (predicted & ~positive).sum()
+        fn = (~predicted & positive).sum()
+        correct = (predicted == positive).sum()
+        squared_error = ((scores.to(torch.float64) - targets.to(torch.float64)) ** 2).sum()
+
+        # AUC = (正样本秩和 - P(P+1)/2) / (P*N)，并列分数取平均秩
+        sorted_scores, order = torch.sort(scores)
+        _, inverse, counts = torch.unique_consecutive(sorted_scores, return_inverse=True, return_counts=True)
+        ends = torch.cumsum(counts, 0).to(torch.float64)
+        average_rank = (ends - (counts.to(torch.float64) - 1) / 2)[inverse]
+        rank_sum = average_rank[positive[order]].sum()
+        n_positive = positive.sum()
+
+        # 所有统计量一次性拷回主机
+        stats = torch.stack([
+            tp.to(torch.float64), fp.to(torch.float64), fn.to(torch.float64), correct.to(torch.float64),
+            squared_error, rank_sum, n_positive.to(torch.float64),
+        ]).tolist()
+        tp, fp, fn, correct, squared_error, rank_sum, n_positive = stats
+
+        n = self.size
+        n_negative = n - n_positive
+        mse = squared_error / n
+        f1_denominator = 2 * tp + fp + fn
+        if n_positive == 0 or n_negative == 0:
+            # 只有一个类别时 AUC 无定义
+            auc = float('nan')
+        else:
+            auc = (rank_sum - n_positive * (n_positive + 1) / 2) / (n_positive * n_negative)
+        return {
+            'acc': correct / n,
+            'f1': 2 * tp / f1_denominator if f1_denominator else 0.0,
+            'auc': auc,
+            'rmse': math.sqrt(mse),
+            'mse': mse,
+        }
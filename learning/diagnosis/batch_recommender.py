@@ -0,0 +1,302 @@
+"""
+整班批量个性化推荐：一次为一个科目的一批学生生成推荐题目，写入 StudentRecommendation
+
+推荐规则与逐个学生计算的 get_weak_knowledge_exercises / get_10_recommended_exercises 相同：
+    1. 薄弱知识点相关题目最多 5 个，按优先级
+         已学过章节 + 前置知识不足 -> 推荐未掌握的前置知识点的题目
+         已学过章节 + 前置知识充分 -> 推荐薄弱知识点本身的题目
+         未学过章节 + 前置知识不足 / 未学过章节 + 前置知识充分 同上
+       同一优先级内按题目覆盖的目标知识点数排序；
+    2. 不足 10 个时随机补未做过的题目；
+    3. 仍不足时随机补做错过的题目。
+区别在于整科数据只读取一次，组织成 NumPy 矩阵：
+    Q:        题目 × 知识点 的 Q 矩阵
+    A:        知识点 × 知识点 的前置关系闭包（prerequisite_index）
+    M / D:    学生 × 知识点 的掌握程度 / 是否有诊断结果（StudentMasteryVector，诊断模型 3）
+    answered / wrong: 学生 × 题目 的已做 / 做错掩码
+各优先级的目标知识点和题目得分都由矩阵运算得到，argpartition 取每个学生的前 10 个，
+5000 名学生只需几次查询和若干次矩阵乘法。
+
+前置知识不足时，逐个学生的实现按薄弱知识点依次取题；这里把同一优先级内所有薄弱知识点的
+未掌握前置知识合并成一个目标集合统一排序，得到的题目集合基本一致，顺序可能略有不同。
+"""
+
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from learning.mastery_snapshot import RECOMMENDATION_MODEL_ID, WEAK_MASTERY_THRESHOLD, refresh_snapshots
+from learning.models import (
+    AnswerLog, Exercise, KnowledgePoint, QMatrix, StudentMasteryVector, StudentRecommendation, StudentSubject,
+)
+from learning.prerequisite_index import get_prerequisite_index
+
+RECOMMENDATION_SIZE = 10
+WEAK_EXERCISE_LIMIT = 5
+
+# 每次参与矩阵运算的学生数，限制 学生 × 题目 矩阵的内存占用
+STUDENT_CHUNK_SIZE = 1000
+
+
+def parse_chapter(problemsets):
+    """从习题集字段（如 "chapter_3"）提取章节号，无法识别时返回 None"""
+    if not problemsets:
+        return None
+    try:
+        chapter_str = problemsets.replace('chapter_', '').replace('Chapter_', '')
+        return int(''.join(filter(str.isdigit, chapter_str)))
+    except (ValueError, AttributeError):
+        return None
+
+
+def load_subject_matrices(subject_id):
+    """
+    读取一个科目的题目、知识点、Q 矩阵、章节和前置关系闭包
+
+    Returns:
+        dict: exercise_ids / kp_ids（升序，下标即矩阵行列号）、q（题目×知识点 float32）、
+              exercise_chapters（无法识别为 -1）、kp_chapters、prerequisites（知识点×知识点 float32，
+              prerequisites[k, j] = 1 表示 j 是 k 的前置）
+    """
+    exercise_rows = list(Exercise.objects.filter(subject_id=subject_id).order_by('id').values_list('id', 'problemsets'))
+    exercise_ids = np.array([row[0] for row in exercise_rows], dtype=np.int64)
+    exercise_chapters = np.array(
+        [chapter if chapter is not None else -1 for chapter in (parse_chapter(row[1]) for row in exercise_rows)],
+        dtype=np.int64,
+    )
+    exercise_pos = {int(exercise_id): i for i, exercise_id in enumerate(exercise_ids)}
+
+    kp_ids = np.array(
+        sorted(KnowledgePoint.objects.filter(subject_id=subject_id).values_list('id', flat=True)), dtype=np.int64
+    )
+    kp_pos = {int(kp_id): i for i, kp_id in enumerate(kp_ids)}
+
+    q = np.zeros((len(exercise_ids), len(kp_ids)), dtype=np.float32)
+    kp_exercise_chapters = defaultdict(list)
+    for exercise_id, kp_id in QMatrix.objects.filter(
+        exercise__subject_id=subject_id
+    ).order_by('exercise_id').values_list('exercise_id', 'knowledge_point_id'):
+        e, k = exercise_pos.get(exercise_id), kp_pos.get(kp_id)
+        if e is None or k is None:
+            continue
+        q[e, k] = 1.0
+        if exercise_chapters[e] >= 0:
+            kp_exercise_chapters[k].append(int(exercise_chapters[e]))
+
+    # 知识点所属章节取相关题目章节的众数，与 get_knowledge_point_chapter 一致
+    kp_chapters = np.zeros(len(kp_ids), dtype=np.int64)
+    for k, chapters in kp_exercise_chapters.items():
+        kp_chapters[k] = Counter(chapters).most_common(1)[0][0]
+
+    prerequisites = np.zeros((len(kp_ids), len(kp_ids)), dtype=np.float32)
+    index = get_prerequisite_index(subject_id)
+    for k, kp_id in enumerate(kp_ids):
+        for prereq_id in index.prerequisites(kp_id):
+            j = kp_pos.get(prereq_id)
+            if j is not None:
+                prerequisites[k, j] = 1.0
+
+    return {
+        'exercise_ids': exercise_ids,
+        'exercise_pos': exercise_pos,
+        'exercise_chapters': exercise_chapters,
+        'kp_ids': kp_ids,
+        'kp_pos': kp_pos,
+        'kp_chapters': kp_chapters,
+        'q': q,
+        'prerequisites': prerequisites,
+    }
+
+
+def load_student_matrices(student_ids, subject_id, matrices):
+    """
+    读取一批学生的掌握程度矩阵和答题掩码（学生顺序与 student_ids 一致）
+
+    掌握程度来自 StudentMasteryVector 中推荐所用的诊断模型，缺失的快照先补建
+    """
+    student_pos = {student_id: i for i, student_id in enumerate(student_ids)}
+    kp_pos, exercise_pos = matrices['kp_pos'], matrices['exercise_pos']
+    n_students, n_kps, n_exercises = len(student_ids), len(kp_pos), len(exercise_pos)
+
+    vectors = dict(StudentMasteryVector.objects.filter(
+        student_id__in=student_ids, subject_id=subject_id
+    ).values_list('student_id', 'mastery'))
+    missing = [student_id for student_id in student_ids if student_id not in vectors]
+    if missing:
+        refresh_snapshots(missing, subject_id)
+        vectors.update(StudentMasteryVector.objects.filter(
+            student_id__in=missing, subject_id=subject_id
+        ).values_list('student_id', 'mastery'))
+
+    mastery = np.zeros((n_students, n_kps), dtype=np.float32)
+    diagnosed = np.zeros((n_students, n_kps), dtype=bool)
+    for student_id, vector in vectors.items():
+        s = student_pos[student_id]
+        for kp_id, level in vector.get(str(RECOMMENDATION_MODEL_ID), {}).items():
+            k = kp_pos.get(int(kp_id))
+            if k is not None:
+                mastery[s, k] = level
+                diagnosed[s, k] = True
+
+    answered = np.zeros((n_students, n_exercises), dtype=bool)
+    wrong = np.zeros((n_students, n_exercises), dtype=bool)
+    for student_id, exercise_id, is_correct in AnswerLog.objects.filter(
+        student_id__in=student_ids, exercise__subject_id=subject_id
+    ).values_list('student_id', 'exercise_id', 'is_correct').distinct():
+        e = exercise_pos.get(exercise_id)
+        if e is None:
+            continue
+        s = student_pos[student_id]
+        answered[s, e] = True
+        if is_correct is False:
+            wrong[s, e] = True
+
+    return mastery, diagnosed, answered, wrong
+
+
+def _top_k(scores, k):
+    """每行得分最高的 k 列（按得分降序），返回列号矩阵"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def score_students(matrices, mastery, diagnosed, answered, wrong, limit=RECOMMENDATION_SIZE, rng=None):
+    """
+    为一批学生挑选推荐题目
+
+    Returns:
+        list[list[int]]: 每个学生按推荐顺序排列的题目ID
+    """
+    n_students = mastery.shape[0]
+    if n_students == 0 or len(matrices['exercise_ids']) == 0:
+        return [[] for _ in range(n_students)]
+    rng = rng or np.random.default_rng()
+    q_t = matrices['q'].T
+    prerequisites = matrices['prerequisites']
+
+    # 1. 薄弱 / 未掌握知识点，前置知识是否充分（未诊断的前置知识点按掌握程度 0 处理）
+    unmastered = mastery < WEAK_MASTERY_THRESHOLD
+    weak = diagnosed & unmastered
+    unmet = weak & ((unmastered.astype(np.float32) @ prerequisites.T) > 0)
+    met = weak & ~unmet
+
+    # 2. 已学过的最高章节：做过的题目中最高的章节号
+    answered_chapters = np.where(answered, matrices['exercise_chapters'][None, :], -1)
+    max_learned_chapter = np.maximum(answered_chapters.max(axis=1), 0)
+    learned = matrices['kp_chapters'][None, :] <= max_learned_chapter[:, None]
+
+    def unmastered_prerequisites_of(targets):
+        return ((targets.astype(np.float32) @ prerequisites) > 0) & unmastered
+
+    tiers = (
+        unmastered_prerequisites_of(unmet & learned),
+        met & learned,
+        unmastered_prerequisites_of(unmet & ~learned),
+        met & ~learned,
+    )
+
+    # 3. 薄弱知识点题目得分：优先级高的先占位，同一优先级内按覆盖的目标知识点数
+    tier_bonus = float(prerequisites.shape[0] + 1)
+    weak_score = np.zeros(answered.shape, dtype=np.float32)
+    for rank, targets in enumerate(tiers):
+        counts = targets.astype(np.float32) @ q_t
+        weak_score = np.where((weak_score == 0) & (counts > 0), (len(tiers) - rank) * tier_bonus + counts, weak_score)
+    weak_score[answered] = 0
+
+    # 4. 补位得分：未做过的题目随机排在做错过的题目之前，其余题目不推荐
+    noise = rng.random(answered.shape, dtype=np.float32)
+    final_score = np.where(~answered, 2 + noise, np.where(wrong, 1 + noise, -np.inf))
+
+    weak_top = _top_k(weak_score, WEAK_EXERCISE_LIMIT)
+    rows = np.arange(n_students)[:, None]
+    picked = np.take_along_axis(weak_score, weak_top, axis=1) > 0
+    final_score[rows, weak_top] = np.where(picked, 3 + np.take_along_axis(weak_score, weak_top, axis=1),
+                                           final_score[rows, weak_top])
+
+    top = _top_k(final_score, limit)
+    valid = np.isfinite(np.take_along_axis(final_score, top, axis=1))
+    exercise_ids = matrices['exercise_ids']
+    return [[int(exercise_ids[e]) for e, ok in zip(top[s], valid[s]) if ok] for s in range(n_students)]
+
+
+def recommend_for_students(subject_id, student_ids, limit=RECOMMENDATION_SIZE, matrices=None, seed=None):
+    """{学生ID: [推荐题目ID]}，学生按 STUDENT_CHUNK_SIZE 分块计算"""
+    student_ids = sorted({int(student_id) for student_id in student_ids})
+    matrices = matrices or load_subject_matrices(subject_id)
+    rng = np.random.default_rng(seed)
+    recommendations = {}
+    for start in range(0, len(student_ids), STUDENT_CHUNK_SIZE):
+        chunk = student_ids[start:start + STUDENT_CHUNK_SIZE]
+        student_matrices = load_student_matrices(chunk, subject_id, matrices)
+        recommendations.update(zip(chunk, score_students(matrices, *student_matrices, limit=limit, rng=rng)))
+    return recommendations
+
+
+def _save_recommendations(subject_id, recommendations, generated_at):
+    """批量写入/更新 StudentRecommendation"""
+    objects = [
+        StudentRecommendation(student_id=student_id, subject_id=subject_id,
+                              exercise_ids=exercise_ids, generated_at=generated_at)
+        for student_id, exercise_ids in recommendations.items()
+    ]
+    # MySQL 的 ON DUPLICATE KEY UPDATE 不能指定冲突列
+    unique_fields = ['student', 'subject'] if connection.features.supports_update_conflicts_with_target else None
+    for start in range(0, len(objects), STUDENT_CHUNK_SIZE):
+        with transaction.atomic():
+            StudentRecommendation.objects.bulk_create(
+                objects[start:start + STUDENT_CHUNK_SIZE],
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=['exercise_ids', 'generated_at'],
+            )
+
+
+def precompute_recommendations(subject_id, student_ids=None, seed=None):
+    """
+    为一个科目的学生（默认全部选课学生）生成推荐并写入 StudentRecommendation
+
+    Returns:
+        dict: students、exercises、seconds
+    """
+    started = time.perf_counter()
+    if student_ids is None:
+        student_ids = StudentSubject.objects.filter(subject_id=subject_id).values_list('student_id', flat=True)
+    matrices = load_subject_matrices(subject_id)
+    recommendations = recommend_for_students(subject_id, student_ids, matrices=matrices, seed=seed)
+    # 生成时间取计算结束时：计算中补建的掌握度快照不应使结果立即过期
+    _save_recommendations(subject_id, recommendations, timezone.now())
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'students': len(recommendations),
+        'exercises': len(matrices['exercise_ids']),
+        'seconds': round(seconds, 3),
+    }
+    print(f"科目 {subject_id} 推荐生成完成：{stats['students']} 名学生，{stats['exercises']} 道题目，"
+          f"耗时 {stats['seconds']}s")
+    return stats
+
+
+def get_recommended_exercise_ids(student_id, subject_id):
+    """
+    读取学生在一个科目的推荐题目ID
+
+    预计算结果生成之后学生又答题、被批改或重新诊断（掌握度快照有更新）时视为过期，
+    当场只为该学生重新计算并写回。
+    """
+    recommendation = StudentRecommendation.objects.filter(student_id=student_id, subject_id=subject_id).first()
+    if recommendation is not None:
+        snapshot_updated_at = StudentMasteryVector.objects.filter(
+            student_id=student_id, subject_id=subject_id
+        ).values_list('updated_at', flat=True).first()
+        if snapshot_updated_at is None or snapshot_updated_at <= recommendation.generated_at:
+            return list(recommendation.exercise_ids)
+
+    exercise_ids = recommend_for_students(subject_id, [student_id]).get(int(student_id), [])
+    _save_recommendations(subject_id, {int(student_id): exercise_ids}, timezone.now())
+    return exercise_ids
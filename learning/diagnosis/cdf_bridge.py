@@ -2,29 +2,31 @@ import hashlib
 import importlib
 import importlib.util
 import json
+import math
 import random
 import sys
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import torch
-from django.db import transaction
+from django.conf import settings
 from django.utils import timezone
 
 from learning.models import (
     AnswerLog,
-    DiagnosisModel,
     Exercise,
     KnowledgeGraph,
     KnowledgePoint,
     QMatrix,
-    StudentDiagnosis,
     Subject,
     User,
 )
+from learning.diagnosis.diagnosis_writer import bulk_upsert_diagnoses
+from learning.sqlite_cache import JSONCache
 
 # 对外暴露给页面/数据库使用的 CDF 模型名。
 # 这里统一成新命名，后续所有训练和推理入口都先经过这层校验。
@@ -34,6 +36,13 @@ CMD_SURVEY_DATA_ROOT = DIAGNOSIS_ROOT / "CMD_survey" / "data"
 GRAPH_CACHE_ROOT = DIAGNOSIS_ROOT / "corseinfo"
 CHECKPOINT_ROOT = DIAGNOSIS_ROOT / "checkpoints"
 LOG_ROOT = DIAGNOSIS_ROOT / "cdflogs"
+# 大模型生成关系图：每个提示词最多 RELATION_CHUNK_SIZE 个知识点，跨块关系由桥接提示词补充，
+# 桥接时每块取 RELATION_BRIDGE_PER_CHUNK 个代表知识点；最多 RELATION_MAX_CONCURRENCY 个请求同时进行。
+RELATION_LLM_MODEL = "qwen-turbo"
+RELATION_CHUNK_SIZE = 40
+RELATION_BRIDGE_PER_CHUNK = 5
+RELATION_MAX_CONCURRENCY = 4
+DEFAULT_RELATION_CACHE_PATH = Path(settings.BASE_DIR) / "data" / "relation_cache.sqlite3"
 _CMD_SURVEY_MODULE_CACHE: Dict[str, Any] = {}
 
 
@@ -273,24 +282,32 @@ def _extract_json_payload(raw_text: str) -> Any:
     return json.loads(text)
 
 
+# 读取大模型 API key（utils_ai 导入时会配置 dashscope.api_key），未安装 dashscope 或未配置时返回 None。
+def _llm_api_key() -> Optional[str]:
+    try:
+        import dashscope
+    except ImportError:
+        return None
+
+    api_key = getattr(dashscope, "api_key", None)
+    if not api_key:
+        try:
+            from learning import utils_ai  # noqa: F401
+            api_key = getattr(dashscope, "api_key", None)
+        except Exception:
+            api_key = None
+    return api_key or None
+
+
 # 统一调用大模型接口，当前用于生成知识图谱关系候选。
 def _call_llm(prompt: str) -> Any:
     try:
-        import dashscope
         from dashscope import Generation
 
-        api_key = getattr(dashscope, "api_key", None)
-        if not api_key:
-            try:
-                from learning import utils_ai  # noqa: F401
-                api_key = getattr(dashscope, "api_key", None)
-            except Exception:
-                api_key = None
-
-        if not api_key:
+        if not _llm_api_key():
             return None
 
-        return Generation.call(model="qwen-turbo", prompt=prompt, result_format="message")
+        return Generation.call(model=RELATION_LLM_MODEL, prompt=prompt, result_format="message")
     except Exception as exc:
         print(f"LLM call failed: {exc}")
         return None
@@ -363,6 +380,8 @@ def _normalize_relation_item(
 
     score = _safe_float(item.get("score", item.get("confidence", 0.5)), default=0.5)
     return {
+        "source": source_kp_id,
+        "target": target_kp_id,
         "source_kp_id": source_kp_id,
         "target_kp_id": target_kp_id,
         "source_node_id": kp_id_to_node_id.get(source_kp_id),
@@ -374,43 +393,235 @@ def _normalize_relation_item(
     }
 
 
-# 调用大模型抽取候选关系，并完成去重和基础清洗。
-def _generate_relation_candidates(
-    knowledge_points: List[KnowledgePoint],
-    relation_kind: str,
-    kp_id_to_node_id: Dict[int, int],
-    kp_name_to_id: Dict[str, int],
-) -> List[Dict[str, Any]]:
-    response = _call_llm(_build_relation_prompt(knowledge_points, relation_kind))
+# 跨块桥接提示词：各块的代表知识点分组列出，只让大模型补充不同组之间的关系。
+def _build_bridge_prompt(groups: List[List[KnowledgePoint]], relation_kind: str) -> str:
+    config = _graph_kind_config(relation_kind)
+    group_lines = "\n\n".join(
+        f"Group {index}:\n" + "\n".join(f"- kp_id={kp.id}, name={kp.name}" for kp in group)
+        for index, group in enumerate(groups, 1)
+    )
+    return f"""
+You are helping to build a {config['prompt_name']} for an education system.
+The knowledge points below are split into groups. Relations inside each group are already known.
+Rules:
+1. Only use the knowledge points listed below.
+2. Only output edges whose source and target belong to different groups.
+3. Output a pure JSON array, no markdown, no extra explanation.
+4. Each item must include source_kp_id, target_kp_id, score, reason.
+5. Each edge must follow this rule: {config['prompt_rule']}.
+6. Keep the graph sparse and meaningful.
+
+Knowledge points:
+{group_lines}
+
+Return format example:
+[
+  {{
+    "source_kp_id": 1,
+    "target_kp_id": 2,
+    "score": 0.92,
+    "reason": "..."
+  }}
+]
+""".strip()
+
+
+# 超过一块大小的分组按知识点名称的 BERT 向量聚类后再切块；向量不可用时按 id 顺序切块。
+def _split_semantic(group: List[KnowledgePoint], chunk_size: int) -> List[List[KnowledgePoint]]:
+    if len(group) <= chunk_size:
+        return [group]
+
+    try:
+        from learning.knowledge_graph_builder import embedding_service
+
+        vectors = embedding_service.embed_texts([kp.name for kp in group])
+    except Exception as exc:
+        print(f"Knowledge point embedding failed, chunking by id: {exc}")
+        vectors = None
+    if vectors is None:
+        return [group[start : start + chunk_size] for start in range(0, len(group), chunk_size)]
+
+    # 球面 k-means：最远点初始化，保证结果确定
+    n_clusters = math.ceil(len(group) / chunk_size)
+    center_ids = [0]
+    nearest = vectors @ vectors[0]
+    while len(center_ids) < n_clusters:
+        center_ids.append(int(np.argmin(nearest)))
+        nearest = np.maximum(nearest, vectors @ vectors[center_ids[-1]])
+    centers = vectors[center_ids].copy()
+    for _ in range(10):
+        labels = np.argmax(vectors @ centers.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[labels == cluster]
+            if len(members):
+                center = members.sum(axis=0)
+                centers[cluster] = center / max(float(np.linalg.norm(center)), 1e-12)
+
+    pieces: List[List[KnowledgePoint]] = []
+    for cluster in sorted(set(labels.tolist()), key=lambda label: int(np.flatnonzero(labels == label)[0])):
+        members = [kp for kp, label in zip(group, labels) if label == cluster]
+        pieces.extend(members[start : start + chunk_size] for start in range(0, len(members), chunk_size))
+    return pieces
+
+
+# 把知识点划分成语义相近的块：同一根父知识点下的放在一起，没有父子关系的单独知识点按语义聚类，
+# 再按顺序装箱到不超过 chunk_size 的块中。划分只取决于 id、父子关系和名称，
+# 单个知识点改名通常只影响它所在的块，其余块的提示词不变，可直接命中缓存。
+def _partition_knowledge_points(knowledge_points: List[KnowledgePoint], chunk_size: int) -> List[List[KnowledgePoint]]:
+    kp_map = {kp.id: kp for kp in knowledge_points}
+
+    def _root_id(kp: KnowledgePoint) -> int:
+        seen = {kp.id}
+        while kp.parent_id in kp_map and kp.parent_id not in seen:
+            kp = kp_map[kp.parent_id]
+            seen.add(kp.id)
+        return kp.id
+
+    trees: Dict[int, List[KnowledgePoint]] = defaultdict(list)
+    for kp in sorted(knowledge_points, key=lambda item: item.id):
+        trees[_root_id(kp)].append(kp)
+    groups = [tree for tree in trees.values() if len(tree) > 1]
+    loose = [tree[0] for tree in trees.values() if len(tree) == 1]
+    if loose:
+        groups.append(loose)
+
+    chunks: List[List[KnowledgePoint]] = []
+    current: List[KnowledgePoint] = []
+    for group in groups:
+        for piece in _split_semantic(group, chunk_size):
+            if current and len(current) + len(piece) > chunk_size:
+                chunks.append(current)
+                current = []
+            current.extend(piece)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# 每块挑出在块内子知识点最多的若干个知识点作为代表，两两组合成桥接提示词，每个提示词不超过 chunk_size 个知识点。
+def _bridge_groups(chunks: List[List[KnowledgePoint]], chunk_size: int) -> List[List[List[KnowledgePoint]]]:
+    representatives = []
+    for chunk in chunks:
+        child_counts = defaultdict(int)
+        for kp in chunk:
+            child_counts[kp.parent_id] += 1
+        ranked = sorted(chunk, key=lambda kp: (-child_counts.get(kp.id, 0), kp.id))
+        representatives.append(ranked[:RELATION_BRIDGE_PER_CHUNK])
+
+    if sum(len(group) for group in representatives) <= chunk_size:
+        return [representatives]
+
+    blocks: List[List[List[KnowledgePoint]]] = [[]]
+    for group in representatives:
+        if blocks[-1] and sum(len(item) for item in blocks[-1]) + len(group) > max(chunk_size // 2, 1):
+            blocks.append([])
+        blocks[-1].append(group)
+    return [blocks[i] + blocks[j] for i in range(len(blocks)) for j in range(i + 1, len(blocks))]
+
+
+# 关系图提示词的回答缓存（learning.sqlite_cache），键为（模型、完整提示词）的 SHA-256，值为大模型返回的原始关系列表。
+def _open_relation_cache() -> JSONCache:
+    return JSONCache(getattr(settings, "CDF_RELATION_CACHE_PATH", None) or DEFAULT_RELATION_CACHE_PATH, "relation_cache")
+
+
+def _relation_cache_key(prompt: str) -> str:
+    return hashlib.sha256(json.dumps([RELATION_LLM_MODEL, prompt], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# 请求一个关系图提示词并解析出关系列表，调用或解析失败返回 None（不写缓存，下次重试）。
+def _request_relation_payload(prompt: str) -> Optional[List[Dict[str, Any]]]:
+    response = _call_llm(prompt)
     if not response or getattr(response, "status_code", None) != 200:
-        return []
+        return None
 
     try:
         content = response.output.choices[0].message.content
         payload = _extract_json_payload(content)
     except Exception as exc:
         print(f"LLM graph parsing failed: {exc}")
-        return []
+        return None
 
     if isinstance(payload, dict):
         payload = payload.get("relations") or payload.get("edges") or []
     if not isinstance(payload, list):
+        return None
+    return [item for item in payload if isinstance(item, dict)]
+
+
+# 先查缓存，未命中的提示词最多 RELATION_MAX_CONCURRENCY 个并发请求；返回与 prompts 对齐的结果，失败的为 None。
+def _run_relation_prompts(prompts: List[str]) -> List[Optional[List[Dict[str, Any]]]]:
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(prompts)
+    cache = _open_relation_cache()
+    try:
+        pending: Dict[int, Tuple[str, str]] = {}
+        for index, prompt in enumerate(prompts):
+            key = _relation_cache_key(prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending[index] = (key, prompt)
+        print(f"LLM graph prompts: {len(prompts)}, cached: {len(prompts) - len(pending)}, requesting: {len(pending)}")
+        if not pending:
+            return results
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=min(RELATION_MAX_CONCURRENCY, len(pending))) as executor:
+            futures = {
+                executor.submit(_request_relation_payload, prompt): (index, key)
+                for index, (key, prompt) in pending.items()
+            }
+            for future in as_completed(futures):
+                index, key = futures[future]
+                payload = future.result()
+                if payload is None:
+                    failed += 1
+                    continue
+                results[index] = payload
+                cache.set(key, payload)
+        if failed:
+            print(f"LLM graph prompts failed: {failed}/{len(pending)}, they will be retried on the next refresh")
+    finally:
+        cache.close()
+    return results
+
+
+# 调用大模型抽取候选关系：知识点分块生成块内关系，再用桥接提示词补充跨块关系，
+# 合并后按 (source, target) 去重并保留最高分。未配置大模型 key 时直接返回空列表（由调用方回退到数据库关系），
+# 不做分块，也就不加载 BERT。
+def _generate_relation_candidates(
+    knowledge_points: List[KnowledgePoint],
+    relation_kind: str,
+    kp_id_to_node_id: Dict[int, int],
+    kp_name_to_id: Dict[str, int],
+) -> List[Dict[str, Any]]:
+    if not _llm_api_key():
+        print("LLM API key is not configured, using relations from the database")
         return []
 
-    normalized: List[Dict[str, Any]] = []
-    seen = set()
-    for item in payload:
-        if not isinstance(item, dict):
-            continue
-        relation = _normalize_relation_item(item, kp_id_to_node_id, kp_name_to_id)
-        if not relation:
-            continue
-        key = (relation["source_kp_id"], relation["target_kp_id"])
-        if key in seen:
-            continue
-        seen.add(key)
-        normalized.append(relation)
-    return normalized
+    chunks = _partition_knowledge_points(knowledge_points, RELATION_CHUNK_SIZE)
+    chunk_of = {kp.id: index for index, chunk in enumerate(chunks) for kp in chunk}
+    prompts = [_build_relation_prompt(chunk, relation_kind) for chunk in chunks]
+    bridge_start = len(prompts)
+    if len(chunks) > 1:
+        prompts.extend(_build_bridge_prompt(groups, relation_kind) for groups in _bridge_groups(chunks, RELATION_CHUNK_SIZE))
+
+    merged: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for index, payload in enumerate(_run_relation_prompts(prompts)):
+        for item in payload or []:
+            relation = _normalize_relation_item(item, kp_id_to_node_id, kp_name_to_id)
+            if not relation:
+                continue
+            source, target = relation["source"], relation["target"]
+            if source not in chunk_of or target not in chunk_of:
+                continue
+            # 桥接提示词只负责跨块关系
+            if index >= bridge_start and chunk_of[source] == chunk_of[target]:
+                continue
+            key = (source, target)
+            if key not in merged or relation["score"] > merged[key]["score"]:
+                merged[key] = relation
+    return list(merged.values())
 
 
 # 当大模型没有返回结果时，退回使用数据库中已有的知识关系。
@@ -500,6 +711,118 @@ def _db_knowledge_relations(knowledge_points: List[KnowledgePoint], relation_kin
     return relations
 
 
+# 有向图的 CSR 邻接表（按源结点分组的出边编号），删边只改 alive 标记。
+class _EdgeCSR:
+    def __init__(self, n_nodes: int, src: np.ndarray, dst: np.ndarray):
+        self.src = src
+        self.dst = dst
+        self.out_edges = np.argsort(src, kind="stable")
+        self.indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n_nodes), out=self.indptr[1:])
+        self.alive = np.ones(len(src), dtype=bool)
+
+    def out_of(self, frontier: np.ndarray) -> np.ndarray:
+        """frontier 中各结点仍存在的出边编号"""
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        edges = self.out_edges[offsets]
+        return edges[self.alive[edges]]
+
+    def path(self, start: int, goal: int, in_component: np.ndarray) -> Optional[List[int]]:
+        """分量内 start 到 goal 的最短路径（结点序列），不可达返回 None；逐层向量化 BFS"""
+        parent_edge = np.full(len(in_component), -1, dtype=np.int64)
+        visited = np.zeros(len(in_component), dtype=bool)
+        visited[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        while frontier.size and not visited[goal]:
+            edges = self.out_of(frontier)
+            heads = self.dst[edges]
+            keep = in_component[heads] & ~visited[heads]
+            edges, heads = edges[keep], heads[keep]
+            # 同一结点被多条边到达时保留最后写入的那条，借此去重而不用排序
+            parent_edge[heads] = edges
+            frontier = heads[parent_edge[heads] == edges]
+            visited[frontier] = True
+        if not visited[goal]:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(self.src[parent_edge[path[-1]]]))
+        return path[::-1]
+
+    def strong_components(self, nodes: np.ndarray) -> List[np.ndarray]:
+        """nodes 诱导子图（只含 alive 边）中结点数大于 1 的强连通分量"""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        local = np.full(len(self.indptr) - 1, -1, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+        edges = self.out_of(nodes)
+        edges = edges[local[self.dst[edges]] >= 0]
+        matrix = csr_matrix(
+            (np.ones(len(edges), dtype=np.int8), (local[self.src[edges]], local[self.dst[edges]])),
+            shape=(len(nodes), len(nodes)),
+        )
+        _, labels = connected_components(matrix, directed=True, connection="strong")
+        sizes = np.bincount(labels)
+        return [nodes[labels == label] for label in np.flatnonzero(sizes > 1)]
+
+    def topological_position(self) -> np.ndarray:
+        """当前 alive 边构成的 DAG 中各结点的拓扑序位置（Kahn 算法，逐层向量化）"""
+        n_nodes = len(self.indptr) - 1
+        indegree = np.bincount(self.dst[self.alive], minlength=n_nodes)
+        position = np.empty(n_nodes, dtype=np.int64)
+        frontier = np.flatnonzero(indegree == 0)
+        placed = 0
+        while frontier.size:
+            position[frontier] = np.arange(placed, placed + frontier.size)
+            placed += frontier.size
+            heads = self.dst[self.out_of(frontier)]
+            np.subtract.at(indegree, heads, 1)
+            heads = np.unique(heads)
+            frontier = heads[indegree[heads] == 0]
+        return position
+
+
+# SCC 分解 + 按分数贪心删边的最小权反馈边集启发式：
+# 每个非平凡强连通分量里，分数最低的边一定在某个环上（分量内 v 可达 u），删掉它并记录这个环；
+# 删边后若 u 仍可达 v，分量不变，继续删下一条最低分边；否则只对该分量重新做 SCC 分解。
+# 全部分量拆完后按剩余 DAG 的拓扑序把指向后方的已删边补回，它们不会重新成环。
+# priority 是边编号按 (score, source, target) 升序排好的顺序，返回 [(删除的边编号, 环上结点编号列表)]。
+def _break_cycles(n_nodes: int, src: np.ndarray, dst: np.ndarray, priority: np.ndarray) -> List[Tuple[int, List[int]]]:
+    csr = _EdgeCSR(n_nodes, src, dst)
+    rank = np.empty(len(priority), dtype=np.int64)
+    rank[priority] = np.arange(len(priority))
+    removed: List[Tuple[int, List[int]]] = []
+
+    pending = csr.strong_components(np.arange(n_nodes))
+    while pending:
+        nodes = pending.pop()
+        in_component = np.zeros(n_nodes, dtype=bool)
+        in_component[nodes] = True
+        candidates = csr.out_of(nodes)
+        candidates = candidates[in_component[dst[candidates]]]
+        candidates = candidates[np.argsort(rank[candidates])]
+
+        for edge in candidates.tolist():
+            source, target = int(src[edge]), int(dst[edge])
+            back = csr.path(target, source, in_component)
+            csr.alive[edge] = False
+            removed.append((edge, [source] + back[:-1]))
+            if csr.path(source, target, in_component) is None:
+                pending.extend(csr.strong_components(nodes))
+                break
+
+    if removed:
+        position = csr.topological_position()
+        removed = [(edge, cycle) for edge, cycle in removed if position[src[edge]] > position[dst[edge]]]
+    return removed
+
+
 # 去掉关系图中的环，保证最终图结构可用于层次诊断。
 def _remove_cycles(
     relations: List[Dict[str, Any]],
@@ -507,10 +830,7 @@ def _remove_cycles(
     kp_id_to_node_id: Dict[int, int],
     knowledge_points: List[KnowledgePoint],
 ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-    import networkx as nx
-
     kp_map = {kp.id: kp for kp in knowledge_points}
-    graph = nx.DiGraph()
     edge_meta: Dict[Tuple[int, int], Dict[str, Any]] = {}
 
     for relation in relations:
@@ -524,36 +844,28 @@ def _remove_cycles(
                 edge_meta[key] = relation
             continue
         edge_meta[key] = relation
-        graph.add_edge(source, target)
-
-    graph.add_nodes_from(kp_map.keys())
-    removed_cycles: List[Dict[str, Any]] = []
 
-    while True:
-        try:
-            cycle = next(nx.simple_cycles(graph))
-        except StopIteration:
-            break
-        if len(cycle) < 2:
-            break
-
-        cycle_edges = list(zip(cycle, cycle[1:] + [cycle[0]]))
-
-        def _edge_score(edge: Tuple[int, int]) -> Tuple[float, int, int]:
-            meta = edge_meta.get(edge, {})
-            return _safe_float(meta.get("score"), default=0.0), edge[0], edge[1]
+    edges = list(edge_meta.keys())
+    node_ids = sorted({kp_id for edge in edges for kp_id in edge})
+    node_index = {kp_id: index for index, kp_id in enumerate(node_ids)}
+    src = np.fromiter((node_index[source] for source, _ in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((node_index[target] for _, target in edges), dtype=np.int64, count=len(edges))
+    # 删边优先级与原实现一致：分数低的先删，分数相同按 (source, target) 排序
+    priority = np.array(
+        sorted(range(len(edges)), key=lambda i: (_safe_float(edge_meta[edges[i]].get("score"), default=0.0), edges[i])),
+        dtype=np.int64,
+    )
 
-        edge_to_remove = min(cycle_edges, key=_edge_score)
+    removed_cycles: List[Dict[str, Any]] = []
+    for edge_index, cycle in _break_cycles(len(node_ids), src, dst, priority):
+        edge_to_remove = edges[edge_index]
         removed_meta = edge_meta.pop(edge_to_remove, {})
-        if graph.has_edge(*edge_to_remove):
-            graph.remove_edge(*edge_to_remove)
-
         source_kp = kp_map.get(edge_to_remove[0])
         target_kp = kp_map.get(edge_to_remove[1])
         removed_cycles.append(
             {
                 "relation_kind": relation_kind,
-                "cycle_nodes": json.dumps(cycle, ensure_ascii=False),
+                "cycle_nodes": json.dumps([node_ids[node] for node in cycle], ensure_ascii=False),
                 "removed_source_kp_id": edge_to_remove[0],
                 "removed_target_kp_id": edge_to_remove[1],
                 "removed_source_node_id": kp_id_to_node_id.get(edge_to_remove[0]),
@@ -566,8 +878,7 @@ def _remove_cycles(
         )
 
     acyclic_relations: List[Dict[str, Any]] = []
-    for source, target in graph.edges():
-        meta = edge_meta.get((source, target), {})
+    for (source, target), meta in edge_meta.items():
         source_kp = kp_map.get(source)
         target_kp = kp_map.get(target)
         acyclic_relations.append(
@@ -939,92 +1250,23 @@ def _normalize_cdf_result(
 # 异步把诊断结果写回数据库，避免阻塞主流程。
 def _save_cdf_results_to_database_async(subject_id: int, model_id: int, diagnosis_data: Dict[str, Any]) -> int:
     try:
-        subject = Subject.objects.get(id=subject_id)
-        diagnosis_model = DiagnosisModel.objects.get(id=model_id)
-        knowledge_points = {
-            kp.id: kp for kp in KnowledgePoint.objects.filter(subject=subject)
-        }
-        student_ids = [int(student_id) for student_id in diagnosis_data.get("diagnosis_results", {}).keys()]
-        students = {
-            student.id: student
-            for student in User.objects.filter(id__in=student_ids, user_type="student")
-        }
-
-        records_to_save = []
-        saved_students = set()
+        rows = []
         for student_id_str, result_data in diagnosis_data.get("diagnosis_results", {}).items():
-            student_id = int(student_id_str)
-            student = students.get(student_id)
-            if not student:
-                continue
-
+            practice_counts = result_data.get("practice_counts", {})
+            correct_counts = result_data.get("correct_counts", {})
             for kp_str, mastery in result_data.get("knowledge_mastery", {}).items():
-                kp_id = int(kp_str)
-                knowledge_point = knowledge_points.get(kp_id)
-                if not knowledge_point:
-                    continue
-
-                records_to_save.append(
-                    {
-                        "student_id": student_id,
-                        "student": student,
-                        "knowledge_point_id": kp_id,
-                        "knowledge_point": knowledge_point,
-                        "mastery": _safe_float(mastery, default=0.0),
-                        "practice_count": _safe_int(result_data.get("practice_counts", {}).get(kp_str), default=0),
-                        "correct_count": _safe_int(result_data.get("correct_counts", {}).get(kp_str), default=0),
-                    }
-                )
-                saved_students.add(student_id)
-
-        records_to_save.sort(key=lambda item: (item["student_id"], item["knowledge_point_id"]))
-        existing_records = {}
-        if records_to_save:
-            existing = StudentDiagnosis.objects.filter(
-                student_id__in=[record["student_id"] for record in records_to_save],
-                knowledge_point_id__in=[record["knowledge_point_id"] for record in records_to_save],
-                diagnosis_model=diagnosis_model,
-            )
-            for record in existing:
-                existing_records[(record.student_id, record.knowledge_point_id)] = record
-
-        current_time = timezone.now()
-        batch_size = 20
-        for start in range(0, len(records_to_save), batch_size):
-            batch = records_to_save[start : start + batch_size]
-            with transaction.atomic():
-                to_create = []
-                to_update = []
-                for record in batch:
-                    key = (record["student_id"], record["knowledge_point_id"])
-                    if key in existing_records:
-                        existing = existing_records[key]
-                        existing.mastery_level = record["mastery"]
-                        existing.practice_count = record["practice_count"]
-                        existing.correct_count = record["correct_count"]
-                        existing.last_practiced = current_time
-                        to_update.append(existing)
-                    else:
-                        to_create.append(
-                            StudentDiagnosis(
-                                student=record["student"],
-                                knowledge_point=record["knowledge_point"],
-                                diagnosis_model=diagnosis_model,
-                                mastery_level=record["mastery"],
-                                practice_count=record["practice_count"],
-                                correct_count=record["correct_count"],
-                                last_practiced=current_time,
-                            )
-                        )
-
-                if to_create:
-                    StudentDiagnosis.objects.bulk_create(to_create, ignore_conflicts=True)
-                if to_update:
-                    StudentDiagnosis.objects.bulk_update(
-                        to_update,
-                        ["mastery_level", "practice_count", "correct_count", "last_practiced"],
+                rows.append(
+                    (
+                        int(student_id_str),
+                        int(kp_str),
+                        _safe_float(mastery, default=0.0),
+                        _safe_int(practice_counts.get(kp_str), default=0),
+                        _safe_int(correct_counts.get(kp_str), default=0),
                     )
-        return len(saved_students)
+                )
+
+        stats = bulk_upsert_diagnoses(model_id, rows, subject_id=subject_id, with_counts=True)
+        return stats["students"]
     except Exception as exc:
         print(f"Failed to save CDF diagnosis results: {exc}")
         return 0
@@ -1222,6 +1464,8 @@ def _build_cdf_hparams(
         "weight_decay": 1e-5,
         "epoch": 30,
         "batch_size": 512,
+        "shuffle": True,
+        "pin_memory": device != "cpu",
         "logger_mode": "file",
         "loss_factor": 0.001,
         "device": device,
@@ -0,0 +1,316 @@
+"""
+研究者模型对比的训练执行器
+
+每个（数据集, 模型）组合的配置都显式传入：数据目录用绝对路径，学生数/习题数/知识点数从该目录的
+config.txt 读取，不再依赖 os.chdir、sys.path、CD_DATASET 环境变量和重新导入 params/dataloader，
+所以同一进程或并行的多个进程里同时训练不同数据集也不会互相改掉对方的路径。
+
+train_model 在当前进程中训练一个组合并返回指标与耗时；run_comparison 用 spawn 方式的进程池
+让每个组合在独立的子进程里训练，并限制每个子进程的 torch 线程数，避免多个模型同时训练时 CPU 超额订阅。
+"""
+
+import importlib
+import math
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+CMD_SURVEY_DIR = Path(__file__).resolve().parent / 'CMD_survey'
+
+# 与 CMD_survey/params.py 保持一致的默认超参数；对比实验固定训练 10 轮
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_LR = 0.002
+DEFAULT_EPOCHS = 10
+
+# 经典模型：模型模块 + 构造函数 (un, en, kn) -> 模型实例
+CLASSIC_MODELS = {
+    'IRT': ('learning.diagnosis.CMD_survey.model.IRT', lambda module, un, en, kn: module.IRT(un, en, value_range=4.0, a_range=2.0)),
+    'NCDM': ('learning.diagnosis.CMD_survey.model.NCDM', lambda module, un, en, kn: module.NCDM(kn, en, un)),
+    'DINA': ('learning.diagnosis.CMD_survey.model.DINA', lambda module, un, en, kn: module.DINA(un, en, kn)),
+}
+
+# CDF 系列模型：展示名 -> (适配器目录名, 适配器模块, 训练函数)
+CDF_ADAPTERS = {
+    'ConCDF': ('ConCDF', 'learning.diagnosis.CMD_survey.model.ConCDF.ConCDF_adapter', 'train_concdm'),
+    'HierCDF': ('HierCDF', 'learning.diagnosis.CMD_survey.model.HierCDF.HierCDF_adapter', 'train_hiercdm'),
+    'IdpCDF': ('IdpCDF', 'learning.diagnosis.CMD_survey.model.IdpCDF.IdpCDF_adapter', 'train_basecdm'),
+    'PCG-CDF': ('PCGCDF', 'learning.diagnosis.CMD_survey.model.PCGCDF.PCGCDF_adapter', 'train_mixcdm'),
+}
+
+
+def default_device():
+    import torch
+    return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+
+def dataset_config(dataset_name, epochs=DEFAULT_EPOCHS, batch_size=DEFAULT_BATCH_SIZE, lr=DEFAULT_LR, device=None):
+    """读取 CMD_survey/data/<数据集>/config.txt，返回一次训练需要的全部配置"""
+    data_dir = CMD_SURVEY_DIR / 'data' / dataset_name
+    with open(data_dir / 'config.txt') as f:
+        f.readline()  # 跳过注释行
+        un, en, kn = (int(value) for value in f.readline().strip().split(','))
+    return {
+        'dataset_name': dataset_name,
+        'data_dir': str(data_dir),
+        'un': un,
+        'en': en,
+        'kn': kn,
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'lr': lr,
+        'device': device or default_device(),
+    }
+
+
+def _load_split(config, split):
+    from .CMD_survey.columnar import load_records
+    from .CMD_survey.interaction_dataset import build_dataset, make_loader
+
+    records = load_records(os.path.join(config['data_dir'], f'{split}.json'))
+    # 数据集中的 user_id / exer_id 从 1 开始，这里直接转成 0 起的下标；knowledge_code 与 CMD_survey/dataloader.py 一致按原值取列
+    dataset = build_dataset(records, config['kn'], id_offset=1, code_offset=0)
+    return make_loader(dataset, config['batch_size'], shuffle=True)
+
+
+def train_classic(config, model_name, epoch_callback=None):
+    """
+    训练 IRT / NCDM / DINA
+
+    Returns:
+        (best_epoch, best_auc, best_acc, rmse)、训练曲线、每轮结束时刻和训练总耗时；时间均为相对开始训练的秒数，不含数据加载
+    """
+    module_path, build = CLASSIC_MODELS[model_name]
+    cdm = build(importlib.import_module(module_path), config['un'], config['en'], config['kn'])
+    train_data = _load_split(config, 'train')
+    test_data = _load_split(config, 'val')
+
+    start = time.perf_counter()
+    epoch_ends = []
+
+    def _on_epoch(epoch, total_epochs, metrics):
+        epoch_ends.append(time.perf_counter() - start)
+        if epoch_callback is not None:
+            epoch_callback(epoch, total_epochs, metrics)
+
+    result, training_curves = cdm.train_with_curves(
+        train_data=train_data, test_data=test_data, epoch=config['epochs'],
+        device=config['device'], lr=config['lr'], epoch_callback=_on_epoch
+    )
+    return result, training_curves, epoch_ends, time.perf_counter() - start
+
+
+def _cdf_model_log_dir(model_name, dataset_name):
+    return CMD_SURVEY_DIR / 'model' / model_name / 'logs' / dataset_name
+
+
+def _snapshot_log_dirs(log_dir):
+    if not log_dir.exists():
+        return set()
+    return {path.resolve() for path in log_dir.iterdir() if path.is_dir()}
+
+
+def _find_newest_log_file(log_dir, before_dirs):
+    if not log_dir.exists():
+        return None
+
+    candidates = []
+    for path in log_dir.iterdir():
+        if not path.is_dir():
+            continue
+        resolved = path.resolve()
+        if resolved in before_dirs:
+            continue
+        log_file = path / 'log.txt'
+        if log_file.exists():
+            candidates.append(log_file)
+
+    if not candidates:
+        candidates = [path / 'log.txt' for path in log_dir.iterdir() if path.is_dir() and (path / 'log.txt').exists()]
+
+    if not candidates:
+        return None
+
+    return max(candidates, key=lambda item: item.stat().st_mtime)
+
+
+def _parse_cdf_training_curves(log_file):
+    curves = {'acc': [], 'auc': [], 'rmse': []}
+    if not log_file or not log_file.exists():
+        return curves
+
+    epoch_metrics = {}
+    train_pattern = re.compile(
+        r"epoch\s*=\s*(?P<epoch>\d+).*?train_acc\s*=\s*(?P<acc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
+        r".*?train_auc\s*=\s*(?P<auc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
+        r".*?train_r?mse\s*=\s*(?P<rmse>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
+    )
+    valid_acc_pattern = re.compile(r"valid acc\s*=\s*(?P<acc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
+    valid_auc_pattern = re.compile(r"valid auc\s*=\s*(?P<auc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
+    valid_mse_pattern = re.compile(r"valid mse\s*=\s*(?P<mse>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
+    epoch_hint_pattern = re.compile(r"epoch\s*=\s*(?P<epoch>\d+)")
+
+    current_epoch = None
+    lines = log_file.read_text(encoding='utf-8', errors='ignore').splitlines()
+    for line in lines:
+        train_match = train_pattern.search(line)
+        if train_match:
+            epoch = int(train_match.group('epoch'))
+            epoch_metrics.setdefault(epoch, {})
+            epoch_metrics[epoch]['acc'] = float(train_match.group('acc'))
+            epoch_metrics[epoch]['auc'] = float(train_match.group('auc'))
+            epoch_metrics[epoch]['rmse'] = float(train_match.group('rmse'))
+            current_epoch = epoch
+            continue
+
+        epoch_hint_match = epoch_hint_pattern.search(line)
+        if epoch_hint_match:
+            current_epoch = int(epoch_hint_match.group('epoch'))
+
+        if current_epoch is None:
+            continue
+
+        valid_acc_match = valid_acc_pattern.search(line)
+        if valid_acc_match:
+            epoch_metrics.setdefault(current_epoch, {})
+            epoch_metrics[current_epoch]['acc'] = float(valid_acc_match.group('acc'))
+            continue
+
+        valid_auc_match = valid_auc_pattern.search(line)
+        if valid_auc_match:
+            epoch_metrics.setdefault(current_epoch, {})
+            epoch_metrics[current_epoch]['auc'] = float(valid_auc_match.group('auc'))
+            continue
+
+        valid_mse_match = valid_mse_pattern.search(line)
+        if valid_mse_match:
+            epoch_metrics.setdefault(current_epoch, {})
+            mse_value = float(valid_mse_match.group('mse'))
+            epoch_metrics[current_epoch]['rmse'] = math.sqrt(mse_value) if mse_value > 0 else 0.0
+
+    for epoch in sorted(epoch_metrics):
+        metrics = epoch_metrics[epoch]
+        curves['acc'].append(metrics.get('acc'))
+        curves['auc'].append(metrics.get('auc'))
+        curves['rmse'].append(metrics.get('rmse'))
+
+    return curves
+
+
+def train_cdf(dataset_name, model_name, device):
+    """CDF 系列模型走各自的适配器，训练曲线从适配器写出的 log.txt 中解析"""
+    model_dir_name, module_path, func_name = CDF_ADAPTERS[model_name]
+    log_dir = _cdf_model_log_dir(model_dir_name, dataset_name)
+    before_log_dirs = _snapshot_log_dirs(log_dir)
+
+    train_func = getattr(importlib.import_module(module_path), func_name)
+    result = train_func(dataset_name, device=device)
+
+    training_curves = _parse_cdf_training_curves(_find_newest_log_file(log_dir, before_log_dirs))
+    return result, training_curves
+
+
+def _estimate_best_round_time(total_time, best_epoch, training_curves):
+    """拿不到逐轮时刻的模型按轮数比例估算到达最优轮次的耗时"""
+    rounds = len(training_curves.get('auc') or [])
+    if not rounds or not best_epoch:
+        return total_time
+    return total_time * min(int(best_epoch), rounds) / rounds
+
+
+def train_model(dataset_name, model_name, epoch_callback=None, device=None, epochs=DEFAULT_EPOCHS):
+    """
+    在当前进程中训练一个（数据集, 模型）组合
+
+    Returns:
+        dict: best_epoch / acc / auc / rmse / training_curves，以及
+              best_round_time（从开始训练到最优轮次结束的秒数）和 total_time（训练总耗时，秒）
+    """
+    device = device or default_device()
+    start = time.perf_counter()
+
+    if model_name in CLASSIC_MODELS:
+        config = dataset_config(dataset_name, epochs=epochs, device=device)
+        result, training_curves, epoch_ends, total_time = train_classic(config, model_name, epoch_callback)
+        best_epoch, best_auc, best_acc, rmse = result if len(result) == 4 else (*result, None)
+        best_round_time = epoch_ends[best_epoch - 1] if 0 < best_epoch <= len(epoch_ends) else total_time
+    elif model_name in CDF_ADAPTERS:
+        result, training_curves = train_cdf(dataset_name, model_name, device)
+        total_time = time.perf_counter() - start
+        best_epoch, best_auc, best_acc, rmse = result
+        best_round_time = _estimate_best_round_time(total_time, best_epoch, training_curves)
+    else:
+        from .dual_relation_ncdm import MODEL_NAMES as IRD_NCDM_MODEL_NAMES
+        if model_name not in IRD_NCDM_MODEL_NAMES:
+            raise ValueError(f'未知模型: {model_name}')
+        from .dual_relation_ncdm.platform import train_researcher_dataset
+
+        result_data = train_researcher_dataset(dataset_name, model_name=model_name)
+        total_time = time.perf_counter() - start
+        best_epoch = result_data['best_epoch']
+        best_auc = result_data['auc']
+        best_acc = result_data['acc']
+        rmse = result_data['rmse']
+        training_curves = result_data.get('training_curves') or {
+            'acc': [best_acc],
+            'auc': [best_auc],
+            'rmse': [rmse],
+        }
+        best_round_time = result_data.get('best_round_time') or _estimate_best_round_time(
+            total_time, best_epoch, training_curves)
+
+    return {
+        'best_epoch': best_epoch,
+        'acc': best_acc,
+        'auc': best_auc,
+        'rmse': rmse,
+        'training_curves': training_curves,
+        'best_round_time': float(best_round_time),
+        'total_time': float(total_time),
+    }
+
+
+def _init_worker(num_threads):
+    """进程池子进程初始化：spawn 出的解释器需要先初始化 Django，再限制 torch 线程数"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+def _train_in_worker(dataset_name, model_name, device, epochs):
+    return train_model(dataset_name, model_name, device=device, epochs=epochs)
+
+
+def run_comparison(dataset_name, model_names, max_workers=None, threads_per_worker=2, device=None,
+                   epochs=DEFAULT_EPOCHS):
+    """
+    用进程池并行训练同一数据集上的多个模型，每个模型一个子进程
+
+    Returns:
+        dict: 模型名 -> train_model 的返回值；训练出错的模型为 {'error': 错误信息}
+    """
+    max_workers = max_workers or max(1, min(len(model_names), (os.cpu_count() or 1) // threads_per_worker))
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as executor:
+        futures = {
+            executor.submit(_train_in_worker, dataset_name, model_name, device, epochs): model_name
+            for model_name in model_names
+        }
+        for future in as_completed(futures):
+            model_name = futures[future]
+            try:
+                results[model_name] = future.result()
+            except Exception as e:
+                results[model_name] = {'error': str(e)}
+    return results
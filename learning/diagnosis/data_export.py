@@ -4,17 +4,22 @@
 import os
 import json
 import csv
+import shutil
+import numpy as np
 from django.db.models import Q
 from collections import defaultdict
 from ..models import AnswerLog, QMatrix, KnowledgePoint, Exercise, User
+from .CMD_survey.columnar import columnar_dir, save_q_matrix, save_split
 
 
-def export_training_data(subject_id):
+def export_training_data(subject_id, fmt='columnar'):
     """
     导出指定科目的训练数据
 
     Args:
         subject_id: 科目ID
+        fmt: 'columnar' 写 int32 数组 + CSR Q矩阵（默认，见 CMD_survey/columnar.py），
+             'json' 写原来的 train/val/log_data.json，'both' 两种都写
 
     Returns:
         dict: 包含导出统计信息
@@ -58,6 +63,94 @@ def export_training_data(subject_id):
     kp_reverse = {v: k for k, v in kp_mapping.items()}
 
     # 6. 构建习题->知识点列表的映射（新ID）
+    exer_to_kps = exercise_knowledge_codes(subject_id, exer_reverse, kp_reverse)
+
+    # 7. 获取所有答题记录（按学生、提交时间排序，同一学生的记录连续）
+    answer_logs = AnswerLog.objects.filter(
+        exercise__subject_id=subject_id,
+        is_correct__isnull=False
+    ).order_by('student_id', 'submitted_at').values_list('id', 'student_id', 'exercise_id', 'is_correct')
+
+    log_ids, user_ids, exer_ids, scores = [], [], [], []
+    last_log_id = 0
+    for log_id, student_id, exercise_id, is_correct in answer_logs.iterator(chunk_size=10000):
+        last_log_id = max(last_log_id, log_id)
+        new_student_id = user_reverse.get(student_id)
+        new_exer_id = exer_reverse.get(exercise_id)
+        if new_student_id and new_exer_id:
+            log_ids.append(log_id)
+            user_ids.append(new_student_id)
+            exer_ids.append(new_exer_id)
+            scores.append(1 if is_correct else 0)
+
+    user_ids = np.asarray(user_ids, dtype=np.int32)
+    exer_ids = np.asarray(exer_ids, dtype=np.int32)
+    scores = np.asarray(scores, dtype=np.int32)
+    log_ids = np.asarray(log_ids, dtype=np.int64)
+
+    # 8. 按学生8:2拆分：每个学生的前80%记录进训练集，其余进验证集
+    is_train = _per_student_split_mask(user_ids, 0.8)
+    splits = {
+        'train': (user_ids[is_train], exer_ids[is_train], scores[is_train]),
+        'val': (user_ids[~is_train], exer_ids[~is_train], scores[~is_train]),
+        'log_data': (user_ids, exer_ids, scores),  # 所有记录，不拆分
+    }
+
+    # 9. 保存文件
+    # 保存 config.txt
+    write_config(base_dir, len(user_mapping), len(exer_mapping), len(kp_mapping))
+
+    # 列式文件和 JSON 同时存在时读取端优先列式，所以只写一种格式时要清掉另一种的旧文件
+    if fmt in ('columnar', 'both'):
+        save_q_matrix(base_dir, exer_to_kps, len(exer_mapping) + 1)
+        for split, (split_users, split_exers, split_scores) in splits.items():
+            # log_data 额外记录 AnswerLog id，增量训练据此替换被重新批改的记录
+            save_split(base_dir, split, split_users, split_exers, split_scores,
+                       log_ids=log_ids if split == 'log_data' else None)
+    else:
+        shutil.rmtree(columnar_dir(base_dir), ignore_errors=True)
+
+    for split, (split_users, split_exers, split_scores) in splits.items():
+        json_path = os.path.join(base_dir, f'{split}.json')
+        if fmt in ('json', 'both'):
+            records = [
+                {'user_id': int(u), 'exer_id': int(e), 'score': int(s), 'knowledge_code': exer_to_kps.get(int(e), [])}
+                for u, e, s in zip(split_users, split_exers, split_scores)
+            ]
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+        elif os.path.exists(json_path):
+            os.remove(json_path)
+
+    # 保存 homologous.csv（映射表）
+    write_homologous(base_dir, user_mapping, exer_mapping, kp_mapping)
+
+    return {
+        'success': True,
+        'data_dir': base_dir,
+        'student_count': len(user_mapping),
+        'exercise_count': len(exer_mapping),
+        'knowledge_count': len(kp_mapping),
+        'train_count': int(is_train.sum()),
+        'val_count': int((~is_train).sum()),
+        'last_log_id': last_log_id,
+        'format': fmt
+    }
+
+
+def _per_student_split_mask(user_ids, ratio):
+    """user_ids 中同一学生的记录连续排列，返回每个学生前 ratio 部分记录的布尔掩码"""
+    n = len(user_ids)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(user_ids)) + 1))
+    counts = np.diff(np.append(starts, n))
+    position = np.arange(n) - np.repeat(starts, counts)
+    return position < np.repeat((counts * ratio).astype(np.int64), counts)
+
+
+def exercise_knowledge_codes(subject_id, exer_reverse, kp_reverse):
+    """按 Q 矩阵构建 {新习题ID: [新知识点ID, ...]}，映射表之外的习题/知识点忽略"""
     exer_to_kps = defaultdict(list)
     qmatrices = QMatrix.objects.filter(
         exercise__subject_id=subject_id
@@ -68,85 +161,18 @@ def export_training_data(subject_id):
         new_kp_id = kp_reverse.get(kp_id)
         if new_exer_id and new_kp_id:
             exer_to_kps[new_exer_id].append(new_kp_id)
+    return exer_to_kps
 
-    # 7. 获取所有答题记录，按学生分组
-    answer_logs = AnswerLog.objects.filter(
-        exercise__subject_id=subject_id,
-        is_correct__isnull=False
-    ).select_related('exercise').order_by('student_id', 'submitted_at')
 
-    # 按学生分组，保存记录
-    student_records = defaultdict(list)
-    for log in answer_logs:
-        new_student_id = user_reverse.get(log.student_id)
-        new_exer_id = exer_reverse.get(log.exercise_id)
-
-        if new_student_id and new_exer_id:
-            student_records[new_student_id].append({
-                'exer_id': new_exer_id,
-                'score': 1 if log.is_correct else 0,
-                'knowledge_code': exer_to_kps.get(new_exer_id, [])
-            })
-
-    # 8. 按学生8:2拆分
-    train_data = []  # 扁平结构
-    val_data = []  # 按学生聚合
-
-    for student_id, records in student_records.items():
-        n = len(records)
-        split_idx = int(n * 0.8)
-
-        # 前80%放入训练集
-        for record in records[:split_idx]:
-            train_data.append({
-                'user_id': student_id,
-                'exer_id': record['exer_id'],
-                'score': record['score'],
-                'knowledge_code': record['knowledge_code']
-            })
-
-        # 后20%也放入验证集（扁平结构，不聚合）
-        for record in records[split_idx:]:
-            val_data.append({
-                'user_id': student_id,
-                'exer_id': record['exer_id'],
-                'score': record['score'],
-                'knowledge_code': record['knowledge_code']
-            })
-
-    # 9. 保存文件
-    # 保存 config.txt
+def write_config(base_dir, student_count, exercise_count, knowledge_count):
     config_path = os.path.join(base_dir, 'config.txt')
     with open(config_path, 'w', encoding='utf-8') as f:
         f.write("# Number of Students, Number of Exercises, Number of Knowledge Concepts\n")
-        f.write(f"{len(user_mapping)}, {len(exer_mapping)}, {len(kp_mapping)}")
-
-    # 保存 train.json
-    train_path = os.path.join(base_dir, 'train.json')
-    with open(train_path, 'w', encoding='utf-8') as f:
-        json.dump(train_data, f, indent=2, ensure_ascii=False)
-
-    # 保存 val.json
-    val_path = os.path.join(base_dir, 'val.json')
-    with open(val_path, 'w', encoding='utf-8') as f:
-        json.dump(val_data, f, indent=2, ensure_ascii=False)
-
-    # 保存 log_data.json（所有记录，不拆分）
-    log_data_path = os.path.join(base_dir, 'log_data.json')
-    all_records = []
-    for student_id, records in student_records.items():
-        for record in records:
-            all_records.append({
-                'user_id': student_id,
-                'exer_id': record['exer_id'],
-                'score': record['score'],
-                'knowledge_code': record['knowledge_code']
-            })
-
-    with open(log_data_path, 'w', encoding='utf-8') as f:
-        json.dump(all_records, f, indent=2, ensure_ascii=False)
+        f.write(f"{student_count}, {exercise_count}, {knowledge_count}")
 
-    # 保存 homologous.csv（映射表）
+
+def write_homologous(base_dir, user_mapping, exer_mapping, kp_mapping):
+    """写 homologous.csv：三组 新ID -> 原ID 映射按行对齐，新ID 从 1 连续编号"""
     csv_path = os.path.join(base_dir, 'homologous.csv')
     with open(csv_path, 'w', encoding='utf-8', newline='') as f:
         writer = csv.writer(f)
@@ -167,12 +193,18 @@ def export_training_data(subject_id):
             orig_kp = kp_mapping.get(i, '')
             writer.writerow([new_user, orig_user, new_exer, orig_exer, new_kp, orig_kp])
 
-    return {
-        'success': True,
-        'data_dir': base_dir,
-        'student_count': len(user_mapping),
-        'exercise_count': len(exer_mapping),
-        'knowledge_count': len(kp_mapping),
-        'train_count': len(train_data),
-        'val_count': len(val_data)
-    }
\ No newline at end of file
+
+def read_homologous(base_dir):
+    """读取 homologous.csv，返回 (user_mapping, exer_mapping, kp_mapping)，均为 新ID -> 原ID"""
+    user_mapping, exer_mapping, kp_mapping = {}, {}, {}
+    with open(os.path.join(base_dir, 'homologous.csv'), 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if row[0]:
+                user_mapping[int(row[0])] = int(row[1])
+            if row[2]:
+                exer_mapping[int(row[2])] = int(row[3])
+            if row[4]:
+                kp_mapping[int(row[4])] = int(row[5])
+    return user_mapping, exer_mapping, kp_mapping
@@ -1,9 +1,10 @@
 import torch
-from torch.utils.data import TensorDataset, DataLoader
-import json
+from torch.utils.data import TensorDataset
 import params
 import random
 import numpy as np
+from CMD_survey.columnar import load_records
+from CMD_survey.interaction_dataset import build_dataset, make_loader
 
 def my_collate(batch):
     input_stu_ids, input_exer_ids, input_knowledge_embs, ys = [], [], [], []
@@ -27,16 +28,15 @@ def my_collate(batch):
     return torch.LongTensor(input_stu_ids), torch.LongTensor(input_exer_ids), torch.Tensor(input_knowledge_embs), torch.Tensor(ys)
 
 def CD_DL():
-    with open(params.src) as i_f:
-        src_dataset = json.load(i_f)
-    with open(params.tgt) as i_f:
-        tgt_dataset = json.load(i_f)
-    src_DL = DataLoader(dataset=src_dataset, batch_size=params.batch_size, shuffle=True, collate_fn=my_collate)
-    tgt_DL = DataLoader(dataset=tgt_dataset, batch_size=params.batch_size, shuffle=True, collate_fn=my_collate)
+    # 优先读取 columnar/ 下的 mmap 列式文件，没有时回退到 JSON
+    src_dataset = load_records(params.src)
+    tgt_dataset = load_records(params.tgt)
+    # 整批下标 gather 出 batch，与 my_collate 产出一致（my_collate 仅保留作基准对比）
+    src_DL = make_loader(build_dataset(src_dataset, params.kn, id_offset=1, code_offset=1), params.batch_size, shuffle=True)
+    tgt_DL = make_loader(build_dataset(tgt_dataset, params.kn, id_offset=1, code_offset=1), params.batch_size, shuffle=True)
     return src_DL, tgt_DL
 
 def slice_d(data = params.all):
-    with open(data) as i_f:
-        all_dataset = json.load(i_f)
-    all_DL = DataLoader(dataset=all_dataset, batch_size=params.batch_size, shuffle=False, collate_fn=my_collate)
+    all_dataset = load_records(data)
+    all_DL = make_loader(build_dataset(all_dataset, params.kn, id_offset=1, code_offset=1), params.batch_size, shuffle=False)
     return all_DL
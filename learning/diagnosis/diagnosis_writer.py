@@ -0,0 +1,109 @@
+"""
+StudentDiagnosis 批量写入（旧模型推理 inference_and_save 与 CDF 桥接 cdf_bridge 共用）
+
+学生和知识点的合法性各用一次查询预取，之后按 (student, knowledge_point, diagnosis_model)
+唯一键分块 bulk_create(update_conflicts=True)，每块一条 INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE，
+不再对每个（学生, 知识点）单独查询和 update_or_create。
+
+分块大小默认 DIAGNOSIS_WRITE_BATCH_SIZE，可在 settings 中用同名配置覆盖。
+写入完成后刷新涉及学生的掌握度快照（learning/mastery_snapshot.py）。
+"""
+
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from learning.mastery_snapshot import refresh_snapshots
+from learning.models import KnowledgePoint, StudentDiagnosis, User
+
+DIAGNOSIS_WRITE_BATCH_SIZE = 2000
+
+
+def _batch_size(batch_size):
+    return max(1, int(batch_size or getattr(settings, 'DIAGNOSIS_WRITE_BATCH_SIZE', DIAGNOSIS_WRITE_BATCH_SIZE)))
+
+
+def bulk_upsert_diagnoses(model_id, rows, subject_id=None, with_counts=False, batch_size=None):
+    """
+    批量写入/更新诊断结果
+
+    Args:
+        model_id: DiagnosisModel 的 ID
+        rows: 可迭代的 (student_id, knowledge_point_id, mastery[, practice_count, correct_count])，
+              ID 都是数据库中的原始 ID
+        subject_id: 指定时只写入该科目下的知识点
+        with_counts: 为 True 时 rows 带练习次数/正确次数，并一起更新
+        batch_size: 每次 INSERT 的行数，默认取 settings.DIAGNOSIS_WRITE_BATCH_SIZE
+
+    Returns:
+        dict: rows（写入行数）、students（涉及学生数）、skipped（学生/知识点不存在而跳过的行数）、
+              seconds、rows_per_sec
+    """
+    started = time.perf_counter()
+    rows = list(rows)
+    student_ids = {int(row[0]) for row in rows}
+    kp_ids = {int(row[1]) for row in rows}
+
+    valid_students = set(User.objects.filter(id__in=student_ids, user_type='student').values_list('id', flat=True))
+    kp_queryset = KnowledgePoint.objects.filter(id__in=kp_ids)
+    if subject_id is not None:
+        kp_queryset = kp_queryset.filter(subject_id=subject_id)
+    kp_subjects = dict(kp_queryset.values_list('id', 'subject_id'))
+
+    now = timezone.now()
+    objects = []
+    saved_students = set()
+    subject_students = defaultdict(set)
+    for row in rows:
+        student_id, kp_id = int(row[0]), int(row[1])
+        if student_id not in valid_students or kp_id not in kp_subjects:
+            continue
+        obj = StudentDiagnosis(
+            student_id=student_id,
+            knowledge_point_id=kp_id,
+            diagnosis_model_id=model_id,
+            mastery_level=float(row[2]),
+            last_practiced=now,
+        )
+        if with_counts:
+            obj.practice_count = int(row[3])
+            obj.correct_count = int(row[4])
+        objects.append(obj)
+        saved_students.add(student_id)
+        subject_students[kp_subjects[kp_id]].add(student_id)
+
+    update_fields = ['mastery_level', 'last_practiced']
+    if with_counts:
+        update_fields += ['practice_count', 'correct_count']
+    # MySQL 的 ON DUPLICATE KEY UPDATE 不能指定冲突列，只有 PostgreSQL / SQLite 需要 unique_fields
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['student', 'knowledge_point', 'diagnosis_model']
+
+    size = _batch_size(batch_size)
+    for start in range(0, len(objects), size):
+        with transaction.atomic():
+            StudentDiagnosis.objects.bulk_create(
+                objects[start:start + size],
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=update_fields,
+            )
+
+    for snapshot_subject_id, student_ids in subject_students.items():
+        refresh_snapshots(student_ids, snapshot_subject_id)
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'rows': len(objects),
+        'students': len(saved_students),
+        'skipped': len(rows) - len(objects),
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(len(objects) / seconds, 1) if seconds > 0 else float(len(objects)),
+    }
+    print(f"诊断结果写入完成：{stats['rows']} 条（{stats['students']} 名学生，跳过 {stats['skipped']} 条），"
+          f"耗时 {stats['seconds']}s，{stats['rows_per_sec']} 行/秒")
+    return stats
@@ -1,5 +1,4 @@
 import csv
-import json
 import random
 import time
 from collections import defaultdict
@@ -10,6 +9,7 @@ import torch
 from torch.utils.data import DataLoader, Dataset as TorchDataset
 
 from . import MODEL_NAMES, NO_GATE_MODEL_NAMES
+from ..CMD_survey.columnar import load_records, records_exist
 from .NCDM.NCDM_dual_relation_sparse_q_fit import NCDM as SoftGateNCDM
 from .NCDM.NCDM_dual_relation_sparse_q_fit_wumenkong import NCDM as NoGateNCDM
 
@@ -138,8 +138,9 @@ def read_config(data_dir):
 
 
 def read_json_records(path):
-    with Path(path).open("r", encoding="utf-8") as file_obj:
-        return json.load(file_obj)
+    # Prefers the memory-mapped columnar/ arrays next to the JSON file and
+    # falls back to json.load when the dataset was exported as JSON only.
+    return load_records(path)
 
 
 def infer_stats(records):
@@ -278,7 +279,7 @@ def build_context_from_json_dir(data_dir, subject_id=None):
     log_path = data_dir / "log_data.json"
     train_rows = read_json_records(data_dir / "train.json")
     val_rows = read_json_records(data_dir / "val.json")
-    log_rows = read_json_records(log_path) if log_path.exists() else train_rows + val_rows
+    log_rows = read_json_records(log_path) if records_exist(log_path) else train_rows + val_rows
 
     stats = read_config(data_dir) or infer_stats(train_rows + val_rows + log_rows)
     student_mapping, exercise_mapping, skill_mapping = read_homologous_mapping(data_dir)
@@ -304,7 +305,7 @@ def build_context_from_json_dir(data_dir, subject_id=None):
 
 def has_system_dataset_files(data_dir):
     data_dir = Path(data_dir)
-    return (data_dir / "train.json").exists() and (data_dir / "val.json").exists() and (data_dir / "config.txt").exists()
+    return records_exist(data_dir / "train.json") and records_exist(data_dir / "val.json") and (data_dir / "config.txt").exists()
 
 
 def resolve_system_dataset_dir(dataset_name):
@@ -427,7 +428,7 @@ def train_from_context(context, model_name="GDNCDM"):
 
 def train_subject(subject_id, model_name="GDNCDM"):
     data_dir = DIAGNOSIS_DATA_DIR / str(subject_id)
-    if not (data_dir / "train.json").exists() or not (data_dir / "val.json").exists():
+    if not records_exist(data_dir / "train.json") or not records_exist(data_dir / "val.json"):
         from learning.diagnosis.data_export import export_training_data
 
         export_training_data(subject_id)
@@ -501,8 +502,8 @@ def infer_and_get_diagnosis_data(subject_id, model_id, model_name):
                 if is_correct:
                     student_skill_stats[(student_idx, skill_idx)]["correct_count"] += 1
 
-    from django.utils import timezone
-    from learning.models import DiagnosisModel, KnowledgeGraph, KnowledgePoint, StudentDiagnosis, User
+    from learning.diagnosis.diagnosis_writer import bulk_upsert_diagnoses
+    from learning.models import DiagnosisModel, KnowledgeGraph, KnowledgePoint, User
 
     diagnosis_model = DiagnosisModel.objects.get(id=model_id)
     kp_info = {kp.id: kp.name for kp in KnowledgePoint.objects.filter(subject_id=subject_id)}
@@ -548,47 +549,7 @@ def infer_and_get_diagnosis_data(subject_id, model_id, model_name):
             "answer_count": len(student_mastery),
         }
 
-    now = timezone.now()
-    existing = {
-        (row.student_id, row.knowledge_point_id): row
-        for row in StudentDiagnosis.objects.filter(
-            diagnosis_model=diagnosis_model,
-            student_id__in=[row[0] for row in diagnosis_rows],
-            knowledge_point_id__in=[row[1] for row in diagnosis_rows],
-        )
-    }
-    to_create = []
-    to_update = []
-    for student_id, knowledge_point_id, mastery_value, practice_count, correct_count in diagnosis_rows:
-        key = (student_id, knowledge_point_id)
-        diagnosis = existing.get(key)
-        if diagnosis:
-            diagnosis.mastery_level = mastery_value
-            diagnosis.practice_count = practice_count
-            diagnosis.correct_count = correct_count
-            diagnosis.last_practiced = now
-            to_update.append(diagnosis)
-        else:
-            to_create.append(
-                StudentDiagnosis(
-                    student_id=student_id,
-                    knowledge_point_id=knowledge_point_id,
-                    diagnosis_model=diagnosis_model,
-                    mastery_level=mastery_value,
-                    practice_count=practice_count,
-                    correct_count=correct_count,
-                    last_practiced=now,
-                )
-            )
-
-    if to_create:
-        StudentDiagnosis.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
-    if to_update:
-        StudentDiagnosis.objects.bulk_update(
-            to_update,
-            ["mastery_level", "practice_count", "correct_count", "last_practiced"],
-            batch_size=500,
-        )
+    bulk_upsert_diagnoses(diagnosis_model.id, diagnosis_rows, subject_id=subject_id, with_counts=True)
 
     knowledge_points_data = []
     for kp_id, name in kp_info.items():
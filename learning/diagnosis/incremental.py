@@ -0,0 +1,491 @@
+# 增量（热启动）诊断训练
+#
+# run_diagnosis 每次都全量导出 + 从头训练，这里改为：
+#   1. 全量训练后记录检查点状态（models/<模型>.state.json）：训练到的最大 AnswerLog id、
+#      新ID -> 原ID 映射、全量训练时的规模以及验证集基线指标；
+#   2. 之后的诊断只取比检查点更新的答题记录（id 更大或训练后被重新批改），
+#      新学生/新习题在映射表末尾追加新ID，对应嵌入行用模型自身的初始化，旧行原样保留，
+#      冻结共享网络、只微调嵌入表几轮；log_data 按 AnswerLog id 替换被重新批改的记录、追加新记录；
+#   3. 漂移指标（新增记录占比、新学生/新习题占比、检查点在新记录上的指标下降、累计增量次数）
+#      超过阈值时，向后台任务队列排入一次 mode='full' 的全量重建。
+#
+# 知识点集合变化、映射表被其他模型的全量导出改写、或数据集不是列式格式（或缺少 log_id 列）时，
+# incremental_update 返回 None，由调用方走原来的全量流程。
+
+import os
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import torch
+import torch.nn as nn
+from django.db.models import Q
+from django.utils import timezone
+from sklearn.metrics import roc_auc_score, accuracy_score
+
+from learning.models import AnswerLog, DiagnosisModel, Exercise, KnowledgePoint
+from learning.training_jobs import enqueue_job, find_active_job
+from CMD_survey.model import NCDM, IRT
+from CMD_survey.columnar import has_columnar, load_log_ids, load_records, load_split, save_q_matrix, save_split
+from CMD_survey.interaction_dataset import InteractionDataset, build_dataset, build_q_tensor, make_loader
+from .data_export import exercise_knowledge_codes, read_homologous, write_config, write_homologous
+
+# 支持热启动的模型：构造函数、网络属性名、按学生/按习题增长的嵌入表、前向是否需要 knowledge_emb
+INCREMENTAL_MODELS = {
+    'NCDM': {
+        'build': lambda un, en, kn: NCDM.NCDM(kn, en, un),
+        'net': 'ncdm_net',
+        'user_tables': ['student_emb'],
+        'item_tables': ['k_difficulty', 'e_difficulty'],
+        'uses_knowledge': True,
+    },
+    'IRT': {
+        'build': lambda un, en, kn: IRT.IRT(un, en, value_range=4.0, a_range=2.0),
+        'net': 'irt_net',
+        'user_tables': ['theta'],
+        'item_tables': ['a', 'b', 'c'],
+        'uses_knowledge': False,
+    },
+}
+
+FINETUNE_EPOCHS = 5
+FINETUNE_LR = 0.002
+BATCH_SIZE = 128
+
+# 超过任一阈值即安排全量重建（比例相对于上次全量训练时的规模）
+DRIFT_THRESHOLDS = {
+    'new_log_ratio': 0.3,
+    'new_student_ratio': 0.2,
+    'new_exercise_ratio': 0.2,
+    'acc_drop': 0.05,
+    'auc_drop': 0.05,
+    'updates': 20,
+}
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境
+    fcntl = None
+    import msvcrt
+
+
+class SubjectLock:
+    """
+    科目数据目录的跨进程互斥锁：对 data/<科目ID>/.lock 加文件锁（Linux 用 flock，Windows 用 msvcrt），
+    诊断任务各自在独立子进程里运行，线程锁拦不住别的进程；持锁进程退出时系统自动释放。
+    同一进程内可重入（文件锁按打开的文件计，嵌套时只在最外层加锁/解锁）。
+    """
+
+    def __init__(self, subject_id):
+        self.path = os.path.join(_data_dir(subject_id), '.lock')
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def _lock_file(self, f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            return
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.5)
+
+    def _unlock_file(self, f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                f = open(self.path, 'a+')
+                try:
+                    f.seek(0)
+                    self._lock_file(f)
+                except BaseException:
+                    f.close()
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._file = f
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+        return False
+
+
+_subject_locks = {}
+_subject_locks_guard = threading.Lock()
+
+
+def subject_lock(subject_id):
+    """同一科目的数据目录同一时间只允许一个导出/训练/推理流程读写（跨进程）"""
+    with _subject_locks_guard:
+        key = str(subject_id)
+        if key not in _subject_locks:
+            _subject_locks[key] = SubjectLock(subject_id)
+        return _subject_locks[key]
+
+
+def supports_incremental(model_name):
+    return model_name in INCREMENTAL_MODELS
+
+
+def _data_dir(subject_id):
+    return os.path.join(os.path.dirname(__file__), 'data', str(subject_id))
+
+
+def checkpoint_path(subject_id, model_name):
+    return os.path.join(_data_dir(subject_id), 'models', f'{model_name}.pth')
+
+
+def state_path(subject_id, model_name):
+    return os.path.join(_data_dir(subject_id), 'models', f'{model_name}.state.json')
+
+
+def load_state(subject_id, model_name):
+    path = state_path(subject_id, model_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(subject_id, model_name, state):
+    path = state_path(subject_id, model_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _mapping_list(mapping):
+    """{新ID: 原ID}（新ID 从 1 连续编号）-> [原ID, ...]"""
+    return [mapping[i] for i in range(1, len(mapping) + 1)]
+
+
+def _device():
+    return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+
+def _predict(spec, net, user_id, item_id, knowledge_emb):
+    if spec['uses_knowledge']:
+        return net(user_id, item_id, knowledge_emb)
+    return net(user_id, item_id)
+
+
+def _evaluate(spec, net, loader, device):
+    """返回 (accuracy, auc)，只有一种标签时 auc 为 None"""
+    net.eval()
+    y_pred, y_true = [], []
+    with torch.no_grad():
+        for user_id, item_id, knowledge_emb, y in loader:
+            pred = _predict(spec, net, user_id.to(device), item_id.to(device), knowledge_emb.to(device))
+            y_pred.append(pred.cpu().numpy())
+            y_true.append(y.numpy())
+    if not y_true:
+        return None, None
+    y_pred = np.concatenate(y_pred)
+    y_true = np.concatenate(y_true)
+    acc = float(accuracy_score(y_true, y_pred >= 0.5))
+    auc = float(roc_auc_score(y_true, y_pred)) if len(np.unique(y_true)) > 1 else None
+    return acc, auc
+
+
+def _load_grown_model(spec, state_dict, un, en, kn):
+    """
+    按新的学生/习题数构造模型并载入检查点：
+    嵌入表的旧行从检查点复制，新增行保留构造函数的初始化，其余参数形状不变直接载入
+    """
+    cdm = spec['build'](un, en, kn)
+    net = getattr(cdm, spec['net'])
+    grown = net.state_dict()
+    growable = {f'{name}.weight' for name in spec['user_tables'] + spec['item_tables']}
+    for key, value in state_dict.items():
+        if key in growable and value.shape[0] <= grown[key].shape[0]:
+            grown[key][:value.shape[0]] = value
+        else:
+            grown[key] = value
+    net.load_state_dict(grown)
+    return cdm, net
+
+
+def record_full_training(subject_id, model_name, export_result):
+    """全量训练完成后记录检查点状态，并在验证集上计算漂移比较用的基线指标"""
+    if not supports_incremental(model_name) or not os.path.exists(checkpoint_path(subject_id, model_name)):
+        return None
+
+    spec = INCREMENTAL_MODELS[model_name]
+    data_dir = _data_dir(subject_id)
+    user_mapping, exer_mapping, kp_mapping = read_homologous(data_dir)
+    un, en, kn = len(user_mapping), len(exer_mapping), len(kp_mapping)
+
+    baseline_acc, baseline_auc = None, None
+    val_records = load_records(os.path.join(data_dir, 'val.json'))
+    if len(val_records):
+        cdm = spec['build'](un, en, kn)
+        net = getattr(cdm, spec['net'])
+        net.load_state_dict(torch.load(checkpoint_path(subject_id, model_name), map_location='cpu'))
+        device = _device()
+        net.to(device)
+        loader = make_loader(build_dataset(val_records, kn, id_offset=1, code_offset=1), BATCH_SIZE, shuffle=False)
+        baseline_acc, baseline_auc = _evaluate(spec, net, loader, device)
+
+    now = timezone.now().isoformat()
+    state = {
+        'model_name': model_name,
+        'last_log_id': export_result.get('last_log_id', 0),
+        'trained_at': now,
+        'full_trained_at': now,
+        'full_log_count': export_result.get('train_count', 0) + export_result.get('val_count', 0),
+        'full_student_count': un,
+        'full_exercise_count': en,
+        'incremental_log_count': 0,
+        'incremental_updates': 0,
+        'baseline_acc': baseline_acc,
+        'baseline_auc': baseline_auc,
+        'user_ids': _mapping_list(user_mapping),
+        'exer_ids': _mapping_list(exer_mapping),
+        'kp_ids': _mapping_list(kp_mapping),
+    }
+    save_state(subject_id, model_name, state)
+    return state
+
+
+def _fetch_new_logs(subject_id, state):
+    """检查点之后新增或被重新批改的作答记录 (id, student_id, exercise_id, is_correct)，按 id 排序"""
+    trained_at = datetime.fromisoformat(state['trained_at'])
+    return list(AnswerLog.objects.filter(
+        exercise__subject_id=subject_id,
+        is_correct__isnull=False,
+        student__user_type='student',
+    ).filter(
+        Q(id__gt=state['last_log_id']) | Q(graded_at__gt=trained_at)
+    ).order_by('id').values_list('id', 'student_id', 'exercise_id', 'is_correct'))
+
+
+def compute_drift(state, new_log_count, new_student_count, new_exercise_count, new_acc, new_auc):
+    """漂移指标以及超过阈值的指标名列表"""
+    full_log_count = max(state['full_log_count'], 1)
+    drift = {
+        'new_log_ratio': (state['incremental_log_count'] + new_log_count) / full_log_count,
+        'new_student_ratio': (len(state['user_ids']) + new_student_count - state['full_student_count'])
+                             / max(state['full_student_count'], 1),
+        'new_exercise_ratio': (len(state['exer_ids']) + new_exercise_count - state['full_exercise_count'])
+                              / max(state['full_exercise_count'], 1),
+        'acc_drop': None,
+        'auc_drop': None,
+        'updates': state['incremental_updates'] + 1,
+    }
+    if new_acc is not None and state.get('baseline_acc') is not None:
+        drift['acc_drop'] = state['baseline_acc'] - new_acc
+    if new_auc is not None and state.get('baseline_auc') is not None:
+        drift['auc_drop'] = state['baseline_auc'] - new_auc
+
+    exceeded = [
+        name for name, threshold in DRIFT_THRESHOLDS.items()
+        if drift[name] is not None and drift[name] >= threshold
+    ]
+    return drift, exceeded
+
+
+def incremental_update(subject_id, model_name):
+    """
+    用检查点之后的新作答记录热启动微调模型，并同步更新推理读取的数据文件
+
+    调用方需持有 subject_lock(subject_id)。
+
+    Returns:
+        dict: 增量训练统计；无法增量（无检查点、知识点变化、映射表不一致等）时返回 None
+    """
+    if not supports_incremental(model_name):
+        return None
+    state = load_state(subject_id, model_name)
+    model_path = checkpoint_path(subject_id, model_name)
+    data_dir = _data_dir(subject_id)
+    if state is None or not os.path.exists(model_path) or not has_columnar(data_dir, 'log_data'):
+        return None
+    # 没有 log_id 列（旧版导出）就无法替换重新批改的记录
+    old_log_ids = load_log_ids(data_dir, 'log_data')
+    if old_log_ids is None:
+        print(f"科目 {subject_id} 的 log_data 缺少 AnswerLog id，改为全量训练")
+        return None
+
+    # 映射表必须和检查点训练时一致（其他模型的全量导出可能已经改写过）
+    user_mapping, exer_mapping, kp_mapping = read_homologous(data_dir)
+    if (_mapping_list(user_mapping) != state['user_ids'] or _mapping_list(exer_mapping) != state['exer_ids']
+            or _mapping_list(kp_mapping) != state['kp_ids']):
+        print(f"科目 {subject_id} 的映射表与 {model_name} 检查点不一致，改为全量训练")
+        return None
+
+    # 知识点集合变化会改变嵌入维度，只能全量重建
+    kp_ids = set(KnowledgePoint.objects.filter(subject_id=subject_id).values_list('id', flat=True))
+    if kp_ids != set(state['kp_ids']):
+        print(f"科目 {subject_id} 的知识点发生变化，改为全量训练")
+        return None
+
+    start = time.perf_counter()
+    new_logs = _fetch_new_logs(subject_id, state)
+    if not new_logs:
+        return {
+            'mode': 'incremental',
+            'new_logs': 0,
+            'regraded_logs': 0,
+            'new_students': 0,
+            'new_exercises': 0,
+            'seconds': round(time.perf_counter() - start, 3),
+            'drift': None,
+            'rebuild_scheduled': False,
+            'rebuild_reasons': [],
+        }
+
+    # 1. 追加新学生、新习题的映射（新ID 接在末尾，旧ID 不变）
+    old_un, old_en, kn = len(user_mapping), len(exer_mapping), len(kp_mapping)
+    user_reverse = {v: k for k, v in user_mapping.items()}
+    exer_reverse = {v: k for k, v in exer_mapping.items()}
+    kp_reverse = {v: k for k, v in kp_mapping.items()}
+
+    for _, student_id, _, _ in new_logs:
+        if student_id not in user_reverse:
+            user_reverse[student_id] = len(user_mapping) + 1
+            user_mapping[len(user_mapping) + 1] = student_id
+    new_exercises = Exercise.objects.filter(subject_id=subject_id).exclude(
+        id__in=list(exer_reverse)
+    ).order_by('id').values_list('id', flat=True)
+    for exercise_id in new_exercises:
+        exer_reverse[exercise_id] = len(exer_mapping) + 1
+        exer_mapping[len(exer_mapping) + 1] = exercise_id
+    un, en = len(user_mapping), len(exer_mapping)
+
+    rows = np.array(
+        [(log_id, user_reverse[s], exer_reverse[e], 1 if c else 0) for log_id, s, e, c in new_logs if e in exer_reverse],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    log_ids, user_ids, exer_ids, scores = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+    # 训练后被重新批改的旧记录在 log_data 中替换，不计入新增记录
+    regraded = np.isin(log_ids, old_log_ids)
+    appended_count = int((~regraded).sum())
+
+    # 2. Q 矩阵（新ID），同时用于微调和写回列式文件
+    exer_to_kps = exercise_knowledge_codes(subject_id, exer_reverse, kp_reverse)
+    q_matrix = build_q_tensor(np.arange(en), [exer_to_kps.get(i + 1, []) for i in range(en)], en, kn, code_offset=1)
+
+    # 3. 载入检查点并扩展嵌入表
+    spec = INCREMENTAL_MODELS[model_name]
+    device = _device()
+    cdm, net = _load_grown_model(spec, torch.load(model_path, map_location='cpu'), un, en, kn)
+    net.to(device)
+
+    # 4. 检查点在新记录（老学生 + 老习题）上的指标，用于漂移判断
+    seen = (user_ids <= old_un) & (exer_ids <= old_en)
+    new_acc, new_auc = None, None
+    if seen.any():
+        seen_data = InteractionDataset(user_ids[seen] - 1, exer_ids[seen] - 1, scores[seen], q_matrix)
+        new_acc, new_auc = _evaluate(spec, net, make_loader(seen_data, BATCH_SIZE, shuffle=False), device)
+
+    # 5. 冻结共享网络，只在新记录上微调嵌入表
+    table_names = set(spec['user_tables'] + spec['item_tables'])
+    tables = []
+    for name, param in net.named_parameters():
+        is_table = name.split('.')[0] in table_names
+        param.requires_grad_(is_table)
+        if is_table:
+            tables.append(param)
+    optimizer = torch.optim.Adam(tables, lr=FINETUNE_LR)
+    loss_function = nn.BCELoss()
+    loader = make_loader(InteractionDataset(user_ids - 1, exer_ids - 1, scores, q_matrix), BATCH_SIZE, shuffle=True)
+
+    net.train()
+    for _ in range(FINETUNE_EPOCHS):
+        for user_id, item_id, knowledge_emb, y in loader:
+            pred = _predict(spec, net, user_id.to(device), item_id.to(device), knowledge_emb.to(device))
+            loss = loss_function(pred, y.to(device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    for param in net.parameters():
+        param.requires_grad_(True)
+
+    # 6. 写回检查点和推理读取的 config.txt / homologous.csv / log_data
+    tmp_path = model_path + '.tmp'
+    torch.save(net.state_dict(), tmp_path)
+    os.replace(tmp_path, model_path)
+
+    write_config(data_dir, un, en, kn)
+    write_homologous(data_dir, user_mapping, exer_mapping, kp_mapping)
+    save_q_matrix(data_dir, exer_to_kps, en + 1)
+    log_data = load_split(data_dir, 'log_data', mmap=False)
+    keep = ~np.isin(old_log_ids, log_ids)
+    save_split(
+        data_dir, 'log_data',
+        np.concatenate([log_data.user[keep], user_ids]),
+        np.concatenate([log_data.exer[keep], exer_ids]),
+        np.concatenate([log_data.score[keep], scores]),
+        log_ids=np.concatenate([old_log_ids[keep], log_ids]),
+    )
+
+    # 7. 漂移判断并更新状态
+    drift, exceeded = compute_drift(state, appended_count, un - old_un, en - old_en, new_acc, new_auc)
+    state.update({
+        'last_log_id': max(state['last_log_id'], max(log[0] for log in new_logs)),
+        'trained_at': timezone.now().isoformat(),
+        'incremental_log_count': state['incremental_log_count'] + appended_count,
+        'incremental_updates': state['incremental_updates'] + 1,
+        'user_ids': _mapping_list(user_mapping),
+        'exer_ids': _mapping_list(exer_mapping),
+        'last_drift': drift,
+    })
+    save_state(subject_id, model_name, state)
+    rebuild_scheduled = bool(exceeded) and schedule_full_rebuild(subject_id, model_name, exceeded) is not None
+
+    seconds = round(time.perf_counter() - start, 3)
+    print(f"{model_name} 增量训练完成: 新记录 {appended_count} 条，重新批改 {len(rows) - appended_count} 条，"
+          f"新学生 {un - old_un}，新习题 {en - old_en}，耗时 {seconds}s")
+    return {
+        'mode': 'incremental',
+        'new_logs': appended_count,
+        'regraded_logs': len(rows) - appended_count,
+        'new_students': un - old_un,
+        'new_exercises': en - old_en,
+        'seconds': seconds,
+        'drift': drift,
+        'rebuild_scheduled': rebuild_scheduled,
+        'rebuild_reasons': exceeded,
+    }
+
+
+def schedule_full_rebuild(subject_id, model_name, reasons):
+    """把全量重建作为 mode='full' 的诊断任务排入后台队列（同一科目和模型已有排队/运行中的任务时不重复排）"""
+    task_key = f"diagnosis_{subject_id}_{model_name}"
+    job = find_active_job(task_key)
+    if job is not None:
+        return job
+    diagnosis_model = DiagnosisModel.objects.filter(name=model_name, is_active=True).first()
+    if diagnosis_model is None:
+        return None
+    print(f"安排全量重建 {model_name}（科目 {subject_id}），原因: {', '.join(reasons)}")
+    return enqueue_job('diagnosis', task_key, {
+        'subject_id': int(subject_id),
+        'model_id': diagnosis_model.id,
+        'mode': 'full',
+    })
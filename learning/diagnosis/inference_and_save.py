@@ -3,12 +3,12 @@
 import torch
 import os
 import csv
-import json
-import threading
 from collections import defaultdict
 from django.utils import timezone
 from learning.models import StudentDiagnosis, User, KnowledgePoint, DiagnosisModel, KnowledgeGraph
 from CMD_survey.model import NCDM
+from CMD_survey.columnar import load_records, student_knowledge_sets
+from learning.diagnosis.diagnosis_writer import bulk_upsert_diagnoses
 
 # The teacher-end inference path now has two branches:
 # 1. legacy models that load exported files and local checkpoints here;
@@ -27,62 +27,34 @@ except ImportError:
     def run_cdf_diagnosis_pipeline(*args, **kwargs):
         raise RuntimeError('cdf_bridge.py is missing')
 
-def save_to_database_async(subject_id, model_id, mastery_vectors, student_known_kps, user_mapping, kp_mapping, un):
-    """异步保存诊断数据到数据库"""
-
-    def _save():
-        try:
-            from learning.models import StudentDiagnosis, User, KnowledgePoint, DiagnosisModel
-            from django.utils import timezone
-
-            diagnosis_model = DiagnosisModel.objects.get(id=model_id)
-            saved_count = 0
-
-            for new_student_id, known_kps in student_known_kps.items():
-                student_original_id = user_mapping.get(new_student_id)
-                if not student_original_id:
-                    continue
+def save_to_database(subject_id, model_id, mastery_vectors, student_known_kps, user_mapping, kp_mapping, un):
+    """
+    同步保存诊断数据到数据库（批量 upsert，见 diagnosis_writer.bulk_upsert_diagnoses）。
+    诊断在任务子进程里执行，execute_job 返回后进程即退出，后台线程会被直接杀掉，
+    所以必须在返回前写完。
+    """
 
-                student = User.objects.filter(id=student_original_id, user_type='student').first()
-                if not student:
+    def _rows():
+        for new_student_id, known_kps in student_known_kps.items():
+            student_original_id = user_mapping.get(new_student_id)
+            if not student_original_id:
+                continue
+            mastery_vector = mastery_vectors[new_student_id - 1]
+            for new_kp_id in known_kps:
+                kp_original_id = kp_mapping.get(new_kp_id)
+                if not kp_original_id:
                     continue
+                yield student_original_id, kp_original_id, round(float(mastery_vector[new_kp_id - 1]), 3)
 
-                mastery_vector = mastery_vectors[new_student_id - 1]
-
-                for new_kp_id in known_kps:
-                    mastery = float(mastery_vector[new_kp_id - 1])
-                    kp_original_id = kp_mapping.get(new_kp_id)
-
-                    if not kp_original_id:
-                        continue
-
-                    knowledge_point = KnowledgePoint.objects.filter(id=kp_original_id).first()
-                    if not knowledge_point:
-                        continue
-
-                    StudentDiagnosis.objects.update_or_create(
-                        student=student,
-                        knowledge_point=knowledge_point,
-                        diagnosis_model=diagnosis_model,
-                        defaults={
-                            'mastery_level': round(mastery, 3),
-                            'last_practiced': timezone.now()
-                        }
-                    )
-                    saved_count += 1
-
-            print(f"后台保存完成：已保存/更新 {saved_count} 条诊断记录")
-        except Exception as e:
-            print(f"后台保存失败: {str(e)}")
-
-    thread = threading.Thread(target=_save)
-    thread.daemon = True
-    thread.start()
+    try:
+        bulk_upsert_diagnoses(model_id, _rows(), subject_id=subject_id)
+    except Exception as e:
+        print(f"保存诊断结果失败: {str(e)}")
 
 
 def infer_and_get_diagnosis_data(subject_id, model_id, model_name):
     """
-    推理获取诊断数据（返回前端数据，后台异步保存到数据库）
+    推理获取诊断数据（保存到数据库后返回前端数据）
     """
     # 1. 数据目录
 
@@ -138,16 +110,9 @@ def infer_and_get_diagnosis_data(subject_id, model_id, model_name):
             if row[4]:
                 kp_mapping[int(row[4])] = int(row[5])
 
-    # 4. 读取 log_data.json
-    log_data_path = os.path.join(data_dir, 'log_data.json')
-    with open(log_data_path, 'r', encoding='utf-8') as f:
-        all_logs = json.load(f)
-
-    student_known_kps = defaultdict(set)
-    for log in all_logs:
-        student_new_id = log['user_id']
-        for kp in log['knowledge_code']:
-            student_known_kps[student_new_id].add(kp)
+    # 4. 读取 log_data（列式文件优先，没有时回退到 log_data.json）
+    all_logs = load_records(os.path.join(data_dir, 'log_data.json'))
+    student_known_kps = student_knowledge_sets(all_logs)
 
     # 5. 加载模型并推理
     device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
@@ -169,9 +134,9 @@ def infer_and_get_diagnosis_data(subject_id, model_id, model_name):
         print(f"模型 {model_name} 暂不支持推理")
         return None
 
-    # 6. 异步保存到数据库（不阻塞）
-    save_to_database_async(subject_id, model_id, mastery_vectors, student_known_kps,
-                           user_mapping, kp_mapping, un)
+    # 6. 保存到数据库
+    save_to_database(subject_id, model_id, mastery_vectors, student_known_kps,
+                     user_mapping, kp_mapping, un)
 
     # 7. 获取原始知识点信息（用于前端返回）
     all_knowledge_points = KnowledgePoint.objects.filter(subject_id=subject_id)
@@ -28,6 +28,9 @@ device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
 
 args = None
 
+# 每轮评估后的回调 epoch_callback(epoch, total_epochs, metrics)，由后台任务在调用训练入口前设置
+epoch_callback = None
+
 
 def _run_cdf_bridge_model(model_name):
     # CDF 家族模型统一走桥接层，而不是老的 CMD_survey 训练入口。
@@ -93,7 +96,8 @@ def IRT_main():
     - 1-PL: return 1 / (1 + F.exp(-D * (theta - b)))
     """
     cdm = IRT.IRT(params.un, params.en, value_range=4.0, a_range=2.0)
-    e, auc, acc, rmse = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr)
+    e, auc, acc, rmse = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr,
+                                  epoch_callback=epoch_callback)
 
     # 保存模型参数
     model_path = os.path.join(params.dataset, 'models', 'IRT.pth')
@@ -121,7 +125,8 @@ def myMIRT_main():
 
 def DINA_main():
     cdm = DINA.DINA(params.un, params.en, params.kn)
-    e, auc, acc = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr)
+    e, auc, acc = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr,
+                            epoch_callback=epoch_callback)
     
     # 打印最终结果到标准输出
     print("\n" + "="*50)
@@ -137,7 +142,8 @@ def DINA_main():
 
 def NCD_main():
     cdm = NCDM.NCDM(params.kn, params.en, params.un)  # reverse
-    e, auc, acc, rmse = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr)
+    e, auc, acc, rmse = cdm.train(train_data=src, test_data=tgt, epoch=params.epoch, device=device, lr=params.lr,
+                                  epoch_callback=epoch_callback)
 
     # 保存模型参数
     model_path = os.path.join(params.dataset, 'models', 'NCDM.pth')
@@ -0,0 +1,99 @@
+"""
+CDF 建图去环的测试文件
+测试 _remove_cycles 的输出无环、删除记录格式不变，且删掉的是环上分数最低的边
+"""
+
+import json
+import random
+
+import networkx as nx
+from django.test import TestCase
+
+from learning.diagnosis.cdf_bridge import _remove_cycles
+from learning.models import KnowledgePoint, Subject
+
+REMOVED_CYCLE_KEYS = {
+    "relation_kind",
+    "cycle_nodes",
+    "removed_source_kp_id",
+    "removed_target_kp_id",
+    "removed_source_node_id",
+    "removed_target_node_id",
+    "removed_source_name",
+    "removed_target_name",
+    "score",
+    "reason",
+}
+RELATION_KEYS = {"source", "target", "source_node_id", "target_node_id", "score", "reason", "source_name", "target_name"}
+
+
+class RemoveCyclesTestCase(TestCase):
+    """测试 _remove_cycles"""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name="数学")
+        self.kps = [KnowledgePoint.objects.create(subject=self.subject, name=f"知识点{i}") for i in range(12)]
+        self.kp_id_to_node_id = {kp.id: node_id for node_id, kp in enumerate(self.kps)}
+
+    def _relation(self, source, target, score):
+        return {"source": self.kps[source].id, "target": self.kps[target].id, "score": score, "reason": "r"}
+
+    def _remove(self, relations):
+        return _remove_cycles(relations, "prereq", self.kp_id_to_node_id, self.kps)
+
+    def assertValidResult(self, relations, acyclic, removed):
+        graph = nx.DiGraph((item["source"], item["target"]) for item in acyclic)
+        self.assertTrue(nx.is_directed_acyclic_graph(graph))
+        input_edges = {(r["source"], r["target"]) for r in relations if r["source"] != r["target"]}
+        kept_edges = {(item["source"], item["target"]) for item in acyclic}
+        removed_edges = {(row["removed_source_kp_id"], row["removed_target_kp_id"]) for row in removed}
+        self.assertEqual(kept_edges | removed_edges, input_edges)
+        self.assertFalse(kept_edges & removed_edges)
+        for item in acyclic:
+            self.assertEqual(set(item), RELATION_KEYS)
+        for row in removed:
+            self.assertEqual(set(row), REMOVED_CYCLE_KEYS)
+            # 记录的环从被删的边开始，且每条边都在输入中
+            cycle = json.loads(row["cycle_nodes"])
+            self.assertEqual(cycle[:2], [row["removed_source_kp_id"], row["removed_target_kp_id"]])
+            for source, target in zip(cycle, cycle[1:] + cycle[:1]):
+                self.assertIn((source, target), input_edges)
+
+    def test_acyclic_input_unchanged(self):
+        """无环输入原样保留，按结点编号排序"""
+        relations = [self._relation(1, 2, 0.8), self._relation(0, 1, 0.9)]
+        acyclic, removed = self._remove(relations)
+        self.assertEqual(removed, [])
+        self.assertEqual([(item["source"], item["target"]) for item in acyclic],
+                         [(self.kps[0].id, self.kps[1].id), (self.kps[1].id, self.kps[2].id)])
+
+    def test_removes_lowest_score_edge(self):
+        """三元环删掉分数最低的边"""
+        relations = [self._relation(0, 1, 0.9), self._relation(1, 2, 0.3), self._relation(2, 0, 0.7)]
+        acyclic, removed = self._remove(relations)
+        self.assertValidResult(relations, acyclic, removed)
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(removed[0]["removed_source_kp_id"], self.kps[1].id)
+        self.assertEqual(removed[0]["removed_target_kp_id"], self.kps[2].id)
+        self.assertEqual(removed[0]["removed_source_node_id"], 1)
+        self.assertEqual(removed[0]["removed_source_name"], "知识点1")
+        self.assertEqual(removed[0]["score"], 0.3)
+
+    def test_duplicate_edges_keep_max_score(self):
+        """重复关系保留分数最高的一条，自环丢弃"""
+        relations = [self._relation(0, 1, 0.2), self._relation(0, 1, 0.6), self._relation(3, 3, 0.9)]
+        acyclic, removed = self._remove(relations)
+        self.assertEqual(removed, [])
+        self.assertEqual(len(acyclic), 1)
+        self.assertEqual(acyclic[0]["score"], 0.6)
+
+    def test_random_graphs(self):
+        """随机稠密图去环后无环，删除记录格式一致"""
+        rng = random.Random(0)
+        for _ in range(30):
+            relations = [
+                self._relation(rng.randrange(12), rng.randrange(12), round(rng.random(), 2))
+                for _ in range(rng.randint(5, 60))
+            ]
+            acyclic, removed = self._remove(relations)
+            self.assertValidResult(relations, acyclic, removed)
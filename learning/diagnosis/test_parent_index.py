@@ -0,0 +1,91 @@
+"""
+HierCDF / PCGCDF 父结点索引的测试文件
+测试 ParentIndex 的逐层后验与按定义枚举 2^q 种父结点掌握状态的结果一致
+"""
+
+import itertools
+
+import pandas as pd
+import torch
+from django.test import SimpleTestCase
+
+from learning.diagnosis.CMD_survey.model.parent_index import ParentIndex
+
+# 小 DAG：0、1 为根，2 有一个父结点，3 有三个父结点，4 在第三层
+EDGES = [(0, 2), (1, 3), (0, 3), (2, 3), (3, 4), (1, 4)]
+N_KNOW = 5
+
+
+def brute_force_posterior(priori, condi_p, condi_n, edges, n_know):
+    """按拓扑序逐个结点枚举父结点掌握状态 θ 求和（原实现的定义）"""
+    posterior = priori.clone()
+    parents = {node: [(i, s) for i, (s, t) in enumerate(edges) if t == node] for node in range(n_know)}
+    for node in range(n_know):
+        if not parents[node]:
+            continue
+        q = len(parents[node])
+        total = torch.zeros(priori.shape[0], dtype=priori.dtype)
+        for theta in itertools.product([0, 1], repeat=q):
+            term = torch.ones(priori.shape[0], dtype=priori.dtype)
+            for bit, (edge, parent) in zip(theta, parents[node]):
+                if bit:
+                    term = term * posterior[:, parent] * condi_p[:, edge] ** (1.0 / q)
+                else:
+                    term = term * (1 - posterior[:, parent]) * condi_n[:, edge] ** (1.0 / q)
+            total = total + term
+        posterior[:, node] = total
+    return posterior
+
+
+class ParentIndexTestCase(SimpleTestCase):
+    """测试 ParentIndex.posterior / condi_extreme"""
+
+    def setUp(self):
+        torch.manual_seed(0)
+        # 打乱行顺序：条件概率的列号取 know_graph 的行索引
+        self.edges = [EDGES[i] for i in (3, 0, 5, 1, 4, 2)]
+        self.know_graph = pd.DataFrame(self.edges, columns=['from', 'to'])
+        self.index = ParentIndex(self.know_graph, N_KNOW)
+        n_batch = 7
+        self.priori = torch.rand(n_batch, N_KNOW, dtype=torch.float64)
+        self.condi_p = torch.rand(n_batch, len(self.edges), dtype=torch.float64)
+        self.condi_n = torch.rand(n_batch, len(self.edges), dtype=torch.float64)
+
+    def test_levels(self):
+        """拓扑层次：第 1 层 {2}，第 2 层 {3}，第 3 层 {4}"""
+        self.assertEqual([level[0].tolist() for level in self.index.levels], [[2], [3], [4]])
+        self.assertEqual(self.index.has_parent.tolist(), [False, False, True, True, True])
+
+    def test_posterior_matches_enumeration(self):
+        expected = brute_force_posterior(self.priori, self.condi_p, self.condi_n, self.edges, N_KNOW)
+        actual = self.index.posterior(self.priori, self.condi_p, self.condi_n)
+        self.assertTrue(torch.allclose(actual, expected, rtol=0, atol=1e-12))
+
+    def test_posterior_float32(self):
+        """float32 输入（模型默认精度）结果同样一致"""
+        expected = brute_force_posterior(self.priori, self.condi_p, self.condi_n, self.edges, N_KNOW)
+        actual = self.index.posterior(self.priori.float(), self.condi_p.float(), self.condi_n.float())
+        self.assertEqual(actual.dtype, torch.float32)
+        self.assertTrue(torch.allclose(actual.double(), expected, atol=1e-6))
+
+    def test_condi_extreme(self):
+        """父结点全掌握时为 prod c+^(1/q)，根结点取先验"""
+        actual = self.index.condi_extreme(self.priori, self.condi_p)
+        for node in range(N_KNOW):
+            edge_ids = [i for i, (_, t) in enumerate(self.edges) if t == node]
+            if not edge_ids:
+                expected = self.priori[:, node]
+            else:
+                expected = torch.prod(self.condi_p[:, edge_ids] ** (1.0 / len(edge_ids)), dim=1)
+            self.assertTrue(torch.allclose(actual[:, node], expected, atol=1e-12))
+
+    def test_gradient_flows_to_priori(self):
+        """逐层 index_copy 非原地，反向传播可用"""
+        priori = self.priori.clone().requires_grad_(True)
+        self.index.posterior(priori, self.condi_p, self.condi_n).sum().backward()
+        self.assertIsNotNone(priori.grad)
+        self.assertTrue(torch.isfinite(priori.grad).all())
+
+    def test_cycle_rejected(self):
+        with self.assertRaises(ValueError):
+            ParentIndex(pd.DataFrame([(0, 1), (1, 0)], columns=['from', 'to']), 2)
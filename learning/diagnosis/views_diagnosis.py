@@ -41,7 +41,7 @@ def diagnosis(request):
 
     return render(request, 'teacher/diagnosis.html', context)
 
-"""运行诊断分析API:导出训练数据、执行模型训练、推理并返回诊断结果"""
+"""运行诊断分析API:把诊断（导出/训练/推理）排入后台任务队列，返回任务ID供前端轮询"""
 @login_required
 @user_passes_test(is_teacher)
 @csrf_exempt
@@ -68,81 +68,168 @@ def run_diagnosis(request):
         except DiagnosisModel.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': '诊断模型不存在或已禁用'}, status=404)
 
-        model_name = diagnosis_model.name
+        from ..training_jobs import enqueue_job, find_active_job
 
-        from .dual_relation_ncdm import MODEL_NAMES as IRD_NCDM_MODEL_NAMES
-        is_ird_ncdm_model = model_name in IRD_NCDM_MODEL_NAMES
-        # 从数据库导出训练数据到本地
-        try:
-            export_result = export_training_data(subject_id)
-            print(f"数据导出成功: {export_result}")
-        except Exception as e:
-            print(f"数据导出失败: {str(e)}")
-            return JsonResponse({'status': 'error', 'message': f'数据导出失败: {str(e)}'}, status=500)
-
-        # 数据导出成功，就执行模型训练
-        if export_result['success']:
+        # 同一科目同一模型已有排队/运行中的诊断时直接返回该任务
+        task_key = f"diagnosis_{subject_id}_{diagnosis_model.name}"
+        job = find_active_job(task_key)
+        if job is None:
+            job = enqueue_job('diagnosis', task_key, {
+                'subject_id': int(subject_id),
+                'model_id': int(model_id),
+                # mode='full' 强制全量导出+训练；默认有检查点时只用新增答题记录热启动微调
+                'mode': data.get('mode', 'auto'),
+            }, user=teacher)
+
+        return JsonResponse({
+            'status': 'queued',
+            'message': '诊断任务已提交',
+            'job_id': job.id,
+            'task_key': task_key,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'JSON解析错误'}, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'status': 'error', 'message': f'诊断任务提交失败: {str(e)}'}, status=500)
+
+
+def _get_teacher_diagnosis_job(teacher, job_id):
+    """教师可查看/取消所授科目的诊断任务（含漂移触发的全量重建任务）"""
+    job = TrainingJob.objects.filter(id=job_id, job_type='diagnosis').first()
+    if job is None or not TeacherSubject.objects.filter(teacher=teacher, subject_id=job.payload.get('subject_id')).exists():
+        return None
+    return job
+
+
+"""查询诊断任务状态API：完成后 result 为诊断结果（diagnosis_summary / diagnosis_data）"""
+@login_required
+@user_passes_test(is_teacher)
+def get_diagnosis_job_status(request, job_id):
+    from ..training_jobs import job_status
+
+    job = _get_teacher_diagnosis_job(request.user, job_id)
+    if job is None:
+        return JsonResponse({'status': 'not_found'}, status=404)
+    return JsonResponse(job_status(job))
+
+
+"""取消诊断任务API"""
+@login_required
+@user_passes_test(is_teacher)
+@csrf_exempt
+def cancel_diagnosis_job(request, job_id):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': '只支持POST请求'}, status=405)
+    from ..training_jobs import cancel_job
+
+    job = _get_teacher_diagnosis_job(request.user, job_id)
+    if job is None:
+        return JsonResponse({'status': 'not_found'}, status=404)
+    return JsonResponse({'job_id': job.id, 'status': cancel_job(job)})
+
+
+def execute_diagnosis(subject_id, model_id, mode='auto', reporter=None):
+    """
+    诊断任务的执行体（在 run_training_worker 的子进程中运行）：
+    增量或全量训练、推理，返回与原 run_diagnosis 接口相同结构的诊断结果
+
+    Raises:
+        RuntimeError: 导出、训练或推理失败
+    """
+    def _stage(progress, stage):
+        if reporter is not None:
+            reporter.update(progress=progress, stage=stage)
+
+    diagnosis_model = DiagnosisModel.objects.get(id=model_id)
+    model_name = diagnosis_model.name
+
+    from .dual_relation_ncdm import MODEL_NAMES as IRD_NCDM_MODEL_NAMES
+    from .incremental import incremental_update, record_full_training, subject_lock
+    is_ird_ncdm_model = model_name in IRD_NCDM_MODEL_NAMES
+
+    # 导出、训练、推理都读写同一个数据目录，与后台全量重建互斥
+    with subject_lock(subject_id):
+        training_result = None
+        if mode != 'full':
+            _stage(5, '增量训练')
             try:
-                run_training(subject_id, model_name)
+                training_result = incremental_update(subject_id, model_name)
             except Exception as e:
-                return JsonResponse({'status': 'error', 'message': f'训练失败: {str(e)}'}, status=500)
+                import traceback
+                traceback.print_exc()
+                print(f"增量训练失败，改为全量训练: {str(e)}")
+
+        if training_result is None:
+            # 从数据库导出训练数据到本地
+            _stage(5, '导出训练数据')
+            try:
+                export_result = export_training_data(subject_id)
+                print(f"数据导出成功: {export_result}")
+            except Exception as e:
+                print(f"数据导出失败: {str(e)}")
+                raise RuntimeError(f'数据导出失败: {str(e)}') from e
+
+            # 数据导出成功，就执行模型训练
+            if export_result['success']:
+                _stage(10, '训练模型')
+                epoch_callback = reporter.epoch_callback(10, 85) if reporter is not None else None
+                try:
+                    run_training(subject_id, model_name, epoch_callback=epoch_callback)
+                except Exception as e:
+                    raise RuntimeError(f'训练失败: {str(e)}') from e
+                record_full_training(subject_id, model_name, export_result)
+            training_result = {'mode': 'full'}
 
         # 3. 推理获取诊断数据
+        _stage(90, '推理诊断结果')
         if is_ird_ncdm_model:
             from .dual_relation_ncdm.platform import infer_and_get_diagnosis_data
         else:
             from .inference_and_save import infer_and_get_diagnosis_data
         diagnosis_data = infer_and_get_diagnosis_data(subject_id, model_id, model_name)
 
-        if diagnosis_data is None:
-            return JsonResponse({'status': 'error', 'message': '推理失败'}, status=500)
-
-        # 4. 构建响应数据
-        subject = Subject.objects.get(id=subject_id)
-        enrolled_students_count = StudentSubject.objects.filter(subject=subject).count()
-
-        # 获取知识点覆盖信息
-        covered_kp_ids = QMatrix.objects.filter(
-            exercise__in=AnswerLog.objects.filter(
-                exercise__subject=subject,
-                is_correct__isnull=False
-            ).values_list('exercise_id', flat=True).distinct()
-        ).values_list('knowledge_point_id', flat=True).distinct()
-        covered_kp_count = len(set(covered_kp_ids))
-
-        # 计算平均掌握度
-        overall_scores = [r['overall_score'] for r in diagnosis_data['diagnosis_results'].values()]
-        avg_mastery = (sum(overall_scores) / len(overall_scores) * 100) if overall_scores else 0
-
-        response_data = {
-            'status': 'success',
-            'message': f'诊断完成，共分析了{len(diagnosis_data["diagnosis_results"])}名学生',
-            'diagnosis_summary': {
-                'subject_name': subject.name,
-                'subject_id': subject.id,
-                'total_students': len(diagnosis_data['diagnosis_results']),
-                'enrolled_students_count': enrolled_students_count,
-                'diagnosed_students': len(diagnosis_data['diagnosis_results']),
-                'total_kp_count': diagnosis_data['total_kp_count'],
-                'covered_kp_count': covered_kp_count,
-                'avg_mastery': round(avg_mastery, 2),
-                'diagnosis_time': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'model_used': diagnosis_model.name,
-                'model_id': model_id
-            },
-            'diagnosis_data': diagnosis_data
-        }
+    if diagnosis_data is None:
+        raise RuntimeError('推理失败')
 
-        return JsonResponse(response_data)
+    # 4. 构建响应数据
+    subject = Subject.objects.get(id=subject_id)
+    enrolled_students_count = StudentSubject.objects.filter(subject=subject).count()
 
-    except json.JSONDecodeError:
-        return JsonResponse({'status': 'error', 'message': 'JSON解析错误'}, status=400)
-    except Subject.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': '科目不存在'}, status=404)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'status': 'error', 'message': f'诊断分析失败: {str(e)}'}, status=500)
+    # 获取知识点覆盖信息
+    covered_kp_ids = QMatrix.objects.filter(
+        exercise__in=AnswerLog.objects.filter(
+            exercise__subject=subject,
+            is_correct__isnull=False
+        ).values_list('exercise_id', flat=True).distinct()
+    ).values_list('knowledge_point_id', flat=True).distinct()
+    covered_kp_count = len(set(covered_kp_ids))
+
+    # 计算平均掌握度
+    overall_scores = [r['overall_score'] for r in diagnosis_data['diagnosis_results'].values()]
+    avg_mastery = (sum(overall_scores) / len(overall_scores) * 100) if overall_scores else 0
+
+    return {
+        'status': 'success',
+        'message': f'诊断完成，共分析了{len(diagnosis_data["diagnosis_results"])}名学生',
+        'diagnosis_summary': {
+            'subject_name': subject.name,
+            'subject_id': subject.id,
+            'total_students': len(diagnosis_data['diagnosis_results']),
+            'enrolled_students_count': enrolled_students_count,
+            'diagnosed_students': len(diagnosis_data['diagnosis_results']),
+            'total_kp_count': diagnosis_data['total_kp_count'],
+            'covered_kp_count': covered_kp_count,
+            'avg_mastery': round(avg_mastery, 2),
+            'diagnosis_time': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'model_used': diagnosis_model.name,
+            'model_id': model_id,
+            'training': training_result
+        },
+        'diagnosis_data': diagnosis_data
+    }
 
 
 # 添加 CMD_survey 到路径
@@ -151,7 +238,7 @@ if CMD_SURVEY_PATH not in sys.path:
     sys.path.insert(0, os.path.dirname(CMD_SURVEY_PATH))
 
 # """同步执行模型训练：模型训练过程"""
-def run_training(subject_id, model_name):
+def run_training(subject_id, model_name, epoch_callback=None):
 
     try:
         from .dual_relation_ncdm import MODEL_NAMES as IRD_NCDM_MODEL_NAMES
@@ -166,7 +253,14 @@ def run_training(subject_id, model_name):
         # 设置环境变量
         os.environ['CD_DATASET'] = str(subject_id)
 
-        from .main import model_functions
+        # main.py 在导入时按 params 读取数据集，清掉缓存的模块才能读到本次导出的数据
+        for module_name in ('params', 'dataloader', 'learning.diagnosis.main'):
+            sys.modules.pop(module_name, None)
+        import importlib
+        diagnosis_main = importlib.import_module('.main', __package__)
+        # 每轮评估指标回传给后台任务（目前 NCDM / IRT / DINA 入口会使用）
+        diagnosis_main.epoch_callback = epoch_callback
+        model_functions = diagnosis_main.model_functions
         # 模型名称需要与 main.py 中的键匹配（大写）
         # 数据库存储的是 "IRT"、"NCDM" 等，直接使用
         if model_name in model_functions:
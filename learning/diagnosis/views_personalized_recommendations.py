@@ -5,6 +5,9 @@ from django.contrib import messages
 from django.db.models import Q, Count
 import random
 from ..models import *
+from ..mastery_snapshot import get_mastery_map, WEAK_MASTERY_THRESHOLD
+from ..prerequisite_index import get_prerequisite_ids
+from .batch_recommender import get_recommended_exercise_ids
 
 
 def is_student(user):
@@ -47,19 +50,14 @@ def personalized_recommendations(request, subject_id=None):
     all_knowledge_points = KnowledgePoint.objects.filter(subject=current_subject)
     
     # 获取学生对这些知识点的诊断结果，只保留掌握程度 < 60% 的（与图谱中的红色节点一致）
+    # 只使用 diagnosis_model=3 的数据，与学生诊断图谱保持一致（整科掌握度从快照一次读出）
+    mastery_map = get_mastery_map(request.user.id, current_subject.id)
     knowledge_points_with_mastery = []
     for kp in all_knowledge_points:
-        # 只获取 diagnosis_model=3 的数据，与学生诊断图谱保持一致
-        diagnosis = StudentDiagnosis.objects.filter(
-            student=request.user,
-            knowledge_point=kp,
-            diagnosis_model_id=3  # 只获取 diagnosis_model=3 的数据
-        ).first()
-        
-        mastery_level = diagnosis.mastery_level if diagnosis else 0.0
+        mastery_level = mastery_map.get(kp.id, 0.0)
         
         # 只添加掌握程度 < 60% 的知识点（与图谱中的红色节点一致）
-        if mastery_level < 0.6:
+        if mastery_level < WEAK_MASTERY_THRESHOLD:
             knowledge_points_with_mastery.append({
                 'knowledge_point': kp,
                 'mastery_level': mastery_level,
@@ -90,47 +88,12 @@ def personalized_recommendations(request, subject_id=None):
 def get_10_recommended_exercises(student, subject):
     """
     获取10个推荐题目的核心函数
-    """
-    # 1. 获取学生已经做过的题目ID
-    answered_exercise_ids = AnswerLog.objects.filter(
-        student=student,
-        exercise__subject=subject
-    ).values_list('exercise_id', flat=True).distinct()
-
-    exercises = []
-
-    # 2. 获取薄弱知识点相关题目（最多5个）
-    weak_exercises = get_weak_knowledge_exercises(
-        student=student,
-        subject=subject,
-        answered_exercise_ids=answered_exercise_ids,
-        limit=5
-    )
-    exercises.extend(weak_exercises)
-
-    # 3. 获取未做过的题目补足到10个
-    if len(exercises) < 10:
-        new_limit = 10 - len(exercises)
-        new_exercises = get_new_exercises(
-            subject=subject,
-            answered_exercise_ids=answered_exercise_ids,
-            exclude_ids=[e.id for e in exercises],
-            limit=new_limit
-        )
-        exercises.extend(new_exercises)
-
-    # 4. 如果还不够，获取做错过的题目
-    if len(exercises) < 10:
-        remaining_limit = 10 - len(exercises)
-        wrong_exercises = get_wrong_exercises(
-            student=student,
-            subject=subject,
-            exclude_ids=[e.id for e in exercises],
-            limit=remaining_limit
-        )
-        exercises.extend(wrong_exercises)
 
-    return exercises[:10]
+    读取整班批量生成的推荐结果（batch_recommender.py），结果缺失或已过期时只为该学生重新计算
+    """
+    exercise_ids = get_recommended_exercise_ids(student.id, subject.id)
+    exercises = Exercise.objects.in_bulk(exercise_ids)
+    return [exercises[exercise_id] for exercise_id in exercise_ids if exercise_id in exercises]
 
 
 def get_student_learned_chapters(student, subject):
@@ -218,39 +181,19 @@ def get_knowledge_point_chapter(knowledge_point, subject):
 
 def get_prerequisite_knowledge_points(knowledge_point, subject):
     """
-    获取某个知识点的所有前置知识点（递归）
+    获取某个知识点的所有前置知识点（传递闭包）
     
     参数：
         knowledge_point: 知识点对象
         subject: 科目对象
     
     返回：
-        前置知识点ID的集合
+        前置知识点ID的集合（读取科目的前置关系索引，见 prerequisite_index.py）
     """
-    prerequisites = set()
-    visited = set()
-    
-    def dfs(kp):
-        """深度优先搜索获取所有前置知识点"""
-        if kp.id in visited:
-            return
-        visited.add(kp.id)
-        
-        # 获取该知识点的所有前置知识点（source → target 关系中，source是前置）
-        incoming_edges = KnowledgeGraph.objects.filter(
-            subject=subject,
-            target=kp
-        )
-        
-        for edge in incoming_edges:
-            prerequisites.add(edge.source.id)
-            dfs(edge.source)
-    
-    dfs(knowledge_point)
-    return prerequisites
+    return get_prerequisite_ids(knowledge_point.id, subject.id)
 
 
-def check_prerequisite_mastery(student, knowledge_point, subject, mastery_threshold=0.6):
+def check_prerequisite_mastery(student, knowledge_point, subject, mastery_threshold=0.6, mastery_map=None):
     """
     检查学生是否掌握了某个知识点的所有前置知识
     
@@ -259,6 +202,7 @@ def check_prerequisite_mastery(student, knowledge_point, subject, mastery_thresh
         knowledge_point: 知识点对象
         subject: 科目对象
         mastery_threshold: 掌握程度阈值（默认0.6）
+        mastery_map: 学生在该科目的 {知识点ID: 掌握程度}，不传时从掌握度快照读取
     
     返回：
         {
@@ -280,15 +224,12 @@ def check_prerequisite_mastery(student, knowledge_point, subject, mastery_thresh
     prerequisite_mastery = {}
     unmastered_prerequisites = []
     
+    if mastery_map is None:
+        mastery_map = get_mastery_map(student.id, subject.id)
+
     # 获取学生对所有前置知识点的掌握程度
     for prereq_id in prerequisite_ids:
-        diagnosis = StudentDiagnosis.objects.filter(
-            student=student,
-            knowledge_point_id=prereq_id,
-            diagnosis_model_id=3
-        ).first()
-        
-        mastery_level = diagnosis.mastery_level if diagnosis else 0.0
+        mastery_level = mastery_map.get(prereq_id, 0.0)
         prerequisite_mastery[prereq_id] = mastery_level
         
         if mastery_level < mastery_threshold:
@@ -316,12 +257,10 @@ def get_weak_knowledge_exercises(student, subject, answered_exercise_ids, limit=
     4. 未学过章节 + 前置知识充分的薄弱知识点的题目
     """
     # 1. 获取学生的薄弱知识点ID（掌握程度<60%，只获取 diagnosis_model=3 的数据）
-    weak_knowledge_ids = StudentDiagnosis.objects.filter(
-        student=student,
-        knowledge_point__subject=subject,
-        mastery_level__lt=0.6,
-        diagnosis_model_id=3  # 只获取 diagnosis_model=3 的数据，与学生诊断图谱保持一致
-    ).values_list('knowledge_point_id', flat=True)
+    mastery_map = get_mastery_map(student.id, subject.id)
+    weak_knowledge_ids = [
+        kp_id for kp_id, mastery_level in mastery_map.items() if mastery_level < WEAK_MASTERY_THRESHOLD
+    ]
 
     if not weak_knowledge_ids:
         return []
@@ -335,7 +274,7 @@ def get_weak_knowledge_exercises(student, subject, answered_exercise_ids, limit=
     
     for weak_kp_id in weak_knowledge_ids:
         weak_kp = KnowledgePoint.objects.get(id=weak_kp_id)
-        prerequisite_check = check_prerequisite_mastery(student, weak_kp, subject)
+        prerequisite_check = check_prerequisite_mastery(student, weak_kp, subject, mastery_map=mastery_map)
         
         if prerequisite_check['all_prerequisites_mastered']:
             weak_kps_with_met_prerequisites.append(weak_kp_id)
@@ -522,49 +461,6 @@ def get_weak_knowledge_exercises(student, subject, answered_exercise_ids, limit=
     return exercises[:limit]
 
 
-def get_new_exercises(subject, answered_exercise_ids, exclude_ids=None, limit=5):
-    """
-    获取未做过的题目
-    """
-    exclude_ids = exclude_ids or []
-
-    exercises = Exercise.objects.filter(
-        subject=subject
-    ).exclude(
-        id__in=answered_exercise_ids
-    ).exclude(
-        id__in=exclude_ids
-    ).order_by('?')[:limit]  # 随机取
-
-    return exercises
-
-
-def get_wrong_exercises(student, subject, exclude_ids=None, limit=5):
-    """
-    获取做错过的题目
-    """
-    exclude_ids = exclude_ids or []
-
-    # 获取做错的题目ID
-    wrong_exercise_ids = AnswerLog.objects.filter(
-        student=student,
-        exercise__subject=subject,
-        is_correct=False
-    ).values_list('exercise_id', flat=True).distinct()
-
-    if not wrong_exercise_ids:
-        return []
-
-    exercises = Exercise.objects.filter(
-        subject=subject,
-        id__in=wrong_exercise_ids
-    ).exclude(
-        id__in=exclude_ids
-    ).order_by('?')[:limit]
-
-    return exercises
-
-
 @login_required
 @user_passes_test(is_student)
 def start_recommended_exercises(request, subject_id):
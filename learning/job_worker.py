@@ -0,0 +1,18 @@
+"""
+run_training_worker 的任务子进程入口
+
+子进程以 spawn 方式启动，是一个全新的解释器，导入任何 models 之前要先初始化 Django，
+所以这里不能在模块顶层导入 learning.models / learning.training_jobs。
+"""
+
+
+def run_job_process(job_id, num_threads):
+    import django
+    django.setup()
+
+    import torch
+    # 每个任务只用分到的线程数，避免多个任务同时训练时 CPU 超额订阅
+    torch.set_num_threads(num_threads)
+
+    from learning.training_jobs import execute_job
+    execute_job(job_id)
@@ -1,8 +1,7 @@
 """
 别称映射表构建模块
-调用LLM为抽取到的实体生成同义词、别称或英文缩写映射
+为抽取到的实体确定规范名称（同义词、别称、英文缩写、写法差异），聚类规则见 alias_engine
 """
-import json
 import csv
 import os
 import sys
@@ -15,9 +14,13 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
     except Exception:
         sys.stdout = _orig_stdout
 
+from collections import Counter
+
 from openai import OpenAI
 from django.conf import settings
 
+from .alias_engine import build_subject_aliases
+
 
 def get_llm_client():
     config = getattr(settings, 'LLM_CONFIG', {})
@@ -26,51 +29,46 @@ def get_llm_client():
     return OpenAI(api_key=api_key, base_url=base_url)
 
 
-def build_alias_map(triples: list, output_path: str = None) -> dict:
-    entities = set()
-    for t in triples:
-        entities.add(t["subject"])
-        entities.add(t["object"])
+def build_alias_map(triples: list, output_path: str = None, subject=None) -> dict:
+    """
+    由本地别名引擎（alias_engine）确定实体的规范名称，只有边界候选对才调用LLM确认。
+    subject 给出时按科目保存/复用别名表。
 
-    print(f"[INFO] 共提取 {len(entities)} 个唯一实体")
-    if not entities:
-        return {}
+    返回 {规范名称: [别名, ...]}（只包含有别名的规范名称），供 entity_standardizer.load_alias_map 使用
+    """
+    counts = Counter()
+    for t in triples:
+        counts[t["subject"]] += 1
+        counts[t["object"]] += 1
 
-    if not get_llm_client().api_key:
-        print("[WARN] 未配置LLM API密钥，跳过别名映射构建")
+    print(f"[INFO] 共提取 {len(counts)} 个唯一实体")
+    if not counts:
         return {}
 
-    system_prompt = (
-        "你是一位精通计算机科学领域的专家。请为以下专业术语提供其在中文教材、"
-        "论文或教学中常见的同义词、别称或英文缩写。"
-        '只返回JSON格式，结构为: {"aliases": {"术语1": ["别称1", "别称2", ...], ...}}'
-    )
+    client = get_llm_client()
+    if not client.api_key:
+        print("[WARN] 未配置LLM API密钥，边界候选不做确认")
+        client = None
 
     try:
-        response = get_llm_client().chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"需要处理的术语列表: {list(entities)}"},
-            ],
-            response_format={"type": "json_object"},
-        )
-        raw = json.loads(response.choices[0].message.content)
-        alias_dict = raw.get("aliases", {})
-
-        if output_path:
-            os.makedirs(os.path.dirname(output_path), exist_ok=True) if os.path.dirname(output_path) else None
-            with open(output_path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.writer(f)
-                writer.writerow(["canonical_name", "alias"])
-                for canonical, aliases in alias_dict.items():
-                    for alias in aliases:
-                        if alias != canonical:
-                            writer.writerow([canonical, alias])
-
-        print(f"[INFO] 别名映射构建完成，共 {len(alias_dict)} 个实体有别名")
-        return alias_dict
-
+        canonical_map = build_subject_aliases(list(counts), subject=subject, counts=counts, client=client)
     except Exception as e:
         print(f"[ERROR] 构建别名映射失败: {e}")
         return {}
+
+    alias_dict = {}
+    for name, canonical in canonical_map.items():
+        if name != canonical:
+            alias_dict.setdefault(canonical, []).append(name)
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True) if os.path.dirname(output_path) else None
+        with open(output_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(["canonical_name", "alias"])
+            for canonical, aliases in alias_dict.items():
+                for alias in aliases:
+                    writer.writerow([canonical, alias])
+
+    print(f"[INFO] 别名映射构建完成，共 {len(alias_dict)} 个实体有别名")
+    return alias_dict
@@ -0,0 +1,208 @@
+"""
+本地知识点别名引擎（代替把全部实体一次交给大模型生成别名表）
+
+  1. 规则：graph_fusion.fusion.normalize_name 相同（大小写/全半角/空白/标点差异）直接合并；
+     “全称（ABBR）”形式的名称与其全称、英文缩写合并；
+  2. 向量：全部名称一次批量编码（字面 n-gram 向量；有本地 BERT 时另算语义向量），每个新名称取
+     top-k 近邻，字面相似度 ≥ ACCEPT_SIMILARITY 的候选对按相似度从高到低做并查集合并；
+  3. 字面相似度落在 [REVIEW_SIMILARITY, ACCEPT_SIMILARITY) 或语义相似度 ≥ SEMANTIC_REVIEW_SIMILARITY
+     的边界候选对才分批交给大模型确认；未配置大模型或调用失败时不合并（宁可漏合并，不误合并）。
+科目中已有的知识点名称和已处理过的规范名称作为锚点：新名称可以归入锚点，两个锚点之间不会被合并。
+结果按科目保存在 EntityAlias，后续上传只对新出现的名称聚类，已处理过的名称直接沿用。
+"""
+import json
+import re
+
+from graph_fusion.entity_alignment import _embed_batch, _ngram_vectors, _top_k_neighbors
+from graph_fusion.fusion import normalize_name
+from learning.models import EntityAlias, KnowledgePoint
+
+ALIAS_TOP_K = 5
+ACCEPT_SIMILARITY = 0.9
+REVIEW_SIMILARITY = 0.75
+SEMANTIC_REVIEW_SIMILARITY = 0.95
+LLM_PAIRS_PER_CALL = 50
+
+_NAME_MAX_LENGTH = 200
+_ABBR = re.compile(r'^(.+?)\s*[（(]\s*([A-Za-z][A-Za-z0-9.+\- ]*?)\s*[）)]$')
+
+
+class _UnionFind:
+    """并查集；每个集合最多包含一个锚点，试图合并两个不同锚点所在集合时拒绝"""
+
+    def __init__(self, n, anchors):
+        self.parent = list(range(n))
+        self.anchor = {i: i for i in anchors}
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if ra in self.anchor and rb in self.anchor:
+            return False
+        if rb in self.anchor:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        return True
+
+
+def load_subject_aliases(subject) -> dict:
+    """科目已保存的 {名称: 规范名称}"""
+    return dict(EntityAlias.objects.filter(subject=subject).values_list('alias', 'canonical'))
+
+
+def _ask_llm(client, pairs) -> set:
+    """让大模型判断边界候选对是否为同一概念，返回确认的候选对"""
+    confirmed = set()
+    for start in range(0, len(pairs), LLM_PAIRS_PER_CALL):
+        batch = pairs[start:start + LLM_PAIRS_PER_CALL]
+        listing = "\n".join(f"{i + 1}. {a} | {b}" for i, (a, b) in enumerate(batch))
+        try:
+            response = client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": (
+                        "你是一位严谨的教材知识图谱专家。判断下面每一对术语是否指同一个知识点"
+                        "（同义词、别称、英文缩写或写法差异）。上下位概念、相关但不同的概念都不算。"
+                        '只返回JSON: {"same": [是同一知识点的序号, ...]}'
+                    )},
+                    {"role": "user", "content": listing},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0,
+            )
+            same = json.loads(response.choices[0].message.content).get("same", [])
+        except Exception as e:
+            print(f"[WARN] 别名边界候选确认失败，本批不合并: {e}")
+            continue
+        for index in same:
+            if isinstance(index, int) and 1 <= index <= len(batch):
+                confirmed.add(batch[index - 1])
+    return confirmed
+
+
+def _choose_canonical(members, names, anchor, counts):
+    if anchor is not None:
+        return names[anchor]
+    return min((names[i] for i in members), key=lambda name: (-counts.get(name, 0), len(name), name))
+
+
+def build_subject_aliases(names, subject=None, counts=None, client=None) -> dict:
+    """
+    为一批实体名称确定规范名称
+
+    Args:
+        names: 实体名称（可重复）
+        subject: 科目；给出时以科目已有知识点和 EntityAlias 为锚点，并保存新名称的结果
+        counts: {名称: 出现次数}，无锚点的簇取出现最多的名称作为规范名称
+        client: 大模型客户端，None 时边界候选对不合并
+
+    Returns:
+        dict: {名称: 规范名称}，覆盖全部非空 names
+    """
+    counts = counts or {}
+    names = list(dict.fromkeys(n for n in names if n and n.strip()))
+    known = load_subject_aliases(subject) if subject is not None else {}
+    new_names = [n for n in names if n not in known]
+    if not new_names:
+        return {n: known[n] for n in names}
+
+    anchor_names = list(dict.fromkeys(known.values()))
+    if subject is not None:
+        anchor_names += [
+            n for n in KnowledgePoint.objects.filter(subject=subject).values_list('name', flat=True)
+            if n not in known
+        ]
+    anchor_names = list(dict.fromkeys(anchor_names))
+    anchor_set = set(anchor_names)
+    pool = anchor_names + [n for n in new_names if n not in anchor_set]
+    index = {name: i for i, name in enumerate(pool)}
+    anchors = range(len(anchor_names))
+    uf = _UnionFind(len(pool), anchors)
+    source = {}
+
+    def link(a, b, how):
+        if uf.union(a, b):
+            source.setdefault(a, how)
+            source.setdefault(b, how)
+
+    # ---- 规则 ----
+    by_norm = {}
+    for i, name in enumerate(pool):
+        norm = normalize_name(name)
+        if norm:
+            by_norm.setdefault(norm, []).append(i)
+    for group in by_norm.values():
+        for i in group[1:]:
+            link(group[0], i, 'rule')
+    for i, name in enumerate(pool):
+        match = _ABBR.match(name)
+        if match:
+            for part in match.groups():
+                if part.strip() in index:
+                    link(index[part.strip()], i, 'rule')
+
+    # ---- 向量近邻 ----
+    queries = list(range(len(anchor_names), len(pool)))
+    ngram = _ngram_vectors(pool)
+    semantic = _embed_batch(pool)
+    k = ALIAS_TOP_K + 1
+    candidates = set()
+    for vectors in (ngram, semantic):
+        if vectors is None:
+            continue
+        for q, neighbors in zip(queries, _top_k_neighbors(vectors[queries], vectors, k)):
+            candidates.update((min(q, int(j)), max(q, int(j))) for j in neighbors if int(j) != q)
+
+    accepted, borderline = [], []
+    for a, b in candidates:
+        lexical = float(ngram[a] @ ngram[b])
+        if lexical >= ACCEPT_SIMILARITY:
+            accepted.append((lexical, a, b))
+        elif lexical >= REVIEW_SIMILARITY or (
+            semantic is not None and float(semantic[a] @ semantic[b]) >= SEMANTIC_REVIEW_SIMILARITY
+        ):
+            borderline.append((lexical, a, b))
+    for _, a, b in sorted(accepted, reverse=True):
+        link(a, b, 'embedding')
+
+    # ---- 边界候选交给大模型 ----
+    review = [(a, b) for _, a, b in sorted(borderline, reverse=True) if uf.find(a) != uf.find(b)]
+    if review and client is not None:
+        print(f"[INFO] {len(review)} 对边界候选交给大模型确认")
+        confirmed = _ask_llm(client, [(pool[a], pool[b]) for a, b in review])
+        for a, b in review:
+            if (pool[a], pool[b]) in confirmed:
+                link(a, b, 'llm')
+
+    # ---- 每个簇选规范名称 ----
+    clusters = {}
+    for i in range(len(pool)):
+        clusters.setdefault(uf.find(i), []).append(i)
+    canonical = {}
+    for root, members in clusters.items():
+        name = _choose_canonical(members, pool, uf.anchor.get(root), counts)
+        for i in members:
+            canonical[pool[i]] = known.get(name, name)
+
+    if subject is not None:
+        EntityAlias.objects.bulk_create(
+            [
+                EntityAlias(subject=subject, alias=name, canonical=canonical[name],
+                            source=source.get(index[name], 'rule'))
+                for name in new_names
+                if len(name) <= _NAME_MAX_LENGTH and len(canonical[name]) <= _NAME_MAX_LENGTH
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+    merged = sum(1 for name in new_names if canonical[name] != name)
+    print(f"[INFO] 别名聚类：新名称 {len(new_names)} 个，归并 {merged} 个，边界候选 {len(review)} 对")
+    return {n: known.get(n) or canonical[n] for n in names}
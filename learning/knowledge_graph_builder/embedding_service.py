@@ -0,0 +1,192 @@
+"""
+知识点文本向量服务（graph_fusion.entity_alignment、learn_fusion、alias_engine 共用）
+
+  - 每个进程只加载一份本地 BERT（settings.BERT_MODEL_PATH，默认 bert-base-chinese，强制离线）；
+  - 按长度排序后分批 padding 编码，torch.inference_mode 下取 [CLS] 向量并 L2 归一化；
+  - 向量按（模型、文本）的 SHA-256 持久化在 SQLite（data/embedding_cache.sqlite3），
+    文本即知识点的“名称 + 描述”，知识点未改动时后续融合直接读缓存，不再前向计算，
+    全部命中时连模型都不加载；进程内另有 MEMORY_CACHE_SIZE 条的内存缓存。
+BERT 不可用且缓存未命中时返回 None，调用方降级为字面相似度。
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = 'bert-base-chinese'
+DEFAULT_CACHE_PATH = os.path.join(settings.BASE_DIR, "data", "embedding_cache.sqlite3")
+EMBED_BATCH_SIZE = 64
+MAX_LENGTH = 128
+MEMORY_CACHE_SIZE = 50000
+# SQLite 单条语句的参数个数有上限，按批查询
+_LOOKUP_BATCH = 500
+
+_model = None
+_tokenizer = None
+_model_inited = False
+_model_lock = threading.Lock()
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_local = threading.local()
+
+
+def model_name():
+    return getattr(settings, 'BERT_MODEL_PATH', None) or DEFAULT_MODEL_NAME
+
+
+def _load_model():
+    """懒加载本地 BERT（每个进程一次）；失败返回 None"""
+    global _model, _tokenizer, _model_inited
+    if _model_inited:
+        return _model
+    with _model_lock:
+        if _model_inited:
+            return _model
+        # 强制离线：无缓存 + 坏代理的机器会立即降级，而不是卡在 huggingface 联网校验
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')
+        os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+        try:
+            from transformers import AutoTokenizer, AutoModel
+            _tokenizer = AutoTokenizer.from_pretrained(model_name(), local_files_only=True)
+            _model = AutoModel.from_pretrained(model_name(), local_files_only=True)
+            _model.eval()
+            logger.info("[embedding] BERT 加载成功: %s", model_name())
+        except Exception as e:
+            logger.warning("[embedding] BERT 加载失败，语义相似度降级为字面：%s", e)
+            _model = None
+            _tokenizer = None
+        _model_inited = True
+        return _model
+
+
+# ---------------- 持久化向量缓存 ----------------
+def _cache_path():
+    return getattr(settings, 'EMBEDDING_CACHE_PATH', None) or DEFAULT_CACHE_PATH
+
+
+def _connect():
+    """每个进程、每个线程一个连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    path = _cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+    )
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def text_key(text):
+    return hashlib.sha256(f"{model_name()}\x00{text}".encode('utf-8')).hexdigest()
+
+
+def _remember(key, vector):
+    with _memory_lock:
+        _memory[key] = vector
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _lookup(keys):
+    found = {}
+    missing = []
+    with _memory_lock:
+        for key in keys:
+            if key in _memory:
+                found[key] = _memory[key]
+                _memory.move_to_end(key)
+            else:
+                missing.append(key)
+    conn = _connect()
+    for start in range(0, len(missing), _LOOKUP_BATCH):
+        batch = missing[start:start + _LOOKUP_BATCH]
+        rows = conn.execute(
+            f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch
+        ).fetchall()
+        for key, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            found[key] = vector
+            _remember(key, vector)
+    return found
+
+
+def _store(vectors_by_key):
+    now = time.time()
+    _connect().executemany(
+        "INSERT OR REPLACE INTO vectors (key, vector, created_at) VALUES (?, ?, ?)",
+        [(key, vector.astype(np.float32).tobytes(), now) for key, vector in vectors_by_key.items()],
+    )
+    for key, vector in vectors_by_key.items():
+        _remember(key, vector)
+
+
+# ---------------- 编码 ----------------
+def _forward(texts, batch_size):
+    """按长度排序分批 padding，返回与 texts 同序的 L2 归一化 [CLS] 向量"""
+    import torch
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    result = [None] * len(texts)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inp = _tokenizer([texts[i] for i in idx], return_tensors='pt',
+                             max_length=MAX_LENGTH, truncation=True, padding=True)
+            cls = _model(**inp).last_hidden_state[:, 0, :].float().numpy()
+            cls /= np.maximum(np.linalg.norm(cls, axis=1, keepdims=True), 1e-12)
+            for row, i in enumerate(idx):
+                result[i] = cls[row]
+    return result
+
+
+def embed_texts(texts, batch_size=EMBED_BATCH_SIZE):
+    """
+    文本 -> (n, d) 的 L2 归一化向量矩阵（float32），行顺序与 texts 一致。
+    只对缓存未命中的不同文本做前向；BERT 不可用或前向出错（显存不足、分词失败等）且有未命中时
+    返回 None，调用方降级为字面相似度。
+    """
+    texts = list(texts)
+    if not texts:
+        return None
+    keys = [text_key(text) for text in texts]
+    found = _lookup(list(dict.fromkeys(keys)))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    if missing:
+        if _load_model() is None:
+            return None
+        started = time.perf_counter()
+        try:
+            encoded = dict(zip(missing, _forward(list(missing.values()), batch_size)))
+        except Exception as e:
+            logger.warning("[embedding] BERT 编码失败，语义相似度降级为字面：%s", e)
+            return None
+        _store(encoded)
+        found.update(encoded)
+        logger.info("[embedding] 编码 %s 条文本（缓存命中 %s 条），耗时 %.2fs",
+                    len(missing), len(found) - len(missing), time.perf_counter() - started)
+    return np.stack([found[key] for key in keys])
+
+
+def similarity(text1, text2):
+    """两段文本的向量余弦；BERT 不可用时返回 None"""
+    vectors = embed_texts([text1, text2])
+    if vectors is None:
+        return None
+    return float(vectors[0] @ vectors[1])
@@ -17,6 +17,10 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
 from django.db import transaction
 from django.conf import settings
 from learning.models import Subject, KnowledgePoint, KnowledgeGraph
+from learning.prerequisite_index import invalidate_prerequisite_index
+from graph_fusion.store import refresh_knowledge_points, refresh_relations
+
+BULK_BATCH_SIZE = 500
 
 
 def _sanitize_rel_type(rel_type: str) -> str:
@@ -41,41 +45,107 @@ def _get_neo4j_driver():
     return GraphDatabase.driver(uri, auth=(neo4j_user, neo4j_password))
 
 
-def save_to_django(triples: list, subject: Subject, relation_source: str = '教材', resource_file=None) -> dict:
-    kp_count = 0
-    rel_count = 0
+def _fold_name(name: str) -> str:
+    """近似 MySQL 默认排序规则的比较键：不区分大小写、忽略末尾空格"""
+    return name.casefold().rstrip()
+
+
+def _load_kps_by_name(subject, names) -> dict:
+    """
+    名称 -> 知识点；同名知识点有多个时取最早创建的。
+    name__in 按数据库排序规则匹配（生产 MySQL 不区分大小写），返回的行名称可能与请求的名称不完全相同，
+    这里同样按数据库的匹配结果归属，与原先逐个 get_or_create 复用已有知识点的行为一致：
+    先精确匹配，再按 _fold_name 匹配；仍有无法归属的行时（如重音不敏感），剩余名称逐个交给数据库判断
+    """
+    names = list(names)
+    rows = []
+    for i in range(0, len(names), BULK_BATCH_SIZE):
+        rows.extend(KnowledgePoint.objects.filter(subject=subject, name__in=names[i:i + BULK_BATCH_SIZE]))
+    rows.sort(key=lambda kp: kp.id)
+
+    exact, folded = {}, {}
+    for kp in rows:
+        exact.setdefault(kp.name, kp)
+        folded.setdefault(_fold_name(kp.name), kp)
+
+    kps = {}
+    unresolved = []
+    for name in names:
+        kp = exact.get(name) or folded.get(_fold_name(name))
+        if kp is not None:
+            kps[name] = kp
+        else:
+            unresolved.append(name)
+
+    requested_folds = {_fold_name(name) for name in names}
+    if unresolved and any(_fold_name(kp.name) not in requested_folds for kp in rows):
+        for name in unresolved:
+            kp = KnowledgePoint.objects.filter(subject=subject, name=name).order_by('id').first()
+            if kp is not None:
+                kps[name] = kp
+    return kps
+
+
+def _load_edges(subject, relation_source) -> dict:
+    return {
+        (kg.source_id, kg.target_id): kg
+        for kg in KnowledgeGraph.objects.filter(subject=subject, relation_source=relation_source)
+    }
 
-    entity_map = {}
-    created_kps = []
-    created_rels = []
 
+def save_to_django(triples: list, subject: Subject, relation_source: str = '教材', resource_file=None) -> dict:
+    """
+    三元组批量写入知识点与关系：先一次性取出科目已有的知识点和关系，
+    缺少的 bulk_create，来源/关系类型有变化的 bulk_update，知识点与资源文件的关联直接批量写中间表。
+    bulk 写入不触发知识点/关系的 post_save 信号，最后统一使先修闭包索引失效并增量更新融合图谱表。
+    """
     all_entity_names = set()
     for t in triples:
         all_entity_names.add(t["subject"])
         all_entity_names.add(t["object"])
+    names = {name for name in all_entity_names if name.strip()}
 
     print(f"[INFO] 准备存储 {len(all_entity_names)} 个知识点...")
 
     with transaction.atomic():
-        for name in all_entity_names:
-            if not name.strip():
-                continue
-            kp, created = KnowledgePoint.objects.get_or_create(
-                subject=subject,
-                name=name,
-            )
-            # 更新来源字段，使按来源过滤（教材/教案/课件）能正确匹配
+        # ---- 知识点 ----
+        entity_map = _load_kps_by_name(subject, names)
+        missing = sorted(names - entity_map.keys())
+        # 只差大小写/末尾空格的新名称只建一个知识点（数据库会把它们当作同一个名称）
+        to_create = {}
+        for name in missing:
+            to_create.setdefault(_fold_name(name), name)
+        KnowledgePoint.objects.bulk_create(
+            [KnowledgePoint(subject=subject, name=name, sources=relation_source) for name in to_create.values()],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # MySQL 的 bulk_create 不回填主键，重新查询新建的知识点
+        created_map = _load_kps_by_name(subject, missing)
+        entity_map.update(created_map)
+        created_kps = list({kp.id: kp for kp in created_map.values()}.values())
+
+        # 更新来源字段，使按来源过滤（教材/教案/课件）能正确匹配
+        stale_sources = []
+        for kp in entity_map.values():
             if relation_source not in kp.sources.split(','):
                 kp.sources = (kp.sources + ',' + relation_source) if kp.sources else relation_source
-                kp.save(update_fields=['sources'])
-            # 记录知识点与资源文件的关联（删除关系后仍保留，用于分图谱节点过滤）
-            if resource_file:
-                kp.resource_files.add(resource_file)
-            entity_map[name] = kp
-            if created:
-                kp_count += 1
-                created_kps.append(kp)
+                stale_sources.append(kp)
+        KnowledgePoint.objects.bulk_update(stale_sources, ['sources'], batch_size=BULK_BATCH_SIZE)
+
+        # 记录知识点与资源文件的关联（删除关系后仍保留，用于分图谱节点过滤）
+        if resource_file:
+            through = KnowledgePoint.resource_files.through
+            through.objects.bulk_create(
+                [through(knowledgepoint_id=kp.id, resourcefile_id=resource_file.id) for kp in entity_map.values()],
+                batch_size=BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
 
+        # ---- 关系 ----
+        relation_types = dict(KnowledgeGraph.RELATION_CHOICES)
+        existing_edges = _load_edges(subject, relation_source)
+        new_edges = []
+        changed_edges = []
         seen_pairs = set()
         for t in triples:
             subj_name = t["subject"]
@@ -94,32 +164,42 @@ def save_to_django(triples: list, subject: Subject, relation_source: str = '教
                 continue
 
             rel_type = t.get("predicate", "关联")
-            if rel_type not in dict(KnowledgeGraph.RELATION_CHOICES):
+            if rel_type not in relation_types:
                 rel_type = "关联"
 
-            defaults = {"relationship_type": rel_type}
-            if resource_file:
-                defaults["resource_file"] = resource_file
-            kg, created = KnowledgeGraph.objects.get_or_create(
-                subject=subject,
-                source=subj_kp,
-                target=obj_kp,
-                relation_source=relation_source,
-                defaults=defaults,
-            )
-            if not created and resource_file and not kg.resource_file:
+            kg = existing_edges.get((subj_kp.id, obj_kp.id))
+            if kg is None:
+                kg = KnowledgeGraph(
+                    subject=subject, source=subj_kp, target=obj_kp, relation_source=relation_source,
+                    relationship_type=rel_type, resource_file=resource_file,
+                )
+                new_edges.append(kg)
+                continue
+            changed = False
+            if resource_file and not kg.resource_file_id:
                 kg.resource_file = resource_file
-                kg.save(update_fields=['resource_file'])
-            if created:
-                rel_count += 1
-                created_rels.append(kg)
-            elif KnowledgeGraph.objects.filter(
-                subject=subject, source=subj_kp, target=obj_kp, relation_source=relation_source
-            ).exclude(relationship_type=rel_type).exists():
-                KnowledgeGraph.objects.filter(
-                    subject=subject, source=subj_kp, target=obj_kp, relation_source=relation_source
-                ).update(relationship_type=rel_type)
-
+                changed = True
+            if kg.relationship_type != rel_type:
+                kg.relationship_type = rel_type
+                changed = True
+            if changed:
+                changed_edges.append(kg)
+
+        KnowledgeGraph.objects.bulk_create(new_edges, batch_size=BULK_BATCH_SIZE)
+        KnowledgeGraph.objects.bulk_update(
+            changed_edges, ['resource_file', 'relationship_type'], batch_size=BULK_BATCH_SIZE
+        )
+        created_rels = []
+        if new_edges:
+            saved_edges = _load_edges(subject, relation_source)
+            created_rels = [saved_edges[(kg.source_id, kg.target_id)] for kg in new_edges]
+
+    kp_count = len(created_kps)
+    rel_count = len(created_rels)
+    invalidate_prerequisite_index(subject.id)
+    refresh_knowledge_points([kp.id for kp in created_kps])
+    refresh_relations({kg.source_id for kg in new_edges + changed_edges}
+                      | {kg.target_id for kg in new_edges + changed_edges})
     print(f"[INFO] 新增 {kp_count} 个知识点，{rel_count} 个关系")
     print(f"[INFO] 科目共 {len(all_entity_names)} 个知识点，{len(seen_pairs)} 个关系")
 
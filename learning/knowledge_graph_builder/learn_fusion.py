@@ -18,14 +18,12 @@ Learn 多图谱融合桥接层（四维特征实体对齐）
 依赖容错：
   - jieba 未安装 -> 倒排索引回退为字符级候选生成
   - 本地 BERT 不可用 -> 语义相似度回退为字面相似度
+BERT 模型与向量缓存由 embedding_service 统一管理（每进程加载一次，向量按文本持久化）。
 """
-import os
-import sys
 import logging
-from functools import lru_cache
 from difflib import SequenceMatcher
 
-from django.conf import settings
+from learning.knowledge_graph_builder import embedding_service
 
 logger = logging.getLogger(__name__)
 
@@ -38,58 +36,19 @@ except ImportError:
     _HAS_JIEBA = False
 
 
-# ====================== 本地 BERT 语义相似度（单例，带降级） ======================
-_sim_model = None
-_sim_tokenizer = None
-_sim_inited = False
-
-
-def _init_sim_model():
-    """懒加载本地 bert-base-chinese；失败则置 None（降级为字面相似度）"""
-    global _sim_model, _sim_tokenizer, _sim_inited
-    if _sim_inited:
-        return
-    _sim_inited = True
-    # 强制离线：无缓存 + 坏代理的机器会立即降级，而不是卡在 huggingface 联网校验
-    os.environ.setdefault('HF_HUB_OFFLINE', '1')
-    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
-    try:
-        import torch  # noqa
-        from transformers import AutoTokenizer, AutoModel
-        # 模型来源：settings.BERT_MODEL_PATH > 默认模型名（依赖本地缓存）
-        name = getattr(settings, 'BERT_MODEL_PATH', None) or 'bert-base-chinese'
-        _sim_tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
-        _sim_model = AutoModel.from_pretrained(name, local_files_only=True)
-        _sim_model.eval()
-        logger.info("[learn_fusion] 语义相似度 BERT 加载成功: %s", name)
-    except Exception as e:
-        logger.warning("[learn_fusion] BERT 加载失败，语义相似度降级为字面：%s", e)
-        _sim_model = None
-        _sim_tokenizer = None
-
-
-@lru_cache(maxsize=8192)
-def _embed(text: str):
-    """对单段文本做 BERT [CLS] 向量编码，带 LRU 缓存避免重复前向。"""
-    import torch
-    inp = _sim_tokenizer(text, return_tensors='pt', max_length=128, truncation=True)
-    with torch.no_grad():
-        out = _sim_model(**inp)
-    return out.last_hidden_state[:, 0, :].squeeze().numpy()
+# ====================== 本地 BERT 语义相似度（共用 embedding_service，带降级） ======================
+def _entity_text(e):
+    return f"{e['name']} {e.get('description', '') or ''}"
 
 
 def _semantic_similarity(text1: str, text2: str) -> float:
-    """两文本语义相似度；BERT 不可用时退化为字面相似度"""
-    _init_sim_model()
-    if _sim_model is None or _sim_tokenizer is None:
-        return SequenceMatcher(None, text1, text2).ratio()
+    """两文本语义相似度（向量持久化缓存）；BERT 不可用时退化为字面相似度"""
     try:
-        from scipy.spatial.distance import cosine
-        e1, e2 = _embed(text1), _embed(text2)
-        return float(1 - cosine(e1, e2))
+        sem = embedding_service.similarity(text1, text2)
     except Exception as e:
         logger.debug("[learn_fusion] 语义相似度计算失败，降级：%s", e)
-        return SequenceMatcher(None, text1, text2).ratio()
+        sem = None
+    return sem if sem is not None else SequenceMatcher(None, text1, text2).ratio()
 
 
 # ====================== 四维特征对齐 ======================
@@ -118,10 +77,7 @@ def _attribute_overlap(e1: dict, e2: dict) -> float:
 
 def _confidence(e1: dict, e2: dict):
     """四维加权置信度"""
-    sem = _semantic_similarity(
-        f"{e1['name']} {e1.get('description', '') or ''}",
-        f"{e2['name']} {e2.get('description', '') or ''}",
-    )
+    sem = _semantic_similarity(_entity_text(e1), _entity_text(e2))
     nam = _name_similarity(e1['name'], e2['name'])
     att = _attribute_overlap(e1, e2)
     rule = 0.1  # 默认低规则匹配，避免无关实体高分
@@ -234,6 +190,12 @@ def align_subjects(subject_ids, max_per_subject=500):
         if len(ents) > max_per_subject:
             by_subject[sid] = rng.sample(ents, max_per_subject)
 
+    # 全部实体一次批量编码（已缓存的直接读取），逐对计算语义相似度时只查内存缓存
+    try:
+        embedding_service.embed_texts([_entity_text(e) for ents in by_subject.values() for e in ents])
+    except Exception as e:
+        logger.warning("[learn_fusion] 批量编码失败，语义相似度逐对计算：%s", e)
+
     sids = list(by_subject.keys())
     all_alignments = []
     for i in range(len(sids)):
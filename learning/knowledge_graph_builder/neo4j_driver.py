@@ -9,6 +9,10 @@ Neo4j 连接与关系操作核心模块
   - 单例驱动：进程内复用同一个 GraphDatabase.driver（线程安全，内置连接池）
   - 容错优先：Neo4j 不可用时所有方法静默降级，绝不影响 MySQL 主流程
   - 节点 uid = "<subject>::<name>"，与历史 migrate_to_neo4j 命令保持一致
+  - 批量写入：按关系标签分组，每 NEO4J_BATCH_SIZE 条一个 UNWIND $rows 语句，
+    在 session.execute_write 托管事务中执行（瞬时错误/集群切主由驱动自动重试）
+  - 流式读取：iter_relations 在一个读事务中执行一次查询，驱动按 fetch_size 分批拉取结果，
+    不排序、不依赖已弃用的 id()
 """
 import os
 import re
@@ -17,13 +21,23 @@ import threading
 from django.conf import settings
 
 try:
-    from neo4j import GraphDatabase
+    from neo4j import GraphDatabase, READ_ACCESS
     _NEO4J_AVAILABLE = True
 except ImportError:  # 未安装驱动时整体降级
     GraphDatabase = None
+    READ_ACCESS = None
     _NEO4J_AVAILABLE = False
 
 
+# 每个 UNWIND 语句写入的行数（可在 settings 中覆盖）、读取关系时驱动每批拉取的记录数
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PAGE_SIZE = 5000
+
+
+def _batch_size():
+    return int(getattr(settings, 'NEO4J_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+
+
 # ====================== 单例驱动 ======================
 _driver = None
 _driver_lock = threading.Lock()
@@ -90,6 +104,144 @@ def sanitize_rel_type(rel_type: str) -> str:
     return s or "RELATED"
 
 
+# ====================== 批量写入 ======================
+_NODE_MERGE = """
+UNWIND $rows AS row
+MERGE (c:Concept {uid: row.uid})
+  SET c.name = row.name, c.subject = row.subject, c.kp_id = row.kp_id, c.type = coalesce(c.type, '概念')
+"""
+
+# 关系标签无法参数化，按标签分组后拼入语句；relation_source 为空时保留边上原值
+_RELATION_MERGE = """
+UNWIND $rows AS row
+MERGE (a:Concept {uid: row.s_uid})
+  SET a.name = row.s_name, a.subject = row.subject, a.kp_id = coalesce(row.s_kp_id, a.kp_id)
+MERGE (b:Concept {uid: row.o_uid})
+  SET b.name = row.o_name, b.subject = row.subject, b.kp_id = coalesce(row.o_kp_id, b.kp_id)
+MERGE (a)-[r:`%s`]->(b)
+  SET r.type = row.rel_type, r.relation_source = coalesce(row.relation_source, r.relation_source)
+"""
+
+
+def _run_write(tx, cypher, rows):
+    tx.run(cypher, rows=rows).consume()
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def relation_row(subject_name, source_name, target_name, rel_type,
+                 source_kp_id=None, target_kp_id=None, relation_source=None):
+    """一条关系 -> UNWIND 行"""
+    return {
+        "s_uid": make_uid(subject_name, source_name), "o_uid": make_uid(subject_name, target_name),
+        "subject": subject_name, "s_name": source_name, "o_name": target_name,
+        "s_kp_id": source_kp_id, "o_kp_id": target_kp_id,
+        "rel_type": rel_type, "relation_source": relation_source,
+    }
+
+
+def write_relations(rows, batch_size=None):
+    """
+    批量写入关系行（relation_row 的结果），按关系标签分组，每批一个托管写事务。
+    返回写入条数；Neo4j 不可用时返回 0，写入失败时抛出异常由调用方决定是否降级。
+    """
+    driver = get_driver()
+    if driver is None:
+        return 0
+    batch_size = batch_size or _batch_size()
+
+    by_label = {}
+    for row in rows:
+        by_label.setdefault(sanitize_rel_type(row["rel_type"]), []).append(row)
+
+    count = 0
+    with driver.session() as session:
+        for label, label_rows in by_label.items():
+            cypher = _RELATION_MERGE % label
+            for chunk in _chunks(label_rows, batch_size):
+                session.execute_write(_run_write, cypher, chunk)
+                count += len(chunk)
+    return count
+
+
+def write_nodes(rows, batch_size=None):
+    """批量写入锚节点：rows 为 [{uid, name, subject, kp_id}]"""
+    driver = get_driver()
+    if driver is None:
+        return 0
+    batch_size = batch_size or _batch_size()
+    with driver.session() as session:
+        for chunk in _chunks(rows, batch_size):
+            session.execute_write(_run_write, _NODE_MERGE, chunk)
+    return len(rows)
+
+
+def _delete_subject_nodes(tx, subject_name, limit):
+    record = tx.run(
+        """
+        MATCH (c:Concept {subject: $subject})
+        WITH c LIMIT $limit
+        DETACH DELETE c
+        RETURN count(*) AS deleted
+        """,
+        subject=subject_name, limit=limit,
+    ).single()
+    return record["deleted"] if record else 0
+
+
+def clear_subject(subject_name, batch_size=None):
+    """分批删除一个科目的全部节点与关系（避免单个事务过大），返回删除的节点数"""
+    driver = get_driver()
+    if driver is None:
+        return 0
+    batch_size = batch_size or _batch_size()
+    total = 0
+    with driver.session() as session:
+        while True:
+            deleted = session.execute_write(_delete_subject_nodes, subject_name, batch_size)
+            total += deleted
+            if deleted < batch_size:
+                return total
+
+
+def rebuild_from_mysql(subjects, clear=True, batch_size=None, log=print):
+    """
+    用 MySQL 的 KnowledgePoint / KnowledgeGraph 重建科目的 Neo4j 镜像。
+    clear=False 时只做 MERGE（补齐缺失的节点和边，不删除 MySQL 中已不存在的关系）。
+    返回 {"kp_count", "rel_count"}。
+    """
+    from learning.models import KnowledgeGraph, KnowledgePoint
+
+    kp_total = rel_total = 0
+    for subject in subjects:
+        if clear:
+            removed = clear_subject(subject.name, batch_size)
+            log(f"科目 {subject.name}: 清除旧镜像节点 {removed} 个")
+
+        nodes = [
+            {"uid": make_uid(subject.name, name), "name": name, "subject": subject.name, "kp_id": kp_id}
+            for kp_id, name in KnowledgePoint.objects.filter(subject=subject).values_list('id', 'name')
+        ]
+        write_nodes(nodes, batch_size)
+
+        rows = [
+            relation_row(subject.name, s_name, t_name, rel_type or '关联', s_id, t_id, relation_source)
+            for s_id, s_name, t_id, t_name, rel_type, relation_source in KnowledgeGraph.objects.filter(
+                subject=subject
+            ).values_list(
+                'source_id', 'source__name', 'target_id', 'target__name', 'relationship_type', 'relation_source'
+            ).iterator(chunk_size=DEFAULT_PAGE_SIZE)
+        ]
+        rel_count = write_relations(rows, batch_size)
+        log(f"科目 {subject.name}: 知识点 {len(nodes)} 个，关系 {rel_count} 条")
+        kp_total += len(nodes)
+        rel_total += rel_count
+    return {"kp_count": kp_total, "rel_count": rel_total}
+
+
 # ====================== 核心关系操作 ======================
 def upsert_relation(subject_name, source_name, target_name, rel_type,
                     source_kp_id=None, target_kp_id=None, relation_source='教材'):
@@ -97,129 +249,110 @@ def upsert_relation(subject_name, source_name, target_name, rel_type,
     写入/更新一条关系（含两端锚节点）。Neo4j 只存关系，不重复存知识点业务数据。
     使用 MERGE 实现幂等：同一对节点 + 同一关系标签不会重复建边。
     """
-    driver = get_driver()
-    if driver is None:
-        return False
-
-    s_uid = make_uid(subject_name, source_name)
-    o_uid = make_uid(subject_name, target_name)
-    label = sanitize_rel_type(rel_type)
-
     try:
-        with driver.session() as session:
-            session.run(
-                """
-                MERGE (a:Concept {uid: $s_uid})
-                  SET a.name = $s_name, a.subject = $subject, a.kp_id = $s_kp_id
-                MERGE (b:Concept {uid: $o_uid})
-                  SET b.name = $o_name, b.subject = $subject, b.kp_id = $o_kp_id
-                MERGE (a)-[r:`%s`]->(b)
-                  SET r.type = $rel_type, r.relation_source = $relation_source
-                """ % label,
-                s_uid=s_uid, o_uid=o_uid, subject=subject_name,
-                s_name=source_name, o_name=target_name,
-                s_kp_id=source_kp_id, o_kp_id=target_kp_id,
-                rel_type=rel_type, relation_source=relation_source,
-            ).consume()
-        return True
+        return write_relations([relation_row(
+            subject_name, source_name, target_name, rel_type, source_kp_id, target_kp_id, relation_source
+        )]) > 0
     except Exception as e:
         print(f"[WARN] Neo4j 写入关系失败（已降级）：{e}")
         return False
 
 
-def sync_relations(triples, subject_name, entity_map=None):
+def sync_relations(triples, subject_name, entity_map=None, batch_size=None):
     """
     批量同步一组三元组的关系到 Neo4j（供构建管线 dual-write 调用）。
     triples: [{"subject","object","predicate", ...}]
     entity_map: {name: KnowledgePoint}，用于把 kp_id 写入节点便于回指 MySQL
     返回成功写入的关系条数。
     """
-    driver = get_driver()
-    if driver is None:
-        return 0
-
     def _kp_id(name):
         kp = entity_map.get(name) if entity_map else None
         return kp.id if kp else None
 
-    count = 0
+    rows = []
     seen = set()
+    for t in triples:
+        s_name, o_name = t.get("subject", ""), t.get("object", "")
+        if not s_name.strip() or not o_name.strip():
+            continue
+        pair = (s_name, o_name)
+        if pair in seen:
+            continue
+        seen.add(pair)
+        rows.append(relation_row(
+            subject_name, s_name, o_name, t.get("predicate", "关联"), _kp_id(s_name), _kp_id(o_name)
+        ))
+
+    count = 0
     try:
-        with driver.session() as session:
-            for t in triples:
-                s_name, o_name = t.get("subject", ""), t.get("object", "")
-                if not s_name.strip() or not o_name.strip():
-                    continue
-                pair = (s_name, o_name)
-                if pair in seen:
-                    continue
-                seen.add(pair)
-
-                label = sanitize_rel_type(t.get("predicate", "关联"))
-                session.run(
-                    """
-                    MERGE (a:Concept {uid: $s_uid})
-                      SET a.name = $s_name, a.subject = $subject, a.kp_id = $s_kp_id
-                    MERGE (b:Concept {uid: $o_uid})
-                      SET b.name = $o_name, b.subject = $subject, b.kp_id = $o_kp_id
-                    MERGE (a)-[r:`%s`]->(b)
-                      SET r.type = $rel_type
-                    """ % label,
-                    s_uid=make_uid(subject_name, s_name),
-                    o_uid=make_uid(subject_name, o_name),
-                    subject=subject_name,
-                    s_name=s_name, o_name=o_name,
-                    s_kp_id=_kp_id(s_name), o_kp_id=_kp_id(o_name),
-                    rel_type=t.get("predicate", "关联"),
-                ).consume()
-                count += 1
-        print(f"[INFO] Neo4j 关系镜像完成，共 {count} 条")
+        count = write_relations(rows, batch_size)
+        if count:
+            print(f"[INFO] Neo4j 关系镜像完成，共 {count} 条")
     except Exception as e:
         print(f"[WARN] Neo4j 批量同步失败（已降级，不影响 MySQL）：{e}")
     return count
 
 
-def query_relations(subject_names=None):
+_RELATION_QUERY = """
+MATCH (a:Concept)-[r]->(b:Concept)
+%s
+RETURN a.kp_id AS s_id, a.name AS s_name, a.subject AS s_sub,
+       b.kp_id AS t_id, b.name AS t_name, b.subject AS t_sub,
+       r.type AS rel_type, r.relation_source AS rel_src
+"""
+
+
+def iter_relations(subject_names=None, fetch_size=DEFAULT_PAGE_SIZE):
     """
-    查询关系。subject_names 为空 -> 全部；否则按科目列表过滤。
-    返回 [{source_kp_id, source_name, source_subject, target_kp_id, target_name,
-           target_subject, rel_type, relation_source}]
+    流式读取关系，逐条产出与 query_relations 相同格式的字典。
+    整个遍历在一个读事务中（结果是同一时刻的快照），驱动每次向服务端拉取 fetch_size 条，
+    内存中只保留一批。Neo4j 不可用时不产出任何数据；读取失败时抛出异常。
     """
     driver = get_driver()
     if driver is None:
-        return []
+        return
 
+    params = {}
+    where = ""
     if subject_names:
-        cypher = """
-            MATCH (a:Concept)-[r]->(b:Concept)
-            WHERE a.subject IN $subjects AND b.subject IN $subjects
-            RETURN a.kp_id AS s_id, a.name AS s_name, a.subject AS s_sub,
-                   b.kp_id AS t_id, b.name AS t_name, b.subject AS t_sub,
-                   r.type AS rel_type, r.relation_source AS rel_src
-        """
-        params = {"subjects": list(subject_names)}
-    else:
-        cypher = """
-            MATCH (a:Concept)-[r]->(b:Concept)
-            RETURN a.kp_id AS s_id, a.name AS s_name, a.subject AS s_sub,
-                   b.kp_id AS t_id, b.name AS t_name, b.subject AS t_sub,
-                   r.type AS rel_type, r.relation_source AS rel_src
-        """
-        params = {}
-
+        where = "WHERE a.subject IN $subjects AND b.subject IN $subjects"
+        params["subjects"] = list(subject_names)
+
+    with driver.session(default_access_mode=READ_ACCESS, fetch_size=int(fetch_size)) as session:
+        with session.begin_transaction() as tx:
+            for record in tx.run(_RELATION_QUERY % where, **params):
+                yield {
+                    "source_kp_id": record["s_id"], "source_name": record["s_name"],
+                    "source_subject": record["s_sub"],
+                    "target_kp_id": record["t_id"], "target_name": record["t_name"],
+                    "target_subject": record["t_sub"],
+                    "rel_type": record["rel_type"], "relation_source": record["rel_src"],
+                }
+
+
+def query_relations(subject_names=None, fetch_size=DEFAULT_PAGE_SIZE):
+    """
+    查询关系。subject_names 为空 -> 全部；否则按科目列表过滤。
+    返回 [{source_kp_id, source_name, source_subject, target_kp_id, target_name,
+           target_subject, rel_type, relation_source}]
+    """
     try:
-        with driver.session() as session:
-            rows = session.run(cypher, **params)
-            return [{
-                "source_kp_id": r["s_id"], "source_name": r["s_name"], "source_subject": r["s_sub"],
-                "target_kp_id": r["t_id"], "target_name": r["t_name"], "target_subject": r["t_sub"],
-                "rel_type": r["rel_type"], "relation_source": r["rel_src"],
-            } for r in rows]
+        return list(iter_relations(subject_names, fetch_size))
     except Exception as e:
         print(f"[WARN] Neo4j 查询失败：{e}")
         return []
 
 
+def _delete_edge(tx, s_uid, o_uid):
+    tx.run(
+        """
+        MATCH (a:Concept {uid: $s_uid})-[r]->(b:Concept {uid: $o_uid})
+        DELETE r
+        """,
+        s_uid=s_uid, o_uid=o_uid,
+    ).consume()
+
+
 def delete_relation(subject_name, source_name, target_name):
     """删除指定方向的关系边（节点保留，避免误删其它关系的锚点）"""
     driver = get_driver()
@@ -227,14 +360,9 @@ def delete_relation(subject_name, source_name, target_name):
         return False
     try:
         with driver.session() as session:
-            session.run(
-                """
-                MATCH (a:Concept {uid: $s_uid})-[r]->(b:Concept {uid: $o_uid})
-                DELETE r
-                """,
-                s_uid=make_uid(subject_name, source_name),
-                o_uid=make_uid(subject_name, target_name),
-            ).consume()
+            session.execute_write(
+                _delete_edge, make_uid(subject_name, source_name), make_uid(subject_name, target_name)
+            )
         return True
     except Exception as e:
         print(f"[WARN] Neo4j 删除关系失败：{e}")
@@ -1,11 +1,17 @@
 """
 PDF文本提取模块
-支持直接提取文字和OCR两种方式，从PDF中提取完整文本内容
+按页并行提取：每页先用PyMuPDF直接取文字，文字过少且含图片的页（扫描页）单独OCR，
+同一份PDF中文字页和扫描页混排时只OCR扫描页。
+页数较多时按 PAGES_PER_TASK 页一组分发到进程池；进程池在多次提取之间保持常驻，
+每个工作进程只加载一次PaddleOCR模型。
 """
 import io
 import os
 import sys
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 # 解决Windows GBK编码问题
@@ -16,58 +22,138 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
     except Exception:
         sys.stdout = _orig_stdout
 
+OCR_DPI = 300
+# 一页直接提取的文字少于该字符数且页内有图片时，判定为扫描页
+OCR_MIN_PAGE_CHARS = 20
+PAGES_PER_TASK = 4
+# 页数少于该值时在当前进程内逐页提取，不值得启动进程池
+PARALLEL_MIN_PAGES = 8
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """
-    从PDF文件中提取文本内容
+_pool = None
+
+# 每个进程一个PaddleOCR实例，首次遇到扫描页时加载
+_ocr_engine = None
+_ocr_missing = False
+
+
+def _get_ocr():
+    global _ocr_engine
+    if _ocr_engine is None:
+        logging.getLogger('ppocr').setLevel(logging.WARNING)
+        from paddleocr import PaddleOCR
+        _ocr_engine = PaddleOCR(use_angle_cls=True, lang='ch', show_log=False)
+    return _ocr_engine
 
-    1. 先尝试使用PyMuPDF直接提取文字
-    2. 如果提取的文字太少（< 50字符），判定为扫描版，启用OCR
-    """
-    pdf = Path(pdf_path)
-    if not pdf.exists():
-        raise FileNotFoundError(f"文件不存在: {pdf_path}")
 
+def _ocr_page(page) -> str:
+    """使用PaddleOCR识别一页"""
+    import numpy as np
+    pix = page.get_pixmap(dpi=OCR_DPI)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    result = _get_ocr().ocr(img, cls=True)
+    if result and result[0]:
+        return "\n".join(line[1][0] for line in result[0])
+    return ""
+
+
+def _page_text(page):
+    """返回 (文本, 是否为扫描页但未能OCR)"""
+    global _ocr_missing
+    text = page.get_text().strip()
+    if len(text) < OCR_MIN_PAGE_CHARS and page.get_images():
+        if _ocr_missing:
+            return text, True
+        try:
+            ocr_text = _ocr_page(page).strip()
+        except ImportError:
+            print("  -> 未安装 paddleocr，扫描页只保留直接提取的文字（pip install paddleocr）")
+            _ocr_missing = True
+            return text, True
+        if len(ocr_text) > len(text):
+            return ocr_text, False
+    return text, False
+
+
+def _extract_pages(pdf_path, page_indexes):
+    """提取若干页，返回 [(页下标, 文本, 是否跳过OCR)]（工作进程与单进程提取共用）"""
     import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return [(i, *_page_text(doc[i])) for i in page_indexes]
 
-    doc = fitz.open(pdf)
-    all_text = []
-    for page in doc:
-        text = page.get_text().strip()
-        if text:
-            all_text.append(text)
-    direct_text = "\n".join(all_text).strip()
 
-    if len(direct_text) < 50:
-        print("  -> 检测到扫描版PDF，启用OCR...")
-        final_text = _ocr_pdf(doc)
-    else:
-        final_text = direct_text
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn：Web 进程里可能有其他线程持有锁，fork 出的子进程会继承锁状态
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
 
-    doc.close()
-    return final_text
 
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
 
-def _ocr_pdf(doc) -> str:
-    """使用PaddleOCR对扫描版PDF进行OCR识别"""
-    import numpy as np
-    logging.getLogger('ppocr').setLevel(logging.WARNING)
-    from paddleocr import PaddleOCR
-    ocr = PaddleOCR(use_angle_cls=True, lang='ch', show_log=False)
-
-    ocr_pages = []
-    total = len(doc)
-    for i, page in enumerate(doc, 1):
-        print(f"  -> OCR第{i}/{total}页...")
-        pix = page.get_pixmap(dpi=300)
-        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
-            pix.height, pix.width, pix.n
-        )
-        result = ocr.ocr(img, cls=True)
-        if result and result[0]:
-            page_lines = [line[1][0] for line in result[0]]
-            ocr_pages.append("\n".join(page_lines))
-        else:
-            ocr_pages.append("")
-
-    return "\n\n".join(ocr_pages)
+
+def _page_count(pdf_path) -> int:
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def iter_pdf_pages(pdf_path: str, ocr_skipped: set = None):
+    """
+    逐页产出 (页下标, 文本)，按完成顺序而不是页码顺序；
+    进程池异常退出时，剩余页面改为在当前进程内提取。
+    传入 ocr_skipped 时，扫描页因未安装 paddleocr 而未能OCR的页下标会加入其中
+    （OCR缺失的标记在各工作进程内，只能随结果带回）
+    """
+    def pages(results):
+        for i, text, skipped in results:
+            if skipped and ocr_skipped is not None:
+                ocr_skipped.add(i)
+            yield i, text
+
+    pdf_path = str(Path(pdf_path).resolve())
+    total = _page_count(pdf_path)
+    if total < PARALLEL_MIN_PAGES or MAX_WORKERS <= 1:
+        for i in range(total):
+            yield from pages(_extract_pages(pdf_path, [i]))
+        return
+
+    chunks = [list(range(start, min(start + PAGES_PER_TASK, total))) for start in range(0, total, PAGES_PER_TASK)]
+    done = set()
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_extract_pages, pdf_path, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for i, text in pages(future.result()):
+                done.add(i)
+                yield i, text
+    except BrokenProcessPool:
+        print("  -> PDF提取进程池异常，剩余页面改为逐页提取")
+        _reset_pool()
+        for i in range(total):
+            if i not in done:
+                yield from pages(_extract_pages(pdf_path, [i]))
+
+
+def extract_text_from_pdf(pdf_path: str, ocr_skipped: set = None) -> str:
+    """
+    从PDF文件中提取文本内容（按页码顺序拼接）
+
+    每页先用PyMuPDF直接提取文字，文字过少且含图片的页启用OCR；
+    ocr_skipped 同 iter_pdf_pages
+    """
+    pdf = Path(pdf_path)
+    if not pdf.exists():
+        raise FileNotFoundError(f"文件不存在: {pdf_path}")
+
+    pages = {}
+    for i, text in iter_pdf_pages(str(pdf), ocr_skipped):
+        pages[i] = text
+        if len(pages) % 50 == 0:
+            print(f"  -> 已提取 {len(pages)} 页...")
+    return "\n".join(pages[i] for i in sorted(pages) if pages[i]).strip()
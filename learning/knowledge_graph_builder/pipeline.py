@@ -15,7 +15,7 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
     except Exception:
         sys.stdout = _orig_stdout
 
-from .pdf_extractor import extract_text_from_pdf
+from .text_extractor import extract_text_from_file
 from .triple_extractor import extract_triples_from_text, save_triples_to_csv
 from .alias_builder import build_alias_map
 from .entity_standardizer import load_alias_map, standardize_triples
@@ -43,7 +43,7 @@ class KnowledgeGraphPipeline:
                 print("Step 1/5: PDF文本提取")
                 print("=" * 50)
                 self._update_status('extracting_text')
-                full_text = extract_text_from_pdf(pdf_path)
+                full_text = extract_text_from_file(pdf_path, 'pdf')
                 print(f"[INFO] 提取文本长度: {len(full_text)} 字符")
             else:
                 raise ValueError("必须提供 pdf_path 或 text 参数")
@@ -60,7 +60,12 @@ class KnowledgeGraphPipeline:
             print("=" * 50)
             self._update_status('extracting_knowledge')
 
-            triples = extract_triples_from_text(full_text, subject_name)
+            triples = extract_triples_from_text(
+                full_text, subject_name,
+                progress=lambda done, total, rate: self._update_status(
+                    'extracting_knowledge', f"三元组抽取 {done}/{total} 块，{rate:.1f} 块/分钟"
+                ),
+            )
             if not triples:
                 print("[WARN] 未抽取到有效三元组，跳过后续步骤")
                 result["success"] = True
@@ -90,7 +95,7 @@ class KnowledgeGraphPipeline:
             self._update_status('analyzing_content')
 
             alias_path = self._get_output_path("别名库.csv") if self.output_dir else None
-            alias_dict = build_alias_map(triples, output_path=alias_path)
+            alias_dict = build_alias_map(triples, output_path=alias_path, subject=subject)
 
             # ===== Step 4: 实体名称标准化 =====
             print("\n" + "=" * 50)
@@ -137,11 +142,12 @@ class KnowledgeGraphPipeline:
 
         return result
 
-    def _update_status(self, status):
+    def _update_status(self, status, detail=''):
         if self.builder:
             try:
                 self.builder.status = status
-                self.builder.save(update_fields=['status'])
+                self.builder.status_detail = detail[:200]
+                self.builder.save(update_fields=['status', 'status_detail'])
             except Exception:
                 pass
 
@@ -1,8 +1,10 @@
 """
 统一的文本提取模块
-支持 PDF / DOCX / PPTX → 纯文本，供后续知识图谱三元组抽取使用
+支持 PDF / DOCX / PPTX → 纯文本，供后续知识图谱三元组抽取和习题导入使用
+提取结果按文件内容的 SHA-256 缓存在 data/extraction_cache 下，同一份教材重复上传不再重新解析/OCR
 """
 
+import hashlib
 import os
 import sys
 import io
@@ -16,8 +18,47 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
 
 from pathlib import Path
 
+# 提取逻辑变化时递增，使旧的缓存失效
+EXTRACTION_VERSION = 1
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[2] / 'data' / 'extraction_cache'
 
-def extract_text_from_file(file_path: str, file_type: str = '') -> str:
+
+def _cache_dir() -> Path:
+    try:
+        from django.conf import settings
+        custom = getattr(settings, 'DOCUMENT_TEXT_CACHE_DIR', None)
+    except Exception:
+        # 从脚本直接运行、未配置 Django 时
+        custom = None
+    return Path(custom) if custom else DEFAULT_CACHE_DIR
+
+
+def _file_digest(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _read_cache(cache_file: Path):
+    try:
+        return cache_file.read_text(encoding='utf-8')
+    except OSError:
+        return None
+
+
+def _write_cache(cache_file: Path, text: str):
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print(f"[WARN] 文本提取缓存写入失败: {e}")
+
+
+def extract_text_from_file(file_path: str, file_type: str = '', use_cache: bool = True) -> str:
     """
     根据文件类型自动提取文本
 
@@ -25,6 +66,7 @@ def extract_text_from_file(file_path: str, file_type: str = '') -> str:
         file_path: 文件路径
         file_type: 文件类型标识（'pdf', 'docx', 'doc', 'pptx', 'ppt'），
                    为空时从扩展名自动判断
+        use_cache: 是否读写按文件内容缓存的提取结果（空结果、有扫描页未能OCR的结果不缓存）
 
     返回:
         提取的纯文本内容
@@ -46,17 +88,35 @@ def extract_text_from_file(file_path: str, file_type: str = '') -> str:
         }
         file_type = type_map.get(ext, '')
 
+    # 扫描页因缺少 OCR 依赖只保留了直接提取的文字时，结果不完整，不写缓存
+    ocr_skipped = set()
     if file_type in ('pdf',):
-        return _extract_pdf(str(path))
+        def extract(pdf_path):
+            return _extract_pdf(pdf_path, ocr_skipped)
     elif file_type in ('docx', 'doc'):
-        return _extract_docx(str(path))
+        extract = _extract_docx
     elif file_type in ('pptx', 'ppt'):
-        return _extract_pptx(str(path))
+        extract = _extract_pptx
     else:
         raise ValueError(f"不支持的文本提取文件类型: {file_type}")
 
+    if not use_cache:
+        return extract(str(path))
+
+    cache_file = _cache_dir() / f"{_file_digest(path)}.{file_type}.v{EXTRACTION_VERSION}.txt"
+    text = _read_cache(cache_file)
+    if text is not None:
+        print(f"[INFO] 文本提取命中缓存: {path.name}")
+        return text
+    text = extract(str(path))
+    if ocr_skipped:
+        print(f"[WARN] {path.name} 有 {len(ocr_skipped)} 页扫描页未能OCR，提取结果不写入缓存")
+    elif text.strip():
+        _write_cache(cache_file, text)
+    return text
+
 
-def _extract_pdf(pdf_path: str) -> str:
+def _extract_pdf(pdf_path: str, ocr_skipped: set = None) -> str:
     """使用已有 pdf_extractor 模块提取 PDF 文本"""
     try:
         from learning.knowledge_graph_builder.pdf_extractor import extract_text_from_pdf
@@ -67,7 +127,7 @@ def _extract_pdf(pdf_path: str) -> str:
         except ImportError:
             raise ImportError("无法导入 PDF 提取模块")
 
-    return extract_text_from_pdf(pdf_path)
+    return extract_text_from_pdf(pdf_path, ocr_skipped)
 
 
 def _extract_docx(docx_path: str) -> str:
@@ -1,13 +1,24 @@
 """
 知识三元组抽取模块
 使用LLM（DeepSeek）对教材文本进行知识抽取，生成结构化的三元组数据
+
+  - 按估算的 token 数切块（CHUNK_TOKENS），相邻块重叠 CHUNK_OVERLAP_TOKENS，跨块的句子不丢关系；
+  - 最多 MAX_CONCURRENCY 个块同时请求，失败按指数退避重试；
+  - 每块的抽取结果按（模型、完整提示词）的 SHA-256 缓存在 SQLite 中（data/triple_cache.sqlite3，
+    learning.sqlite_cache，超过 TTL 或总数超限的旧条目自动淘汰）。
+    管线中断或修改提示词后重跑，只有内容/提示词变化的块和上次没抽完的块才会重新请求；
+    章节核心词识别按样本文本缓存。
 """
+import hashlib
 import json
 import csv
 import os
+import random
+import re
 import time
 import sys
 import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 _orig_stdout = sys.stdout
 if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer.closed:
@@ -19,13 +30,24 @@ if hasattr(sys.stdout, 'buffer') and sys.stdout.buffer and not sys.stdout.buffer
 from openai import OpenAI
 from django.conf import settings
 
+from learning.sqlite_cache import JSONCache
+
 # 知识三元组CSV字段
 TRIPLE_HEADERS = [
     "subject", "sub_type", "predicate", "object",
     "obj_type", "subject_desc", "object_desc",
 ]
 
-BATCH_SIZE = 200
+MODEL = "deepseek-chat"
+# 每块的估算 token 数上限与相邻块的重叠 token 数
+CHUNK_TOKENS = 3000
+CHUNK_OVERLAP_TOKENS = 200
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 4
+
+DEFAULT_CACHE_PATH = os.path.join(settings.BASE_DIR, "data", "triple_cache.sqlite3")
+
+_CJK = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
 
 
 def get_llm_client():
@@ -35,7 +57,71 @@ def get_llm_client():
     return OpenAI(api_key=api_key, base_url=base_url)
 
 
-def extract_triples_from_text(full_text: str, subject_name: str = "") -> list:
+# ---------------- 分块 ----------------
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符约 0.6 个，其余字符约 0.3 个"""
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def split_into_chunks(lines, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS) -> list:
+    """
+    按行累积到 max_tokens 切块，下一块以上一块末尾不超过 overlap_tokens 的若干行开头；
+    单行超过上限时按字符切开
+    """
+    pieces = []
+    for line in lines:
+        tokens = estimate_tokens(line)
+        if tokens <= max_tokens:
+            pieces.append((line, tokens))
+            continue
+        step = max(1, len(line) * max_tokens // tokens)
+        for start in range(0, len(line), step):
+            part = line[start:start + step]
+            pieces.append((part, estimate_tokens(part)))
+
+    chunks = []
+    current, size = [], 0
+    for piece, tokens in pieces:
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(p for p, _ in current))
+            overlap, overlap_size = [], 0
+            for prev, prev_tokens in reversed(current):
+                if overlap_size + prev_tokens > overlap_tokens or overlap_size + prev_tokens + tokens > max_tokens:
+                    break
+                overlap.insert(0, (prev, prev_tokens))
+                overlap_size += prev_tokens
+            current, size = overlap, overlap_size
+        current.append((piece, tokens))
+        size += tokens
+    if current:
+        chunks.append("\n".join(p for p, _ in current))
+    return chunks
+
+
+# ---------------- 结果缓存 ----------------
+def _cache_path():
+    return getattr(settings, 'KG_TRIPLE_CACHE_PATH', None) or DEFAULT_CACHE_PATH
+
+
+def _open_cache():
+    return JSONCache(_cache_path(), 'chunk_cache')
+
+
+def _cache_key(*parts) -> str:
+    payload = json.dumps([MODEL, *parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# ---------------- 抽取 ----------------
+def extract_triples_from_text(full_text: str, subject_name: str = "", progress=None) -> list:
+    """
+    Args:
+        progress: 可选回调 progress(已完成块数, 总块数, 每分钟完成块数)，每完成一块调用一次
+
+    Returns:
+        list[dict]: 按块顺序合并、去重后的三元组
+    """
     lines = [line.strip() for line in full_text.split('\n') if line.strip()]
     client = get_llm_client()
 
@@ -43,35 +129,91 @@ def extract_triples_from_text(full_text: str, subject_name: str = "") -> list:
         print("[WARN] 未配置LLM API密钥，跳过知识抽取")
         return []
 
-    scope_keywords = _identify_scope(lines, client)
-
-    all_results = []
-    total = len(lines)
-
-    for i in range(0, total, BATCH_SIZE):
-        batch = lines[i:i + BATCH_SIZE]
-        current_range = f"{i + 1}-{min(i + BATCH_SIZE, total)}"
-        print(f"  正在处理第 {current_range} / {total} 段...", end=" ", flush=True)
-
-        start = time.time()
-        results = _extract_batch("\n".join(batch), scope_keywords, subject_name, client)
-
-        if results:
-            all_results.extend(results)
-            cost = time.time() - start
-            print(f"[OK] 成功 (获取 {len(results)} 条, 耗时 {cost:.1f}s)")
-        else:
-            print(f"[WARN] 未抽取到内容")
-
-        if i + BATCH_SIZE < total:
-            time.sleep(0.5)
-
+    cache = _open_cache()
+    try:
+        scope_keywords = _identify_scope(lines, client, cache)
+        chunks = split_into_chunks(lines)
+        total = len(chunks)
+        results = {}
+        pending = {}
+        for index, chunk in enumerate(chunks):
+            key = _cache_key('triples', _build_prompts(chunk, subject_name))
+            cached = cache.get(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending[index] = (key, chunk)
+        print(f"[INFO] 文本共 {total} 块，缓存命中 {len(results)} 块，待抽取 {len(pending)} 块")
+
+        started = time.time()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(_extract_batch, chunk, scope_keywords, subject_name, client): (index, key)
+                for index, (key, chunk) in pending.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                index, key = futures[future]
+                items = future.result()
+                if items is None:
+                    failed += 1
+                else:
+                    results[index] = items
+                    cache.set(key, items)
+                minutes = max(time.time() - started, 1e-6) / 60
+                rate = done / minutes
+                print(f"  [{done}/{len(pending)}] 第 {index + 1}/{total} 块完成，"
+                      f"获取 {len(items or [])} 条，{rate:.1f} 块/分钟")
+                if progress:
+                    progress(total - len(pending) + done, total, rate)
+    finally:
+        cache.close()
+
+    if failed:
+        print(f"[WARN] {failed} 块抽取失败，重新运行时只重试这些块")
+    all_results = _merge_chunk_results(results[i] for i in sorted(results))
     print(f"\n[INFO] 共抽取 {len(all_results)} 条知识三元组")
     return all_results
 
 
-def _identify_scope(lines, client) -> set:
+def _merge_chunk_results(chunk_results) -> list:
+    """相邻块重叠部分会抽出相同的三元组：按 (头实体, 关系, 尾实体) 去重，任一条为低置信度则记为低"""
+    merged = {}
+    for items in chunk_results:
+        for item in items:
+            key = (item["subject"], item["predicate"], item["object"])
+            if key not in merged:
+                merged[key] = dict(item)
+            elif item.get("confidence") == "低":
+                merged[key]["confidence"] = "低"
+    return list(merged.values())
+
+
+def _chat_json(client, messages):
+    """调用 DeepSeek 并解析 JSON 输出，失败按指数退避（带随机抖动）重试"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+            return json.loads(response.choices[0].message.content)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            wait = 2 ** attempt + random.random()
+            print(f"[WARN] 抽取请求失败（第{attempt + 1}次）：{e}，{wait:.1f} 秒后重试")
+            time.sleep(wait)
+
+
+def _identify_scope(lines, client, cache=None) -> set:
     text_sample = "\n".join(lines[:20])[:1000]
+    key = _cache_key('scope', text_sample)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return set(cached)
 
     prompt = f"""
     请分析以下教材文本片段，严格按以下步骤执行：
@@ -83,25 +225,23 @@ def _identify_scope(lines, client) -> set:
     {text_sample}
     """
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-        )
-        result = json.loads(response.choices[0].message.content)
+        result = _chat_json(client, [{"role": "user", "content": prompt}])
         title = result.get("chapter_title", "")
         concepts = result.get("core_concepts", [])
         print(f"[INFO] 识别到章节: {title}")
         print(f"[INFO] 核心词: {', '.join(concepts)}")
-        return set(
+        keywords = set(
             [title.lower()] + [c.lower() for c in concepts]
         )
     except Exception as e:
         print(f"[WARN] 章节识别失败: {e}")
         return set()
+    if cache is not None:
+        cache.set(key, sorted(keywords))
+    return keywords
 
 
-def _extract_batch(text_batch, scope_keywords, subject_name, client) -> list:
+def _build_prompts(text_batch, subject_name):
     system_prompt = "你是一个严谨的在线教育知识图谱专家。请严格按JSON格式抽取知识三元组，并评估每条三元组的置信度。"
 
     user_prompt = f"""
@@ -126,17 +266,17 @@ def _extract_batch(text_batch, scope_keywords, subject_name, client) -> list:
     ### 待处理文本
     {text_batch}
     """
+    return system_prompt, user_prompt
+
 
+def _extract_batch(text_batch, scope_keywords, subject_name, client):
+    """抽取一块文本的三元组；重试后仍失败返回 None（不写缓存），成功但无内容返回 []"""
+    system_prompt, user_prompt = _build_prompts(text_batch, subject_name)
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            response_format={"type": "json_object"},
-        )
-        raw_data = json.loads(response.choices[0].message.content)
+        raw_data = _chat_json(client, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ])
         items = raw_data.get("data", [])
 
         results = []
@@ -156,7 +296,7 @@ def _extract_batch(text_batch, scope_keywords, subject_name, client) -> list:
         return results
     except Exception as e:
         print(f"[ERROR] 抽取错误: {e}")
-        return []
+        return None
 
 
 def save_triples_to_csv(triples: list, output_path: str):
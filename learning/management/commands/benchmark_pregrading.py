@@ -0,0 +1,70 @@
+"""
+估算近似答案聚类对批量评分的大模型调用量和耗时的影响（只在本地聚类，不调用大模型）
+用法: python manage.py benchmark_pregrading --subject 3 [--threshold 0.8] [--all]
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learning.ai_scoring.answer_clustering import cluster_answers, similarity_threshold
+from learning.ai_scoring.batch_grading import PROVIDER_RATE_LIMITS, pending_logs
+from learning.ai_scoring.scoring_agent import answer_cache_key, grading_inputs, is_dictation
+from learning.models import AnswerLog, Subject
+
+# 每个非默写答案：组件提取 1 次 + 三个模型评分各 1 次（仲裁另计，按比例不变）
+CALLS_PER_ANSWER = 4
+
+
+class Command(BaseCommand):
+    help = "统计科目主观题答案的聚类结果，对比开启/关闭预评分时需要调用大模型评分的答案数"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subject', type=int, required=True, help='科目ID')
+        parser.add_argument('--threshold', type=float, default=None, help='聚类相似度阈值，默认 settings / 模块默认值')
+        parser.add_argument('--all', action='store_true', help='统计科目下全部主观题答案（默认只统计待批改的）')
+
+    def handle(self, *args, **options):
+        subject_id = options['subject']
+        if not Subject.objects.filter(id=subject_id).exists():
+            raise CommandError(f"科目不存在: {subject_id}")
+        threshold = options['threshold'] if options['threshold'] is not None else similarity_threshold()
+        if threshold is None:
+            raise CommandError("预评分已关闭（AI_PREGRADE_SIMILARITY=None），请用 --threshold 指定阈值")
+
+        if options['all']:
+            logs = AnswerLog.objects.filter(exercise__subject_id=subject_id, exercise__question_type='5') \
+                .exclude(text_answer__isnull=True).exclude(text_answer='')
+        else:
+            logs = pending_logs(subject_id)
+
+        by_exercise = {}
+        answers = 0
+        for log in logs.select_related('exercise'):
+            inputs = grading_inputs(log)
+            if is_dictation(inputs['key_points'], inputs['std_answer']):
+                continue
+            answers += 1
+            by_exercise.setdefault(log.exercise_id, {}).setdefault(answer_cache_key(inputs), inputs['student_answer'])
+
+        started = time.perf_counter()
+        distinct = clusters = 0
+        for texts in by_exercise.values():
+            texts = list(texts.values())
+            distinct += len(texts)
+            clusters += len(cluster_answers(texts, threshold))
+        seconds = time.perf_counter() - started
+
+        # 批量评分的耗时下限由最慢的限速模型决定（每个答案各调用一次）
+        slowest_rate = min(rate for rate, _ in PROVIDER_RATE_LIMITS.values())
+        self.stdout.write(f"题目 {len(by_exercise)} 道，非默写答案 {answers} 条，阈值 {threshold}")
+        self.stdout.write(f"本地聚类耗时 {seconds:.3f}s")
+        self.stdout.write(
+            f"仅去重相同答案：评分 {distinct} 次，约 {distinct * CALLS_PER_ANSWER} 次模型调用，"
+            f"限速下至少 {distinct / slowest_rate:.0f}s"
+        )
+        self.stdout.write(
+            f"近似答案聚类：评分 {clusters} 次，约 {clusters * CALLS_PER_ANSWER} 次模型调用，"
+            f"限速下至少 {clusters / slowest_rate:.0f}s"
+        )
+        if distinct:
+            self.stdout.write(f"模型调用减少 {(1 - clusters / distinct) * 100:.1f}%")
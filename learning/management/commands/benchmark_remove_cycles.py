@@ -0,0 +1,85 @@
+"""
+在随机合成的知识点关系图上测量 CDF 建图去环（_remove_cycles）的耗时，不读写数据库
+用法: python manage.py benchmark_remove_cycles [--nodes 1000] [--edges 10000] [--seed 0] [--legacy]
+"""
+import random
+import time
+from types import SimpleNamespace
+
+import networkx as nx
+from django.core.management.base import BaseCommand, CommandError
+
+from learning.diagnosis.cdf_bridge import _remove_cycles
+
+
+def _synthetic_relations(nodes, edges, seed):
+    rng = random.Random(seed)
+    knowledge_points = [SimpleNamespace(id=kp_id, name=f"知识点{kp_id}") for kp_id in range(1, nodes + 1)]
+    relations = []
+    while len(relations) < edges:
+        source, target = rng.randint(1, nodes), rng.randint(1, nodes)
+        if source != target:
+            relations.append({"source": source, "target": target, "score": round(rng.random(), 3), "reason": ""})
+    return knowledge_points, relations
+
+
+# 原实现：每轮 simple_cycles 取第一个环并删掉其中分数最低的边，time_limit 秒后放弃
+def _legacy_remove_count(relations, time_limit):
+    graph = nx.DiGraph()
+    scores = {}
+    for relation in relations:
+        key = (relation["source"], relation["target"])
+        scores[key] = max(scores.get(key, 0.0), relation["score"])
+        graph.add_edge(*key)
+
+    started = time.perf_counter()
+    removed = 0
+    while time.perf_counter() - started < time_limit:
+        try:
+            cycle = next(nx.simple_cycles(graph))
+        except StopIteration:
+            return removed, time.perf_counter() - started, True
+        cycle_edges = list(zip(cycle, cycle[1:] + [cycle[0]]))
+        graph.remove_edge(*min(cycle_edges, key=lambda edge: (scores[edge], edge[0], edge[1])))
+        removed += 1
+    return removed, time.perf_counter() - started, False
+
+
+class Command(BaseCommand):
+    help = "在合成关系图上统计去环耗时与删除的边数，可选对比原 simple_cycles 逐环删边实现"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=1000, help='知识点数')
+        parser.add_argument('--edges', type=int, default=10000, help='关系数（随机有向边，可能重复）')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--legacy', action='store_true', help='同时运行原 simple_cycles 实现')
+        parser.add_argument('--legacy-timeout', type=float, default=120.0, help='原实现最多运行的秒数')
+
+    def handle(self, *args, **options):
+        nodes, edges = options['nodes'], options['edges']
+        if nodes < 2 or edges < 1:
+            raise CommandError("--nodes 至少为 2，--edges 至少为 1")
+        knowledge_points, relations = _synthetic_relations(nodes, edges, options['seed'])
+        kp_id_to_node_id = {kp.id: kp.id - 1 for kp in knowledge_points}
+
+        started = time.perf_counter()
+        acyclic, removed = _remove_cycles(relations, "prerequisite", kp_id_to_node_id, knowledge_points)
+        seconds = time.perf_counter() - started
+
+        graph = nx.DiGraph((item["source"], item["target"]) for item in acyclic)
+        if not nx.is_directed_acyclic_graph(graph):
+            raise CommandError("去环结果仍含环")
+        kept_score = sum(item["score"] for item in acyclic)
+        removed_score = sum(row["score"] for row in removed)
+        self.stdout.write(f"知识点 {nodes} 个，关系 {edges} 条（去重后 {len(acyclic) + len(removed)} 条）")
+        self.stdout.write(
+            f"SCC 去环耗时 {seconds:.3f}s，删除 {len(removed)} 条边（分数和 {removed_score:.1f}），"
+            f"保留 {len(acyclic)} 条（分数和 {kept_score:.1f}）"
+        )
+
+        if options['legacy']:
+            count, legacy_seconds, finished = _legacy_remove_count(relations, options['legacy_timeout'])
+            if finished:
+                self.stdout.write(f"原实现耗时 {legacy_seconds:.3f}s，删除 {count} 条边")
+            else:
+                self.stdout.write(f"原实现 {legacy_seconds:.0f}s 内未完成，已删除 {count} 条边")
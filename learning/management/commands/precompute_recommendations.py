@@ -0,0 +1,31 @@
+"""
+整班预先生成个性化推荐题目（可放在每晚的定时任务中）
+用法: python manage.py precompute_recommendations [--subject 3 --subject 5] [--seed 0]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from learning.diagnosis.batch_recommender import precompute_recommendations
+from learning.models import StudentSubject, Subject
+
+
+class Command(BaseCommand):
+    help = "为科目的全部选课学生批量生成推荐题目并写入 StudentRecommendation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subject', type=int, action='append', help='科目ID，可重复指定，默认所有有选课学生的科目')
+        parser.add_argument('--seed', type=int, default=None, help='补位题目随机顺序的种子')
+
+    def handle(self, *args, **options):
+        subject_ids = options['subject']
+        if subject_ids:
+            unknown = set(subject_ids) - set(Subject.objects.filter(id__in=subject_ids).values_list('id', flat=True))
+            if unknown:
+                raise CommandError(f"科目不存在: {', '.join(map(str, sorted(unknown)))}")
+        else:
+            subject_ids = sorted(set(StudentSubject.objects.values_list('subject_id', flat=True)))
+
+        for subject_id in subject_ids:
+            stats = precompute_recommendations(subject_id, seed=options['seed'])
+            self.stdout.write(
+                f"科目 {subject_id}: {stats['students']} 名学生，{stats['exercises']} 道题目，耗时 {stats['seconds']}s"
+            )
@@ -0,0 +1,47 @@
+"""
+全量重建融合图谱表（全局节点 / 知识点映射 / 融合关系），可选重新做跨学科语义对齐；
+--check 只核对增量维护的结果与全量计算是否一致，不写入
+用法: python manage.py rebuild_fused_graph [--realign] [--check]
+
+部署（迁移）后执行一次 --realign 完成首次构建；未执行时第一次读取融合图谱会排入后台构建任务，
+完成前读取结果不带语义对齐。之后知识点新增 / 改名会自动排入只重算语义对齐的后台任务，
+这两类任务都需要 run_training_worker 在运行。
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from graph_fusion import store
+
+
+class Command(BaseCommand):
+    help = (
+        "从 KnowledgePoint / KnowledgeGraph 全量重建多学科融合图谱表（部署后用 --realign 做首次构建）；"
+        "知识点新增/改名后的语义对齐由 run_training_worker 执行的后台任务补算"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--realign', action='store_true', help='同时对全部科目重新做四维语义对齐（较慢）')
+        parser.add_argument('--check', action='store_true', help='只比较现有表与全量计算结果，不一致时返回错误')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            expected, current = store.expected_state(), store.current_state()
+            diffs = []
+            for part in ('nodes', 'members', 'edges'):
+                keys = expected[part].keys() | current[part].keys()
+                bad = [k for k in keys if expected[part].get(k) != current[part].get(k)]
+                if bad:
+                    diffs.append(f"{part} 不一致 {len(bad)} 项，例如 {bad[0]!r}: "
+                                 f"期望 {expected[part].get(bad[0])!r}，实际 {current[part].get(bad[0])!r}")
+            if diffs:
+                raise CommandError("融合图谱表与全量计算不一致：\n" + "\n".join(diffs))
+            self.stdout.write(self.style.SUCCESS(
+                f"一致：{len(expected['nodes'])} 个节点，{len(expected['members'])} 个知识点，"
+                f"{len(expected['edges'])} 条融合关系"
+            ))
+            return
+
+        counts = store.rebuild(realign=options['realign'])
+        self.stdout.write(self.style.SUCCESS(
+            f"重建完成！{counts['nodes']} 个节点，{counts['members']} 个知识点，"
+            f"{counts['edges']} 条融合关系，{counts['alignments']} 条语义对齐"
+        ))
@@ -0,0 +1,35 @@
+"""
+用 MySQL 的知识点与关系重建 Neo4j 关系镜像（先清除科目的旧节点和边，再批量写入）
+用法: python manage.py rebuild_neo4j_mirror [--subject 科目名称 ...] [--batch-size 1000] [--keep-existing]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from learning.knowledge_graph_builder import neo4j_driver
+from learning.models import Subject
+
+
+class Command(BaseCommand):
+    help = "从 MySQL KnowledgeGraph 重建 Neo4j 关系镜像"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subject', type=str, action='append', help='科目名称（精确匹配），可重复指定，默认全部科目')
+        parser.add_argument('--batch-size', type=int, default=None, help='每个 UNWIND 语句写入的行数，默认 settings.NEO4J_BATCH_SIZE')
+        parser.add_argument('--keep-existing', action='store_true', help='不清除旧镜像，只补齐缺失的节点和关系')
+
+    def handle(self, *args, **options):
+        if not neo4j_driver.is_available():
+            raise CommandError("Neo4j 不可用：请检查 NEO4J_URI 配置并安装 neo4j 驱动")
+
+        subjects = Subject.objects.order_by('id')
+        if options['subject']:
+            subjects = subjects.filter(name__in=options['subject'])
+            missing = set(options['subject']) - set(subjects.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"科目不存在: {', '.join(sorted(missing))}")
+
+        stats = neo4j_driver.rebuild_from_mysql(
+            subjects, clear=not options['keep_existing'], batch_size=options['batch_size'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"\n重建完成！共写入 {stats['kp_count']} 个知识点，{stats['rel_count']} 条关系"
+        ))
@@ -0,0 +1,44 @@
+"""
+在命令行中并行对比多个诊断模型：每个模型在进程池的独立子进程中训练
+用法: python manage.py run_model_comparison --dataset Math1 --model NCDM --model IRT --model DINA [--threads-per-worker 2]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from learning.diagnosis.comparison_runner import DEFAULT_EPOCHS, run_comparison
+
+
+class Command(BaseCommand):
+    help = "并行训练同一数据集上的多个诊断模型并输出指标和耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', required=True, help='CMD_survey/data 下的数据集名称')
+        parser.add_argument('--model', action='append', required=True, help='模型名称，可重复指定')
+        parser.add_argument('--workers', type=int, default=None, help='子进程数，默认 CPU 核数 / 每进程线程数')
+        parser.add_argument('--threads-per-worker', type=int, default=2, help='每个子进程的 torch 线程数')
+        parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS, help='经典模型的训练轮数')
+        parser.add_argument('--device', default=None, help='训练设备，默认有 GPU 时用 cuda:0')
+
+    def handle(self, *args, **options):
+        results = run_comparison(
+            options['dataset'], options['model'],
+            max_workers=options['workers'],
+            threads_per_worker=max(1, options['threads_per_worker']),
+            device=options['device'],
+            epochs=options['epochs'],
+        )
+
+        failed = []
+        for model_name in options['model']:
+            result = results[model_name]
+            if 'error' in result:
+                failed.append(model_name)
+                self.stderr.write(f"{model_name}: 训练失败 - {result['error']}")
+                continue
+            rmse = result['rmse'] if result['rmse'] is not None else float('nan')
+            self.stdout.write(
+                f"{model_name}: best_epoch={result['best_epoch']} acc={result['acc']:.4f} "
+                f"auc={result['auc']:.4f} rmse={rmse:.4f} "
+                f"最优轮次耗时={result['best_round_time']:.1f}s 总耗时={result['total_time']:.1f}s"
+            )
+        if failed:
+            raise CommandError(f"{len(failed)} 个模型训练失败: {', '.join(failed)}")
@@ -0,0 +1,123 @@
+"""
+后台训练任务 worker：领取 TrainingJob 并在独立子进程中执行（教师诊断 / 研究者模型对比 / 主观题批量评分 / 融合图谱构建）
+用法: python manage.py run_training_worker [--concurrency 4] [--threads-per-job 2] [--job-type comparison]
+
+与 Web 服务分开启动，可以在多台机器上各跑一个；并发数默认按 CPU 核数 / 每个任务的线程数计算。
+请求取消的运行中任务会直接终止子进程；worker 退出时未完成的任务重新放回队列。
+"""
+import multiprocessing
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from learning.job_worker import run_job_process
+from learning.models import TrainingJob
+from learning.training_jobs import claim_next_job
+
+
+class Command(BaseCommand):
+    help = "后台训练任务 worker：按并发上限领取 TrainingJob，每个任务在单独子进程中执行"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads-per-job', type=int, default=2, help='每个任务子进程的 torch 线程数')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='同时运行的任务数，默认 CPU 核数 / 每任务线程数')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='轮询队列的间隔（秒）')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='运行中任务超过该秒数没有心跳即视为 worker 失联，标记为失败')
+        parser.add_argument('--job-type', action='append', choices=['diagnosis', 'comparison', 'grading', 'fusion'],
+                            help='只处理指定类型的任务，可重复指定；默认全部')
+
+    def handle(self, *args, **options):
+        threads_per_job = max(1, options['threads_per_job'])
+        concurrency = options['concurrency'] or max(1, (os.cpu_count() or 1) // threads_per_job)
+        poll_interval = options['poll_interval']
+        stale_after = timedelta(seconds=options['stale_after'])
+        job_types = options['job_type']
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+
+        # spawn 出的子进程是全新的解释器，不继承父进程的数据库连接和 torch 线程池
+        context = multiprocessing.get_context('spawn')
+        running = {}  # job_id -> Process
+
+        self.stdout.write(
+            f"训练 worker {worker_name} 已启动：并发 {concurrency}，每任务 {threads_per_job} 线程，"
+            f"任务类型 {', '.join(job_types) if job_types else '全部'}"
+        )
+
+        try:
+            while True:
+                close_old_connections()
+                self._reap_finished(running)
+                self._terminate_cancelled(running)
+                self._fail_stale_jobs(running, stale_after)
+
+                if running:
+                    TrainingJob.objects.filter(id__in=list(running)).update(heartbeat_at=timezone.now())
+
+                while len(running) < concurrency:
+                    job_id = claim_next_job(worker_name, job_types)
+                    if job_id is None:
+                        break
+                    process = context.Process(target=run_job_process, args=(job_id, threads_per_job), daemon=True)
+                    process.start()
+                    running[job_id] = process
+                    self.stdout.write(f"任务 {job_id} 开始执行（子进程 {process.pid}）")
+
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.stdout.write("worker 停止，未完成的任务重新放回队列")
+        finally:
+            for job_id, process in running.items():
+                process.terminate()
+                process.join(timeout=5)
+            if running:
+                close_old_connections()
+                TrainingJob.objects.filter(id__in=list(running), status='running').update(
+                    status='pending', progress=0.0, stage='', metrics=[], worker='', started_at=None
+                )
+
+    def _reap_finished(self, running):
+        for job_id, process in list(running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            running.pop(job_id)
+            # 正常结束时子进程已经写好状态；异常退出（被 kill、段错误等）时状态仍是 running
+            if process.exitcode != 0:
+                TrainingJob.objects.filter(id=job_id, status='running').update(
+                    status='failed', stage='失败', error=f'任务子进程异常退出 (exitcode={process.exitcode})',
+                    finished_at=timezone.now()
+                )
+            self.stdout.write(f"任务 {job_id} 结束（exitcode={process.exitcode}）")
+
+    def _terminate_cancelled(self, running):
+        if not running:
+            return
+        cancelled = TrainingJob.objects.filter(
+            id__in=list(running), status='running', cancel_requested=True
+        ).values_list('id', flat=True)
+        for job_id in cancelled:
+            process = running.pop(job_id)
+            process.terminate()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            TrainingJob.objects.filter(id=job_id, status='running').update(
+                status='cancelled', stage='已取消', finished_at=timezone.now()
+            )
+            self.stdout.write(f"任务 {job_id} 已取消")
+
+    def _fail_stale_jobs(self, running, stale_after):
+        """其他 worker 崩溃后遗留的运行中任务：心跳超时即标记失败"""
+        TrainingJob.objects.filter(
+            status='running', heartbeat_at__lt=timezone.now() - stale_after
+        ).exclude(id__in=list(running)).update(
+            status='failed', stage='失败', error='执行任务的 worker 已失联', finished_at=timezone.now()
+        )
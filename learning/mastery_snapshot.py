@@ -0,0 +1,137 @@
+"""
+学生学习快照：每个（学生, 科目）一行答题统计 StudentSubjectSummary 和一行掌握度缓存 StudentMasteryVector
+
+学生首页和个性化推荐直接读这两张表，不再逐科目统计 AnswerLog、逐知识点查询 StudentDiagnosis。
+快照在数据变化处增量维护：
+    学生提交答案 / 教师或 AI 批改后    -> refresh_student_snapshot(学生, 科目)
+    诊断结果批量写入后（diagnosis_writer） -> refresh_snapshots(本次写入的学生, 科目)
+每次只重算受影响学生在该科目的一行，读取时缺失的快照会当场补建。
+"""
+
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import AnswerLog, StudentDiagnosis, StudentMasteryVector, StudentSubjectSummary
+
+# 与学生诊断图谱、个性化推荐一致：掌握程度低于 0.6 视为薄弱，推荐使用 ID 为 3 的诊断模型
+WEAK_MASTERY_THRESHOLD = 0.6
+RECOMMENDATION_MODEL_ID = 3
+
+# 一次重算的学生数，避免 IN 列表过长
+REFRESH_CHUNK_SIZE = 500
+
+
+def _answer_stats(student_ids, subject_id):
+    rows = AnswerLog.objects.filter(
+        student_id__in=student_ids, exercise__subject_id=subject_id
+    ).values('student_id').annotate(
+        attempts=Count('id'),
+        correct=Count('id', filter=Q(is_correct=True)),
+        distinct_exercises=Count('exercise_id', distinct=True),
+    )
+    return {row['student_id']: row for row in rows}
+
+
+def _mastery_maps(student_ids, subject_id):
+    """{学生ID: {诊断模型ID(str): {知识点ID(str): 掌握程度}}}，键用字符串与 JSONField 读回的结果保持一致"""
+    vectors = defaultdict(lambda: defaultdict(dict))
+    rows = StudentDiagnosis.objects.filter(
+        student_id__in=student_ids, knowledge_point__subject_id=subject_id
+    ).values_list('student_id', 'diagnosis_model_id', 'knowledge_point_id', 'mastery_level')
+    for student_id, model_id, kp_id, mastery in rows:
+        vectors[student_id][str(model_id)][str(kp_id)] = mastery
+    return vectors
+
+
+def _weak_kp_ids(model_mastery):
+    weak = [(mastery, int(kp_id)) for kp_id, mastery in model_mastery.items() if mastery < WEAK_MASTERY_THRESHOLD]
+    return [kp_id for _, kp_id in sorted(weak)]
+
+
+def refresh_snapshots(student_ids, subject_id):
+    """重算一批学生在一个科目的答题统计和掌握度缓存（每批两次读取 + 两次批量 upsert）"""
+    student_ids = sorted({int(student_id) for student_id in student_ids})
+    for start in range(0, len(student_ids), REFRESH_CHUNK_SIZE):
+        chunk = student_ids[start:start + REFRESH_CHUNK_SIZE]
+        stats = _answer_stats(chunk, subject_id)
+        vectors = _mastery_maps(chunk, subject_id)
+
+        summaries = []
+        mastery_rows = []
+        for student_id in chunk:
+            row = stats.get(student_id, {})
+            attempts = row.get('attempts', 0)
+            correct = row.get('correct', 0)
+            mastery = {model_id: dict(kps) for model_id, kps in vectors.get(student_id, {}).items()}
+            summaries.append(StudentSubjectSummary(
+                student_id=student_id,
+                subject_id=subject_id,
+                attempts=attempts,
+                correct_count=correct,
+                distinct_exercises=row.get('distinct_exercises', 0),
+                accuracy=correct / attempts if attempts else 0.0,
+                weak_kp_ids=_weak_kp_ids(mastery.get(str(RECOMMENDATION_MODEL_ID), {})),
+            ))
+            mastery_rows.append(StudentMasteryVector(student_id=student_id, subject_id=subject_id, mastery=mastery))
+
+        _upsert(StudentSubjectSummary, summaries,
+                ['attempts', 'correct_count', 'distinct_exercises', 'accuracy', 'weak_kp_ids', 'updated_at'])
+        _upsert(StudentMasteryVector, mastery_rows, ['mastery', 'updated_at'])
+
+
+def _upsert(model, objects, update_fields):
+    # MySQL 的 ON DUPLICATE KEY UPDATE 不能指定冲突列
+    unique_fields = ['student', 'subject'] if connection.features.supports_update_conflicts_with_target else None
+    model.objects.bulk_create(objects, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+
+def refresh_student_snapshot(student_id, subject_id):
+    """单个学生答题或被批改后调用"""
+    if student_id and subject_id:
+        refresh_snapshots([student_id], subject_id)
+
+
+def refresh_for_answer_log(answer_log):
+    refresh_student_snapshot(answer_log.student_id, answer_log.subject_id or answer_log.exercise.subject_id)
+
+
+def get_subject_summaries(student_id, subject_ids):
+    """{科目ID: StudentSubjectSummary}，缺失的科目当场补建"""
+    subject_ids = list(subject_ids)
+    summaries = {
+        summary.subject_id: summary
+        for summary in StudentSubjectSummary.objects.filter(student_id=student_id, subject_id__in=subject_ids)
+    }
+    missing = [subject_id for subject_id in subject_ids if subject_id not in summaries]
+    for subject_id in missing:
+        refresh_snapshots([student_id], subject_id)
+    if missing:
+        summaries.update({
+            summary.subject_id: summary
+            for summary in StudentSubjectSummary.objects.filter(student_id=student_id, subject_id__in=missing)
+        })
+    return summaries
+
+
+def get_mastery_vectors(student_id, subject_ids):
+    """{科目ID: {诊断模型ID(str): {知识点ID(str): 掌握程度}}}，缺失的科目当场补建"""
+    subject_ids = list(subject_ids)
+    vectors = dict(StudentMasteryVector.objects.filter(
+        student_id=student_id, subject_id__in=subject_ids
+    ).values_list('subject_id', 'mastery'))
+    missing = [subject_id for subject_id in subject_ids if subject_id not in vectors]
+    for subject_id in missing:
+        refresh_snapshots([student_id], subject_id)
+    if missing:
+        vectors.update(StudentMasteryVector.objects.filter(
+            student_id=student_id, subject_id__in=missing
+        ).values_list('subject_id', 'mastery'))
+    return vectors
+
+
+def get_mastery_map(student_id, subject_id, model_id=RECOMMENDATION_MODEL_ID):
+    """学生在一个科目、一个诊断模型下的 {知识点ID(int): 掌握程度}"""
+    mastery = get_mastery_vectors(student_id, [subject_id]).get(subject_id, {})
+    return {int(kp_id): level for kp_id, level in mastery.get(str(model_id), {}).items()}
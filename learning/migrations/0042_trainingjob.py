@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:25
+# 后台训练任务表：教师诊断与研究者模型对比统一进入该队列，由 run_training_worker 执行
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0041_auto_20260608_2130'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('diagnosis', '教师诊断'), ('comparison', '模型对比')], max_length=20, verbose_name='任务类型')),
+                ('task_key', models.CharField(db_index=True, max_length=200, verbose_name='任务标识')),
+                ('payload', models.JSONField(default=dict, verbose_name='任务参数')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '运行中'), ('completed', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='pending', max_length=20, verbose_name='任务状态')),
+                ('progress', models.FloatField(default=0.0, verbose_name='进度(%)')),
+                ('stage', models.CharField(blank=True, default='', max_length=100, verbose_name='当前阶段')),
+                ('metrics', models.JSONField(default=list, verbose_name='每轮指标')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='任务结果')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='是否请求取消')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='执行进程')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='最近心跳')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='创建人')),
+            ],
+            options={
+                'verbose_name': '后台训练任务',
+                'verbose_name_plural': '后台训练任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='learning_tr_status_d2e02d_idx')],
+            },
+        ),
+    ]
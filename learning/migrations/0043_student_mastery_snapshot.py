@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:38
+# 学生科目学习概况与掌握度缓存：供学生首页和个性化推荐一次查询读取
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0042_trainingjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentMasteryVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mastery', models.JSONField(default=dict, verbose_name='掌握程度')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning.subject', verbose_name='科目')),
+            ],
+            options={
+                'verbose_name': '学生掌握度缓存',
+                'verbose_name_plural': '学生掌握度缓存',
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentSubjectSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0, verbose_name='答题次数')),
+                ('correct_count', models.IntegerField(default=0, verbose_name='正确次数')),
+                ('distinct_exercises', models.IntegerField(default=0, verbose_name='已做题目数')),
+                ('accuracy', models.FloatField(default=0.0, verbose_name='正确率')),
+                ('weak_kp_ids', models.JSONField(default=list, verbose_name='薄弱知识点')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning.subject', verbose_name='科目')),
+            ],
+            options={
+                'verbose_name': '学生科目学习概况',
+                'verbose_name_plural': '学生科目学习概况',
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+    ]
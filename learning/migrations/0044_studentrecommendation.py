@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:52
+# 预先批量计算的个性化推荐题目
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0043_student_mastery_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise_ids', models.JSONField(default=list, verbose_name='推荐题目')),
+                ('generated_at', models.DateTimeField(verbose_name='生成时间')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='学生')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning.subject', verbose_name='科目')),
+            ],
+            options={
+                'verbose_name': '学生推荐题目',
+                'verbose_name_plural': '学生推荐题目',
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+    ]
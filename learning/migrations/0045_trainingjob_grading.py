@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:14
+# 后台任务新增类型：主观题批量评分
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0044_studentrecommendation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trainingjob',
+            name='job_type',
+            field=models.CharField(choices=[('diagnosis', '教师诊断'), ('comparison', '模型对比'), ('grading', '主观题批量评分')], max_length=20, verbose_name='任务类型'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:02
+# 课本快速构建：记录当前步骤的进度说明（三元组抽取的块数与吞吐量）
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0045_trainingjob_grading'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textbookcoursebuilder',
+            name='status_detail',
+            field=models.CharField(blank=True, max_length=200, verbose_name='处理进度'),
+        ),
+    ]
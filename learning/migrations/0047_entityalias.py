@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:41
+# 科目内知识点别名表（本地别名聚类结果，后续上传增量复用）
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0046_textbookcoursebuilder_status_detail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=200, verbose_name='名称')),
+                ('canonical', models.CharField(max_length=200, verbose_name='规范名称')),
+                ('source', models.CharField(choices=[('rule', '规则'), ('embedding', '向量聚类'), ('llm', '大模型确认')], default='rule', max_length=20, verbose_name='判定方式')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning.subject', verbose_name='所属科目')),
+            ],
+            options={
+                'verbose_name': '知识点别名',
+                'verbose_name_plural': '知识点别名',
+                'unique_together': {('subject', 'alias')},
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:12
+# 融合图谱持久化：全局节点、知识点 -> 节点映射、按科目去重的融合关系、语义对齐结果
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning', '0047_entityalias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FusedNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='规范化名称')),
+                ('name', models.CharField(max_length=200, verbose_name='显示名称')),
+            ],
+            options={
+                'verbose_name': '融合图谱节点',
+                'verbose_name_plural': '融合图谱节点',
+            },
+        ),
+        migrations.CreateModel(
+            name='FusedAlignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('align_type', models.CharField(choices=[('EquivalentTo', '等价'), ('GeneralizeTo', '泛化'), ('ApplyTo', '应用')], max_length=20, verbose_name='对齐类型')),
+                ('confidence', models.FloatField(verbose_name='置信度')),
+                ('features', models.JSONField(blank=True, default=dict, verbose_name='特征得分')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='计算时间')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.knowledgepoint')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.knowledgepoint')),
+            ],
+            options={
+                'verbose_name': '融合语义对齐',
+                'verbose_name_plural': '融合语义对齐',
+            },
+        ),
+        migrations.CreateModel(
+            name='FusedNodeMember',
+            fields=[
+                ('knowledge_point', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fused_member', serialize=False, to='learning.knowledgepoint', verbose_name='知识点')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='learning.fusednode', verbose_name='全局节点')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.subject', verbose_name='所属科目')),
+            ],
+            options={
+                'verbose_name': '融合图谱节点成员',
+                'verbose_name_plural': '融合图谱节点成员',
+            },
+        ),
+        migrations.CreateModel(
+            name='FusedEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relationship_type', models.CharField(max_length=10, verbose_name='关系类型')),
+                ('support', models.PositiveIntegerField(default=1, verbose_name='原始关系数')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='learning.subject', verbose_name='所属科目')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.fusednode')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.fusednode')),
+                ('source_subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.subject', verbose_name='源知识点科目')),
+                ('target_subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='learning.subject', verbose_name='目标知识点科目')),
+            ],
+            options={
+                'verbose_name': '融合图谱关系',
+                'verbose_name_plural': '融合图谱关系',
+                'unique_together': {('subject', 'source', 'target', 'source_subject', 'target_subject', 'relationship_type')},
+            },
+        ),
+    ]
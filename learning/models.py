@@ -106,6 +106,101 @@ class KnowledgeGraph(models.Model):
             target=self.source
         ).exists()
 
+#知识点别名表
+class EntityAlias(models.Model):
+    """科目内实体名称 -> 规范名称（learning/knowledge_graph_builder/alias_engine.py 维护），
+    规范名称自身也有一行（alias == canonical），表示该名称已处理过，后续上传只对新名称聚类"""
+    SOURCE_CHOICES = [
+        ('rule', '规则'),
+        ('embedding', '向量聚类'),
+        ('llm', '大模型确认'),
+    ]
+
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="所属科目")
+    alias = models.CharField(max_length=200, verbose_name="名称")
+    canonical = models.CharField(max_length=200, verbose_name="规范名称")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='rule', verbose_name="判定方式")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "知识点别名"
+        verbose_name_plural = "知识点别名"
+        unique_together = ('subject', 'alias')
+
+    def __str__(self):
+        return f"{self.alias} → {self.canonical}"
+
+#融合图谱（graph_fusion/store.py 随知识点/关系的增删改增量维护，rebuild_fused_graph 全量重建）
+class FusedNode(models.Model):
+    """融合图谱全局节点：规范化名称相同的知识点（跨科目）归为同一节点"""
+    key = models.CharField(max_length=200, unique=True, verbose_name="规范化名称")
+    name = models.CharField(max_length=200, verbose_name="显示名称")
+
+    class Meta:
+        verbose_name = "融合图谱节点"
+        verbose_name_plural = "融合图谱节点"
+
+    def __str__(self):
+        return self.name
+
+
+class FusedNodeMember(models.Model):
+    """知识点 -> 融合图谱全局节点"""
+    knowledge_point = models.OneToOneField(KnowledgePoint, on_delete=models.CASCADE, primary_key=True,
+                                           related_name='fused_member', verbose_name="知识点")
+    node = models.ForeignKey(FusedNode, on_delete=models.CASCADE, related_name='members', verbose_name="全局节点")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='+', verbose_name="所属科目")
+
+    class Meta:
+        verbose_name = "融合图谱节点成员"
+        verbose_name_plural = "融合图谱节点成员"
+
+    def __str__(self):
+        return f"{self.knowledge_point_id} → {self.node_id}"
+
+
+class FusedEdge(models.Model):
+    """所属科目、两端节点及两端知识点所属科目、关系类型都相同的原始关系合为一行（无向关系 source 取 id 较小的节点），
+    support 为原始关系条数；方向冲突在读取时按所选科目消解"""
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="所属科目")
+    source = models.ForeignKey(FusedNode, on_delete=models.CASCADE, related_name='+')
+    target = models.ForeignKey(FusedNode, on_delete=models.CASCADE, related_name='+')
+    source_subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='+', verbose_name="源知识点科目")
+    target_subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='+', verbose_name="目标知识点科目")
+    relationship_type = models.CharField(max_length=10, verbose_name="关系类型")
+    support = models.PositiveIntegerField(default=1, verbose_name="原始关系数")
+
+    class Meta:
+        verbose_name = "融合图谱关系"
+        verbose_name_plural = "融合图谱关系"
+        unique_together = ('subject', 'source', 'target', 'source_subject', 'target_subject', 'relationship_type')
+
+    def __str__(self):
+        return f"{self.source_id} → {self.target_id} [{self.relationship_type}]"
+
+
+class FusedAlignment(models.Model):
+    """跨学科四维语义对齐结果（rebuild_fused_graph --realign 时计算，知识点改名后删除其对齐）"""
+    ALIGN_TYPE_CHOICES = [
+        ('EquivalentTo', '等价'),
+        ('GeneralizeTo', '泛化'),
+        ('ApplyTo', '应用'),
+    ]
+
+    source = models.ForeignKey(KnowledgePoint, on_delete=models.CASCADE, related_name='+')
+    target = models.ForeignKey(KnowledgePoint, on_delete=models.CASCADE, related_name='+')
+    align_type = models.CharField(max_length=20, choices=ALIGN_TYPE_CHOICES, verbose_name="对齐类型")
+    confidence = models.FloatField(verbose_name="置信度")
+    features = models.JSONField(default=dict, blank=True, verbose_name="特征得分")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="计算时间")
+
+    class Meta:
+        verbose_name = "融合语义对齐"
+        verbose_name_plural = "融合语义对齐"
+
+    def __str__(self):
+        return f"{self.source_id} ~ {self.target_id} [{self.align_type}]"
+
 #习题
 class Exercise(models.Model):
 
@@ -233,6 +328,60 @@ class StudentDiagnosis(models.Model):
     def __str__(self):
         return f"{self.student.username} - {self.knowledge_point.name}"
 
+
+class StudentSubjectSummary(models.Model):
+    """学生在某科目的答题统计与薄弱知识点快照，由 learning/mastery_snapshot.py 在答题/批改/诊断保存后维护"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="学生")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="科目")
+    attempts = models.IntegerField(default=0, verbose_name="答题次数")
+    correct_count = models.IntegerField(default=0, verbose_name="正确次数")
+    distinct_exercises = models.IntegerField(default=0, verbose_name="已做题目数")
+    accuracy = models.FloatField(default=0.0, verbose_name="正确率")
+    # 推荐所用诊断模型下掌握程度低于阈值的知识点ID，按掌握程度从低到高
+    weak_kp_ids = models.JSONField(default=list, verbose_name="薄弱知识点")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "学生科目学习概况"
+        verbose_name_plural = "学生科目学习概况"
+        unique_together = ('student', 'subject')
+
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id}"
+
+
+class StudentMasteryVector(models.Model):
+    """学生在某科目全部知识点的掌握程度缓存：{诊断模型ID: {知识点ID: 掌握程度}}，一次查询取出整科掌握度"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="学生")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="科目")
+    mastery = models.JSONField(default=dict, verbose_name="掌握程度")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "学生掌握度缓存"
+        verbose_name_plural = "学生掌握度缓存"
+        unique_together = ('student', 'subject')
+
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id}"
+
+
+class StudentRecommendation(models.Model):
+    """预先批量计算的个性化推荐题目（learning/diagnosis/batch_recommender.py），个性化推荐页面直接读取"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="学生")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="科目")
+    # 按推荐顺序排列的题目ID
+    exercise_ids = models.JSONField(default=list, verbose_name="推荐题目")
+    generated_at = models.DateTimeField(verbose_name="生成时间")
+
+    class Meta:
+        verbose_name = "学生推荐题目"
+        verbose_name_plural = "学生推荐题目"
+        unique_together = ('student', 'subject')
+
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id}"
+
 # 习题收藏模型
 class ExerciseFavorite(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="学生", related_name='favorite_exercises')
@@ -447,6 +596,55 @@ class ModelTrainingResult(models.Model):
         }
 
 
+class TrainingJob(models.Model):
+    """后台训练任务（教师诊断 / 研究者模型对比 / 主观题批量评分 / 融合图谱构建），由 run_training_worker 进程池领取执行"""
+    JOB_TYPES = [
+        ('diagnosis', '教师诊断'),
+        ('comparison', '模型对比'),
+        ('grading', '主观题批量评分'),
+        ('fusion', '融合图谱构建'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '运行中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已取消'),
+    ]
+
+    job_type = models.CharField(max_length=20, choices=JOB_TYPES, verbose_name="任务类型")
+    # 与前端展示的任务名一致，如 "Math1_NCDM"、"diagnosis_3_NCDM"
+    task_key = models.CharField(max_length=200, db_index=True, verbose_name="任务标识")
+    payload = models.JSONField(default=dict, verbose_name="任务参数")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="任务状态")
+    progress = models.FloatField(default=0.0, verbose_name="进度(%)")
+    stage = models.CharField(max_length=100, blank=True, default='', verbose_name="当前阶段")
+    # 每轮评估指标 [{'epoch': 1, 'acc': ..., 'auc': ..., 'rmse': ...}, ...]
+    metrics = models.JSONField(default=list, verbose_name="每轮指标")
+    result = models.JSONField(null=True, blank=True, verbose_name="任务结果")
+    error = models.TextField(blank=True, default='', verbose_name="错误信息")
+
+    cancel_requested = models.BooleanField(default=False, verbose_name="是否请求取消")
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name="执行进程")
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, verbose_name="创建人")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="结束时间")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="最近心跳")
+
+    class Meta:
+        verbose_name = "后台训练任务"
+        verbose_name_plural = "后台训练任务"
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.task_key} ({self.get_status_display()})"
+
+
 
 # 教学资料文件模型
 def resource_file_upload_path(instance, filename):
@@ -560,6 +758,7 @@ class TextbookCourseBuilder(models.Model):
     )
     original_filename = models.CharField(max_length=255, verbose_name="原始文件名")
     status = models.CharField(max_length=30, choices=PROCESS_STATUS, default='pending', verbose_name="处理状态")
+    status_detail = models.CharField(max_length=200, blank=True, verbose_name="处理进度")
     
     # 处理结果
     extracted_text = models.TextField(blank=True, verbose_name="提取的文本")
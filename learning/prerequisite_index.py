@@ -0,0 +1,191 @@
+"""
+知识图谱前置关系索引：每个科目在内存中保存一份 CSR 邻接表和传递闭包
+
+个性化推荐查询某知识点的全部前置知识点时，直接读取预先算好的集合，不再逐节点递归查询 KnowledgeGraph。
+（与原先的递归查询一致：边 source -> target 中 source 是 target 的前置，不区分关系类型。）
+
+索引按科目懒加载：第一次查询时用一条查询取出该科目全部边，
+在前置方向上求强连通分量，按拓扑序用整数位集合并出每个节点的全部祖先。
+
+KnowledgeGraph 的保存/删除（教师增删关系、删除知识点时的级联删除等）通过 post_save / post_delete 信号
+使该科目的索引失效；不触发信号的批量写入（三元组写回 save_to_django）写完后显式调用
+invalidate_prerequisite_index(subject_id)。版本号记在 Django 缓存中，配置了共享缓存时其他进程也会重建；
+另外索引最多缓存 INDEX_TTL 秒，默认的进程内缓存下也不会长期读到旧图。
+"""
+
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import KnowledgeGraph
+
+INDEX_TTL = 300
+_VERSION_KEY = 'prerequisite_index_version:{}'
+
+_indexes = {}  # subject_id -> (version, built_at, PrerequisiteIndex)
+_lock = threading.Lock()
+
+
+class PrerequisiteIndex:
+    """
+    一个科目的前置关系索引
+
+    node_ids: 图中出现的知识点ID（升序），下标即节点编号
+    indptr / indices: CSR 形式的“直接前置”邻接表，节点 i 的直接前置为 indices[indptr[i]:indptr[i + 1]]
+    """
+
+    def __init__(self, edges):
+        edges = np.asarray(list(edges), dtype=np.int64).reshape(-1, 2)
+        self.node_ids = np.unique(edges) if len(edges) else np.zeros(0, dtype=np.int64)
+        self.position = {int(kp_id): i for i, kp_id in enumerate(self.node_ids)}
+
+        n = len(self.node_ids)
+        sources = np.searchsorted(self.node_ids, edges[:, 0])
+        targets = np.searchsorted(self.node_ids, edges[:, 1])
+        order = np.lexsort((sources, targets))
+        self.indices = sources[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=n), out=self.indptr[1:])
+
+        self._ancestor_bits = self._build_closure()
+        self._ancestor_sets = {}
+
+    def direct_prerequisites(self, kp_id):
+        i = self.position.get(int(kp_id))
+        if i is None:
+            return frozenset()
+        return frozenset(int(self.node_ids[j]) for j in self.indices[self.indptr[i]:self.indptr[i + 1]])
+
+    def prerequisites(self, kp_id):
+        """知识点的全部（传递）前置知识点ID集合；图中成环时包含自身，与递归查询的结果一致"""
+        i = self.position.get(int(kp_id))
+        if i is None:
+            return frozenset()
+        ancestors = self._ancestor_sets.get(i)
+        if ancestors is None:
+            bits = self._ancestor_bits[i]
+            ancestors = frozenset(
+                int(self.node_ids[j]) for j in range(bits.bit_length()) if bits >> j & 1
+            )
+            self._ancestor_sets[i] = ancestors
+        return ancestors
+
+    def _build_closure(self):
+        """
+        在前置方向上做迭代版 Tarjan：一个强连通分量出栈时，它的所有祖先分量都已出栈，
+        因此可以直接把分量内各节点直接前置的位集合并起来
+        """
+        n = len(self.node_ids)
+        indptr, indices = self.indptr, self.indices
+        index_of = [-1] * n
+        lowlink = [0] * n
+        on_stack = [False] * n
+        stack = []
+        ancestor_bits = [0] * n
+        counter = 0
+
+        for root in range(n):
+            if index_of[root] != -1:
+                continue
+            work = [(root, indptr[root])]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+
+            while work:
+                node, edge_pos = work[-1]
+                if edge_pos < indptr[node + 1]:
+                    work[-1] = (node, edge_pos + 1)
+                    pred = int(indices[edge_pos])
+                    if index_of[pred] == -1:
+                        index_of[pred] = lowlink[pred] = counter
+                        counter += 1
+                        stack.append(pred)
+                        on_stack[pred] = True
+                        work.append((pred, indptr[pred]))
+                    elif on_stack[pred]:
+                        lowlink[node] = min(lowlink[node], index_of[pred])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] != index_of[node]:
+                    continue
+
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    members.append(member)
+                    if member == node:
+                        break
+
+                member_bits = 0
+                for member in members:
+                    member_bits |= 1 << member
+                bits = 0
+                cyclic = len(members) > 1
+                for member in members:
+                    for pred in indices[indptr[member]:indptr[member + 1]]:
+                        pred = int(pred)
+                        if member_bits >> pred & 1:
+                            cyclic = True
+                        else:
+                            bits |= (1 << pred) | ancestor_bits[pred]
+                if cyclic:
+                    bits |= member_bits
+                for member in members:
+                    ancestor_bits[member] = bits
+
+        return ancestor_bits
+
+
+def _current_version(subject_id):
+    return cache.get(_VERSION_KEY.format(subject_id), 0)
+
+
+def invalidate_prerequisite_index(subject_id):
+    """知识点关系变化后调用，下次查询时重建该科目的索引"""
+    key = _VERSION_KEY.format(subject_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+    with _lock:
+        _indexes.pop(subject_id, None)
+
+
+def get_prerequisite_index(subject_id):
+    version = _current_version(subject_id)
+    now = time.monotonic()
+    cached = _indexes.get(subject_id)
+    if cached and cached[0] == version and now - cached[1] < INDEX_TTL:
+        return cached[2]
+
+    edges = KnowledgeGraph.objects.filter(subject_id=subject_id).values_list('source_id', 'target_id')
+    index = PrerequisiteIndex(edges)
+    with _lock:
+        _indexes[subject_id] = (version, now, index)
+    return index
+
+
+def get_prerequisite_ids(knowledge_point_id, subject_id):
+    """知识点的全部前置知识点ID（frozenset）"""
+    return get_prerequisite_index(subject_id).prerequisites(knowledge_point_id)
+
+
+@receiver(post_save, sender=KnowledgeGraph)
+@receiver(post_delete, sender=KnowledgeGraph)
+def _knowledge_graph_changed(sender, instance, **kwargs):
+    # 提交后再失效一次：避免事务提交前其他请求按旧数据重建的索引留在缓存里
+    invalidate_prerequisite_index(instance.subject_id)
+    transaction.on_commit(lambda: invalidate_prerequisite_index(instance.subject_id))
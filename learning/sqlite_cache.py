@@ -0,0 +1,84 @@
+"""
+基于 SQLite 的 JSON 键值缓存（多个 gunicorn worker / 后台任务进程共用一个文件）
+
+triple_extractor 的分块抽取结果、cdf_bridge 的关系图提示词回答都按（模型、完整提示词）的 SHA-256
+存在这里。修改提示词后旧键不会再被读到，由淘汰规则清理（与 grading_cache 的内容缓存相同）：
+超过 TTL 的条目删除，总数超过上限时按最近访问时间删除最旧的。打开缓存时和每写入 EVICT_EVERY 条时各检查一次。
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+MAX_ENTRIES = 200000
+TTL_SECONDS = 180 * 24 * 3600
+EVICT_EVERY = 500
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    # WAL：读写互不阻塞，多进程并发写入时由 busy_timeout 排队
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def prune(conn, table, ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+    """删除超过 TTL 的条目；总数超过 max_entries 时再按最近访问时间删除最旧的"""
+    conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (time.time() - ttl_seconds,))
+    excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - max_entries
+    if excess > 0:
+        conn.execute(
+            f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+
+
+class JSONCache:
+    """
+    一张 (key, value, created_at, last_access) 表，value 为 JSON。
+    一个实例持有一个连接，只在创建它的线程中使用，用完 close()。
+    """
+
+    def __init__(self, path, table, ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._writes = 0
+        self.conn = connect(str(path))
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        if 'last_access' not in columns:
+            # 早先建的表没有 last_access，旧条目按最久未访问处理
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self.prune()
+
+    def get(self, key):
+        row = self.conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.ttl_seconds:
+            return None
+        self.conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now, now),
+        )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        prune(self.conn, self.table, self.ttl_seconds, self.max_entries)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,152 @@
+"""
+融合图谱增量维护的测试文件
+知识点、关系增删改后，信号驱动的增量结果应与从头计算的 expected_state() 一致；
+未构建时读取路径不在请求内构建，构建 / 语义对齐交给后台任务
+"""
+
+import random
+
+from django.test import TestCase
+
+from graph_fusion import store
+from graph_fusion.fusion import fuse_graph
+from learning.models import FusedNode, KnowledgeGraph, KnowledgePoint, Subject, TrainingJob
+
+
+class FusedGraphIncrementalTestCase(TestCase):
+    """测试 refresh_knowledge_points / refresh_relations（经由信号）"""
+
+    def setUp(self):
+        self.math = Subject.objects.create(name="数学")
+        self.cs = Subject.objects.create(name="计算机")
+        self.structure = KnowledgePoint.objects.create(subject=self.math, name="数据结构")
+        self.stack = KnowledgePoint.objects.create(subject=self.math, name="栈")
+        self.queue = KnowledgePoint.objects.create(subject=self.cs, name="队列")
+        KnowledgeGraph.objects.create(
+            subject=self.math, source=self.structure, target=self.stack, relationship_type='前置'
+        )
+        store.rebuild(realign=False)
+
+    def assertStateConsistent(self):
+        self.assertEqual(store.current_state(), store.expected_state())
+
+    def test_rebuild_matches_expected(self):
+        """全量构建的结果"""
+        self.assertTrue(FusedNode.objects.exists())
+        self.assertStateConsistent()
+
+    def test_create_merges_same_normalized_name(self):
+        """新建与已有知识点规范化名称相同的知识点，归入同一全局节点"""
+        duplicate = KnowledgePoint.objects.create(subject=self.cs, name="数据 结构")
+        KnowledgeGraph.objects.create(
+            subject=self.cs, source=duplicate, target=self.queue, relationship_type='前置'
+        )
+        self.assertStateConsistent()
+        state = store.current_state()
+        self.assertEqual(state['members'][duplicate.id][0], state['members'][self.structure.id][0])
+
+    def test_rename_moves_member_and_edges(self):
+        """改名后知识点换到新节点，关系随之迁移，原节点成员为空时删除"""
+        self.stack.name = "队列"
+        self.stack.save()
+        self.assertStateConsistent()
+        self.assertFalse(FusedNode.objects.filter(name="栈").exists())
+
+    def test_delete_knowledge_point(self):
+        """删除知识点（关系级联删除）"""
+        self.stack.delete()
+        self.assertStateConsistent()
+
+    def test_relation_update_and_delete(self):
+        """关系修改类型、删除"""
+        edge = KnowledgeGraph.objects.get(source=self.structure, target=self.stack)
+        edge.relationship_type = '关联'
+        edge.save()
+        self.assertStateConsistent()
+        edge.delete()
+        self.assertStateConsistent()
+
+    def test_random_operations(self):
+        """随机的增删改序列，每一步都与全量结果一致"""
+        rng = random.Random(0)
+        names = ['数据结构', '数据 结构', 'Data-Structure', 'data structure', '链表', '栈', '队列', '', '树']
+        subjects = [self.math, self.cs]
+        for _ in range(60):
+            kp_ids = list(KnowledgePoint.objects.values_list('id', flat=True))
+            op = rng.random()
+            if op < 0.3 or len(kp_ids) < 4:
+                KnowledgePoint.objects.create(subject=rng.choice(subjects), name=rng.choice(names))
+            elif op < 0.45:
+                kp = KnowledgePoint.objects.get(id=rng.choice(kp_ids))
+                kp.name = rng.choice(names)
+                kp.save()
+            elif op < 0.55:
+                KnowledgePoint.objects.get(id=rng.choice(kp_ids)).delete()
+            elif op < 0.85:
+                source_id, target_id = rng.sample(kp_ids, 2)
+                source = KnowledgePoint.objects.get(id=source_id)
+                KnowledgeGraph.objects.get_or_create(
+                    subject_id=source.subject_id, source_id=source_id, target_id=target_id,
+                    relation_source=rng.choice(['教材', '教案']),
+                    defaults={'relationship_type': rng.choice(['前置', '隶属', '关联', '相似'])},
+                )
+            else:
+                edge = KnowledgeGraph.objects.order_by('?').first()
+                if edge:
+                    edge.delete()
+            self.assertStateConsistent()
+
+
+class FusedGraphBuildScheduleTestCase(TestCase):
+    """测试未构建时的读取路径，以及构建 / 语义对齐后台任务的排入"""
+
+    def setUp(self):
+        self.math = Subject.objects.create(name="数学")
+        self.cs = Subject.objects.create(name="计算机")
+        self.structure = KnowledgePoint.objects.create(subject=self.math, name="数据结构")
+        self.stack = KnowledgePoint.objects.create(subject=self.math, name="栈")
+        self.duplicate = KnowledgePoint.objects.create(subject=self.cs, name="数据 结构")
+        self.queue = KnowledgePoint.objects.create(subject=self.cs, name="队列")
+        KnowledgeGraph.objects.create(
+            subject=self.math, source=self.structure, target=self.stack, relationship_type='前置'
+        )
+        KnowledgeGraph.objects.create(
+            subject=self.cs, source=self.duplicate, target=self.queue, relationship_type='前置'
+        )
+
+    def _jobs(self, task_key):
+        return TrainingJob.objects.filter(job_type='fusion', task_key=task_key)
+
+    def test_unbuilt_read_matches_built_and_queues_one_build(self):
+        """未构建时不在请求内构建：现算结果与构建后一致（不含语义对齐），只排入一条构建任务"""
+        unbuilt = fuse_graph([self.math.id, self.cs.id])
+        fuse_graph([self.math.id, self.cs.id])
+        self.assertFalse(FusedNode.objects.exists())
+        self.assertTrue(unbuilt['building'])
+        self.assertEqual(unbuilt['alignments'], [])
+        self.assertEqual(self._jobs(store.BUILD_TASK_KEY).count(), 1)
+
+        store.rebuild(realign=False)
+        built = fuse_graph([self.math.id, self.cs.id])
+        self.assertFalse(built['building'])
+        for result in (unbuilt, built):
+            result['links'].sort(key=lambda link: (link['source'], link['target']))
+        self.assertEqual(unbuilt['nodes'], built['nodes'])
+        self.assertEqual(unbuilt['links'], built['links'])
+
+    def test_new_knowledge_point_queues_realign(self):
+        """构建后新建 / 改名知识点排入一条只重算语义对齐的任务"""
+        store.rebuild(realign=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            KnowledgePoint.objects.create(subject=self.cs, name="链表")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stack.name = "堆栈"
+            self.stack.save()
+        self.assertEqual(self._jobs(store.REALIGN_TASK_KEY).count(), 1)
+        self.assertEqual(TrainingJob.objects.get(task_key=store.REALIGN_TASK_KEY).payload, {'mode': 'realign'})
+
+    def test_unchanged_save_does_not_queue_realign(self):
+        store.rebuild(realign=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stack.save()
+        self.assertFalse(self._jobs(store.REALIGN_TASK_KEY).exists())
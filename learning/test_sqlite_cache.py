@@ -0,0 +1,70 @@
+"""
+SQLite JSON 键值缓存的测试文件
+测试读写、TTL 过期、按最近访问时间淘汰，以及没有 last_access 列的旧表升级
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from learning import sqlite_cache
+from learning.sqlite_cache import JSONCache
+
+
+class JSONCacheTestCase(SimpleTestCase):
+    """测试 JSONCache / prune"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'sub', 'cache.sqlite3')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        cache = JSONCache(self.path, 'chunk_cache')
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', [{'subject': '栈', 'object': '队列'}])
+        cache.close()
+        cache = JSONCache(self.path, 'chunk_cache')
+        self.assertEqual(cache.get('a'), [{'subject': '栈', 'object': '队列'}])
+        cache.close()
+
+    def test_expired_entry_not_returned(self):
+        cache = JSONCache(self.path, 'chunk_cache', ttl_seconds=60)
+        cache.set('a', 1)
+        cache.conn.execute("UPDATE chunk_cache SET created_at = ?", (time.time() - 120,))
+        self.assertIsNone(cache.get('a'))
+        cache.prune()
+        self.assertEqual(cache.conn.execute("SELECT COUNT(*) FROM chunk_cache").fetchone()[0], 0)
+        cache.close()
+
+    def test_prune_keeps_recently_used(self):
+        cache = JSONCache(self.path, 'chunk_cache', max_entries=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+            time.sleep(0.01)
+        cache.get('a')
+        cache.prune()
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'c')
+        cache.close()
+
+    def test_upgrades_table_without_last_access(self):
+        os.makedirs(os.path.dirname(self.path))
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE relation_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)")
+        conn.execute("INSERT INTO relation_cache VALUES ('old', '[1]', ?)", (time.time(),))
+        conn.commit()
+        conn.close()
+        cache = JSONCache(self.path, 'relation_cache', max_entries=1)
+        self.assertEqual(cache.conn.execute("SELECT last_access FROM relation_cache").fetchone()[0], 0)
+        cache.set('new', [2])
+        sqlite_cache.prune(cache.conn, 'relation_cache', max_entries=1)
+        self.assertIsNone(cache.get('old'))
+        self.assertEqual(cache.get('new'), [2])
+        cache.close()
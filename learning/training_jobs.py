@@ -0,0 +1,162 @@
+"""
+后台任务队列（教师诊断 / 研究者模型对比 / 主观题批量评分 / 融合图谱构建）
+
+Web 进程只调用 enqueue_job 写入一条 TrainingJob 就返回；独立的 worker 进程
+（python manage.py run_training_worker）轮询领取 pending 任务，每个任务在单独的子进程中执行。
+执行过程通过 JobReporter 把阶段、进度百分比和每轮评估指标写回数据库，
+状态查询直接读表，因此与 gunicorn worker 的数量、重启都无关。
+"""
+
+import json
+import traceback
+
+import numpy as np
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TrainingJob
+
+# 任务类型 -> 执行函数，函数以 reporter=JobReporter 和 payload 中的字段为参数，返回可 JSON 序列化的结果
+JOB_HANDLERS = {
+    'diagnosis': 'learning.diagnosis.views_diagnosis.execute_diagnosis',
+    'comparison': 'learning.views_researcher.run_training_task',
+    'grading': 'learning.ai_scoring.batch_grading.run_batch_grading',
+    'fusion': 'graph_fusion.store.run_fusion_job',
+}
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class JobReporter:
+    """任务子进程内使用：更新阶段/进度，并把模型每轮的评估指标追加到 TrainingJob.metrics"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.metrics = []
+
+    def update(self, progress=None, stage=None):
+        fields = {'heartbeat_at': timezone.now()}
+        if progress is not None:
+            fields['progress'] = round(float(progress), 1)
+        if stage is not None:
+            fields['stage'] = stage
+        TrainingJob.objects.filter(id=self.job_id).update(**fields)
+
+    def epoch_callback(self, start=0.0, end=100.0):
+        """
+        返回传给模型 train(..., epoch_callback=...) 的回调
+
+        回调签名为 (epoch, total_epochs, metrics)，epoch 从 0 开始；
+        每轮把指标追加到 metrics，并把进度线性映射到 [start, end] 区间
+        """
+        def _callback(epoch, total_epochs, metrics):
+            row = {'epoch': int(epoch) + 1}
+            row.update({name: float(value) for name, value in metrics.items() if value is not None})
+            self.metrics.append(row)
+            progress = start + (end - start) * (int(epoch) + 1) / max(int(total_epochs), 1)
+            TrainingJob.objects.filter(id=self.job_id).update(
+                metrics=self.metrics,
+                progress=round(progress, 1),
+                heartbeat_at=timezone.now(),
+            )
+        return _callback
+
+
+def enqueue_job(job_type, task_key, payload, user=None):
+    return TrainingJob.objects.create(job_type=job_type, task_key=task_key, payload=payload, created_by=user)
+
+
+def find_active_job(task_key):
+    """同一任务标识下仍在排队/运行的任务，避免重复点击排入多条相同任务"""
+    return TrainingJob.objects.filter(
+        task_key=task_key, status__in=ACTIVE_STATUSES
+    ).order_by('-created_at').first()
+
+
+def cancel_job(job):
+    """排队中的任务直接取消；运行中的任务打上取消标记，由 worker 终止其子进程。返回取消后的状态"""
+    now = timezone.now()
+    if TrainingJob.objects.filter(id=job.id, status='pending').update(
+            status='cancelled', cancel_requested=True, stage='已取消', finished_at=now):
+        return 'cancelled'
+    if TrainingJob.objects.filter(id=job.id, status='running').update(cancel_requested=True):
+        return 'cancelling'
+    return TrainingJob.objects.values_list('status', flat=True).get(id=job.id)
+
+
+def job_status(job):
+    """状态查询接口的返回内容"""
+    data = {
+        'job_id': job.id,
+        'task_key': job.task_key,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'stage': job.stage,
+        'metrics': job.metrics,
+        'cancel_requested': job.cancel_requested,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == 'completed':
+        data['result'] = job.result
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def _subject_busy(payload):
+    """
+    同一科目的诊断任务共用 data/<科目ID>/ 目录，已有运行中的就先领别的任务。
+    这只是调度上的优化（检查与领取之间仍可能并发），真正的互斥由 incremental.subject_lock 的文件锁保证。
+    """
+    return TrainingJob.objects.filter(
+        job_type='diagnosis', status='running', payload__subject_id=payload.get('subject_id')
+    ).exists()
+
+
+def claim_next_job(worker_name, job_types=None):
+    """按创建顺序领取一条 pending 任务；用带状态条件的 update 抢占，多个 worker 不会领到同一条"""
+    queryset = TrainingJob.objects.filter(status='pending')
+    if job_types:
+        queryset = queryset.filter(job_type__in=job_types)
+    for job_id, job_type, payload in queryset.order_by('created_at').values_list('id', 'job_type', 'payload')[:20]:
+        if job_type == 'diagnosis' and _subject_busy(payload):
+            continue
+        now = timezone.now()
+        claimed = TrainingJob.objects.filter(id=job_id, status='pending').update(
+            status='running', worker=worker_name, stage='启动中', started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def _to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} 不能序列化为 JSON')
+
+
+def execute_job(job_id):
+    """在 worker 子进程中执行一条已领取的任务，结果或错误写回数据库"""
+    job = TrainingJob.objects.get(id=job_id)
+    reporter = JobReporter(job_id)
+    try:
+        handler = import_string(JOB_HANDLERS[job.job_type])
+        result = handler(reporter=reporter, **job.payload)
+        result = json.loads(json.dumps(result, default=_to_builtin))
+    except Exception as e:
+        traceback.print_exc()
+        TrainingJob.objects.filter(id=job_id, status='running').update(
+            status='failed', error=str(e), stage='失败', finished_at=timezone.now()
+        )
+        return
+
+    now = timezone.now()
+    TrainingJob.objects.filter(id=job_id, status='running').update(
+        status='completed', progress=100.0, stage='完成', result=result, finished_at=now, heartbeat_at=now
+    )
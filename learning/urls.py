@@ -130,6 +130,8 @@ urlpatterns = [
     #诊断
     path('teacher/diagnosis/', views_diagnosis.diagnosis, name='diagnosis'),
     path('teacher/api/diagnosis/run/', views_diagnosis.run_diagnosis, name='run_diagnosis'),
+    path('teacher/api/diagnosis/jobs/<int:job_id>/', views_diagnosis.get_diagnosis_job_status, name='diagnosis_job_status'),
+    path('teacher/api/diagnosis/jobs/<int:job_id>/cancel/', views_diagnosis.cancel_diagnosis_job, name='cancel_diagnosis_job'),
     path('teacher/api/diagnosis/<int:diagnosis_id>/', views_diagnosis.get_diagnosis_result, name='get_diagnosis_result'),
     path('teacher/api/student/<int:student_id>/diagnosis/<int:subject_id>/', views_diagnosis.get_student_diagnosis_detail, name='student_diagnosis_detail'),
     path('teacher/api/diagnosis/summary/<int:subject_id>/', views_diagnosis.get_diagnosis_summary,name='get_diagnosis_summary'),
@@ -142,6 +144,7 @@ urlpatterns = [
     # 智能体评分（三模型仲裁）+ 批量批改 + 清除记录
     path('teacher/api/answer/<int:log_id>/ai-agent-score/', views_teacher.ai_agent_score, name='ai_agent_score'),
     path('teacher/api/answer/batch-ai-score/', views_teacher.batch_ai_agent_score, name='batch_ai_agent_score'),
+    path('teacher/api/answer/batch-ai-score/jobs/<int:job_id>/', views_teacher.batch_ai_score_status, name='batch_ai_score_status'),
     path('teacher/api/answer/clear-records/', views_teacher.clear_grading_records, name='clear_grading_records'),
 
 #研究者功能
@@ -152,4 +155,5 @@ urlpatterns = [
     path('researcher/performance-comparison/', views_researcher.researcher_performance_comparison,name='researcher_performance_comparison'),
     path('researcher/run-comparison/', views_researcher.researcher_run_comparison, name='researcher_run_comparison'),
     path('researcher/check-status/', views_researcher.check_training_status, name='check_training_status'),
+    path('researcher/cancel-task/', views_researcher.cancel_training_task, name='cancel_training_task'),
 ]
\ No newline at end of file
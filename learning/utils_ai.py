@@ -3,25 +3,14 @@ import os
 import re
 import sys
 import traceback
-import io
 import json
 
-# === 依赖库检测 ===
-try:
-    import docx
-except ImportError:
-    print("【提示】缺少 python-docx，请运行: pip install python-docx")
-
-try:
-    import pdfplumber
-except ImportError:
-    print("【提示】缺少 pdfplumber，请运行: pip install pdfplumber")
-
 from openai import OpenAI
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
 from learning.models import Subject, TeacherSubject, Exercise, Choice, KnowledgePoint, QMatrix
+from learning.knowledge_graph_builder.text_extractor import extract_text_from_file
 
 
 def parse_fill_in_blanks(content, answer_text=None):
@@ -206,15 +195,12 @@ def handle_document_file(file_record):
 
         if filename.endswith('.pdf'):
             try:
-                with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                    full_text = "\n".join([page.extract_text() or '' for page in pdf.pages])
+                full_text = extract_text_from_file(file_record.file.path, 'pdf')
             except Exception as e:
                 print(f"PDF 解析失败: {e}")
         elif filename.endswith('.docx'):
             try:
-                docx_file = io.BytesIO(file_content)
-                doc = docx.Document(docx_file)
-                full_text = "\n".join([para.text.strip() for para in doc.paragraphs if para.text.strip()])
+                full_text = extract_text_from_file(file_record.file.path, 'docx')
             except Exception as e:
                 print(f"Word解析异常: {e}")
                 try:
@@ -448,15 +434,12 @@ def handle_material_generation(file_record):
 
         if filename.endswith('.pdf'):
             try:
-                with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                    full_text = "\n".join([page.extract_text() or '' for page in pdf.pages])
+                full_text = extract_text_from_file(file_record.file.path, 'pdf')
             except Exception as e:
                 print(f"资料 PDF 解析失败: {e}")
         elif filename.endswith('.docx'):
             try:
-                docx_file = io.BytesIO(file_content)
-                doc = docx.Document(docx_file)
-                full_text = "\n".join([para.text.strip() for para in doc.paragraphs if para.text.strip()])
+                full_text = extract_text_from_file(file_record.file.path, 'docx')
             except Exception as e:
                 print(f"资料 Word 解析异常: {e}")
                 try:
@@ -712,16 +695,13 @@ def handle_document_file_llm(file_record):
 
         if filename.endswith('.pdf'):
             try:
-                with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                    full_text = "\n".join([page.extract_text() or '' for page in pdf.pages])
+                full_text = extract_text_from_file(file_record.file.path, 'pdf')
             except Exception as e:
                 print(f"PDF 解析失败: {e}")
                 return 0
         elif filename.endswith('.docx'):
             try:
-                docx_file = io.BytesIO(file_content)
-                doc = docx.Document(docx_file)
-                full_text = "\n".join([para.text.strip() for para in doc.paragraphs if para.text.strip()])
+                full_text = extract_text_from_file(file_record.file.path, 'docx')
             except Exception as e:
                 print(f"Word 解析异常: {e}")
                 return 0
@@ -788,9 +768,8 @@ def analyze_textbook_pdf(textbook_builder):
 
         file_path = textbook_builder.textbook_file.path
 
-        # 使用PyMuPDF提取文本（支持OCR回退）
-        from learning.knowledge_graph_builder.pdf_extractor import extract_text_from_pdf
-        full_text = extract_text_from_pdf(file_path)
+        # 按页并行提取文本（扫描页OCR），结果按文件内容缓存
+        full_text = extract_text_from_file(file_path, 'pdf')
 
         textbook_builder.extracted_text = full_text[:10000]  # 保存前10000字符用于参考
         textbook_builder.status = 'analyzing_content'
@@ -1,7 +1,5 @@
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .models import *
-import sys
-import threading  # 添加这个
 from .forms import ExerciseForm, KnowledgePointForm, QMatrixForm
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
@@ -10,16 +8,10 @@ from django.http import JsonResponse, HttpResponse
 from django.db.models import Q, Count, Avg
 from django.core.paginator import Paginator
 import json
-import math
-import re
 from datetime import datetime, timedelta
-from pathlib import Path
 from .models import Exercise, Subject, KnowledgePoint, Choice, QMatrix, AnswerLog, StudentDiagnosis
 from accounts.models import *
-import importlib.util
 from .forms import ExerciseForm
-import torch
-from django.conf import settings
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 
@@ -253,435 +245,56 @@ def researcher_performance_comparison(request):
     return render(request, 'researcher/researcher_performance_comparison.html', context)
 
 
-# 训练状态存储（实际生产环境应该用数据库或缓存）
-training_tasks = {}
-
-def _cdf_model_log_dir(model_name, dataset_name):
-    return (
-        Path(settings.BASE_DIR)
-        / 'learning'
-        / 'diagnosis'
-        / 'CMD_survey'
-        / 'model'
-        / model_name
-        / 'logs'
-        / dataset_name
-    )
-
-
-def _snapshot_log_dirs(log_dir):
-    if not log_dir.exists():
-        return set()
-    return {path.resolve() for path in log_dir.iterdir() if path.is_dir()}
-
-
-def _find_newest_log_file(log_dir, before_dirs):
-    if not log_dir.exists():
-        return None
-
-    candidates = []
-    for path in log_dir.iterdir():
-        if not path.is_dir():
-            continue
-        resolved = path.resolve()
-        if resolved in before_dirs:
-            continue
-        log_file = path / 'log.txt'
-        if log_file.exists():
-            candidates.append(log_file)
-
-    if not candidates:
-        candidates = [path / 'log.txt' for path in log_dir.iterdir() if path.is_dir() and (path / 'log.txt').exists()]
-
-    if not candidates:
-        return None
-
-    return max(candidates, key=lambda item: item.stat().st_mtime)
-
-
-def _parse_cdf_training_curves(log_file):
-    curves = {'acc': [], 'auc': [], 'rmse': []}
-    if not log_file or not log_file.exists():
-        return curves
-
-    epoch_metrics = {}
-    train_pattern = re.compile(
-        r"epoch\s*=\s*(?P<epoch>\d+).*?train_acc\s*=\s*(?P<acc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
-        r".*?train_auc\s*=\s*(?P<auc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
-        r".*?train_r?mse\s*=\s*(?P<rmse>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)"
-    )
-    valid_acc_pattern = re.compile(r"valid acc\s*=\s*(?P<acc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
-    valid_auc_pattern = re.compile(r"valid auc\s*=\s*(?P<auc>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
-    valid_mse_pattern = re.compile(r"valid mse\s*=\s*(?P<mse>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
-    epoch_hint_pattern = re.compile(r"epoch\s*=\s*(?P<epoch>\d+)")
-
-    current_epoch = None
-    lines = log_file.read_text(encoding='utf-8', errors='ignore').splitlines()
-    for line in lines:
-        train_match = train_pattern.search(line)
-        if train_match:
-            epoch = int(train_match.group('epoch'))
-            epoch_metrics.setdefault(epoch, {})
-            epoch_metrics[epoch]['acc'] = float(train_match.group('acc'))
-            epoch_metrics[epoch]['auc'] = float(train_match.group('auc'))
-            epoch_metrics[epoch]['rmse'] = float(train_match.group('rmse'))
-            current_epoch = epoch
-            continue
-
-        epoch_hint_match = epoch_hint_pattern.search(line)
-        if epoch_hint_match:
-            current_epoch = int(epoch_hint_match.group('epoch'))
-
-        if current_epoch is None:
-            continue
-
-        valid_acc_match = valid_acc_pattern.search(line)
-        if valid_acc_match:
-            epoch_metrics.setdefault(current_epoch, {})
-            epoch_metrics[current_epoch]['acc'] = float(valid_acc_match.group('acc'))
-            continue
-
-        valid_auc_match = valid_auc_pattern.search(line)
-        if valid_auc_match:
-            epoch_metrics.setdefault(current_epoch, {})
-            epoch_metrics[current_epoch]['auc'] = float(valid_auc_match.group('auc'))
-            continue
-
-        valid_mse_match = valid_mse_pattern.search(line)
-        if valid_mse_match:
-            epoch_metrics.setdefault(current_epoch, {})
-            mse_value = float(valid_mse_match.group('mse'))
-            epoch_metrics[current_epoch]['rmse'] = math.sqrt(mse_value) if mse_value > 0 else 0.0
-
-    for epoch in sorted(epoch_metrics):
-        metrics = epoch_metrics[epoch]
-        curves['acc'].append(metrics.get('acc'))
-        curves['auc'].append(metrics.get('auc'))
-        curves['rmse'].append(metrics.get('rmse'))
-
-    return curves
-
-"""后台执行训练任务"""
-def run_training_task(dataset_name, model_name, experiment_id, user_id):
-    import os
+# 训练任务的状态保存在 TrainingJob 表中，由 run_training_worker 进程执行（见 learning/training_jobs.py）
+
+"""后台执行训练任务（comparison 类型 TrainingJob 的执行体，在 worker 子进程中运行）"""
+def run_training_task(dataset_name, model_name, experiment_id, user_id, reporter=None):
+    from .diagnosis.comparison_runner import train_model
+
     try:
         print(f"========== 开始训练任务: {dataset_name}_{model_name} ==========")
-        
-        # CDF 系列模型单独走适配器训练逻辑。
-        # 这里的展示名已经改成 IdpCDF / PCG-CDF，底层适配器目录也已经改成新名称。
-        if model_name in {'IdpCDF', 'HierCDF', 'ConCDF', 'PCG-CDF'}:
-            print(f"检测到 {model_name} 模型，使用专用适配器训练")
-
-            device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
-            if model_name == 'IdpCDF':
-                model_dir_name = 'IdpCDF'
-            elif model_name == 'PCG-CDF':
-                model_dir_name = 'PCGCDF'
-            else:
-                model_dir_name = model_name
-            log_dir = _cdf_model_log_dir(model_dir_name, dataset_name)
-            before_log_dirs = _snapshot_log_dirs(log_dir)
-
-            if model_name == 'ConCDF':
-                # 包含关系模型使用 ConCDF 适配器。
-                from learning.diagnosis.CMD_survey.model.ConCDF.ConCDF_adapter import train_concdm
-                best_epoch, best_auc, best_acc, rmse = train_concdm(dataset_name, device=device)
-            elif model_name == 'HierCDF':
-                # 层次关系模型使用 HierCDF 适配器。
-                from learning.diagnosis.CMD_survey.model.HierCDF.HierCDF_adapter import train_hiercdm
-                best_epoch, best_auc, best_acc, rmse = train_hiercdm(dataset_name, device=device)
-            elif model_name == 'IdpCDF':
-                # IdpCDF 使用新的适配器。
-                from learning.diagnosis.CMD_survey.model.IdpCDF.IdpCDF_adapter import train_basecdm
-                best_epoch, best_auc, best_acc, rmse = train_basecdm(dataset_name, device=device)
-            else:
-                # PCG-CDF 使用新的适配器。
-                from learning.diagnosis.CMD_survey.model.PCGCDF.PCGCDF_adapter import train_mixcdm
-                best_epoch, best_auc, best_acc, rmse = train_mixcdm(dataset_name, device=device)
+        if reporter is not None:
+            reporter.update(progress=5, stage='训练模型')
+
+        # 数据集路径、规模和超参数都显式传给训练函数，不修改工作目录、sys.path 和环境变量
+        result = train_model(
+            dataset_name, model_name,
+            epoch_callback=reporter.epoch_callback(10, 95) if reporter is not None else None
+        )
+        print(f"训练完成: best_epoch={result['best_epoch']}, acc={result['acc']}, auc={result['auc']}, "
+              f"rmse={result['rmse']}, 总耗时={result['total_time']:.1f}s")
 
-            log_file = _find_newest_log_file(log_dir, before_log_dirs)
-            training_curves = _parse_cdf_training_curves(log_file)
+        if reporter is not None:
+            reporter.update(progress=95, stage='保存结果')
 
+        if experiment_id:
             from .models import Experiment, ModelTrainingResult, Dataset, DiagnosisModel
             from django.contrib.auth import get_user_model
 
             User = get_user_model()
-            dataset_obj = Dataset.objects.get(name=dataset_name)
-            model_obj = DiagnosisModel.objects.get(name=model_name)
-
-            if experiment_id:
-                experiment = Experiment.objects.get(batch_id=experiment_id)
-                ModelTrainingResult.objects.create(
-                    experiment=experiment,
-                    diagnosis_model=model_obj,
-                    dataset=dataset_obj,
-                    best_round=best_epoch,
-                    acc=best_acc,
-                    auc=best_auc,
-                    rmse=rmse if rmse else 0.0,
-                    best_round_time=0.0,
-                    total_time=0.0,
-                    created_by=User.objects.get(id=user_id)
-                )
-
-            task_key = f"{dataset_name}_{model_name}"
-            training_tasks[task_key] = {
-                'status': 'completed',
-                'result': {
-                    'best_epoch': best_epoch,
-                    'acc': best_acc,
-                    'auc': best_auc,
-                    'rmse': rmse,
-                    'training_curves': training_curves
-                }
-            }
-            print(f"========== 任务 {dataset_name}_{model_name} 完成 ==========")
-            return
-
-
-        from .diagnosis.dual_relation_ncdm import MODEL_NAMES as IRD_NCDM_MODEL_NAMES
-        if model_name in IRD_NCDM_MODEL_NAMES:
-            from .diagnosis.dual_relation_ncdm.platform import train_researcher_dataset
-
-            result_data = train_researcher_dataset(dataset_name, model_name=model_name)
-            best_epoch = result_data['best_epoch']
-            best_auc = result_data['auc']
-            best_acc = result_data['acc']
-            rmse = result_data['rmse']
-            training_curves = result_data.get('training_curves') or {
-                'acc': [best_acc],
-                'auc': [best_auc],
-                'rmse': [rmse],
-            }
-
-            if experiment_id:
-                from .models import Experiment, ModelTrainingResult, Dataset, DiagnosisModel
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                experiment = Experiment.objects.get(batch_id=experiment_id)
-                dataset_obj = Dataset.objects.get(name=dataset_name)
-                model_obj = DiagnosisModel.objects.get(name=model_name)
-                ModelTrainingResult.objects.create(
-                    experiment=experiment,
-                    diagnosis_model=model_obj,
-                    dataset=dataset_obj,
-                    best_round=best_epoch,
-                    acc=best_acc,
-                    auc=best_auc,
-                    rmse=rmse,
-                    best_round_time=result_data.get('best_round_time', 0.0),
-                    total_time=result_data.get('total_time', 0.0),
-                    created_by=User.objects.get(id=user_id)
-                )
-
-            task_key = f"{dataset_name}_{model_name}"
-            training_tasks[task_key] = {
-                'status': 'completed',
-                'result': {
-                    'best_epoch': best_epoch,
-                    'acc': best_acc,
-                    'auc': best_auc,
-                    'rmse': rmse,
-                    'training_curves': training_curves
-                }
-            }
-            print(f"========== 任务 {dataset_name}_{model_name} 完成 ==========")
-            return
-
-        # 设置环境变量，告诉params.py使用哪个数据集
-        os.environ['CD_DATASET'] = dataset_name
-        print(f"设置环境变量 CD_DATASET={dataset_name}")
-
-        # 构建数据集路径
-        base_path = os.path.join(settings.BASE_DIR, 'learning', 'diagnosis', 'CMD_survey')
-        data_path = os.path.join(base_path, 'data', dataset_name)
-        print(f"数据路径: {data_path}")
-
-        # 读取config.txt获取学生数、习题数、知识点数
-        config_path = os.path.join(data_path, 'config.txt')
-        with open(config_path, 'r') as f:
-            f.readline()  # 跳过注释行
-            un, en, kn = f.readline().strip().split(',')
-            un, en, kn = int(un), int(en), int(kn)
-        print(f"数据集信息: 学生数={un}, 习题数={en}, 知识点数={kn}")
-
-        # 切换到 CMD_survey 目录
-        sys.path = [p for p in sys.path if os.path.abspath(p) != os.path.abspath(base_path)]
-        sys.path.insert(0, base_path)
-        os.chdir(base_path)
-        print(f"当前工作目录: {os.getcwd()}")
-
-        # 导入params（现在它会读取环境变量）
-        sys.modules.pop('params', None)
-        sys.modules.pop('dataloader', None)
-        import params
-        print("已导入params模块")
-
-        # 验证params中的路径是否正确
-        print(f"params.dataset = {params.dataset}")
-
-        # 导入对应的模型模块
-        model_module_map = {
-            'IRT': 'IRT',
-            'NCDM': 'NCDM',
-            'DINA': 'DINA',
-        }
-
-        module_name = model_module_map.get(model_name)
-        if not module_name:
-            raise Exception(f'未知模型: {model_name}')
-
-        print(f"导入模型模块: model.{module_name}")
-        model_module = importlib.import_module(f'model.{module_name}')
-
-        # 创建模型实例
-        print(f"创建{model_name}模型实例...")
-        if model_name == 'IRT':
-            cdm = model_module.IRT(un, en, value_range=4.0, a_range=2.0)
-        elif model_name == 'NCDM':
-            cdm = model_module.NCDM(kn, en, un)
-        elif model_name == 'DINA':
-            cdm = model_module.DINA(un, en, kn)
-        else:
-            raise Exception(f'未实现的模型: {model_name}')
-        print("模型实例创建完成")
-
-        # 加载数据
-        print("加载数据...")
-        import dataloader
-        src, tgt = dataloader.CD_DL()
-        print("数据加载完成")
-
-        # 将ID从1-based转换为0-based
-        print("转换ID从1-based到0-based...")
-
-        def convert_to_zero_based(dataloader):
-            new_batches = []
-            for batch in dataloader:
-                user_ids, exer_ids, knowledge_emb, ys = batch
-                # ID减1（1-based -> 0-based）
-                user_ids = user_ids - 1
-                exer_ids = exer_ids - 1
-                new_batches.append((user_ids, exer_ids, knowledge_emb, ys))
-            return new_batches
-
-        # 转换训练集和验证集
-        src = convert_to_zero_based(src)
-        tgt = convert_to_zero_based(tgt)
-        print("ID转换完成")
-
-        # ========== 新增：修改训练方法，获取每轮数据 ==========
-        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
-        print(f"开始训练，使用设备: {device}")
-
-        # 存储每轮的训练数据
-        training_curves = {
-            'acc': [],
-            'auc': [],
-            'rmse': []
-        }
-
-        # 检查模型是否有自定义的训练方法
-        if hasattr(cdm, 'train_with_curves'):
-            # 如果模型支持返回曲线数据
-            result, training_curves = cdm.train_with_curves(
-                train_data=src, test_data=tgt, epoch=10, device=device, lr=params.lr
-            )
-        elif hasattr(cdm, 'train_one_epoch'):
-            # 否则手动记录每轮数据
-            best_epoch = 0
-            best_acc = 0
-            best_auc = 0
-            best_rmse = None
-
-            # 假设训练10轮
-            num_epochs = 10
-
-            for epoch in range(num_epochs):
-                print(f"训练第 {epoch + 1}/{num_epochs} 轮...")
-
-                # 训练一轮（需要根据你的模型接口调整）
-                # 这里假设模型有 train_one_epoch 方法
-                cdm.train_one_epoch(train_data=src, device=device, lr=params.lr)
-                epoch_acc, epoch_auc, epoch_rmse = evaluate_model(cdm, tgt, device)
-                # 记录数据
-                training_curves['acc'].append(epoch_acc)
-                training_curves['auc'].append(epoch_auc)
-                training_curves['rmse'].append(epoch_rmse)
-
-                # 更新最佳结果
-                if epoch_acc > best_acc:
-                    best_acc = epoch_acc
-                    best_auc = epoch_auc
-                    best_rmse = epoch_rmse
-                    best_epoch = epoch + 1
-
-            result = (best_epoch, best_auc, best_acc, best_rmse)
-        else:
-            raise AttributeError(f"{model_name} does not provide train_with_curves or train_one_epoch.")
-
-        print(f"训练完成，原始结果: {result}")
-        print(f"训练曲线数据: {training_curves}")
-
-        # result 格式可能是 (best_epoch, best_auc, best_acc) 或包含 rmse
-        if len(result) == 3:
-            best_epoch, best_auc, best_acc = result
-            rmse = None
-        else:
-            best_epoch, best_auc, best_acc, rmse = result
-
-        print(f"解析结果: best_epoch={best_epoch}, acc={best_acc}, auc={best_auc}, rmse={rmse}")
-
-        # 保存到数据库
-        print("保存结果到数据库...")
-        from .models import Experiment, ModelTrainingResult, Dataset, DiagnosisModel
-        from django.contrib.auth import get_user_model
-
-        User = get_user_model()
-
-        dataset_obj = Dataset.objects.get(name=dataset_name)
-        model_obj = DiagnosisModel.objects.get(name=model_name)
-
-        if experiment_id:
-            experiment = Experiment.objects.get(batch_id=experiment_id)
             ModelTrainingResult.objects.create(
-                experiment=experiment,
-                diagnosis_model=model_obj,
-                dataset=dataset_obj,
-                best_round=best_epoch,
-                acc=best_acc,
-                auc=best_auc,
-                rmse=rmse if rmse else 0.0,
-                best_round_time=0.0,
-                total_time=0.0,
+                experiment=Experiment.objects.get(batch_id=experiment_id),
+                diagnosis_model=DiagnosisModel.objects.get(name=model_name),
+                dataset=Dataset.objects.get(name=dataset_name),
+                best_round=result['best_epoch'],
+                acc=result['acc'],
+                auc=result['auc'],
+                rmse=result['rmse'] if result['rmse'] else 0.0,
+                best_round_time=result['best_round_time'],
+                total_time=result['total_time'],
                 created_by=User.objects.get(id=user_id)
             )
             print("数据库保存完成")
 
-        # 更新任务状态 - 包含 training_curves
-        task_key = f"{dataset_name}_{model_name}"
-        training_tasks[task_key] = {
-            'status': 'completed',
-            'result': {
-                'best_epoch': best_epoch,
-                'acc': best_acc,
-                'auc': best_auc,
-                'rmse': rmse,
-                'training_curves': training_curves  # 新增：返回训练曲线数据
-            }
-        }
         print(f"========== 任务 {dataset_name}_{model_name} 完成 ==========")
+        # 返回值即任务结果，包含 training_curves 和耗时
+        return result
 
     except Exception as e:
         print(f"!!!!!!!!!! 训练任务出错: {str(e)} !!!!!!!!!!")
         import traceback
         traceback.print_exc()
-
-        task_key = f"{dataset_name}_{model_name}"
-        training_tasks[task_key] = {
-            'status': 'failed',
-            'error': str(e)
-        }
+        raise
 
 """处理性能对比的AJAX请求 - 异步启动训练任务"""
 @login_required
@@ -727,23 +340,26 @@ def researcher_run_comparison(request):
                 created_by=request.user
             )
 
-        # 为每个模型启动训练任务
+        # 为每个模型排入一条后台训练任务，由 run_training_worker 进程执行
+        from .training_jobs import enqueue_job
+
+        jobs = {}
         for model in models:
-            # 启动后台线程训练
             task_key = f"{dataset.name}_{model.name}"
-            training_tasks[task_key] = {'status': 'training'}
-
-            thread = threading.Thread(
-                target=run_training_task,
-                args=(dataset.name, model.name, experiment.batch_id if experiment else None, request.user.id)
-            )
-            thread.start()
+            job = enqueue_job('comparison', task_key, {
+                'dataset_name': dataset.name,
+                'model_name': model.name,
+                'experiment_id': experiment.batch_id if experiment else None,
+                'user_id': request.user.id,
+            }, user=request.user)
+            jobs[task_key] = job.id
 
         return JsonResponse({
             'success': True,
-            'message': '训练任务已启动',
+            'message': '训练任务已提交',
             'experiment_id': experiment.batch_id if experiment else None,
-            'tasks': [f"{dataset.name}_{model.name}" for model in models]
+            'tasks': list(jobs),
+            'jobs': jobs
         })
 
     except json.JSONDecodeError:
@@ -751,12 +367,35 @@ def researcher_run_comparison(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
-"""检查训练任务状态"""
+"""检查训练任务状态：?job=<任务ID>，或按 ?task=<任务名> 查最近一次提交的任务"""
 @login_required
 @user_passes_test(is_researcher)
 def check_training_status(request):
+    from .training_jobs import job_status
+
+    jobs = TrainingJob.objects.filter(job_type='comparison', created_by=request.user)
+    job_id = request.GET.get('job')
+    if job_id:
+        job = jobs.filter(id=job_id).first()
+    else:
+        job = jobs.filter(task_key=request.GET.get('task')).order_by('-created_at').first()
+    if job is None:
+        return JsonResponse({'status': 'not_found'})
+    return JsonResponse(job_status(job))
+
+"""取消训练任务"""
+@login_required
+@user_passes_test(is_researcher)
+@require_POST
+def cancel_training_task(request):
+    from .training_jobs import cancel_job
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': '数据格式错误'})
 
-    task_key = request.GET.get('task')
-    if task_key in training_tasks:
-        return JsonResponse(training_tasks[task_key])
-    return JsonResponse({'status': 'not_found'})
+    job = TrainingJob.objects.filter(id=data.get('job_id'), job_type='comparison', created_by=request.user).first()
+    if job is None:
+        return JsonResponse({'success': False, 'error': '任务不存在'})
+    return JsonResponse({'success': True, 'job_id': job.id, 'status': cancel_job(job)})
@@ -2,7 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import JsonResponse
-from django.db.models import Count, Avg, Q
+from django.db.models import Count, Q
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 import json
@@ -10,6 +10,7 @@ from itertools import groupby
 from .models import *
 from .forms import ExerciseForm, KnowledgePointForm, QMatrixForm
 from .diagnosis.views_diagnosis import *
+from .mastery_snapshot import get_mastery_vectors, get_subject_summaries, refresh_for_answer_log
 from django.utils import timezone
 from datetime import timedelta
 #登录用户判断
@@ -37,13 +38,20 @@ def student_dashboard(request):
     subjects = [record.subject for record in enrolled_records]
     recent_logs = AnswerLog.objects.filter(student=request.user).order_by('-submitted_at')[:13]
     total_answers = AnswerLog.objects.filter(student=request.user).count()
-    
+
+    # 各科答题统计与掌握度都从快照表读取（见 mastery_snapshot.py），不再逐科目统计
+    subject_ids = [subject.id for subject in subjects]
+    summaries = get_subject_summaries(request.user.id, subject_ids)
+    mastery_vectors = get_mastery_vectors(request.user.id, subject_ids)
+
     # 计算总体掌握情况
-    total_diagnosis = StudentDiagnosis.objects.filter(student=request.user)
-    if total_diagnosis.exists():
-        avg_mastery = total_diagnosis.aggregate(avg=Avg('mastery_level'))['avg']
-    else:
-        avg_mastery = 0
+    mastery_cells = [
+        (level, int(kp_id), subject_id)
+        for subject_id, vector in mastery_vectors.items()
+        for model_mastery in vector.values()
+        for kp_id, level in model_mastery.items()
+    ]
+    avg_mastery = sum(cell[0] for cell in mastery_cells) / len(mastery_cells) if mastery_cells else 0
 
     # 只传递账号创建时间（不做计算，交给模板处理）
     account_joined = request.user.date_joined
@@ -53,50 +61,32 @@ def student_dashboard(request):
     first_subject = subjects[0] if subjects else None  # 推荐：用索引判断（最简洁）
 
     # 计算每个科目的统计数据
+    exercise_totals = dict(
+        Exercise.objects.filter(subject_id__in=subject_ids).values('subject_id')
+        .annotate(total=Count('id')).values_list('subject_id', 'total')
+    )
     subject_stats = []
     for subject in subjects:
-        # 该科目的所有习题数
-        total_exercises = Exercise.objects.filter(subject=subject).count()
-        
-        # 该科目的已完成习题数（去重）
-        completed_exercises = AnswerLog.objects.filter(
-            student=request.user,
-            exercise__subject=subject
-        ).values('exercise_id').distinct().count()
-        
-        # 该科目的正确率
-        correct_count = AnswerLog.objects.filter(
-            student=request.user,
-            exercise__subject=subject,
-            is_correct=True
-        ).count()
-        
-        total_count = AnswerLog.objects.filter(
-            student=request.user,
-            exercise__subject=subject
-        ).count()
-        
-        accuracy = (correct_count / total_count * 100) if total_count > 0 else 0
-        
+        summary = summaries.get(subject.id)
         subject_stats.append({
             'name': subject.name,
-            'total_exercises': total_exercises,
-            'completed_exercises': completed_exercises,
-            'accuracy': round(accuracy, 1),
-            'answer_count': total_count
+            'total_exercises': exercise_totals.get(subject.id, 0),
+            'completed_exercises': summary.distinct_exercises if summary else 0,
+            'accuracy': round(summary.accuracy * 100, 1) if summary else 0,
+            'answer_count': summary.attempts if summary else 0
         })
     
     # 获取薄弱知识点（掌握程度最低的5个）
-    weak_knowledge_points = StudentDiagnosis.objects.filter(
-        student=request.user
-    ).select_related('knowledge_point').order_by('mastery_level')[:5]
-    
+    weak_cells = sorted(mastery_cells)[:5]
+    kp_names = dict(KnowledgePoint.objects.filter(id__in=[cell[1] for cell in weak_cells]).values_list('id', 'name'))
+    subject_names = {subject.id: subject.name for subject in subjects}
+
     weak_kp_data = []
-    for kp in weak_knowledge_points:
+    for level, kp_id, subject_id in weak_cells:
         weak_kp_data.append({
-            'name': kp.knowledge_point.name,
-            'mastery': round(kp.mastery_level * 100, 1),
-            'subject': kp.knowledge_point.subject.name
+            'name': kp_names.get(kp_id, ''),
+            'mastery': round(level * 100, 1),
+            'subject': subject_names.get(subject_id, '')
         })
 
     return render(request, 'student/student_dashboard.html', {
@@ -423,6 +413,7 @@ def take_exercise(request, exercise_id):
 
         # 更新知识点掌握情况
         update_knowledge_mastery(request.user, exercise, answer_log.is_correct)
+        refresh_for_answer_log(answer_log)
 
         # 设置单题模式标志到session
         if single_mode:
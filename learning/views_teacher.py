@@ -8,6 +8,7 @@ from .forms import ExerciseForm
 from django.db.models import Count, Q
 from django.db import transaction
 from .utils_ai import parse_fill_in_blanks
+from .mastery_snapshot import refresh_for_answer_log
 import csv
 import json
 from datetime import datetime
@@ -1391,11 +1392,12 @@ def grade_answer(request, log_id):
         log.graded_by = request.user
         log.grading_confidence = None
         log.save()
+        refresh_for_answer_log(log)
 
         # 缓存评分结果（保留已有 AI 评分详情）
         try:
-            from .ai_scoring.scoring_agent import _scoring_result_cache
-            existing = _scoring_result_cache.get(str(log_id), {})
+            from .ai_scoring.scoring_agent import cache_result, get_cached_score
+            existing = get_cached_score(log_id) or {}
             manual_note = '【手动评分】{}/{}，判定：{}'.format(
                 manual_score, full_score, '正确' if log.is_correct else '错误')
             # 合并：保留 AI 模型分数和过程，叠加手动评分信息
@@ -1409,12 +1411,7 @@ def grade_answer(request, log_id):
                 'manual': True,
                 'process': (existing.get('process', '') + '\n' + manual_note).strip(),
             }
-            _scoring_result_cache[str(log_id)] = merged
-            try:
-                from .ai_scoring.scoring_agent import _save_cache, _scoring_result_cache as cache_obj
-                _save_cache(cache_obj)
-            except Exception:
-                pass
+            cache_result(log_id, merged)
         except Exception:
             pass
 
@@ -1485,7 +1482,7 @@ def ai_grade_answer(request, log_id):
 def ai_agent_score(request, log_id):
     """使用智能体（三模型仲裁）评分，结果写入 is_correct + 返回详细 JSON"""
     try:
-        from .ai_scoring.scoring_agent import auto_score_answer
+        from .ai_scoring.scoring_agent import apply_agent_result, auto_score_answer
 
         log = get_object_or_404(AnswerLog, id=log_id)
 
@@ -1501,23 +1498,16 @@ def ai_agent_score(request, log_id):
         if not result.get('success'):
             return JsonResponse({'success': False, 'message': result.get('error', '评分失败')})
 
-        full = result['full_score']
-        score = result['final_score']
-        threshold = full * 0.6 if full > 0 else 0
-        log.is_correct = score >= threshold
-        log.score = score
-        log.ai_feedback = result.get('process', '')
-        log.graded_at = timezone.now()
-        log.graded_by = request.user
-        log.grading_confidence = 0.85
+        apply_agent_result(log, result, request.user, timezone.now())
         log.save()
+        refresh_for_answer_log(log)
 
         return JsonResponse({
             'success': True,
             'grading': {
                 'is_correct': log.is_correct,
-                'final_score': score,
-                'full_score': full,
+                'final_score': result['final_score'],
+                'full_score': result['full_score'],
                 'ds_score': result.get('ds_score'),
                 'km_score': result.get('km_score'),
                 'xf_score': result.get('xf_score'),
@@ -1555,57 +1545,28 @@ def batch_ai_agent_score(request):
         if int(subject_id) not in teacher_subjects:
             return JsonResponse({'success': False, 'message': '无权批改此科目'})
 
-        pending_logs = AnswerLog.objects.filter(
-            exercise__subject_id=int(subject_id),
-            exercise__question_type__in=['5'],
-            is_correct__isnull=True,
-        ).exclude(text_answer__isnull=True).exclude(text_answer='')
+        from .ai_scoring.batch_grading import pending_logs
+        from .training_jobs import enqueue_job, find_active_job
 
-        total = pending_logs.count()
+        total = pending_logs(subject_id).count()
         if total == 0:
             return JsonResponse({'success': False, 'message': '没有待批改的记录'})
 
-        from .ai_scoring.scoring_agent import auto_score_answer
-
-        success_count = 0
-        fail_count = 0
-        results = []
-
-        for log in pending_logs:
-            result = auto_score_answer(log.id)
-            if result.get('success'):
-                full = result['full_score']
-                score = result['final_score']
-                threshold = full * 0.6 if full > 0 else 0
-                log.is_correct = score >= threshold
-                log.score = score
-                log.ai_feedback = result.get('process', '')
-                log.graded_at = timezone.now()
-                log.graded_by = request.user
-                log.grading_confidence = 0.85
-                log.save()
-                success_count += 1
-                results.append({
-                    'log_id': log.id,
-                    'student': log.student.username,
-                    'final_score': score,
-                    'is_correct': log.is_correct,
-                })
-            else:
-                fail_count += 1
-                results.append({
-                    'log_id': log.id,
-                    'student': log.student.username,
-                    'error': result.get('error', '评分失败'),
-                })
+        # 评分在 run_training_worker 中异步并发执行；同一科目已有排队/运行中的批改任务时直接返回该任务
+        task_key = f"grading_{int(subject_id)}"
+        job = find_active_job(task_key)
+        if job is None:
+            job = enqueue_job('grading', task_key, {
+                'subject_id': int(subject_id),
+                'grader_id': teacher.id,
+            }, user=teacher)
 
         return JsonResponse({
             'success': True,
-            'message': f'批量批改完成：成功 {success_count}，失败 {fail_count}，共 {total} 题',
+            'queued': True,
+            'message': f'批量批改任务已提交，共 {total} 题待批改',
+            'job_id': job.id,
             'total': total,
-            'success_count': success_count,
-            'fail_count': fail_count,
-            'results': results,
         })
 
     except Exception as e:
@@ -1617,6 +1578,23 @@ def batch_ai_agent_score(request):
         }, status=500)
 
 
+@login_required
+@user_passes_test(is_teacher)
+def batch_ai_score_status(request, job_id):
+    """批量批改任务状态（进度、完成后的逐条结果）"""
+    from .training_jobs import job_status
+
+    teacher_subjects = TeacherSubject.objects.filter(
+        teacher=request.user
+    ).values_list('subject_id', flat=True)
+    job = TrainingJob.objects.filter(
+        id=job_id, job_type='grading', payload__subject_id__in=list(teacher_subjects)
+    ).first()
+    if job is None:
+        return JsonResponse({'status': 'not_found'}, status=404)
+    return JsonResponse(job_status(job))
+
+
 @login_required
 @user_passes_test(is_teacher)
 @require_POST
@@ -1652,9 +1630,8 @@ def clear_grading_records(request):
         )
 
         try:
-            from .ai_scoring.scoring_agent import _scoring_result_cache
-            for lid in cleared_ids:
-                _scoring_result_cache.pop(str(lid), None)
+            from .ai_scoring.grading_cache import delete_log_results
+            delete_log_results(cleared_ids)
         except Exception:
             pass
 